@@ -0,0 +1,347 @@
+"""
+bulk_ingest.py — Nạp hàng loạt một cây thư mục tài liệu vào pipeline.
+
+Quét đệ quy, bỏ qua các path đã có trong index bằng một truy vấn duy nhất,
+xử lý song song qua process_new_file, ghi checkpoint (JSON Lines) để chạy
+lại sau khi bị ngắt, và in throughput (files/s, MB/s, số lần gọi AI tiết kiệm).
+Mọi lần phân loại chạy ở lớp bulk: hết ngân sách gọi AI thì dừng, file chưa xử
+lý không ghi checkpoint để lần chạy sau làm tiếp. Các file cùng thư mục được
+phân loại theo nhóm (FolderGroupClassifier): một lần gọi AI cho cả thư mục.
+
+Sử dụng:
+    python -m app.bulk_ingest ~/MedicalDevices --workers 4
+    medicaldocbot-ingest ~/Archive/2024 --fresh
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import fnmatch
+import itertools
+import json
+import logging
+import os
+import time
+from collections.abc import Iterator
+from pathlib import Path
+from typing import Any
+
+import yaml
+
+from app.classifier import BatchingClassifier, MedicalClassifier
+from app.folder_group import FolderGroupClassifier
+from app.index_store import IndexStore
+from app.notifier import TelegramNotifier
+from app.process_event import SKIPPED, process_new_file
+from app.scheduler import BULK, classification_priority
+from app.taxonomy import Taxonomy
+from app.usage import BudgetExceededError
+from app.wiki_generator import WikiGenerator
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CHECKPOINT = "data/bulk_ingest_checkpoint.jsonl"
+
+# In tiến độ sau mỗi N file
+_PROGRESS_EVERY = 25
+
+
+def _expand_path(path_str: str) -> Path:
+    """Mở rộng ~ và biến môi trường trong path."""
+    return Path(os.path.expandvars(os.path.expanduser(path_str)))
+
+
+def iter_candidate_files(root: Path, config: dict[str, Any]) -> Iterator[tuple[str, int]]:
+    """
+    Duyệt đệ quy root, áp dụng cùng bộ lọc với watcher.
+
+    Yields:
+        (path, size_bytes) của các file hợp lệ
+    """
+    watcher_cfg = config.get("watcher", {})
+    ignore = watcher_cfg.get("ignore_patterns", [])
+    allowed = {ext.lower() for ext in watcher_cfg.get("allowed_extensions", [])}
+    min_size = watcher_cfg.get("min_file_size_bytes", 0)
+
+    def _ignored(name: str) -> bool:
+        return any(fnmatch.fnmatch(name, pattern) for pattern in ignore)
+
+    for dirpath, dirnames, filenames in os.walk(root):
+        # Cắt tỉa thư mục bị ignore (wiki, .cache, .git...) ngay khi walk
+        dirnames[:] = sorted(d for d in dirnames if not _ignored(d) and not d.startswith("."))
+        for name in sorted(filenames):
+            if _ignored(name) or name.startswith("."):
+                continue
+            if allowed and Path(name).suffix.lower() not in allowed:
+                continue
+            path = os.path.join(dirpath, name)
+            try:
+                size = os.path.getsize(path)
+            except OSError:
+                continue
+            if size >= min_size:
+                yield path, size
+
+
+class Checkpoint:
+    """
+    Checkpoint dạng JSON Lines: mỗi dòng một file đã xử lý xong.
+
+    Append-only nên an toàn khi tiến trình bị kill giữa chừng.
+    """
+
+    def __init__(self, path: str | Path) -> None:
+        self._path = Path(path)
+        self._path.parent.mkdir(parents=True, exist_ok=True)
+        self._fh = None
+
+    def load(self, include_failed: bool = True) -> set[str]:
+        """Đọc các path đã hoàn tất từ lần chạy trước."""
+        done: set[str] = set()
+        if not self._path.exists():
+            return done
+        with open(self._path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    continue  # Dòng cuối bị cắt dở khi crash
+                if include_failed or entry.get("status") != "failed":
+                    done.add(entry["path"])
+        return done
+
+    def reset(self) -> None:
+        """Xóa checkpoint cũ (chạy lại từ đầu)."""
+        self._path.unlink(missing_ok=True)
+
+    def record(self, path: str, status: str, **extra: Any) -> None:
+        """Ghi nhận một file đã xử lý (flush ngay để không mất khi crash)."""
+        if self._fh is None:
+            self._fh = open(self._path, "a", encoding="utf-8")
+        self._fh.write(json.dumps({"path": path, "status": status, **extra}, ensure_ascii=False))
+        self._fh.write("\n")
+        self._fh.flush()
+
+    def close(self) -> None:
+        if self._fh is not None:
+            self._fh.close()
+            self._fh = None
+
+
+class IngestStats:
+    """Đếm throughput cho một lần bulk ingest."""
+
+    def __init__(self) -> None:
+        self.started = time.monotonic()
+        self.files = 0
+        self.bytes = 0
+        self.failed = 0
+        self.skipped = 0
+        self.by_source: dict[str, int] = {}
+
+    def add(self, size_bytes: int, source: str | None) -> None:
+        self.files += 1
+        self.bytes += size_bytes
+        if source is None:
+            self.failed += 1
+        else:
+            self.by_source[source] = self.by_source.get(source, 0) + 1
+
+    @property
+    def llm_calls_saved(self) -> int:
+        """Số file được phân loại không cần gọi 9router (đặt thủ công, luật...)."""
+        return sum(n for src, n in self.by_source.items() if src != "llm")
+
+    def summary(self) -> str:
+        elapsed = max(time.monotonic() - self.started, 1e-9)
+        mb = self.bytes / (1024 * 1024)
+        return (
+            f"{self.files} files ({self.failed} lỗi, {self.skipped} bỏ qua) "
+            f"trong {elapsed:.1f}s — {self.files / elapsed:.2f} files/s, "
+            f"{mb / elapsed:.2f} MB/s, tiết kiệm {self.llm_calls_saved} lần gọi AI "
+            f"{json.dumps(self.by_source, ensure_ascii=False)}"
+        )
+
+
+async def bulk_ingest(
+    root: Path,
+    config: dict[str, Any],
+    classifier: MedicalClassifier | BatchingClassifier | FolderGroupClassifier,
+    store: IndexStore,
+    wiki: WikiGenerator,
+    taxonomy: Taxonomy,
+    notifier: TelegramNotifier | None = None,
+    workers: int = 4,
+    checkpoint: Checkpoint | None = None,
+    retry_failed: bool = False,
+) -> IngestStats:
+    """
+    Xử lý song song toàn bộ file hợp lệ dưới root.
+
+    Args:
+        root: Thư mục gốc cần quét
+        workers: Số file xử lý đồng thời
+        checkpoint: Checkpoint để resume (None → không ghi)
+        retry_failed: Xử lý lại các file bị lỗi trong lần chạy trước
+
+    Returns:
+        IngestStats
+    """
+    stats = IngestStats()
+    indexed = await store.get_indexed_paths(prefix=str(root))
+    done = checkpoint.load(include_failed=not retry_failed) if checkpoint else set()
+    logger.info("Đã có %d file trong index, %d file trong checkpoint", len(indexed), len(done))
+
+    queue: asyncio.Queue = asyncio.Queue(maxsize=workers * 4)
+    budget_stop = asyncio.Event()
+
+    async def _worker() -> None:
+        while True:
+            item = await queue.get()
+            if item is None:
+                return
+            if budget_stop.is_set():
+                continue
+            path, size = item
+            source = None
+            try:
+                with classification_priority(BULK):
+                    file_info = await process_new_file(
+                        path, config, classifier, store, wiki, taxonomy, notifier
+                    )
+                if file_info == SKIPPED:
+                    # Đã có trong DB (VD watcher xử lý trước): không tính là lỗi
+                    stats.skipped += 1
+                    if checkpoint:
+                        checkpoint.record(path, "skipped")
+                    continue
+                source = file_info.get("source", "llm") if file_info else None
+            except BudgetExceededError as e:
+                # Không ghi checkpoint: lần chạy sau xử lý lại file này
+                if not budget_stop.is_set():
+                    logger.warning("⛔ %s", e)
+                budget_stop.set()
+                continue
+            except Exception as e:
+                logger.error("❌ Lỗi xử lý %s: %s", path, e)
+            stats.add(size, source)
+            if checkpoint:
+                checkpoint.record(path, "ok" if source else "failed", source=source)
+            if stats.files % _PROGRESS_EVERY == 0:
+                logger.info("⏳ %s", stats.summary())
+
+    grouping = classifier if isinstance(classifier, FolderGroupClassifier) else None
+    tasks = [asyncio.create_task(_worker()) for _ in range(max(1, workers))]
+    try:
+        # os.walk trả file theo từng thư mục: báo trước cả thư mục để phân loại theo nhóm
+        folders = itertools.groupby(
+            iter_candidate_files(root, config), key=lambda item: os.path.dirname(item[0])
+        )
+        for _, entries in folders:
+            todo = []
+            for path, size in entries:
+                if path in indexed or path in done:
+                    stats.skipped += 1
+                else:
+                    todo.append((path, size))
+            if grouping is not None:
+                grouping.expect(path for path, _ in todo)
+            for item in todo:
+                if budget_stop.is_set():
+                    break
+                await queue.put(item)
+            if budget_stop.is_set():
+                logger.warning("⛔ Dừng nạp hàng loạt vì hết ngân sách gọi AI, chạy lại để làm tiếp")
+                break
+    finally:
+        for _ in tasks:
+            await queue.put(None)
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    return stats
+
+
+async def _main(args: argparse.Namespace) -> None:
+    with open(args.config, encoding="utf-8") as f:
+        config = yaml.safe_load(f)
+
+    root = _expand_path(args.root or config["paths"]["medical_devices_root"]).absolute()
+    if not root.exists():
+        logger.error("Không tìm thấy thư mục: %s", root)
+        return
+
+    classifier = MedicalClassifier(args.config)
+    store = IndexStore(config["paths"]["db_file"])
+    await store.init()
+    await classifier.usage.attach(store)
+    # Học các file đã confirm trước khi ingest: tài liệu quen thuộc không cần gọi AI
+    await classifier.refresh_local_model(store)
+    batch_size = args.batch_size or classifier.batch_size
+    if batch_size > 1:
+        # Gom file của các worker thành batch: nhiều tài liệu / một lần gọi 9router
+        classifier = BatchingClassifier(classifier, batch_size=batch_size)
+    if config.get("classifier", {}).get("folder_groups", True):
+        # File cùng thư mục: một lần gọi AI suy ra thiết bị chung cho cả thư mục
+        classifier = FolderGroupClassifier.from_config(classifier, config)
+    wiki = WikiGenerator(args.config)
+    taxonomy = Taxonomy(config["paths"]["taxonomy_file"])
+    notifier = None if args.no_notify else TelegramNotifier.from_config(config)
+    if notifier:
+        await notifier.start()
+
+    checkpoint = Checkpoint(args.checkpoint)
+    if args.fresh:
+        checkpoint.reset()
+
+    logger.info("🚀 Bulk ingest %s với %d workers, batch %d", root, args.workers, batch_size)
+    try:
+        stats = await bulk_ingest(
+            root,
+            config,
+            classifier,
+            store,
+            wiki,
+            taxonomy,
+            notifier=notifier,
+            workers=args.workers,
+            checkpoint=checkpoint,
+            retry_failed=args.retry_failed,
+        )
+        logger.info("✅ Hoàn tất: %s", stats.summary())
+    finally:
+        checkpoint.close()
+        if notifier:
+            await notifier.close()
+        await classifier.close()
+        await store.close()
+
+
+def main() -> None:
+    """Entry point cho lệnh bulk ingest."""
+    parser = argparse.ArgumentParser(description="Nạp hàng loạt tài liệu vào MedicalDocBot")
+    parser.add_argument("root", nargs="?", help="Thư mục cần quét (mặc định: medical_devices_root)")
+    parser.add_argument("--config", default="config.yaml", help="Đường dẫn config.yaml")
+    parser.add_argument("--workers", type=int, default=4, help="Số file xử lý đồng thời")
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=None,
+        help="Số file mỗi request phân loại (mặc định: services.9router.batch_size, 1 = tắt)",
+    )
+    parser.add_argument("--checkpoint", default=DEFAULT_CHECKPOINT, help="File checkpoint JSONL")
+    parser.add_argument("--fresh", action="store_true", help="Bỏ checkpoint cũ, chạy lại từ đầu")
+    parser.add_argument(
+        "--retry-failed", action="store_true", help="Xử lý lại các file lỗi ở lần chạy trước"
+    )
+    parser.add_argument("--no-notify", action="store_true", help="Không gửi thông báo Telegram")
+    args = parser.parse_args()
+
+    logging.basicConfig(
+        format="%(asctime)s - %(name)s - %(levelname)s - %(message)s", level=logging.INFO
+    )
+    asyncio.run(_main(args))
+
+
+if __name__ == "__main__":
+    main()
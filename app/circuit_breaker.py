@@ -0,0 +1,146 @@
+"""
+circuit_breaker.py — Circuit breaker + theo dõi latency cho từng route gateway.
+
+Khi 9router suy giảm, mỗi file phải qua tối đa `max_retries` lần backoff
+lũy thừa. Breaker theo dõi tỉ lệ lỗi trên cửa sổ N request gần nhất của
+một route (model + endpoint):
+- closed: gọi bình thường
+- open: tỉ lệ lỗi vượt ngưỡng → từ chối ngay (fail fast) trong `open_seconds`
+- half_open: hết thời gian chờ → cho một request thử; thành công thì đóng lại
+
+Latency các request thành công được giữ lại để tính p95 (ngưỡng hedge).
+
+Sử dụng:
+    breaker = CircuitBreaker.from_config("primary", router_config)
+    if not breaker.allow():
+        raise CircuitOpenError(breaker.name)
+    ...
+    breaker.record_success(latency_ms)  # hoặc breaker.record_failure()
+"""
+
+from __future__ import annotations
+
+import logging
+import time
+from collections import deque
+from typing import Any
+
+from app.utils import percentile
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_FAILURE_THRESHOLD = 0.5
+DEFAULT_WINDOW = 20
+DEFAULT_MIN_REQUESTS = 5
+DEFAULT_OPEN_SECONDS = 30.0
+_LATENCY_SAMPLES = 200
+
+
+class CircuitOpenError(Exception):
+    """Mọi route gateway đang mở mạch (fail fast, không gọi mạng)."""
+
+
+class CircuitBreaker:
+    """
+    Breaker theo tỉ lệ lỗi trên cửa sổ trượt.
+
+    Args:
+        name: Tên route (để log)
+        failure_threshold: Tỉ lệ lỗi (0..1) để mở mạch
+        window: Số kết quả gần nhất được xét
+        min_requests: Số kết quả tối thiểu trước khi có thể mở mạch
+        open_seconds: Thời gian mở mạch trước khi thử lại (half-open)
+    """
+
+    def __init__(
+        self,
+        name: str,
+        failure_threshold: float = DEFAULT_FAILURE_THRESHOLD,
+        window: int = DEFAULT_WINDOW,
+        min_requests: int = DEFAULT_MIN_REQUESTS,
+        open_seconds: float = DEFAULT_OPEN_SECONDS,
+    ) -> None:
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.min_requests = max(1, min_requests)
+        self.open_seconds = open_seconds
+        self._results: deque[bool] = deque(maxlen=max(window, self.min_requests))
+        self._latencies: deque[float] = deque(maxlen=_LATENCY_SAMPLES)
+        self._opened_at: float | None = None
+        self._probe_started: float | None = None
+        self.opened = 0
+
+    @classmethod
+    def from_config(cls, name: str, router_config: dict[str, Any]) -> CircuitBreaker:
+        """Tạo breaker từ `services.9router.circuit_*` trong config.yaml."""
+        return cls(
+            name,
+            failure_threshold=router_config.get(
+                "circuit_failure_threshold", DEFAULT_FAILURE_THRESHOLD
+            ),
+            window=router_config.get("circuit_window", DEFAULT_WINDOW),
+            min_requests=router_config.get("circuit_min_requests", DEFAULT_MIN_REQUESTS),
+            open_seconds=router_config.get("circuit_open_seconds", DEFAULT_OPEN_SECONDS),
+        )
+
+    @property
+    def state(self) -> str:
+        if self._opened_at is None:
+            return "closed"
+        if time.monotonic() - self._opened_at >= self.open_seconds:
+            return "half_open"
+        return "open"
+
+    def allow(self) -> bool:
+        """Có được gửi request qua route này không (half-open: một request thử)."""
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "open":
+            return False
+        now = time.monotonic()
+        # Request thử bị hủy/treo quá lâu thì cho request khác thử thay
+        if self._probe_started is None or now - self._probe_started >= self.open_seconds:
+            self._probe_started = now
+            return True
+        return False
+
+    def record_success(self, latency_ms: float | None = None) -> None:
+        if latency_ms is not None:
+            self._latencies.append(latency_ms)
+        if self._opened_at is not None:
+            if self._probe_started is None:
+                return  # Request gửi trước khi mở mạch, chưa phải request thử
+            logger.info(f"Gateway '{self.name}' hoạt động lại, đóng circuit breaker.")
+            self._opened_at = None
+            self._probe_started = None
+            self._results.clear()
+        self._results.append(True)
+
+    def record_failure(self) -> None:
+        self._results.append(False)
+        if self._opened_at is not None:
+            # Request thử ở half-open thất bại → mở lại mạch
+            if self._probe_started is not None:
+                self._trip()
+            return
+        failures = self._results.count(False)
+        if (
+            len(self._results) >= self.min_requests
+            and failures / len(self._results) >= self.failure_threshold
+        ):
+            self._trip()
+
+    def _trip(self) -> None:
+        self._opened_at = time.monotonic()
+        self._probe_started = None
+        self.opened += 1
+        logger.warning(
+            f"Gateway '{self.name}' lỗi nhiều, mở circuit breaker trong {self.open_seconds:.0f}s."
+        )
+
+    def latency_percentile(self, q: float, min_samples: int = 1) -> float | None:
+        """Percentile latency (ms) của các request thành công, None nếu chưa đủ mẫu."""
+        if len(self._latencies) < max(1, min_samples):
+            return None
+        return percentile(list(self._latencies), q)
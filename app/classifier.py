@@ -8,6 +8,9 @@ import json
 import logging
 import os
 import time
+from collections.abc import Callable
+from contextvars import ContextVar
+from dataclasses import dataclass
 from pathlib import Path
 from typing import Any
 
@@ -16,10 +19,183 @@ import yaml
 from dotenv import load_dotenv
 from kreuzberg import extract_file
 
+from app.circuit_breaker import CircuitBreaker, CircuitOpenError
+from app.extract_cache import ExtractionCache
+from app.extract_pool import ExtractionPool
+from app.ingest import IngestedFile, ingest_file
+from app.local_model import LocalModel, featurize, label_key, row_labels
+from app.ocr import PageOcr
+from app.preview import (
+    DEFAULT_PREVIEW_PAGES,
+    PREVIEW_VARIANT,
+    FullExtractionQueue,
+    extract_preview,
+)
+from app.preview_builder import DEFAULT_TOKEN_BUDGET, PreviewBuilder, estimate_tokens
+from app.rate_limiter import AdaptiveRateLimiter, get_shared_limiter, parse_retry_after
+from app.rule_classifier import RuleClassifier
+from app.scheduler import current_priority
+from app.taxonomy import Taxonomy, TaxonomyError
+from app.tracing import annotate, record, span
+from app.usage import BudgetExceededError, UsageTracker
+
 load_dotenv(override=False)
 
 logger = logging.getLogger(__name__)
 
+# Các lần gọi gateway của lần phân loại hiện tại (token, latency) để ghi usage
+_usage_calls: ContextVar[list[dict] | None] = ContextVar("medicaldocbot_usage", default=None)
+
+
+# Phần mô tả trường dùng chung cho prompt đơn lẻ, prompt batch và prompt thư mục
+_DOC_TYPE_SPEC = (
+    "- doc_type: [ky_thuat, cau_hinh, bao_gia, trung_thau, hop_dong, so_sanh, thong_tin,"
+    " lien_ket, khac]\n"
+)
+_DEVICE_SPEC = (
+    "- vendor: [Tên hãng sản xuất, viết hoa đúng chuẩn, e.g. GE Healthcare, Philips, Siemens."
+    ' Ghi "Unknown" nếu không rõ]\n'
+    '- model: [Model thiết bị, viết hoa đúng chuẩn. Ghi "Unknown" nếu không rõ]\n'
+    '- category_slug: [ID nhóm thiết bị theo định dạng "nhom_lon/nhom_con",'
+    ' ví dụ: "noi_soi/ong_soi_mem"]\n'
+)
+_FIELDS_SPEC = _DOC_TYPE_SPEC + _DEVICE_SPEC + (
+    "- summary: [Tóm tắt ngắn gọn nội dung tài liệu bằng tiếng Việt, tối đa 20 từ]\n"
+    "- confidence: [Số thực từ 0.0 đến 1.0 thể hiện mức độ chắc chắn của phân loại."
+    " 1.0 = rất chắc, 0.5 = không chắc]\n"
+)
+
+_RULES_SPEC = (
+    "1. Nếu là tài liệu liên quan đến Tim mạch, hãy chọn category_slug là"
+    ' "tim_mach_can_thiep/can_thiep" hoặc tương tự.\n'
+    "2. Nếu tên file có đủ thông tin rõ ràng (hãng, model), đặt confidence >= 0.8."
+)
+
+_DOC_TYPES = {
+    "ky_thuat", "cau_hinh", "bao_gia", "trung_thau", "hop_dong",
+    "so_sanh", "thong_tin", "lien_ket", "khac",
+}
+_REQUIRED_FIELDS = ("doc_type", "vendor", "model", "category_slug")
+
+
+def _parse_json_content(content_str: str) -> Any:
+    """Bóc JSON từ nội dung message (bỏ code fence markdown, text thừa)."""
+    # Clean up markdown code blocks
+    content_str = content_str.strip()
+    if content_str.startswith("```json"):
+        content_str = content_str[7:]
+    if content_str.startswith("```"):
+        content_str = content_str[3:]
+    if content_str.endswith("```"):
+        content_str = content_str[:-3]
+    content_str = content_str.strip()
+
+    # Fallback robust extraction: từ "{" (hoặc "[") đầu tiên tới dấu đóng cuối cùng
+    starts = [i for i in (content_str.find("{"), content_str.find("[")) if i != -1]
+    if starts:
+        start_idx = min(starts)
+        end_idx = content_str.rfind("}" if content_str[start_idx] == "{" else "]") + 1
+        if end_idx > start_idx:
+            content_str = content_str[start_idx:end_idx]
+
+    return json.loads(content_str)
+
+
+def _is_valid_result(entry: Any) -> bool:
+    """Kết quả batch hợp lệ: đủ trường bắt buộc (chuỗi) và doc_type đúng danh mục."""
+    if not isinstance(entry, dict):
+        return False
+    if not all(isinstance(entry.get(k), str) and entry.get(k) for k in _REQUIRED_FIELDS):
+        return False
+    return entry["doc_type"] in _DOC_TYPES
+
+
+def _is_folder_result(entry: Any) -> bool:
+    """Phản hồi prompt thư mục: thiết bị chung (chuỗi) + mảng `results` theo id."""
+    return (
+        isinstance(entry, dict)
+        and all(isinstance(entry.get(k), str) and entry.get(k) for k in _REQUIRED_FIELDS[1:])
+        and isinstance(entry.get("results"), list)
+    )
+
+
+def _is_batch_result(entry: Any) -> bool:
+    """Phản hồi batch đủ cấu trúc: {"results": [...]} hoặc mảng trực tiếp."""
+    return isinstance(entry, list) or (
+        isinstance(entry, dict) and isinstance(entry.get("results"), list)
+    )
+
+
+class _JsonObjectScanner:
+    """
+    Tìm các JSON object/array hoàn chỉnh ở cấp ngoài cùng trong text nhận dần
+    (stream), bỏ qua text/code fence xung quanh. Dấu ngoặc trong chuỗi JSON
+    được bỏ qua đúng cách.
+    """
+
+    def __init__(self) -> None:
+        self.text = ""
+        self._pos = 0
+        self._depth = 0
+        self._start = -1
+        self._in_string = False
+        self._escape = False
+
+    def feed(self, chunk: str) -> list[str]:
+        """Thêm text mới, trả về các object/array vừa đóng đủ ngoặc."""
+        self.text += chunk
+        complete = []
+        text = self.text
+        for i in range(self._pos, len(text)):
+            ch = text[i]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+            elif ch == '"':
+                if self._depth > 0:
+                    self._in_string = True
+            elif ch in "{[":
+                if self._depth == 0:
+                    self._start = i
+                self._depth += 1
+            elif ch in "}]" and self._depth > 0:
+                self._depth -= 1
+                if self._depth == 0:
+                    complete.append(text[self._start : i + 1])
+        self._pos = len(text)
+        return complete
+
+
+def _first_valid_json(content: str, validate: Callable[[Any], bool]) -> str:
+    """
+    JSON object/array đầu tiên trong nội dung thỏa `validate` (như chế độ
+    stream); không có thì trả nguyên nội dung để caller xử lý lỗi.
+    """
+    for candidate in _JsonObjectScanner().feed(content):
+        try:
+            parsed = json.loads(candidate)
+        except json.JSONDecodeError:
+            continue
+        if validate(parsed):
+            return candidate
+    return content
+
+
+@dataclass
+class _Route:
+    """Một đích gọi chat/completions (model + endpoint) với breaker và limiter riêng."""
+
+    name: str
+    base_url: str
+    model: str
+    api_key: str
+    breaker: CircuitBreaker
+    rate_limiter: AdaptiveRateLimiter
+
 
 class MedicalClassifier:
     """Xử lý phân loại file tài liệu y tế bằng 9router local gateway."""
@@ -34,35 +210,360 @@ class MedicalClassifier:
         self.model_name = router_config.get("model", "if/glm-4.7")
         self.timeout = router_config.get("timeout_seconds", 30)
         self.max_retries = router_config.get("max_retries", 5)
-        self.rate_limit_seconds = router_config.get("rate_limit_seconds", 6.0)
+        # Batch mode: số tài liệu mỗi request và ngân sách token preview mỗi tài liệu
+        self.batch_size = max(1, router_config.get("batch_size", 5))
+        self.batch_preview_tokens = router_config.get(
+            "batch_preview_tokens", DEFAULT_TOKEN_BUDGET // 2
+        )
+
+        # HTTP client dùng chung (keep-alive + connection pool), tạo lười khi cần
+        self._limits = httpx.Limits(
+            max_connections=router_config.get("max_connections", 10),
+            max_keepalive_connections=router_config.get("max_keepalive_connections", 5),
+            keepalive_expiry=router_config.get("keepalive_expiry_seconds", 30.0),
+        )
+        self._http2 = bool(router_config.get("http2", False))
+        # Streaming (SSE): dừng đọc ngay khi nhận đủ một JSON object hợp lệ
+        self.stream = bool(router_config.get("stream", False))
+        self._client: httpx.AsyncClient | None = None
+
+        # Cache trích xuất theo sha256 nội dung (paths.extracted_cache_dir)
+        self.extract_cache = ExtractionCache.from_config(self.config)
+        # kreuzberg chạy trong worker process (timeout, giới hạn RAM), tạo lười
+        self.extract_pool = ExtractionPool.from_config(self.config)
+        # Preview giới hạn trang cho phân loại; bản đầy đủ trích xuất nền vào cache
+        extraction_cfg = self.config.get("extraction", {})
+        self.preview_pages = extraction_cfg.get("preview_pages", DEFAULT_PREVIEW_PAGES)
+        # Chọn đoạn giàu thông tin (tiêu đề, hãng/model, bảng thông số) trong ngân sách token
+        self.preview_chars = extraction_cfg.get("preview_chars", 20000)
+        self.preview_token_budget = extraction_cfg.get("preview_token_budget", DEFAULT_TOKEN_BUDGET)
+        self.preview_builder = PreviewBuilder.from_config(self.config)
+        # PDF scan: OCR song song theo trang, dừng sớm khi đủ text cho phân loại
+        self.ocr = PageOcr.from_config(self.config, self.extract_pool)
+        # txt/csv/docx/xlsx/pptx đọc bằng reader native, kreuzberg làm fallback
+        self.native_extractors = bool(extraction_cfg.get("native_extractors", True))
+        # Token/latency mỗi lần gọi AI và ngân sách (services.9router.budget_*);
+        # ghi vào index khi watcher/bulk ingest gọi usage.attach(store)
+        self.usage = UsageTracker.from_config(self.config)
+        self.full_extraction = FullExtractionQueue(
+            self.extract_cache if extraction_cfg.get("background_full_extraction", True) else None,
+            self.config.get("watcher", {}).get("max_buffer_bytes"),
+            self.extract_pool,
+            self.ocr,
+            self.native_extractors,
+            max_held_bytes=int(extraction_cfg.get("background_max_held_mb", 128)) * 1024 * 1024,
+        )
+
+        # Tầng 1: luật tĩnh (filename_rules, subfolder_rules, vendor_aliases)
+        try:
+            taxonomy = Taxonomy(
+                self.config.get("paths", {}).get("taxonomy_file", "data/taxonomy.yaml")
+            )
+        except TaxonomyError as e:
+            logger.warning(f"Không load được taxonomy cho rule classifier: {e}")
+            taxonomy = None
+        self.rules = RuleClassifier(self.config, taxonomy)
+        # Prompt thư mục (app.folder_group): số file tối đa / số file gửi kèm preview
+        classifier_cfg = self.config.get("classifier", {})
+        self.folder_group_max_files = max(2, classifier_cfg.get("folder_group_max_files", 50))
+        self.folder_group_context_files = classifier_cfg.get("folder_group_context_files", 3)
+        # Tầng 2: mô hình thống kê cục bộ học từ các file đã confirm (None nếu tắt)
+        self.local_model = LocalModel.from_config(self.config)
+
+        # Rate limiting: token bucket thích ứng, dùng chung cho mọi worker gọi cùng gateway
+        self.rate_limiter = get_shared_limiter(router_config)
+
+        # Route chính + route dự phòng (model/endpoint khác), mỗi route một circuit breaker
+        self.routes = [
+            _Route(
+                "primary", self.api_base, self.model_name, self.api_key,
+                CircuitBreaker.from_config(self.model_name, router_config), self.rate_limiter,
+            )
+        ]
+        fallback_model = router_config.get("fallback_model") or ""
+        fallback_base = router_config.get("fallback_base_url") or ""
+        if fallback_model or fallback_base:
+            fallback_base = fallback_base or self.api_base
+            fallback_model = fallback_model or self.model_name
+            self.routes.append(
+                _Route(
+                    "fallback", fallback_base, fallback_model,
+                    os.getenv("NINEROUTER_FALLBACK_API_KEY", self.api_key),
+                    CircuitBreaker.from_config(f"{fallback_model} (dự phòng)", router_config),
+                    get_shared_limiter({**router_config, "base_url": fallback_base}),
+                )
+            )
+        self.fallback_max_retries = router_config.get("fallback_max_retries", 2)
+        # Hedge: request chậm hơn p95 latency của route → gửi thêm một request song song
+        self.hedge_enabled = bool(router_config.get("hedge_enabled", False))
+        self.hedge_percentile = router_config.get("hedge_percentile", 95)
+        self.hedge_min_samples = router_config.get("hedge_min_samples", 20)
+
+    def _get_client(self) -> httpx.AsyncClient:
+        """Trả về AsyncClient dùng chung, tạo mới nếu chưa có hoặc đã bị đóng."""
+        if self._client is None or self._client.is_closed:
+            http2 = self._http2
+            if http2:
+                try:
+                    import h2  # noqa: F401
+                except ImportError:
+                    logger.warning("Chưa cài 'h2' (pip install httpx[http2]), dùng HTTP/1.1.")
+                    http2 = False
+            self._client = httpx.AsyncClient(
+                timeout=self.timeout, limits=self._limits, http2=http2
+            )
+        return self._client
+
+    async def close(self) -> None:
+        """Đóng HTTP client, hàng đợi trích xuất nền và worker pool (gọi khi tắt watcher/script)."""
+        await self.usage.close()
+        await self.full_extraction.close()
+        if self.extract_pool is not None:
+            await self.extract_pool.close()
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
 
-        # Rate limiting variables (instance level)
-        self._last_request_time: float = 0.0
-        self._request_lock = asyncio.Lock()
+    async def __aenter__(self) -> "MedicalClassifier":
+        return self
 
-    async def classify_file(self, file_path: str, max_retries: int | None = None) -> dict:
+    async def __aexit__(self, *exc_info) -> None:
+        await self.close()
+
+    def _confident_rule_result(self, file_path_obj: Path) -> dict | None:
+        """Kết quả tầng luật nếu đủ chắc chắn để bỏ qua gateway, ngược lại None."""
+        with span("rules") as sp:
+            rule_result = self.rules.classify(file_path_obj)
+            sp["hit"] = self.rules.is_confident(rule_result)
+        if not self.rules.is_confident(rule_result):
+            return None
+        logger.info(
+            f"Phân loại bằng luật (bỏ qua AI): {file_path_obj.name} "
+            f"(confidence={rule_result['confidence']})"
+        )
+        return rule_result
+
+    def _local_result(self, file_path_obj: Path, content_preview: str) -> dict | None:
         """
-        Phân loại tài liệu bằng AI qua 9router local gateway.
-        Đọc nội dung file nếu có thể để tăng độ chính xác.
+        Kết quả mô hình cục bộ nếu đạt `local_model_threshold`, ngược lại None.
+
+        Mô hình không dự đoán model thiết bị: chỉ dùng khi file nằm trong thư mục
+        thiết bị có sẵn (tầng luật suy ra `device_slug`), còn lại để gateway
+        phân loại thay vì gom mọi tài liệu của một hãng vào "<hãng>_unknown".
         """
-        lock = self._request_lock
+        if self.local_model is None or not self.local_model.ready:
+            return None
+        rule_result = self.rules.classify(file_path_obj) or {}
+        with span("local_model") as sp:
+            sp["device"] = "device_slug" in rule_result
+            prediction = None
+            if sp["device"]:
+                prediction = self.local_model.predict(
+                    featurize(file_path_obj.name, content_preview)
+                )
+            sp["hit"] = bool(prediction and prediction["confidence"] >= self.local_model.threshold)
+        if not sp["hit"]:
+            return None
+        logger.info(
+            f"Phân loại bằng mô hình cục bộ (bỏ qua AI): {file_path_obj.name} "
+            f"(confidence={prediction['confidence']:.2f})"
+        )
+        vendor = rule_result["vendor"]
+        return {
+            "doc_type": prediction["doc_type"],
+            "vendor": vendor if vendor != "Unknown" else prediction["vendor"],
+            "model": rule_result["model"],
+            "device_slug": rule_result["device_slug"],
+            "category_slug": rule_result["category_slug"] or prediction["category"],
+            "summary": "Phân loại bằng mô hình cục bộ (học từ file đã xác nhận)",
+            "confidence": round(prediction["confidence"], 2),
+            "source": "local_model",
+        }
 
-        if max_retries is None:
-            max_retries = self.max_retries
+    async def _offline_result(
+        self, file_path_obj: Path, ingested: IngestedFile | None
+    ) -> dict | None:
+        """Kết quả tầng luật hoặc mô hình cục bộ nếu đủ chắc chắn (không gọi gateway)."""
+        rule_result = self._confident_rule_result(file_path_obj)
+        if rule_result is not None:
+            return rule_result
+        if self.local_model is None or not self.local_model.ready:
+            return None
+        # Preview được cache theo sha256, lần đọc lại khi dựng prompt rẻ
+        preview = await self._content_preview(file_path_obj, ingested, self.preview_token_budget)
+        return self._local_result(file_path_obj, preview)
 
-        file_path_obj = Path(file_path)
-        logger.info(f"Đang phân loại file: {file_path_obj.name} bằng {self.model_name}")
+    async def refresh_local_model(self, store: Any) -> int:
+        """
+        Học các file mới được confirm trong index (tăng dần). Lần đầu đủ
+        `local_model_min_rows` file, hoặc khi nhãn của file đã học bị sửa, thì
+        huấn luyện từ đầu. Mọi bước đặc trưng/học chạy trong thread riêng trên bản
+        sao của mô hình rồi mới thay thế. Mỗi nội dung (sha256) là một mẫu.
+
+        Args:
+            store: IndexStore
+
+        Returns:
+            Số file mới (hoặc sửa nhãn) đã học
+        """
+        model = self.local_model
+        if model is None:
+            return 0
+        # Cùng nội dung ở nhiều dòng: dòng confirm sau cùng (id lớn nhất) thắng
+        rows = await store.get_confirmed_files()
+        samples = {row["sha256"]: (row, row_labels(row)) for row in rows}
+        new_keys = [
+            key for key, (_, labels) in samples.items()
+            if model.trained.get(key) != label_key(labels)
+        ]
+        if not new_keys or (not model.ready and len(samples) < model.min_rows):
+            return 0
+        # Nhãn của mẫu đã học bị sửa: học lại từ đầu để nhãn cũ không còn được tính
+        refit = not model.ready or any(key in model.trained for key in new_keys)
+
+        raw = []
+        for key in samples if refit else new_keys:
+            row, labels = samples[key]
+            text = ""
+            if self.extract_cache is not None:
+                cached = await self.extract_cache.get(row["sha256"], variant=PREVIEW_VARIANT)
+                cached = cached or await self.extract_cache.get(row["sha256"])
+                if cached is not None:
+                    text = self.preview_builder.build(
+                        cached.content[: self.preview_chars], self.preview_token_budget
+                    )
+            raw.append((key, Path(row["path"]).name, text, labels))
+
+        def train() -> LocalModel:
+            examples = [(key, featurize(name, text), labels) for key, name, text, labels in raw]
+            if refit:
+                trained = LocalModel(model.path, model.threshold, model.min_rows)
+                trained.fit(examples)
+            else:
+                trained = model.copy()
+                trained.partial_fit(examples)
+            trained.save()
+            return trained
 
-        # Trích xuất nội dung file (vài nghìn ký tự đầu)
-        content_preview = ""
+        started = time.monotonic()
+        # Học trên mô hình mới/bản sao rồi thay thế (predict không thấy trạng thái dở dang)
+        self.local_model = model = await asyncio.to_thread(train)
+        logger.info(
+            f"Mô hình cục bộ đã học {len(new_keys)} file mới/sửa nhãn "
+            f"(tổng {len(model.trained)}) trong {time.monotonic() - started:.1f}s"
+        )
+        return len(new_keys)
+
+    def _degraded_result(self, file_path_obj: Path, error: Exception) -> dict:
+        """
+        Gateway đang mở mạch: trả kết quả tầng luật (dù chưa chắc chắn) với
+        confidence thấp để draft chờ người dùng xác nhận, thay vì dừng pipeline.
+        """
+        logger.warning(f"{error} Phân loại tạm bằng luật: {file_path_obj.name}")
+        result = self.rules.classify(file_path_obj) or {
+            "doc_type": "khac",
+            "vendor": "Unknown",
+            "model": "Unknown",
+            "category_slug": "",
+            "confidence": 0.0,
+            "source": "rules",
+        }
+        result["confidence"] = min(result.get("confidence", 0.0), 0.5)
+        result["summary"] = "Gateway AI tạm ngưng — phân loại sơ bộ, cần xác nhận"
+        result["degraded"] = True
+        return result
+
+    async def _extract_for_preview(self, file_path_obj: Path, ingested: IngestedFile | None) -> str:
+        """Text trích xuất giới hạn trang (qua cache/pool/OCR) cho preview."""
+        if ingested is None:
+            # Cần sha256 để tra cache và buffer để cắt trang: đọc file rẻ hơn trích xuất
+            try:
+                ingested = await ingest_file(file_path_obj)
+            except OSError:
+                ingested = None
+        with span("extract") as sp:
+            if ingested is not None:
+                extraction_result = await extract_preview(
+                    ingested, self.extract_cache, self.preview_pages, self.preview_chars,
+                    pool=self.extract_pool, ocr=self.ocr, native=self.native_extractors,
+                )
+                sp["partial"] = extraction_result.partial
+                if extraction_result.metadata.get("ocr_pages"):
+                    sp["ocr_pages"] = extraction_result.metadata["ocr_pages"]
+                if extraction_result.partial:
+                    self.full_extraction.submit(ingested.path, ingested.sha256, ingested)
+            else:
+                extraction_result = await extract_file(file_path_obj)
+            sp["chars"] = len(extraction_result.content)
+        return extraction_result.content
+
+    async def _content_preview(
+        self,
+        file_path_obj: Path,
+        ingested: IngestedFile | None,
+        token_budget: int,
+        extracted_text: str | None = None,
+    ) -> str:
+        """
+        Preview cho prompt: trích xuất giới hạn trang rồi chọn các đoạn giàu
+        thông tin nhất trong `token_budget` token, "" nếu không đọc được.
+        Bản trích xuất đầy đủ được dời sang hàng đợi nền. Có `extracted_text`
+        (text đã trích xuất sẵn) thì chỉ chọn đoạn, không đọc file.
+        """
         try:
-            extraction_result = await extract_file(file_path_obj)
-            content_preview = extraction_result.content[:3000]  # Lấy 3000 ký tự đầu
-            logger.info(f"Đã trích xuất {len(content_preview)} ký tự từ file")
+            if extracted_text is not None:
+                content = extracted_text
+            else:
+                content = await self._extract_for_preview(file_path_obj, ingested)
+            with span("preview_select") as sp:
+                content_preview = self.preview_builder.build(
+                    content[: self.preview_chars], token_budget
+                )
+                sp["tokens"] = estimate_tokens(content_preview)
+            logger.info(
+                f"Đã trích xuất {len(content_preview)} ký tự (~{sp['tokens']} token) từ file"
+            )
+            return content_preview
         except Exception as e:
             logger.warning(
                 f"Không thể trích xuất nội dung từ {file_path_obj.name}: {e}. Phân loại dựa trên tên file."
             )
+            return ""
+
+    async def classify_file(
+        self,
+        file_path: str,
+        max_retries: int | None = None,
+        ingested: IngestedFile | None = None,
+        use_rules: bool = True,
+        extracted_text: str | None = None,
+    ) -> dict:
+        """
+        Phân loại tài liệu bằng AI qua 9router local gateway.
+        Đọc nội dung file nếu có thể để tăng độ chính xác.
+
+        Nếu truyền `ingested` (từ app.ingest), extractor dùng lại buffer đã đọc
+        thay vì đọc file lần nữa; `extracted_text` (text đã trích xuất sẵn,
+        VD: từ cache khi đánh giá offline) thì không đọc file. Nếu tầng luật
+        (RuleClassifier) hoặc mô hình cục bộ (LocalModel) đủ chắc chắn thì trả
+        kết quả luôn, không gọi gateway; `use_rules=False` bỏ qua cả hai tầng.
+        """
+        file_path_obj = Path(file_path)
+
+        if use_rules:
+            rule_result = self._confident_rule_result(file_path_obj)
+            if rule_result is not None:
+                return rule_result
+
+        logger.info(f"Đang phân loại file: {file_path_obj.name} bằng {self.model_name}")
+
+        content_preview = await self._content_preview(
+            file_path_obj, ingested, self.preview_token_budget, extracted_text
+        )
+        if use_rules:
+            local_result = self._local_result(file_path_obj, content_preview)
+            if local_result is not None:
+                return local_result
 
         prompt = f"""
 Bạn là một trợ lý chuyên gia về thiết bị y tế. Nhiệm vụ của bạn là phân loại tài liệu sau.
@@ -72,124 +573,713 @@ Nội dung trích xuất (nếu có):
 {content_preview}
 
 Dựa vào tên file và nội dung, hãy trả về kết quả dưới dạng JSON với CÁC TRƯỜNG SAU (bắt buộc đủ):
-- doc_type: [ky_thuat, cau_hinh, bao_gia, trung_thau, hop_dong, so_sanh, thong_tin, lien_ket, khac]
-- vendor: [Tên hãng sản xuất, viết hoa đúng chuẩn, e.g. GE Healthcare, Philips, Siemens. Ghi "Unknown" nếu không rõ]
-- model: [Model thiết bị, viết hoa đúng chuẩn. Ghi "Unknown" nếu không rõ]
-- category_slug: [ID nhóm thiết bị theo định dạng "nhom_lon/nhom_con", ví dụ: "noi_soi/ong_soi_mem"]
-- summary: [Tóm tắt ngắn gọn nội dung tài liệu bằng tiếng Việt, tối đa 20 từ]
-- confidence: [Số thực từ 0.0 đến 1.0 thể hiện mức độ chắc chắn của phân loại. 1.0 = rất chắc, 0.5 = không chắc]
-
+{_FIELDS_SPEC}
 Lưu ý quan trọng:
-1. Nếu là tài liệu liên quan đến Tim mạch, hãy chọn category_slug là "tim_mach_can_thiep/can_thiep" hoặc tương tự.
-2. Nếu tên file có đủ thông tin rõ ràng (hãng, model), đặt confidence >= 0.8.
+{_RULES_SPEC}
 3. Trả về DUY NHẤT một JSON object hợp lệ.
 """
 
-        url = f"{self.api_base}/chat/completions"
-        headers = {"Authorization": f"Bearer {self.api_key}", "Content-Type": "application/json"}
+        priority = current_priority()
+        await self.usage.admit(priority)
+        calls: list[dict] = []
+        token = _usage_calls.set(calls)
+        result: Any = None
+        content_str: str | None = None
+        try:
+            content_str = await self._complete(prompt, max_retries, validate=_is_valid_result)
+            result = _parse_json_content(content_str)
+            if isinstance(result, list) and len(result) == 1:
+                # Model bọc object trong mảng
+                result = result[0]
+            if not isinstance(result, dict):
+                raise json.JSONDecodeError("Phản hồi không phải JSON object", content_str, 0)
+        except CircuitOpenError as e:
+            return self._degraded_result(file_path_obj, e)
+        except json.JSONDecodeError as jde:
+            if content_str is None:
+                # Body HTTP của gateway không phải JSON (sau mọi lần thử): lỗi gateway,
+                # không phải model trả sai định dạng → để caller báo lỗi như trước
+                raise
+            logger.error(f"9router trả về không đúng định dạng JSON: {content_str} | Lỗi: {jde}")
+            result = {"doc_type": "khac", "summary": "Không thể phân loại tự động"}
+            return result
+        finally:
+            _usage_calls.reset(token)
+            doc_type = result.get("doc_type") if isinstance(result, dict) else None
+            self._record_usage(calls, [str(file_path_obj)], [doc_type], priority)
+        if isinstance(result, dict):
+            result.setdefault("source", "llm")
+        return result
+
+    def _record_usage(
+        self,
+        calls: list[dict],
+        paths: list[str],
+        doc_types: list[str | None],
+        priority: str,
+    ) -> None:
+        """Ghi usage của một lần phân loại; batch được chia đều token cho từng file."""
+        if not calls:
+            return
+        n = len(paths)
+        prompt_tokens = sum(c["prompt_tokens"] for c in calls)
+        completion_tokens = sum(c["completion_tokens"] for c in calls)
+        latency_ms = sum(c["latency_ms"] for c in calls)
+        retries = sum(1 for c in calls if c["failed"])
+        estimated = any(c["estimated"] for c in calls)
+        if n == 1:
+            # Gắn vào trace của file (bench/đánh giá offline đọc từ record "total")
+            annotate(tokens=prompt_tokens + completion_tokens)
+        for i, (path, doc_type) in enumerate(zip(paths, doc_types)):
+            # Request/retry chỉ tính ở file đầu để tổng theo ngày/tháng vẫn đúng
+            self.usage.record(
+                path=path,
+                model=calls[-1]["model"],
+                prompt_tokens=prompt_tokens // n + (prompt_tokens % n if i == 0 else 0),
+                completion_tokens=completion_tokens // n + (completion_tokens % n if i == 0 else 0),
+                latency_ms=latency_ms / n,
+                requests=len(calls) if i == 0 else 0,
+                retries=retries if i == 0 else 0,
+                doc_type=doc_type,
+                priority=priority,
+                estimated=estimated,
+            )
+
+    async def classify_batch(
+        self,
+        items: list[tuple[str, IngestedFile | None]],
+        max_retries: int | None = None,
+        use_rules: bool = True,
+    ) -> list[dict]:
+        """
+        Phân loại nhiều tài liệu, gói tối đa `batch_size` file vào một request.
+
+        Gateway trả về mảng JSON gắn theo id của từng tài liệu; phần tử thiếu
+        hoặc sai định dạng được phân loại lại bằng classify_file riêng lẻ.
+
+        Args:
+            items: Danh sách (file_path, ingested hoặc None)
+
+        Returns:
+            Kết quả theo đúng thứ tự của items
+        """
+        results: list[dict | None] = [None] * len(items)
+        pending: list[int] = []
+        for i, (file_path, ingested) in enumerate(items):
+            if use_rules:
+                results[i] = await self._offline_result(Path(file_path), ingested)
+            if results[i] is None:
+                pending.append(i)
+
+        for start in range(0, len(pending), self.batch_size):
+            chunk = pending[start : start + self.batch_size]
+            batch_results: dict[str, dict] = {}
+            if len(chunk) > 1:
+                try:
+                    batch_results = await self._classify_chunk(
+                        [items[i] for i in chunk], max_retries
+                    )
+                except BudgetExceededError:
+                    raise
+                except Exception as e:
+                    logger.warning(f"Batch {len(chunk)} file lỗi ({e}), chuyển sang gọi từng file.")
+            for pos, i in enumerate(chunk):
+                result = batch_results.get(str(pos + 1))
+                if result is None:
+                    file_path, ingested = items[i]
+                    result = await self.classify_file(
+                        file_path, max_retries=max_retries, ingested=ingested, use_rules=False
+                    )
+                results[i] = result
+        return results
+
+    async def _classify_chunk(
+        self, chunk: list[tuple[str, IngestedFile | None]], max_retries: int | None
+    ) -> dict[str, dict]:
+        """Một request cho cả chunk. Trả về {id: kết quả hợp lệ}, id đánh số từ "1"."""
+        documents = []
+        for doc_id, (file_path, ingested) in enumerate(chunk, start=1):
+            file_path_obj = Path(file_path)
+            preview = await self._content_preview(
+                file_path_obj, ingested, self.batch_preview_tokens
+            )
+            documents.append(
+                f"### id: {doc_id}\nTên file: {file_path_obj.name}\n"
+                f"Nội dung trích xuất (nếu có):\n{preview}"
+            )
+
+        logger.info(f"Đang phân loại batch {len(chunk)} file bằng {self.model_name}")
+        docs_text = "\n\n".join(documents)
+        prompt = (
+            "\nBạn là một trợ lý chuyên gia về thiết bị y tế. Nhiệm vụ của bạn là phân loại"
+            f" {len(chunk)} tài liệu sau, mỗi tài liệu có một id.\n\n"
+            f"{docs_text}\n\n"
+            "Với MỖI tài liệu, dựa vào tên file và nội dung, trả về một phần tử JSON với"
+            ' trường "id" (đúng id ở trên) và CÁC TRƯỜNG SAU (bắt buộc đủ):\n'
+            f"{_FIELDS_SPEC}\n"
+            "Lưu ý quan trọng:\n"
+            f"{_RULES_SPEC}\n"
+            "3. Trả về DUY NHẤT một JSON object hợp lệ dạng"
+            ' {"results": [{"id": "1", ...}, ...]},'
+            f" đủ {len(chunk)} phần tử.\n"
+        )
+
+        priority = current_priority()
+        await self.usage.admit(priority)
+        calls: list[dict] = []
+        token = _usage_calls.set(calls)
+        valid: dict[str, dict] = {}
+        try:
+            with span("classify_batch", size=len(chunk)) as sp:
+                content_str = await self._complete(prompt, max_retries, validate=_is_batch_result)
+                parsed = _parse_json_content(content_str)
+                entries = parsed.get("results", []) if isinstance(parsed, dict) else parsed
+                for entry in entries if isinstance(entries, list) else []:
+                    if not _is_valid_result(entry):
+                        continue
+                    doc_id = str(entry.pop("id", "")).strip()
+                    if doc_id.isdigit() and 1 <= int(doc_id) <= len(chunk):
+                        entry.setdefault("source", "llm")
+                        valid[str(int(doc_id))] = entry
+                sp["valid"] = len(valid)
+        finally:
+            _usage_calls.reset(token)
+            self._record_usage(
+                calls,
+                [str(file_path) for file_path, _ in chunk],
+                [valid.get(str(i), {}).get("doc_type") for i in range(1, len(chunk) + 1)],
+                priority,
+            )
+        if len(valid) < len(chunk):
+            logger.warning(
+                f"Batch trả về {len(valid)}/{len(chunk)} kết quả hợp lệ, gọi lại phần còn thiếu."
+            )
+        return valid
+
+    async def classify_folder(
+        self,
+        items: list[tuple[str, IngestedFile | None]],
+        max_retries: int | None = None,
+    ) -> tuple[dict | None, dict[str, dict]]:
+        """
+        Phân loại các file cùng một thư mục (thường do hãng giao cho một thiết bị)
+        bằng một request: hãng/model/category chung suy ra một lần từ tên thư mục,
+        tên các file và preview `folder_group_context_files` file đầu; mỗi file
+        chỉ cần doc_type + summary. doc_type suy ra được từ luật (thư mục con,
+        từ khóa tên file) được ưu tiên.
+
+        Args:
+            items: (file_path, ingested hoặc None); chỉ `folder_group_max_files` file đầu
+
+        Returns:
+            (thiết bị chung {vendor, model, category_slug, confidence} hoặc None nếu
+            gateway cho rằng các file không cùng thiết bị, {file_path: kết quả})
+        """
+        items = items[: self.folder_group_max_files]
+        folder = Path(items[0][0]).parent.name
+        documents = []
+        for doc_id, (file_path, ingested) in enumerate(items, start=1):
+            file_path_obj = Path(file_path)
+            document = f"### id: {doc_id}\nTên file: {file_path_obj.name}"
+            if doc_id <= self.folder_group_context_files:
+                preview = await self._content_preview(
+                    file_path_obj, ingested, self.batch_preview_tokens
+                )
+                document += f"\nNội dung trích xuất (nếu có):\n{preview}"
+            documents.append(document)
+
+        logger.info(f"Đang phân loại thư mục {folder} ({len(items)} file) bằng {self.model_name}")
+        docs_text = "\n\n".join(documents)
+        prompt = (
+            f"\nBạn là một trợ lý chuyên gia về thiết bị y tế. {len(items)} tài liệu sau nằm"
+            " cùng một thư mục, thường do hãng giao cho MỘT thiết bị (brochure, cấu hình,"
+            " báo giá, hướng dẫn sử dụng...).\n\n"
+            f"Thư mục: {folder}\n\n"
+            f"{docs_text}\n\n"
+            "Hãy xác định thiết bị chung của thư mục (dựa vào tên thư mục, tên các file và"
+            " nội dung) với CÁC TRƯỜNG SAU:\n"
+            f"{_DEVICE_SPEC}"
+            "- same_device: [true nếu các tài liệu thuộc cùng một thiết bị, false nếu không]\n"
+            "- confidence: [Số thực từ 0.0 đến 1.0 thể hiện mức độ chắc chắn về thiết bị"
+            " chung]\n"
+            'Với MỖI tài liệu, trả về một phần tử trong "results" với trường "id"'
+            " (đúng id ở trên) và:\n"
+            f"{_DOC_TYPE_SPEC}"
+            "- summary: [Tóm tắt ngắn gọn bằng tiếng Việt, tối đa 12 từ]\n"
+            "Lưu ý quan trọng:\n"
+            f"{_RULES_SPEC}\n"
+            "3. Trả về DUY NHẤT một JSON object hợp lệ dạng"
+            ' {"same_device": true, "vendor": ..., "model": ..., "category_slug": ...,'
+            ' "confidence": ..., "results": [{"id": "1", "doc_type": ..., "summary": ...},'
+            f" ...]}}, đủ {len(items)} phần tử.\n"
+        )
+
+        priority = current_priority()
+        await self.usage.admit(priority)
+        calls: list[dict] = []
+        token = _usage_calls.set(calls)
+        results: dict[str, dict] = {}
+        doc_types: dict[str, str] = {}
+        try:
+            with span("classify_folder", size=len(items)) as sp:
+                content_str = await self._complete(prompt, max_retries, validate=_is_folder_result)
+                parsed = _parse_json_content(content_str)
+                if not _is_folder_result(parsed):
+                    raise ValueError("Phản hồi thư mục thiếu thiết bị chung hoặc results")
+                for entry in parsed["results"]:
+                    doc_id = str(entry.get("id", "")).strip() if isinstance(entry, dict) else ""
+                    if doc_id.isdigit() and entry.get("doc_type") in _DOC_TYPES:
+                        doc_types[str(int(doc_id))] = entry
+                sp["valid"] = len(doc_types)
+        finally:
+            _usage_calls.reset(token)
+            self._record_usage(
+                calls,
+                [str(file_path) for file_path, _ in items],
+                [doc_types.get(str(i), {}).get("doc_type") for i in range(1, len(items) + 1)],
+                priority,
+            )
+
+        if parsed.get("same_device") is False:
+            logger.info(f"Thư mục {folder}: các file không cùng thiết bị, phân loại riêng lẻ.")
+            return None, {}
+        try:
+            confidence = float(parsed.get("confidence", 0.7))
+        except (TypeError, ValueError):
+            confidence = 0.7
+        identity = {
+            "vendor": parsed["vendor"],
+            "model": parsed["model"],
+            "category_slug": parsed["category_slug"],
+            "confidence": max(0.0, min(confidence, 1.0)),
+        }
+        for doc_id, (file_path, _) in enumerate(items, start=1):
+            entry = doc_types.get(str(doc_id))
+            if entry is None:
+                continue
+            doc_type = entry["doc_type"]
+            rule_result = self.rules.classify(file_path)
+            if rule_result and rule_result["doc_type"] != "khac":
+                doc_type = rule_result["doc_type"]
+            results[str(file_path)] = {
+                **identity,
+                "doc_type": doc_type,
+                "summary": str(entry.get("summary") or ""),
+                "source": "folder_group",
+            }
+        if len(results) < len(items):
+            logger.warning(
+                f"Thư mục {folder}: {len(results)}/{len(items)} file có doc_type, "
+                "gọi lại riêng phần còn thiếu."
+            )
+        return identity, results
+
+    @staticmethod
+    def _message_content(response: httpx.Response) -> str:
+        """Nội dung message từ response không stream (chịu được text thừa sau JSON)."""
+        return MedicalClassifier._response_data(response)["choices"][0]["message"]["content"]
+
+    @staticmethod
+    def _response_data(response: httpx.Response) -> dict:
+        """Body JSON của response không stream (chịu được text thừa sau JSON)."""
+        try:
+            response_data = response.json()
+        except json.JSONDecodeError as de:
+            raw_text = response.text
+            # Proxy (like openrouter via 9router) might append extra data like
+            # `\n\n: OPENROUTER PROCESSING...`
+            # We must extract exactly the first valid JSON object natively.
+            start_idx = raw_text.find("{")
+            if start_idx != -1:
+                try:
+                    response_data, _ = json.JSONDecoder().raw_decode(raw_text[start_idx:])
+                except json.JSONDecodeError as de2:
+                    logger.error(
+                        f"RAW TEXT FROM 9ROUTER (length: {len(raw_text)}): {repr(raw_text)}"
+                    )
+                    raise de2
+            else:
+                raise de
+
+        return response_data
+
+    @staticmethod
+    def _note_usage_fields(data: Any, sp: dict) -> None:
+        """Chép `usage` (prompt/completion token) của gateway vào thuộc tính span."""
+        usage = data.get("usage") if isinstance(data, dict) else None
+        if isinstance(usage, dict):
+            for key in ("prompt_tokens", "completion_tokens"):
+                if isinstance(usage.get(key), int):
+                    sp[key] = usage[key]
+
+    async def _stream_content(
+        self,
+        client: httpx.AsyncClient,
+        route: _Route,
+        url: str,
+        headers: dict,
+        payload: dict,
+        validate: Callable[[Any], bool] | None,
+        sp: dict,
+    ) -> str:
+        """
+        Gọi chat/completions với `stream: true` (SSE), ghép delta dần và đóng
+        stream ngay khi có một JSON object hoàn chỉnh qua được `validate`.
+        Gateway không hỗ trợ SSE (trả JSON thường) vẫn được xử lý như cũ.
+        """
+        async with client.stream("POST", url, headers=headers, json=payload) as response:
+            sp["status"] = response.status_code
+            if response.status_code >= 400:
+                await response.aread()  # Để handler lỗi đọc được body/header
+            response.raise_for_status()
+            route.rate_limiter.on_success(response.headers)
+
+            if "text/event-stream" not in response.headers.get("content-type", ""):
+                await response.aread()
+                data = self._response_data(response)
+                self._note_usage_fields(data, sp)
+                return data["choices"][0]["message"]["content"]
+
+            scanner = _JsonObjectScanner()
+            async for line in response.aiter_lines():
+                # SSE: bỏ dòng trống và comment (": OPENROUTER PROCESSING")
+                if not line.startswith("data:"):
+                    continue
+                data = line[5:].strip()
+                if data == "[DONE]":
+                    break
+                try:
+                    chunk = json.loads(data)
+                    # Chunk cuối có thể kèm `usage` (không thấy nếu dừng sớm → ước lượng)
+                    self._note_usage_fields(chunk, sp)
+                    delta = chunk["choices"][0].get("delta", {}).get("content") or ""
+                except (json.JSONDecodeError, KeyError, IndexError, TypeError, AttributeError):
+                    continue
+                for candidate in scanner.feed(delta):
+                    try:
+                        parsed = json.loads(candidate)
+                    except json.JSONDecodeError:
+                        continue
+                    if validate is None or validate(parsed):
+                        sp["early_stop"] = True
+                        sp["chars"] = len(scanner.text)
+                        # Thoát khỏi `async with` sẽ đóng stream, model ngừng sinh tiếp
+                        return candidate
+            sp["early_stop"] = False
+            sp["chars"] = len(scanner.text)
+            return scanner.text
+
+    async def _complete(
+        self,
+        prompt: str,
+        max_retries: int | None = None,
+        validate: Callable[[Any], bool] | None = None,
+    ) -> str:
+        """
+        Gọi chat/completions (rate limit + retry), trả về nội dung message.
+
+        Thử route chính rồi tới route dự phòng; route đang mở circuit breaker
+        bị bỏ qua ngay. Ở chế độ stream (`services.9router.stream`), trả về
+        JSON object đầu tiên thỏa `validate` ngay khi nhận đủ.
+
+        Raises:
+            CircuitOpenError: Mọi route đều đang mở mạch (không gọi mạng)
+        """
+        if max_retries is None:
+            max_retries = self.max_retries
+
+        last_error: Exception | None = None
+        for index, route in enumerate(self.routes):
+            if not route.breaker.allow():
+                logger.debug("Bỏ qua route '%s' (circuit breaker mở)", route.name)
+                continue
+            retries = max_retries if index == 0 else min(max_retries, self.fallback_max_retries)
+            try:
+                return await self._complete_on_route(route, prompt, retries, validate)
+            except Exception as e:
+                last_error = e
+                if index + 1 < len(self.routes):
+                    logger.warning(f"Route '{route.name}' lỗi ({e}), chuyển sang route dự phòng.")
+        if last_error is None:
+            raise CircuitOpenError("Mọi route 9router đang mở circuit breaker, tạm bỏ qua gọi AI.")
+        raise last_error
+
+    async def _attempt(
+        self,
+        route: _Route,
+        prompt: str,
+        validate: Callable[[Any], bool] | None,
+        attempt: int,
+        hedge: bool = False,
+    ) -> str:
+        """Một lần gọi route (chờ rate limit), ghi kết quả vào circuit breaker."""
+        url = f"{route.base_url}/chat/completions"
+        headers = {"Authorization": f"Bearer {route.api_key}", "Content-Type": "application/json"}
 
         payload = {
-            "model": self.model_name,
+            "model": route.model,
             "messages": [{"role": "user", "content": prompt}],
             "response_format": {"type": "json_object"},
             "temperature": 0.1,
         }
+        if self.stream:
+            payload["stream"] = True
 
-        # Dùng lại retry logic đã có
-        base_delay = 2.0
+        client = self._get_client()
+        started: float | None = None
+        sp: dict = {}
+        try:
+            # Rate Limiting (thời gian chờ token/slot được ghi thành span riêng)
+            async with route.rate_limiter.acquire() as waited:
+                record("rate_limit_wait", waited * 1000)
+                started = time.monotonic()
+                with span(
+                    "gateway", attempt=attempt, route=route.name, stream=self.stream, hedge=hedge
+                ) as sp:
+                    if self.stream:
+                        content = await self._stream_content(
+                            client, route, url, headers, payload, validate, sp
+                        )
+                    else:
+                        response = await client.post(url, headers=headers, json=payload)
+                        sp["status"] = response.status_code
+            if not self.stream:
+                response.raise_for_status()
+                route.rate_limiter.on_success(response.headers)
+                data = self._response_data(response)
+                self._note_usage_fields(data, sp)
+                content = data["choices"][0]["message"]["content"]
+                if validate is not None:
+                    content = _first_valid_json(content, validate)
+        except httpx.HTTPStatusError as e:
+            # 429 là giới hạn tốc độ (limiter xử lý), không tính là gateway lỗi
+            if e.response.status_code != 429:
+                route.breaker.record_failure()
+            self._note_usage(route, prompt, None, sp, started)
+            raise
+        except Exception:
+            route.breaker.record_failure()
+            self._note_usage(route, prompt, None, sp, started)
+            raise
+        route.breaker.record_success((time.monotonic() - started) * 1000)
+        self._note_usage(route, prompt, content, sp, started)
+        return content
 
-        async with httpx.AsyncClient(timeout=self.timeout) as client:
-            for attempt in range(max_retries):
-                try:
-                    # Rate Limiting
-                    async with lock:
-                        now = time.monotonic()
-                        time_since_last = now - self._last_request_time
-                        if time_since_last < self.rate_limit_seconds:
-                            await asyncio.sleep(self.rate_limit_seconds - time_since_last)
-                        self._last_request_time = time.monotonic()
+    @staticmethod
+    def _note_usage(
+        route: _Route, prompt: str, content: str | None, sp: dict, started: float | None
+    ) -> None:
+        """
+        Ghi token/latency của một lần gọi vào lần phân loại đang chạy. Lần gọi
+        lỗi chỉ tính request; thiếu `usage` từ gateway thì ước lượng token.
+        """
+        calls = _usage_calls.get()
+        if calls is None or started is None:
+            return
+        failed = content is None
+        estimated = not failed and "prompt_tokens" not in sp
+        calls.append({
+            "model": route.model,
+            "prompt_tokens": 0 if failed else sp.get("prompt_tokens", estimate_tokens(prompt)),
+            "completion_tokens": 0 if failed else sp.get(
+                "completion_tokens", estimate_tokens(content)
+            ),
+            "latency_ms": (time.monotonic() - started) * 1000,
+            "failed": failed,
+            "estimated": estimated,
+        })
 
-                    response = await client.post(url, headers=headers, json=payload)
-                    response.raise_for_status()
+    async def _hedged_attempt(
+        self,
+        route: _Route,
+        prompt: str,
+        validate: Callable[[Any], bool] | None,
+        attempt: int,
+    ) -> str:
+        """
+        Gọi route; nếu quá p95 latency mà chưa xong thì gửi thêm một request
+        (tới route dự phòng nếu có) và lấy kết quả về trước, hủy request còn lại.
+        """
+        delay_ms = None
+        if self.hedge_enabled:
+            delay_ms = route.breaker.latency_percentile(
+                self.hedge_percentile, self.hedge_min_samples
+            )
+        if delay_ms is None:
+            return await self._attempt(route, prompt, validate, attempt)
 
-                    try:
-                        response_data = response.json()
-                    except json.JSONDecodeError as de:
-                        raw_text = response.text
-                        # Proxy (like openrouter via 9router) might append extra data like `\n\n: OPENROUTER PROCESSING...`
-                        # We must extract exactly the first valid JSON object natively.
-                        start_idx = raw_text.find("{")
-                        if start_idx != -1:
-                            try:
-                                response_data, _ = json.JSONDecoder().raw_decode(
-                                    raw_text[start_idx:]
-                                )
-                            except json.JSONDecodeError as de2:
-                                logger.error(
-                                    f"RAW TEXT FROM 9ROUTER (length: {len(raw_text)}): {repr(raw_text)}"
-                                )
-                                raise de2
-                        else:
-                            raise de
-
-                    content_str = response_data["choices"][0]["message"]["content"]
+        first = asyncio.create_task(self._attempt(route, prompt, validate, attempt))
+        done, _ = await asyncio.wait({first}, timeout=delay_ms / 1000)
+        if done:
+            return first.result()
 
-                    try:
-                        # Clean up markdown code blocks
-                        content_str = content_str.strip()
-                        if content_str.startswith("```json"):
-                            content_str = content_str[7:]
-                        if content_str.startswith("```"):
-                            content_str = content_str[3:]
-                        if content_str.endswith("```"):
-                            content_str = content_str[:-3]
-                        content_str = content_str.strip()
-
-                        # Fallback robust extraction
-                        if "{" in content_str and "}" in content_str:
-                            start_idx = content_str.find("{")
-                            end_idx = content_str.rfind("}") + 1
-                            content_str = content_str[start_idx:end_idx]
-
-                        result = json.loads(content_str)
-                        return result
-                    except json.JSONDecodeError as jde:
-                        logger.error(
-                            f"9router trả về không đúng định dạng JSON: {content_str} | Lỗi: {jde}"
+        hedge_route = next(
+            (r for r in self.routes if r is not route and r.breaker.allow()), route
+        )
+        logger.info(
+            f"Request chậm hơn p{self.hedge_percentile} ({delay_ms:.0f}ms), "
+            f"gửi thêm request tới route '{hedge_route.name}'."
+        )
+        annotate(hedged=True)
+        second = asyncio.create_task(
+            self._attempt(hedge_route, prompt, validate, attempt, hedge=True)
+        )
+        pending = {first, second}
+        error: BaseException | None = None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+
+    @staticmethod
+    def _raise_if_open(route: _Route, error: Exception) -> None:
+        """Breaker vừa mở: bỏ các lần backoff còn lại, chuyển route ngay."""
+        if route.breaker.state == "open":
+            raise CircuitOpenError(f"Route '{route.name}' đang mở circuit breaker.") from error
+
+    async def _complete_on_route(
+        self,
+        route: _Route,
+        prompt: str,
+        max_retries: int,
+        validate: Callable[[Any], bool] | None,
+    ) -> str:
+        """Retry trên một route; dừng ngay nếu circuit breaker của route mở giữa chừng."""
+        # Dùng lại retry logic đã có
+        base_delay = 2.0
+
+        for attempt in range(max_retries):
+            annotate(retries=attempt)
+            if attempt > 0 and not route.breaker.allow():
+                raise CircuitOpenError(f"Route '{route.name}' đang mở circuit breaker.")
+            try:
+                return await self._hedged_attempt(route, prompt, validate, attempt)
+
+            except httpx.HTTPStatusError as e:
+                # Catch 429 Too Many Requests
+                if e.response.status_code == 429:
+                    # Limiter chặn mọi worker tới hết Retry-After (hoặc backoff nếu không có)
+                    route.rate_limiter.on_throttle(
+                        parse_retry_after(e.response.headers.get("retry-after")),
+                        fallback=base_delay * (2**attempt),
+                    )
+                    if attempt < max_retries - 1:
+                        logger.warning(
+                            "Lỗi giới hạn API 9router (429). Thử lại... "
+                            f"(lần {attempt + 1}/{max_retries})"
                         )
-                        return {"doc_type": "khac", "summary": "Không thể phân loại tự động"}
-
-                except httpx.HTTPStatusError as e:
-                    # Catch 429 Too Many Requests
-                    if e.response.status_code == 429:
-                        if attempt < max_retries - 1:
-                            delay = base_delay * (2**attempt)
-                            logger.warning(
-                                f"Lỗi giới hạn API 9router (429). Thử lại sau {delay}s... (lần {attempt + 1}/{max_retries})"
-                            )
-                            await asyncio.sleep(delay)
-                        else:
-                            logger.error(
-                                f"Vượt quá số lần thử lại ({max_retries} lần) do lỗi Rate Limit: {e}"
-                            )
-                            raise Exception("Lỗi API (Rate Limit rớt 5 lần). Vui lòng thử lại sau.")
                     else:
                         logger.error(
-                            f"Lỗi HTTP {e.response.status_code} khi gọi 9router API: {e.response.text}"
+                            f"Vượt quá số lần thử lại ({max_retries} lần) do lỗi Rate Limit: {e}"
                         )
-                        raise Exception(f"HTTP Error: {e.response.status_code}")
-                except httpx.RequestError as e:
-                    logger.error(f"Lỗi kết nối khi gọi 9router API: {e}")
-                    if attempt < max_retries - 1:
-                        await asyncio.sleep(base_delay * (2**attempt))
-                    else:
-                        raise Exception(str(e))
-                except Exception as e:
-                    logger.error(f"Lỗi không xác định: {e}")
-                    if attempt < max_retries - 1:
-                        await asyncio.sleep(base_delay * (2**attempt))
-                    else:
-                        raise e
+                        raise Exception("Lỗi API (Rate Limit rớt 5 lần). Vui lòng thử lại sau.")
+                else:
+                    logger.error(
+                        f"Lỗi HTTP {e.response.status_code} khi gọi 9router API: {e.response.text}"
+                    )
+                    raise Exception(f"HTTP Error: {e.response.status_code}")
+            except httpx.RequestError as e:
+                logger.error(f"Lỗi kết nối khi gọi 9router API: {e}")
+                self._raise_if_open(route, e)
+                if attempt < max_retries - 1:
+                    await asyncio.sleep(base_delay * (2**attempt))
+                else:
+                    raise Exception(str(e))
+            except Exception as e:
+                logger.error(f"Lỗi không xác định: {e}")
+                self._raise_if_open(route, e)
+                if attempt < max_retries - 1:
+                    await asyncio.sleep(base_delay * (2**attempt))
+                else:
+                    raise e
+
+
+class BatchingClassifier:
+    """
+    Gom các lần gọi classify_file đồng thời (VD từ các worker bulk ingest)
+    thành batch cho MedicalClassifier.classify_batch.
+
+    Batch được gửi khi đủ `batch_size` file hoặc sau `max_wait_seconds` kể từ
+    file đầu tiên. Có cùng interface classify_file/close với MedicalClassifier.
+    """
+
+    def __init__(
+        self,
+        classifier: MedicalClassifier,
+        batch_size: int | None = None,
+        max_wait_seconds: float = 0.5,
+    ) -> None:
+        self.classifier = classifier
+        self.batch_size = max(1, batch_size or classifier.batch_size)
+        self.max_wait_seconds = max_wait_seconds
+        self._pending: list[tuple[str, IngestedFile | None, int | None, asyncio.Future]] = []
+        self._timer: asyncio.Task | None = None
+        self._tasks: set[asyncio.Task] = set()
+
+    async def classify_file(
+        self,
+        file_path: str,
+        max_retries: int | None = None,
+        ingested: IngestedFile | None = None,
+        use_rules: bool = True,
+    ) -> dict:
+        if use_rules:
+            # Luật + mô hình cục bộ theo từng file trước khi gom batch (batch chỉ gọi gateway)
+            offline_result = await self.classifier._offline_result(Path(file_path), ingested)
+            if offline_result is not None:
+                return offline_result
+
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((file_path, ingested, max_retries, future))
+        if len(self._pending) >= self.batch_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = asyncio.create_task(self._flush_later())
+        return await future
+
+    async def _flush_later(self) -> None:
+        await asyncio.sleep(self.max_wait_seconds)
+        self._timer = None
+        self._flush()
+
+    def _flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if batch:
+            task = asyncio.create_task(self._run(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, batch: list) -> None:
+        try:
+            results = await self.classifier.classify_batch(
+                [(file_path, ingested) for file_path, ingested, _, _ in batch],
+                max_retries=batch[0][2],
+                use_rules=False,
+            )
+        except Exception as e:
+            for *_, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (*_, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+
+    async def close(self) -> None:
+        """Gửi nốt batch đang chờ rồi đóng classifier bên trong."""
+        self._flush()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        await self.classifier.close()
 
 
 async def main():
@@ -199,8 +1289,8 @@ async def main():
         print("Usage: python classifier.py <file_path>")
         return
 
-    classifier = MedicalClassifier()
-    result = await classifier.classify_file(sys.argv[1])
+    async with MedicalClassifier() as classifier:
+        result = await classifier.classify_file(sys.argv[1])
     print(json.dumps(result, indent=2, ensure_ascii=False))
 
 
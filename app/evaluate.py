@@ -0,0 +1,434 @@
+"""
+evaluate.py — Đánh giá offline classifier trên các file đã confirm.
+
+Lấy mẫu các dòng `confirmed = 1` trong index (nhãn do người dùng xác nhận),
+dùng text đã trích xuất trong cache (preview hoặc bản đầy đủ, không đọc lại
+file) và phân loại lại bằng một cấu hình classifier với số request đồng thời
+giới hạn. Báo cáo độ chính xác theo trường (doc_type, category, vendor),
+confusion matrix, latency p50/p95/p99 và token đã dùng.
+
+So sánh hai cấu hình trên cùng mẫu (`--compare`/`--compare-set`), hoặc với
+báo cáo đã lưu (`--save` rồi `--baseline`) khi thay đổi prompt trong code.
+Mặc định bỏ qua tầng luật và mô hình cục bộ (học từ chính các file này) để
+đo riêng model của gateway; `--with-rules` đánh giá cả pipeline.
+
+Sử dụng:
+    python -m app.evaluate --sample 200 --save data/eval_glm47.json
+    python -m app.evaluate --sample 200 --compare-set services.9router.model=if/glm-5
+    python -m app.evaluate --sample 200 --baseline data/eval_glm47.json
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import copy
+import json
+import logging
+import random
+import tempfile
+import time
+from collections import Counter
+from pathlib import Path
+from typing import Any
+
+import yaml
+
+from app.classifier import MedicalClassifier
+from app.extract_cache import ExtractionCache
+from app.index_store import IndexStore
+from app.preview import PREVIEW_VARIANT
+from app.taxonomy import Taxonomy
+from app.taxonomy_resolver import TaxonomyResolver, get_resolver
+from app.tracing import add_sink, format_summary, remove_sink, summarize, trace_file
+from app.utils import clean_name, percentile
+
+logger = logging.getLogger(__name__)
+
+FIELDS = ("doc_type", "category", "vendor")
+# Confusion matrix chỉ in N nhãn thật phổ biến nhất của mỗi trường
+_CONFUSION_TOP = 8
+
+
+def _truth(row: dict[str, Any]) -> dict[str, str]:
+    """Nhãn đã confirm của một dòng `files`."""
+    return {
+        "doc_type": row.get("doc_type") or "khac",
+        "category": f"{row.get('category_slug') or 'chua_phan_loai'}/"
+        f"{row.get('group_slug') or 'khac'}",
+        "vendor": _vendor(row.get("vendor")),
+    }
+
+
+def _vendor(value: Any) -> str:
+    vendor = str(value or "").strip().lower()
+    return "unknown" if vendor in ("", "unknown", "none") else vendor
+
+
+def _category(raw: str, resolver: TaxonomyResolver | None) -> str:
+    """category_slug AI trả về → "nhom_lon/nhom_con" như process_new_file lưu vào index."""
+    category, _, group = (raw or "").partition("/")
+    category = clean_name(category) or "chua_phan_loai"
+    group = clean_name(group) or "khac"
+    if resolver is not None:
+        resolution = resolver.resolve(category, group)
+        if resolution.category_slug is None:
+            return "chua_phan_loai/khac"
+        return f"{resolution.category_slug}/{resolution.group_slug or 'khac'}"
+    return f"{category}/{group}"
+
+
+def _predicted(result: dict[str, Any], resolver: TaxonomyResolver | None) -> dict[str, str]:
+    return {
+        "doc_type": result.get("doc_type") or "khac",
+        "category": _category(result.get("category_slug", ""), resolver),
+        "vendor": _vendor(result.get("vendor")),
+    }
+
+
+async def load_samples(
+    store: IndexStore,
+    cache: ExtractionCache | None,
+    sample: int | None = None,
+    seed: int = 0,
+) -> tuple[list[tuple[dict[str, Any], str]], int]:
+    """
+    Lấy mẫu các file đã confirm có text trích xuất trong cache.
+
+    Args:
+        sample: Số file tối đa (None → tất cả), chọn ngẫu nhiên theo `seed`
+
+    Returns:
+        ([(dòng index, text)], số file bỏ qua vì chưa có trong cache)
+    """
+    rows = await store.get_confirmed_files()
+    random.Random(seed).shuffle(rows)
+    samples = []
+    missing = 0
+    for row in rows:
+        if sample is not None and len(samples) >= sample:
+            break
+        cached = None
+        if cache is not None:
+            cached = await cache.get(row["sha256"], variant=PREVIEW_VARIANT)
+            cached = cached or await cache.get(row["sha256"])
+        if cached is None:
+            missing += 1
+            continue
+        samples.append((row, cached.content))
+    samples.sort(key=lambda item: item[0]["id"])
+    return samples, missing
+
+
+async def evaluate(
+    classifier: MedicalClassifier,
+    samples: list[tuple[dict[str, Any], str]],
+    concurrency: int = 4,
+    use_rules: bool = False,
+    resolver: TaxonomyResolver | None = None,
+) -> dict[str, Any]:
+    """
+    Phân loại lại các mẫu, tối đa `concurrency` file cùng lúc.
+
+    Returns:
+        Báo cáo {"model", "rows": [...], "stages": summarize() của các span}
+    """
+    records: list[dict[str, Any]] = []
+    rows: list[dict[str, Any]] = []
+    queue: asyncio.Queue = asyncio.Queue()
+    for item in samples:
+        queue.put_nowait(item)
+
+    async def _worker() -> None:
+        while not queue.empty():
+            row, text = queue.get_nowait()
+            entry = {"id": row["id"], "path": row["path"], "truth": _truth(row)}
+            started = time.perf_counter()
+            with trace_file(row["path"]) as trace_id:
+                try:
+                    result = await classifier.classify_file(
+                        row["path"], use_rules=use_rules, extracted_text=text
+                    )
+                    entry["predicted"] = _predicted(result, resolver)
+                    entry["source"] = result.get("source", "llm")
+                except Exception as e:
+                    logger.warning("Phân loại lỗi %s: %s", row["path"], e)
+                    entry["error"] = str(e)
+            entry["latency_ms"] = (time.perf_counter() - started) * 1000
+            entry["trace_id"] = trace_id
+            rows.append(entry)
+
+    add_sink(records.append)
+    try:
+        await asyncio.gather(*(_worker() for _ in range(max(1, concurrency))))
+    finally:
+        remove_sink(records.append)
+
+    tokens = {
+        r["trace_id"]: r.get("tokens", 0) for r in records if r.get("stage") == "total"
+    }
+    for entry in rows:
+        entry["tokens"] = tokens.get(entry.pop("trace_id"), 0)
+    rows.sort(key=lambda entry: entry["id"])
+    return {"model": classifier.model_name, "rows": rows, "stages": summarize(records)}
+
+
+def summarize_report(report: dict[str, Any]) -> dict[str, Any]:
+    """Độ chính xác theo trường, confusion matrix, latency và token của một báo cáo."""
+    rows = report["rows"]
+    ok = [r for r in rows if "predicted" in r]
+    latencies = [r["latency_ms"] for r in ok]
+    tokens = sum(r.get("tokens", 0) for r in rows)
+    summary: dict[str, Any] = {
+        "files": len(rows),
+        "errors": len(rows) - len(ok),
+        "accuracy": {},
+        "confusion": {},
+        "latency_ms": {q: percentile(latencies, q) for q in (50, 95, 99)},
+        "tokens": tokens,
+        "tokens_per_file": tokens / len(rows) if rows else 0.0,
+        "sources": dict(Counter(r.get("source", "error") for r in rows)),
+    }
+    for field in FIELDS:
+        correct = sum(1 for r in ok if r["predicted"][field] == r["truth"][field])
+        # File lỗi tính là sai: cấu hình hay lỗi không được điểm cao hơn
+        summary["accuracy"][field] = correct / len(rows) if rows else 0.0
+        summary["confusion"][field] = Counter(
+            (r["truth"][field], r["predicted"][field]) for r in ok
+        )
+    return summary
+
+
+def format_confusion(confusion: Counter, top: int = _CONFUSION_TOP) -> str:
+    """Bảng confusion (dòng: nhãn thật, cột: nhãn dự đoán); nhãn hiếm gộp vào "(khác)"."""
+    truth_counts = Counter()
+    for (truth, _), n in confusion.items():
+        truth_counts[truth] += n
+    labels = [label for label, _ in truth_counts.most_common(top)]
+    other = "(khác)"
+
+    def _bucket(label: str) -> str:
+        return label if label in labels else other
+
+    cells = Counter()
+    for (truth, predicted), n in confusion.items():
+        cells[(_bucket(truth), _bucket(predicted))] += n
+    columns = labels + ([other] if any(k[1] == other for k in cells) else [])
+    rows = labels + ([other] if any(k[0] == other for k in cells) else [])
+    width = max([len(label) for label in rows + columns] + [6]) + 2
+    lines = [" " * width + "".join(f"{label[:width - 1]:>{width}}" for label in columns)]
+    for truth in rows:
+        line = f"{truth[:width - 1]:<{width}}"
+        line += "".join(f"{cells[(truth, predicted)] or '.':>{width}}" for predicted in columns)
+        lines.append(line)
+    return "\n".join(lines)
+
+
+def format_report(name: str, report: dict[str, Any], summary: dict[str, Any]) -> str:
+    """Báo cáo text của một cấu hình."""
+    lat = summary["latency_ms"]
+    lines = [
+        f"=== {name} (model {report['model']}) ===",
+        f"File: {summary['files']}  lỗi: {summary['errors']}  nguồn: {summary['sources']}",
+        "Độ chính xác: "
+        + "  ".join(f"{field} {summary['accuracy'][field]:.1%}" for field in FIELDS),
+        f"Latency/file: p50 {lat[50]:.0f}ms  p95 {lat[95]:.0f}ms  p99 {lat[99]:.0f}ms",
+        f"Token: {summary['tokens']:,} ({summary['tokens_per_file']:.0f}/file)",
+    ]
+    for field in ("doc_type", "category"):
+        lines += ["", f"Confusion {field}:", format_confusion(summary["confusion"][field])]
+    if report.get("stages"):
+        lines += ["", format_summary(report["stages"])]
+    return "\n".join(lines)
+
+
+def format_comparison(
+    reports: tuple[dict[str, Any], dict[str, Any]],
+    summaries: tuple[dict[str, Any], dict[str, Any]],
+    names: tuple[str, str],
+) -> str:
+    """So sánh hai cấu hình trên các file có trong cả hai báo cáo."""
+    a, b = summaries
+    lines = [
+        f"=== So sánh {names[0]} → {names[1]} ===",
+        f"{'':<22}{names[0][:14]:>16}{names[1][:14]:>16}{'Δ':>10}",
+    ]
+    for field in FIELDS:
+        va, vb = a["accuracy"][field], b["accuracy"][field]
+        lines.append(f"{'acc ' + field:<22}{va:>16.1%}{vb:>16.1%}{(vb - va) * 100:>+10.1f}")
+    for q in (50, 95, 99):
+        va, vb = a["latency_ms"][q], b["latency_ms"][q]
+        lines.append(f"{f'latency p{q} ms':<22}{va:>16.0f}{vb:>16.0f}{vb - va:>+10.0f}")
+    va, vb = a["tokens_per_file"], b["tokens_per_file"]
+    lines.append(f"{'token/file':<22}{va:>16.0f}{vb:>16.0f}{vb - va:>+10.0f}")
+    lines.append(f"{'lỗi':<22}{a['errors']:>16}{b['errors']:>16}{b['errors'] - a['errors']:>+10}")
+
+    # File đổi kết quả: đúng → sai và sai → đúng (từng trường)
+    by_id = {r["id"]: r for r in reports[0]["rows"]}
+    for field in FIELDS:
+        fixed = broken = 0
+        for row in reports[1]["rows"]:
+            base = by_id.get(row["id"])
+            if base is None:
+                continue
+            ok_a = base.get("predicted", {}).get(field) == base["truth"][field]
+            ok_b = row.get("predicted", {}).get(field) == row["truth"][field]
+            fixed += ok_b and not ok_a
+            broken += ok_a and not ok_b
+        lines.append(f"{field}: {fixed} file sai → đúng, {broken} file đúng → sai")
+    return "\n".join(lines)
+
+
+def _common(
+    first: dict[str, Any], second: dict[str, Any]
+) -> tuple[dict[str, Any], dict[str, Any]]:
+    """Giữ các dòng có trong cả hai báo cáo (baseline có thể lấy mẫu khác)."""
+    ids = {r["id"] for r in first["rows"]} & {r["id"] for r in second["rows"]}
+    return (
+        {**first, "rows": [r for r in first["rows"] if r["id"] in ids]},
+        {**second, "rows": [r for r in second["rows"] if r["id"] in ids]},
+    )
+
+
+def _parse_overrides(items: list[str]) -> dict[str, Any]:
+    """`a.b.c=giá trị` (giá trị đọc bằng YAML) → {"a.b.c": giá trị}."""
+    overrides = {}
+    for item in items:
+        key, sep, value = item.partition("=")
+        if not sep or not key:
+            raise ValueError(f"Override phải có dạng khóa=giá_trị: {item}")
+        overrides[key.strip()] = yaml.safe_load(value)
+    return overrides
+
+
+def apply_overrides(config: dict[str, Any], overrides: dict[str, Any]) -> dict[str, Any]:
+    """Bản sao config với các khóa dạng `services.9router.model` được ghi đè."""
+    config = copy.deepcopy(config)
+    for key, value in overrides.items():
+        node = config
+        *parents, leaf = key.split(".")
+        for part in parents:
+            node = node.setdefault(part, {})
+        node[leaf] = value
+    return config
+
+
+def _write_config(config: dict[str, Any], path: Path) -> str:
+    # Chỉ dùng text trong cache: không cần worker process trích xuất
+    config = apply_overrides(config, {"extraction.pool_workers": 0})
+    path.write_text(yaml.safe_dump(config, allow_unicode=True), encoding="utf-8")
+    return str(path)
+
+
+async def _run_config(
+    config: dict[str, Any],
+    path: Path,
+    samples: list[tuple[dict[str, Any], str]],
+    args: argparse.Namespace,
+    resolver: TaxonomyResolver | None,
+) -> dict[str, Any]:
+    async with MedicalClassifier(_write_config(config, path)) as classifier:
+        return await evaluate(classifier, samples, args.concurrency, args.with_rules, resolver)
+
+
+async def _main(args: argparse.Namespace) -> None:
+    with open(args.config, encoding="utf-8") as f:
+        base = yaml.safe_load(f)
+    config_a = apply_overrides(base, _parse_overrides(args.set))
+    config_b = None
+    if args.compare or args.compare_set:
+        other = base
+        if args.compare:
+            with open(args.compare, encoding="utf-8") as f:
+                other = yaml.safe_load(f)
+        config_b = apply_overrides(other, _parse_overrides(args.compare_set))
+
+    store = IndexStore(base["paths"]["db_file"])
+    await store.init()
+    try:
+        samples, missing = await load_samples(
+            store, ExtractionCache.from_config(base), args.sample, args.seed
+        )
+    finally:
+        await store.close()
+    logger.info(
+        "Đánh giá %d file đã confirm (%d file chưa có text trong cache)", len(samples), missing
+    )
+    if not samples:
+        return
+
+    resolver = None
+    try:
+        resolver = get_resolver(Taxonomy(base["paths"]["taxonomy_file"]), base)
+    except Exception as e:
+        logger.warning("Không nạp được taxonomy, so category thô: %s", e)
+
+    with tempfile.TemporaryDirectory(prefix="mdb_eval_") as tmp:
+        report = await _run_config(config_a, Path(tmp) / "a.yaml", samples, args, resolver)
+        other_report = None
+        if config_b is not None:
+            other_report = await _run_config(
+                config_b, Path(tmp) / "b.yaml", samples, args, resolver
+            )
+
+    name = args.name or report["model"]
+    summary = summarize_report(report)
+    print(format_report(name, report, summary))
+    if args.save:
+        Path(args.save).write_text(
+            json.dumps({"name": name, **report}, ensure_ascii=False, indent=2), encoding="utf-8"
+        )
+
+    if other_report is not None:
+        other_name = other_report["model"]
+        if other_name == report["model"]:
+            other_name += " (B)"
+        print()
+        print(format_report(other_name, other_report, summarize_report(other_report)))
+        pair = (report, other_report)
+        names = (name, other_name)
+    elif args.baseline:
+        baseline = json.loads(Path(args.baseline).read_text(encoding="utf-8"))
+        pair = _common(baseline, report)
+        names = (baseline.get("name", "baseline"), name)
+    else:
+        return
+    print()
+    print(format_comparison(pair, (summarize_report(pair[0]), summarize_report(pair[1])), names))
+
+
+def main() -> None:
+    """Entry point cho lệnh đánh giá classifier."""
+    parser = argparse.ArgumentParser(
+        description="Đánh giá offline classifier trên các file đã confirm"
+    )
+    parser.add_argument("--config", default="config.yaml", help="Đường dẫn config.yaml")
+    parser.add_argument(
+        "--set", action="append", default=[], metavar="KHÓA=GIÁ_TRỊ",
+        help="Ghi đè config, VD services.9router.model=if/glm-5 (lặp lại được)",
+    )
+    parser.add_argument("--compare", help="Config thứ hai để so sánh trên cùng mẫu")
+    parser.add_argument(
+        "--compare-set", action="append", default=[], metavar="KHÓA=GIÁ_TRỊ",
+        help="Ghi đè cho cấu hình so sánh (mặc định dựa trên --config)",
+    )
+    parser.add_argument("--sample", type=int, default=None, help="Số file lấy mẫu (mặc định: hết)")
+    parser.add_argument("--seed", type=int, default=0, help="Seed lấy mẫu (giữ nguyên để so sánh)")
+    parser.add_argument("--concurrency", type=int, default=4, help="Số file phân loại đồng thời")
+    parser.add_argument(
+        "--with-rules", action="store_true", help="Bật tầng luật và mô hình cục bộ"
+    )
+    parser.add_argument("--name", help="Tên cấu hình trong báo cáo (mặc định: model)")
+    parser.add_argument("--save", help="Lưu báo cáo JSON (dùng làm --baseline sau này)")
+    parser.add_argument("--baseline", help="Báo cáo JSON đã lưu để so sánh")
+    args = parser.parse_args()
+
+    logging.basicConfig(
+        format="%(asctime)s - %(name)s - %(levelname)s - %(message)s", level=logging.WARNING
+    )
+    logger.setLevel(logging.INFO)
+    asyncio.run(_main(args))
+
+
+if __name__ == "__main__":
+    main()
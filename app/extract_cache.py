@@ -0,0 +1,195 @@
+"""
+extract_cache.py — Cache kết quả trích xuất trên đĩa, theo sha256 nội dung file.
+
+Mỗi entry là một file JSON nén gzip trong `paths.extracted_cache_dir`
+(text, metadata, MIME type, phiên bản extractor). Entry của extractor cũ
+bị coi như miss. Dung lượng được giới hạn bằng LRU: lần đọc trúng cập nhật
+mtime, khi vượt `extraction.cache_max_mb` thì xóa các entry lâu chưa dùng.
+
+Sử dụng:
+    cache = ExtractionCache.from_config(config)
+    result = await extract_content(ingested, cache=cache)
+"""
+
+from __future__ import annotations
+
+import asyncio
+import gzip
+import json
+import logging
+import os
+import threading
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any
+
+import kreuzberg
+
+logger = logging.getLogger(__name__)
+
+# Đổi khi thay đổi định dạng entry hoặc cách trích xuất (VD giới hạn trang)
+_CACHE_FORMAT = 1
+EXTRACTOR_VERSION = f"kreuzberg-{kreuzberg.__version__}/cache-{_CACHE_FORMAT}"
+
+DEFAULT_CACHE_MAX_MB = 1024
+_SUFFIX = ".json.gz"
+
+
+@dataclass
+class CachedExtraction:
+    """Kết quả trích xuất đọc từ cache (cùng thuộc tính chính với ExtractionResult)."""
+
+    content: str
+    mime_type: str | None = None
+    metadata: dict[str, Any] = field(default_factory=dict)
+    extractor_version: str = EXTRACTOR_VERSION
+
+
+def _json_safe(value: Any) -> Any:
+    """Giữ lại phần metadata serialize được sang JSON."""
+    try:
+        json.dumps(value)
+        return value
+    except (TypeError, ValueError):
+        if isinstance(value, dict):
+            return {str(k): _json_safe(v) for k, v in value.items()}
+        if isinstance(value, list | tuple):
+            return [_json_safe(v) for v in value]
+        return str(value)
+
+
+class ExtractionCache:
+    """
+    Cache trích xuất content-addressed với giới hạn dung lượng (LRU).
+
+    Args:
+        cache_dir: Thư mục cache
+        max_bytes: Tổng dung lượng tối đa (bytes, đã nén)
+    """
+
+    def __init__(self, cache_dir: str | Path, max_bytes: int = DEFAULT_CACHE_MAX_MB * 1024 * 1024):
+        self._dir = Path(cache_dir)  # Tạo lười ở lần ghi đầu tiên
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._total_bytes: int | None = None  # Tính lười ở lần ghi đầu tiên
+        self.hits = 0
+        self.misses = 0
+
+    @classmethod
+    def from_config(cls, config: dict[str, Any]) -> ExtractionCache | None:
+        """Tạo cache từ config.yaml; None nếu tắt hoặc không khai báo thư mục."""
+        extraction_cfg = config.get("extraction", {})
+        cache_dir = config.get("paths", {}).get("extracted_cache_dir")
+        if not cache_dir or not extraction_cfg.get("cache_enabled", True):
+            return None
+        max_mb = extraction_cfg.get("cache_max_mb", DEFAULT_CACHE_MAX_MB)
+        return cls(os.path.expandvars(os.path.expanduser(cache_dir)), int(max_mb * 1024 * 1024))
+
+    def _path(self, sha256: str, variant: str = "") -> Path:
+        # Chia thư mục con theo 2 ký tự đầu để tránh một thư mục quá nhiều file.
+        # variant (VD "preview") lưu cạnh bản đầy đủ nhưng không ghi đè nhau.
+        name = f"{sha256}-{variant}" if variant else sha256
+        return self._dir / sha256[:2] / f"{name}{_SUFFIX}"
+
+    # ------------------------------------------------------------------
+    # Sync (chạy trong thread pool)
+    # ------------------------------------------------------------------
+
+    def get_sync(self, sha256: str, variant: str = "") -> CachedExtraction | None:
+        path = self._path(sha256, variant)
+        try:
+            with gzip.open(path, "rt", encoding="utf-8") as f:
+                entry = json.load(f)
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        except (OSError, EOFError, json.JSONDecodeError) as e:
+            logger.warning(f"Entry cache hỏng {path.name}: {e}")
+            path.unlink(missing_ok=True)
+            self.misses += 1
+            return None
+
+        if entry.get("extractor_version") != EXTRACTOR_VERSION:
+            self.misses += 1
+            return None
+
+        try:
+            os.utime(path)  # Đánh dấu vừa dùng (LRU)
+        except OSError:
+            pass
+        self.hits += 1
+        return CachedExtraction(
+            content=entry.get("content", ""),
+            mime_type=entry.get("mime_type"),
+            metadata=entry.get("metadata", {}),
+            extractor_version=entry["extractor_version"],
+        )
+
+    def put_sync(self, sha256: str, result: Any, variant: str = "") -> None:
+        entry = {
+            "extractor_version": EXTRACTOR_VERSION,
+            "content": result.content or "",
+            "mime_type": getattr(result, "mime_type", None),
+            "metadata": _json_safe(getattr(result, "metadata", None) or {}),
+            "created": time.time(),
+        }
+        path = self._path(sha256, variant)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        old_size = path.stat().st_size if path.exists() else 0
+        with gzip.open(tmp, "wt", encoding="utf-8", compresslevel=6) as f:
+            json.dump(entry, f, ensure_ascii=False)
+        os.replace(tmp, path)
+
+        with self._lock:
+            if self._total_bytes is None:
+                self._total_bytes = self._scan_size()
+            else:
+                self._total_bytes += path.stat().st_size - old_size
+            if self._total_bytes > self.max_bytes:
+                self._evict()
+
+    def _entries(self) -> list[tuple[float, int, Path]]:
+        entries = []
+        for path in self._dir.glob(f"*/*{_SUFFIX}"):
+            try:
+                st = path.stat()
+            except OSError:
+                continue
+            entries.append((st.st_mtime, st.st_size, path))
+        return entries
+
+    def _scan_size(self) -> int:
+        return sum(size for _, size, _ in self._entries())
+
+    def _evict(self) -> None:
+        """Xóa entry ít dùng gần đây nhất tới khi còn ~90% giới hạn."""
+        target = int(self.max_bytes * 0.9)
+        entries = sorted(self._entries())
+        total = sum(size for _, size, _ in entries)
+        removed = 0
+        for _, size, path in entries:
+            if total <= target:
+                break
+            path.unlink(missing_ok=True)
+            total -= size
+            removed += 1
+        self._total_bytes = total
+        if removed:
+            logger.info(f"Cache trích xuất: đã xóa {removed} entry cũ (LRU)")
+
+    # ------------------------------------------------------------------
+    # Async API
+    # ------------------------------------------------------------------
+
+    async def get(self, sha256: str, variant: str = "") -> CachedExtraction | None:
+        """Đọc kết quả trích xuất đã cache (None nếu miss/khác phiên bản)."""
+        return await asyncio.to_thread(self.get_sync, sha256, variant)
+
+    async def put(self, sha256: str, result: Any, variant: str = "") -> None:
+        """Lưu kết quả trích xuất (lỗi ghi cache chỉ log, không làm hỏng pipeline)."""
+        try:
+            await asyncio.to_thread(self.put_sync, sha256, result, variant)
+        except OSError as e:
+            logger.warning(f"Không ghi được cache trích xuất: {e}")
@@ -0,0 +1,295 @@
+"""
+extract_pool.py — Chạy kreuzberg trong pool tiến trình con (sandbox).
+
+Trích xuất trong event loop của watcher: một PDF hỏng/khổng lồ có thể treo
+consumer hoặc đẩy RAM lên tới khi daemon bị kill. Pool này chạy mỗi job
+trong một worker process riêng:
+- Timeout theo wall-clock cho từng job (`extraction.pool_timeout_seconds`)
+- Giới hạn RSS: parent theo dõi `/proc/<pid>/statm` trong lúc chờ
+  (`extraction.pool_max_rss_mb`)
+- Tái tạo worker sau N job (`extraction.pool_max_jobs_per_worker`)
+- Worker chết/treo bị kill và thay mới, không ảnh hưởng job khác
+
+Lỗi trả về dưới dạng `ExtractionError` có `kind` (timeout/memory/crash/error).
+
+Sử dụng:
+    pool = ExtractionPool.from_config(config)
+    result = await extract_content(ingested, cache=cache, pool=pool)
+    await pool.close()
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import multiprocessing
+import os
+import signal
+import time
+from collections.abc import Callable
+from pathlib import Path
+from typing import Any
+
+from app.extract_cache import CachedExtraction, _json_safe
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_POOL_WORKERS = 2
+DEFAULT_POOL_TIMEOUT_SECONDS = 120.0
+DEFAULT_POOL_MAX_RSS_MB = 2048
+DEFAULT_POOL_MAX_JOBS_PER_WORKER = 50
+
+# Chu kỳ kiểm tra kết quả / RSS của worker (giây)
+_POLL_INTERVAL = 0.1
+
+
+class ExtractionError(Exception):
+    """
+    Trích xuất thất bại trong worker.
+
+    Attributes:
+        kind: "timeout" | "memory" | "crash" | "error"
+        path: File đang trích xuất
+        detail: Mô tả lỗi
+    """
+
+    def __init__(self, kind: str, path: str | Path, detail: str):
+        self.kind = kind
+        self.path = str(path)
+        self.detail = detail
+        super().__init__(f"[{kind}] {Path(self.path).name}: {detail}")
+
+    def to_dict(self) -> dict[str, str]:
+        return {"kind": self.kind, "path": self.path, "detail": self.detail}
+
+
+def _extract(
+    path: str, data: bytes | None, mime_type: str | None, ocr_language: str | None = None
+) -> dict[str, Any]:
+    """Extractor mặc định (chạy trong worker). `ocr_language` → bắt buộc OCR (tesseract)."""
+    import kreuzberg
+
+    config = None
+    if ocr_language:
+        config = kreuzberg.ExtractionConfig(
+            force_ocr=True, ocr=kreuzberg.OcrConfig(backend="tesseract", language=ocr_language)
+        )
+    if data is not None and mime_type:
+        result = kreuzberg.extract_bytes_sync(data, mime_type, config)
+    else:
+        result = kreuzberg.extract_file_sync(path, mime_type, config=config)
+    return {
+        "content": result.content or "",
+        "mime_type": getattr(result, "mime_type", None),
+        "metadata": _json_safe(getattr(result, "metadata", None) or {}),
+    }
+
+
+def _worker_main(conn: Any, extractor: Callable[..., dict[str, Any]]) -> None:
+    """Vòng lặp của worker: nhận job qua pipe, trả ("ok", payload) hoặc ("error", msg)."""
+    # Ctrl+C do tiến trình cha xử lý (đóng pool), worker không tự thoát giữa job
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    while True:
+        try:
+            job = conn.recv()
+        except (EOFError, OSError):
+            break
+        if job is None:
+            break
+        try:
+            conn.send(("ok", extractor(*job)))
+        except Exception as e:
+            conn.send(("error", f"{type(e).__name__}: {e}"))
+
+
+def _rss_bytes(pid: int) -> int | None:
+    """RSS hiện tại của tiến trình (Linux /proc), None nếu không đọc được."""
+    try:
+        with open(f"/proc/{pid}/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+class _Worker:
+    """Một tiến trình con cùng pipe điều khiển."""
+
+    def __init__(self, ctx: Any, extractor: Callable[..., dict[str, Any]]):
+        self.conn, child_conn = ctx.Pipe()
+        self.process = ctx.Process(
+            target=_worker_main, args=(child_conn, extractor), daemon=True
+        )
+        self.process.start()
+        child_conn.close()
+        self.jobs = 0
+
+    @property
+    def pid(self) -> int | None:
+        return self.process.pid
+
+    def run(self, job: tuple, timeout: float, max_rss_bytes: int | None) -> tuple[str, Any]:
+        """
+        Gửi job và chờ kết quả (blocking, chạy trong thread).
+
+        Returns:
+            ("ok", payload) | ("error", msg) | ("timeout"/"memory"/"crash", msg)
+        """
+        try:
+            self.conn.send(job)
+        except (OSError, ValueError) as e:
+            return "crash", f"không gửi được job: {e}"
+        self.jobs += 1
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                if self.conn.poll(_POLL_INTERVAL):
+                    return self.conn.recv()
+            except (EOFError, OSError):
+                pass
+            if not self.process.is_alive():
+                return "crash", f"worker thoát với mã {self.process.exitcode}"
+            if time.monotonic() > deadline:
+                self.kill()
+                return "timeout", f"quá {timeout:.0f}s"
+            if max_rss_bytes is not None:
+                rss = _rss_bytes(self.process.pid)
+                if rss is not None and rss > max_rss_bytes:
+                    self.kill()
+                    return "memory", f"RSS {rss // (1024 * 1024)}MB vượt giới hạn"
+
+    def rss(self) -> int | None:
+        return _rss_bytes(self.process.pid) if self.process.pid else None
+
+    def stop(self, grace: float = 2.0) -> None:
+        """Dừng nhẹ nhàng (gửi None), kill nếu không thoát kịp."""
+        try:
+            self.conn.send(None)
+        except (OSError, ValueError):
+            pass
+        self.process.join(grace)
+        self.kill()
+
+    def kill(self) -> None:
+        if self.process.is_alive():
+            self.process.kill()
+            self.process.join(1.0)
+        self.conn.close()
+
+
+class ExtractionPool:
+    """
+    Pool worker process cho kreuzberg, tạo lười ở job đầu tiên.
+
+    Args:
+        workers: Số worker (số job trích xuất chạy song song)
+        timeout_seconds: Thời gian tối đa cho một job
+        max_rss_mb: RSS tối đa của worker (None → không giới hạn)
+        max_jobs_per_worker: Tái tạo worker sau N job (tránh rò rỉ bộ nhớ)
+        extractor: Hàm top-level (pickle được) chạy trong worker,
+            nhận (path, data, mime_type[, ocr_language]) và trả dict
+            content/mime_type/metadata
+    """
+
+    def __init__(
+        self,
+        workers: int = DEFAULT_POOL_WORKERS,
+        timeout_seconds: float = DEFAULT_POOL_TIMEOUT_SECONDS,
+        max_rss_mb: int | None = DEFAULT_POOL_MAX_RSS_MB,
+        max_jobs_per_worker: int = DEFAULT_POOL_MAX_JOBS_PER_WORKER,
+        extractor: Callable[..., dict[str, Any]] = _extract,
+    ):
+        self.workers = max(1, workers)
+        self.timeout_seconds = timeout_seconds
+        self.max_rss_bytes = max_rss_mb * 1024 * 1024 if max_rss_mb else None
+        self.max_jobs_per_worker = max(1, max_jobs_per_worker)
+        self._extractor = extractor
+        # spawn: không fork event loop/thread của tiến trình cha
+        self._ctx = multiprocessing.get_context("spawn")
+        self._slots = asyncio.Semaphore(self.workers)
+        self._idle: list[_Worker] = []
+        self.failures: dict[str, int] = {}
+
+    @classmethod
+    def from_config(cls, config: dict[str, Any]) -> ExtractionPool | None:
+        """Tạo pool từ `extraction` trong config.yaml; None nếu `pool_workers` = 0."""
+        cfg = config.get("extraction", {})
+        workers = cfg.get("pool_workers", DEFAULT_POOL_WORKERS)
+        if not workers:
+            return None
+        return cls(
+            workers=workers,
+            timeout_seconds=cfg.get("pool_timeout_seconds", DEFAULT_POOL_TIMEOUT_SECONDS),
+            max_rss_mb=cfg.get("pool_max_rss_mb", DEFAULT_POOL_MAX_RSS_MB),
+            max_jobs_per_worker=cfg.get(
+                "pool_max_jobs_per_worker", DEFAULT_POOL_MAX_JOBS_PER_WORKER
+            ),
+        )
+
+    def _release(self, worker: _Worker) -> None:
+        """Trả worker về pool, hoặc tái tạo nếu đã đủ số job / RSS quá cao."""
+        rss = worker.rss()
+        if worker.jobs >= self.max_jobs_per_worker or (
+            self.max_rss_bytes is not None and rss is not None and rss > self.max_rss_bytes * 0.8
+        ):
+            worker.stop()
+        else:
+            self._idle.append(worker)
+
+    async def extract(
+        self,
+        path: str | Path,
+        data: bytes | None = None,
+        mime_type: str | None = None,
+        ocr_language: str | None = None,
+    ) -> CachedExtraction:
+        """
+        Trích xuất một file trong worker.
+
+        Args:
+            path: Đường dẫn file (worker tự đọc nếu không có `data`)
+            data: Buffer đã đọc sẵn (IngestedFile.data, tối đa `max_buffer_bytes`)
+                hoặc vài trang PDF cắt cho preview/OCR. Được pickle qua pipe:
+                đổi một bản sao trong RAM lấy việc không đọc lại file qua NAS
+            mime_type: MIME type cho extract_bytes / extract_file
+            ocr_language: Bắt buộc OCR với ngôn ngữ tesseract này (app.ocr)
+
+        Raises:
+            ExtractionError: timeout / memory / crash / lỗi của extractor
+        """
+        job = (str(path), data, mime_type)
+        if ocr_language:
+            job += (ocr_language,)
+        async with self._slots:
+            worker = self._idle.pop() if self._idle else None
+            if worker is None:
+                worker = await asyncio.to_thread(_Worker, self._ctx, self._extractor)
+            try:
+                status, payload = await asyncio.to_thread(
+                    worker.run, job, self.timeout_seconds, self.max_rss_bytes
+                )
+            except BaseException:
+                # Bị hủy giữa chừng: không biết worker đang ở trạng thái nào
+                worker.kill()
+                raise
+
+            if status in ("ok", "error"):
+                self._release(worker)
+            else:
+                worker.kill()
+
+        if status == "ok":
+            return CachedExtraction(
+                content=payload["content"],
+                mime_type=payload.get("mime_type"),
+                metadata=payload.get("metadata", {}),
+            )
+        self.failures[status] = self.failures.get(status, 0) + 1
+        error = ExtractionError(status, path, payload)
+        logger.warning(f"Trích xuất lỗi: {error}")
+        raise error
+
+    async def close(self) -> None:
+        """Dừng mọi worker đang rảnh (gọi khi tắt watcher/script)."""
+        idle, self._idle = self._idle, []
+        for worker in idle:
+            await asyncio.to_thread(worker.stop)
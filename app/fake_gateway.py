@@ -0,0 +1,458 @@
+"""
+fake_gateway.py — Gateway giả lập tương thích OpenAI để test/load-test classifier.
+
+Thay cho 9router khi chạy offline: server HTTP/1.1 (keep-alive) tối giản
+trên asyncio, trả lời `POST /v1/chat/completions` bằng JSON phân loại suy
+ra từ tên file trong prompt (prompt đơn lẻ, batch `### id: N` hoặc nhóm
+`Thư mục:` cùng thiết bị).
+Hành vi lỗi cấu hình qua `GatewayProfile`:
+- Latency theo phân phối log-normal / uniform / cố định
+- Chuỗi 429 liên tiếp (burst) kèm `Retry-After`
+- Body JSON thừa đuôi (VD `: OPENROUTER PROCESSING`) hoặc nội dung không phải JSON
+- Lỗi 503 (gateway/upstream sập) và request treo quá timeout của client
+- Model "nói nhiều": văn xuôi sau JSON, sinh theo từng chunk (`stream: true` → SSE)
+
+`GET /stats` trả về bộ đếm theo loại phản hồi.
+
+Sử dụng:
+    python -m app.fake_gateway --port 20128 --latency-ms 800 --burst-429-prob 0.05
+    # hoặc trong test
+    async with FakeGateway(GatewayProfile(latency_ms=20)) as gateway:
+        config["services"]["9router"]["base_url"] = gateway.base_url
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import logging
+import random
+import re
+import time
+import zlib
+from collections import Counter
+from collections.abc import AsyncIterator
+from dataclasses import dataclass
+from typing import Any
+
+logger = logging.getLogger(__name__)
+
+_MALFORMED_SUFFIX = "\n\n: OPENROUTER PROCESSING\n\n"
+_FILENAME_RE = re.compile(r"Tên file: (.+)")
+_BATCH_ID_RE = re.compile(r"### id: (\d+)\nTên file: (.+)")
+_FOLDER_RE = re.compile(r"Thư mục: (.+)")
+_VERBOSE_TEXT = (
+    "\n\nGiải thích: tài liệu được phân loại dựa trên tên file và nội dung trích xuất. "
+)
+
+_DOC_TYPE_KEYWORDS = {
+    "bao_gia": ("bao_gia", "quotation", "quote"),
+    "hop_dong": ("hop_dong", "contract"),
+    "trung_thau": ("trung_thau", "award"),
+    "cau_hinh": ("cau_hinh", "config"),
+    "so_sanh": ("so_sanh", "compare"),
+    "ky_thuat": ("manual", "spec", "ky_thuat"),
+}
+_VENDORS = ("GE Healthcare", "Philips", "Siemens Healthineers", "Olympus", "Mindray", "Dräger")
+
+_REASONS = {
+    200: "OK",
+    404: "Not Found",
+    405: "Method Not Allowed",
+    429: "Too Many Requests",
+    503: "Service Unavailable",
+}
+
+
+@dataclass
+class GatewayProfile:
+    """
+    Hành vi của gateway giả lập.
+
+    Attributes:
+        latency_ms: Latency trung vị (ms)
+        latency_distribution: "lognormal" | "uniform" | "fixed"
+        latency_sigma: Độ lệch của log-normal (đuôi p99 dài khi tăng)
+        burst_429_prob: Xác suất bắt đầu một chuỗi 429 ở mỗi request
+        burst_429_length: Số 429 liên tiếp trong một chuỗi
+        retry_after_seconds: Giá trị header Retry-After (None → không gửi header)
+        malformed_rate: Tỉ lệ body JSON bị nối thêm text thừa
+        invalid_content_rate: Tỉ lệ message content không phải JSON
+        list_reply_rate: Tỉ lệ phản hồi đơn bọc trong mảng một phần tử (`[{...}]`)
+        ratelimit_reset_ms: Gửi `X-RateLimit-Remaining: 0` và `X-RateLimit-Reset`
+            dạng epoch ms (kiểu OpenRouter), hết hạn sau N ms (None → không gửi)
+        error_rate: Tỉ lệ request trả 503
+        timeout_rate: Tỉ lệ request treo `hang_seconds` (vượt timeout client)
+        hang_seconds: Thời gian treo
+        verbose_suffix_chars: Số ký tự văn xuôi model sinh thêm sau JSON
+        stream_chunk_chars / stream_chunk_delay_ms: Tốc độ sinh token (mỗi chunk);
+            áp dụng cho cả phản hồi thường (chờ sinh xong) lẫn SSE
+        seed: Seed cho bộ sinh ngẫu nhiên (tái lập được)
+    """
+
+    latency_ms: float = 50.0
+    latency_distribution: str = "lognormal"
+    latency_sigma: float = 0.5
+    burst_429_prob: float = 0.0
+    burst_429_length: int = 3
+    retry_after_seconds: float | None = 1.0
+    malformed_rate: float = 0.0
+    invalid_content_rate: float = 0.0
+    list_reply_rate: float = 0.0
+    ratelimit_reset_ms: float | None = None
+    error_rate: float = 0.0
+    timeout_rate: float = 0.0
+    hang_seconds: float = 60.0
+    verbose_suffix_chars: int = 0
+    stream_chunk_chars: int = 16
+    stream_chunk_delay_ms: float = 0.0
+    seed: int = 42
+
+
+def _guess_doc_type(filename: str) -> str:
+    lowered = filename.lower()
+    for doc_type, keywords in _DOC_TYPE_KEYWORDS.items():
+        if any(k in lowered for k in keywords):
+            return doc_type
+    return "thong_tin"
+
+
+def _classification(filename: str, rng: random.Random) -> dict[str, Any]:
+    """Kết quả phân loại giả (ổn định theo tên file)."""
+    vendor = next((v for v in _VENDORS if v.split()[0].lower() in filename.lower()), None)
+    return {
+        "doc_type": _guess_doc_type(filename),
+        "vendor": vendor or rng.choice(_VENDORS),
+        "model": f"M{zlib.crc32(filename.encode()) % 900 + 100}",
+        "category_slug": "chan_doan_hinh_anh/x_quang",
+        "summary": f"Tài liệu {filename}",
+        "confidence": round(rng.uniform(0.6, 0.95), 2),
+    }
+
+
+def _folder_classification(
+    folder: str, batch: list[tuple[str, str]], rng: random.Random
+) -> dict[str, Any]:
+    """Kết quả phân loại nhóm giả: một thiết bị chung, doc_type theo tên từng file."""
+    identity = _classification(folder, rng)
+    names = " ".join([folder] + [name for _, name in batch]).lower()
+    vendor = next((v for v in _VENDORS if v.split()[0].lower() in names), identity["vendor"])
+    return {
+        "same_device": True,
+        "vendor": vendor,
+        "model": identity["model"],
+        "category_slug": identity["category_slug"],
+        "confidence": 0.9,
+        "results": [
+            {"id": doc_id, "doc_type": _guess_doc_type(name), "summary": f"Tài liệu {name}"}
+            for doc_id, name in batch
+        ],
+    }
+
+
+class FakeGateway:
+    """
+    Server OpenAI-compatible giả lập (chỉ chat/completions).
+
+    Args:
+        profile: Hành vi latency/lỗi
+        host / port: Địa chỉ lắng nghe (port 0 → chọn port trống)
+    """
+
+    def __init__(self, profile: GatewayProfile | None = None, host: str = "127.0.0.1", port: int = 0):
+        self.profile = profile or GatewayProfile()
+        self.host = host
+        self.port = port
+        self.stats: Counter[str] = Counter()
+        self._rng = random.Random(self.profile.seed)
+        self._burst_remaining = 0
+        self._server: asyncio.AbstractServer | None = None
+        self._connections: set[asyncio.Task] = set()
+
+    @property
+    def base_url(self) -> str:
+        return f"http://{self.host}:{self.port}/v1"
+
+    async def start(self) -> str:
+        """Bắt đầu lắng nghe, trả về base_url (dạng `.../v1`)."""
+        self._server = await asyncio.start_server(self._handle_connection, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        logger.info(f"Gateway giả lập lắng nghe tại {self.base_url}")
+        return self.base_url
+
+    async def stop(self) -> None:
+        if self._server is not None:
+            self._server.close()
+            # Đóng cả các kết nối keep-alive (và request đang treo)
+            for task in list(self._connections):
+                task.cancel()
+            await asyncio.gather(*self._connections, return_exceptions=True)
+            await self._server.wait_closed()
+            self._server = None
+
+    async def __aenter__(self) -> FakeGateway:
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.stop()
+
+    # ------------------------------------------------------------------
+    # HTTP
+    # ------------------------------------------------------------------
+
+    async def _handle_connection(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        task = asyncio.current_task()
+        self._connections.add(task)
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, path, _ = request_line.decode("latin-1").split(" ", 2)
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    key, _, value = line.decode("latin-1").partition(":")
+                    headers[key.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get("content-length", 0) or 0))
+
+                status, extra_headers, payload = await self._respond(method, path, body)
+                head = [f"HTTP/1.1 {status} {_REASONS.get(status, 'Error')}"]
+                head += [f"{k}: {v}" for k, v in extra_headers.items()]
+                if isinstance(payload, bytes):
+                    head += [
+                        "Content-Type: application/json",
+                        f"Content-Length: {len(payload)}",
+                        "Connection: keep-alive",
+                    ]
+                    writer.write(("\r\n".join(head) + "\r\n\r\n").encode("latin-1") + payload)
+                    await writer.drain()
+                    continue
+
+                # SSE: chunked transfer encoding, dừng nếu client đóng stream sớm
+                head += ["Content-Type: text/event-stream", "Transfer-Encoding: chunked"]
+                writer.write(("\r\n".join(head) + "\r\n\r\n").encode("latin-1"))
+                async for event in payload:
+                    if reader.at_eof() or writer.is_closing():
+                        self.stats["stream_cancelled"] += 1
+                        return
+                    writer.write(f"{len(event):x}\r\n".encode() + event + b"\r\n")
+                    await writer.drain()
+                writer.write(b"0\r\n\r\n")
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError, asyncio.CancelledError):
+            pass
+        finally:
+            self._connections.discard(task)
+            writer.close()
+
+    async def _respond(
+        self, method: str, path: str, body: bytes
+    ) -> tuple[int, dict, bytes | AsyncIterator[bytes]]:
+        path = path.split("?", 1)[0].rstrip("/")
+        if path.endswith("/stats") and method == "GET":
+            return 200, {}, json.dumps(dict(self.stats)).encode()
+        if not path.endswith("/chat/completions"):
+            return 404, {}, b'{"error": "not found"}'
+        if method != "POST":
+            return 405, {}, b'{"error": "method not allowed"}'
+
+        profile = self.profile
+        self.stats["requests"] += 1
+
+        if self._burst_remaining == 0 and self._rng.random() < profile.burst_429_prob:
+            self._burst_remaining = profile.burst_429_length
+        if self._burst_remaining > 0:
+            self._burst_remaining -= 1
+            self.stats["rate_limited"] += 1
+            headers = {}
+            if profile.retry_after_seconds is not None:
+                headers["Retry-After"] = f"{profile.retry_after_seconds:g}"
+            return 429, headers, b'{"error": {"message": "rate limited"}}'
+
+        if self._rng.random() < profile.error_rate:
+            self.stats["errors"] += 1
+            await asyncio.sleep(self._latency() / 1000)
+            return 503, {}, b'{"error": {"message": "upstream unavailable"}}'
+
+        if self._rng.random() < profile.timeout_rate:
+            self.stats["timeouts"] += 1
+            await asyncio.sleep(profile.hang_seconds)
+
+        prompt, stream = "", False
+        try:
+            request = json.loads(body)
+            stream = bool(request.get("stream"))
+            prompt = request["messages"][-1]["content"]
+        except (ValueError, KeyError, IndexError, TypeError, AttributeError):
+            pass
+
+        if self._rng.random() < profile.invalid_content_rate:
+            self.stats["invalid_content"] += 1
+            content = "Xin lỗi, tôi không thể phân loại tài liệu này."
+        else:
+            batch = [(doc_id, name.strip()) for doc_id, name in _BATCH_ID_RE.findall(prompt)]
+            folder = _FOLDER_RE.search(prompt)
+            if batch and folder:
+                content = json.dumps(
+                    _folder_classification(folder.group(1).strip(), batch, self._rng),
+                    ensure_ascii=False,
+                )
+            elif batch:
+                results = [
+                    {"id": doc_id, **_classification(name, self._rng)}
+                    for doc_id, name in batch
+                ]
+                content = json.dumps({"results": results}, ensure_ascii=False)
+            else:
+                match = _FILENAME_RE.search(prompt)
+                name = match.group(1).strip() if match else "unknown"
+                reply: Any = _classification(name, self._rng)
+                if profile.list_reply_rate and self._rng.random() < profile.list_reply_rate:
+                    self.stats["list_replies"] += 1
+                    reply = [reply]
+                content = json.dumps(reply, ensure_ascii=False)
+        if profile.verbose_suffix_chars:
+            repeat = profile.verbose_suffix_chars // len(_VERBOSE_TEXT) + 1
+            content += (_VERBOSE_TEXT * repeat)[: profile.verbose_suffix_chars]
+
+        step = max(1, profile.stream_chunk_chars)
+        pieces = [content[i : i + step] for i in range(0, len(content), step)]
+        malformed = self._rng.random() < profile.malformed_rate
+        if malformed:
+            self.stats["malformed"] += 1
+        self.stats["ok"] += 1
+        headers = {}
+        if profile.ratelimit_reset_ms is not None:
+            reset_at = time.time() * 1000 + profile.ratelimit_reset_ms
+            headers = {"X-RateLimit-Remaining": "0", "X-RateLimit-Reset": f"{reset_at:.0f}"}
+        # Latency = thời gian tới token đầu, sau đó sinh từng chunk
+        await asyncio.sleep(self._latency() / 1000)
+        if stream:
+            return 200, headers, self._sse_events(pieces, malformed)
+        await asyncio.sleep(len(pieces) * profile.stream_chunk_delay_ms / 1000)
+
+        payload = json.dumps(
+            {
+                "id": f"chatcmpl-{self.stats['requests']}",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": "fake-gateway",
+                "choices": [
+                    {
+                        "index": 0,
+                        "message": {"role": "assistant", "content": content},
+                        "finish_reason": "stop",
+                    }
+                ],
+                "usage": {
+                    "prompt_tokens": len(prompt) // 4,
+                    "completion_tokens": len(content) // 4,
+                    "total_tokens": (len(prompt) + len(content)) // 4,
+                },
+            },
+            ensure_ascii=False,
+        )
+        if malformed:
+            payload += _MALFORMED_SUFFIX
+        return 200, headers, payload.encode("utf-8")
+
+    async def _sse_events(self, pieces: list[str], malformed: bool) -> AsyncIterator[bytes]:
+        """Các event SSE kiểu OpenAI (`data: {...delta...}`), kết thúc bằng `[DONE]`."""
+        if malformed:
+            yield _MALFORMED_SUFFIX.lstrip("\n").encode()
+        for piece in pieces:
+            await asyncio.sleep(self.profile.stream_chunk_delay_ms / 1000)
+            chunk = {
+                "object": "chat.completion.chunk",
+                "model": "fake-gateway",
+                "choices": [{"index": 0, "delta": {"content": piece}, "finish_reason": None}],
+            }
+            yield f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode("utf-8")
+        yield b"data: [DONE]\n\n"
+
+    def _latency(self) -> float:
+        profile = self.profile
+        if profile.latency_distribution == "fixed":
+            return profile.latency_ms
+        if profile.latency_distribution == "uniform":
+            return self._rng.uniform(0, 2 * profile.latency_ms)
+        return self._rng.lognormvariate(0, profile.latency_sigma) * profile.latency_ms
+
+
+def add_profile_arguments(parser: argparse.ArgumentParser) -> None:
+    """Thêm các tham số CLI của GatewayProfile (dùng chung với script load test)."""
+    parser.add_argument("--latency-ms", type=float, default=800.0)
+    parser.add_argument(
+        "--latency-distribution", choices=["lognormal", "uniform", "fixed"], default="lognormal"
+    )
+    parser.add_argument("--latency-sigma", type=float, default=0.5)
+    parser.add_argument("--burst-429-prob", type=float, default=0.0)
+    parser.add_argument("--burst-429-length", type=int, default=3)
+    parser.add_argument("--retry-after", type=float, default=1.0)
+    parser.add_argument("--malformed-rate", type=float, default=0.0)
+    parser.add_argument("--invalid-content-rate", type=float, default=0.0)
+    parser.add_argument("--list-reply-rate", type=float, default=0.0)
+    parser.add_argument(
+        "--ratelimit-reset-ms", type=float, default=None,
+        help="Gửi X-RateLimit-Reset dạng epoch ms, hết hạn sau N ms",
+    )
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Tỉ lệ trả 503")
+    parser.add_argument("--timeout-rate", type=float, default=0.0)
+    parser.add_argument("--hang-seconds", type=float, default=60.0)
+    parser.add_argument("--verbose-suffix-chars", type=int, default=0)
+    parser.add_argument("--stream-chunk-chars", type=int, default=16)
+    parser.add_argument("--stream-chunk-delay-ms", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=42)
+
+
+def profile_from_args(args: argparse.Namespace) -> GatewayProfile:
+    return GatewayProfile(
+        latency_ms=args.latency_ms,
+        latency_distribution=args.latency_distribution,
+        latency_sigma=args.latency_sigma,
+        burst_429_prob=args.burst_429_prob,
+        burst_429_length=args.burst_429_length,
+        retry_after_seconds=args.retry_after,
+        malformed_rate=args.malformed_rate,
+        invalid_content_rate=args.invalid_content_rate,
+        list_reply_rate=args.list_reply_rate,
+        ratelimit_reset_ms=args.ratelimit_reset_ms,
+        error_rate=args.error_rate,
+        timeout_rate=args.timeout_rate,
+        hang_seconds=args.hang_seconds,
+        verbose_suffix_chars=args.verbose_suffix_chars,
+        stream_chunk_chars=args.stream_chunk_chars,
+        stream_chunk_delay_ms=args.stream_chunk_delay_ms,
+        seed=args.seed,
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Gateway OpenAI-compatible giả lập cho 9router")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=20128)
+    add_profile_arguments(parser)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    profile = profile_from_args(args)
+
+    async def serve() -> None:
+        async with FakeGateway(profile, args.host, args.port):
+            await asyncio.Event().wait()
+
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,232 @@
+"""
+folder_group.py — Phân loại theo nhóm các file cùng thư mục.
+
+Hãng thường giao một thư mục 10–50 file cho một thiết bị (brochure, cấu hình,
+báo giá, hướng dẫn sử dụng). Phân loại từng file riêng lẻ tốn một lần gọi AI
+(và một lượt rate limit) mỗi file, đôi khi còn viết hãng/model khác nhau làm
+một thiết bị bị tách thành nhiều `device_slug`.
+
+`FolderGroupClassifier` đứng trước classifier (cùng interface
+classify_file/close). Watcher/bulk ingest báo trước các file cùng thư mục đến
+trong một đợt (`expect`); file đầu tiên của nhóm chờ tối đa
+`folder_group_gather_seconds` cho các file khác tới (để preview dùng buffer đã
+đọc thay vì đọc lại qua NAS) rồi gọi `MedicalClassifier.classify_folder` một
+lần cho cả nhóm, các file còn lại chờ kết quả đó. File đã phân loại được bằng
+luật không được gửi trong prompt nhóm. Mọi file trong nhóm dùng chung
+hãng/model/category, chỉ doc_type là riêng. File không thuộc nhóm nào, hoặc
+gateway cho rằng nhóm không cùng thiết bị, được phân loại riêng lẻ như cũ.
+
+Sử dụng:
+    grouping = FolderGroupClassifier.from_config(classifier, config)
+    grouping.expect(paths)           # các path của một đợt debounce / một thư mục
+    await grouping.classify_file(path, ingested=ingested)
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from collections.abc import Iterable
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any
+
+from app.classifier import BatchingClassifier, MedicalClassifier
+from app.ingest import IngestedFile
+from app.usage import BudgetExceededError
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MIN_FILES = 3
+DEFAULT_TTL_SECONDS = 600.0
+DEFAULT_GATHER_SECONDS = 0.5
+
+
+@dataclass
+class _Group:
+    members: list[str]
+    # Thành viên chưa nhận kết quả (nhóm bị xóa khi rỗng hoặc hết hạn)
+    pending: set[str]
+    expires: float
+    ingested: dict[str, IngestedFile] = field(default_factory=dict)
+    # Thành viên đã tới classify_file / đã có kết quả từ tầng luật
+    arrived: set[str] = field(default_factory=set)
+    resolved: set[str] = field(default_factory=set)
+    changed: asyncio.Event = field(default_factory=asyncio.Event)
+    task: asyncio.Task | None = None
+
+
+class FolderGroupClassifier:
+    """
+    Gom các file cùng thư mục thành một lần phân loại.
+
+    Args:
+        classifier: MedicalClassifier (hoặc BatchingClassifier) cho file lẻ
+        min_files: Số file tối thiểu cùng thư mục để phân loại theo nhóm
+        ttl_seconds: Nhóm có thành viên không bao giờ tới (bị lọc trước khi
+            phân loại) được xóa sau N giây
+        gather_seconds: Thời gian tối đa chờ các file khác của nhóm tới trước
+            khi gọi gateway (preview lấy từ buffer của chúng)
+    """
+
+    def __init__(
+        self,
+        classifier: MedicalClassifier | BatchingClassifier,
+        min_files: int = DEFAULT_MIN_FILES,
+        ttl_seconds: float = DEFAULT_TTL_SECONDS,
+        gather_seconds: float = DEFAULT_GATHER_SECONDS,
+    ) -> None:
+        self.classifier = classifier
+        self.min_files = max(2, min_files)
+        self.ttl_seconds = ttl_seconds
+        self.gather_seconds = max(0.0, gather_seconds)
+        self._groups: dict[str, _Group] = {}
+        self.groups_classified = 0
+
+    @classmethod
+    def from_config(
+        cls, classifier: MedicalClassifier | BatchingClassifier, config: dict[str, Any]
+    ) -> FolderGroupClassifier:
+        """Tạo từ `classifier.folder_group_*`."""
+        cfg = config.get("classifier", {})
+        return cls(
+            classifier,
+            min_files=cfg.get("folder_group_min_files", DEFAULT_MIN_FILES),
+            ttl_seconds=cfg.get("folder_group_ttl_seconds", DEFAULT_TTL_SECONDS),
+            gather_seconds=cfg.get("folder_group_gather_seconds", DEFAULT_GATHER_SECONDS),
+        )
+
+    @property
+    def base(self) -> MedicalClassifier:
+        """MedicalClassifier bên trong (bỏ qua lớp gom batch)."""
+        if isinstance(self.classifier, BatchingClassifier):
+            return self.classifier.classifier
+        return self.classifier
+
+    def expect(self, paths: Iterable[str]) -> int:
+        """
+        Báo trước các file sắp được phân loại (một đợt debounce, một thư mục).
+        Thư mục có từ `min_files` tới `folder_group_max_files` file được phân
+        loại theo nhóm; thư mục lớn hơn thường là kho chứa nhiều thiết bị.
+
+        Returns:
+            Số nhóm mới
+        """
+        now = time.monotonic()
+        for folder in [f for f, g in self._groups.items() if g.expires <= now]:
+            del self._groups[folder]
+
+        by_folder: dict[str, list[str]] = {}
+        for path in paths:
+            by_folder.setdefault(str(Path(path).parent), []).append(str(path))
+        created = 0
+        for folder, members in by_folder.items():
+            members = list(dict.fromkeys(members))
+            if folder in self._groups:
+                continue
+            if not self.min_files <= len(members) <= self.base.folder_group_max_files:
+                continue
+            self._groups[folder] = _Group(members, set(members), now + self.ttl_seconds)
+            created += 1
+            logger.info("📁 %d file cùng thư mục %s → phân loại theo nhóm", len(members), folder)
+        return created
+
+    def _group_of(self, file_path: str) -> _Group | None:
+        group = self._groups.get(str(Path(file_path).parent))
+        return group if group is not None and file_path in group.pending else None
+
+    def _done(self, file_path: str, group: _Group) -> None:
+        group.pending.discard(file_path)
+        folder = str(Path(file_path).parent)
+        if not group.pending and self._groups.get(folder) is group:
+            del self._groups[folder]
+
+    async def classify_file(
+        self,
+        file_path: str,
+        max_retries: int | None = None,
+        ingested: IngestedFile | None = None,
+        use_rules: bool = True,
+    ) -> dict:
+        file_path = str(file_path)
+        group = self._group_of(file_path)
+        if group is None:
+            return await self.classifier.classify_file(
+                file_path, max_retries=max_retries, ingested=ingested, use_rules=use_rules
+            )
+
+        try:
+            group.arrived.add(file_path)
+            group.changed.set()
+            if use_rules:
+                rule_result = self.base._confident_rule_result(Path(file_path))
+                if rule_result is not None:
+                    group.resolved.add(file_path)
+                    return rule_result
+            if ingested is not None:
+                group.ingested[file_path] = ingested
+            if group.task is None:
+                # Task riêng (không chiếm slot scheduler của file đầu); file khác chờ chung
+                group.task = asyncio.create_task(self._classify_group(group, max_retries))
+            identity, results = await asyncio.shield(group.task)
+        finally:
+            self._done(file_path, group)
+
+        result = results.get(file_path)
+        if result is not None:
+            return dict(result)
+        result = await self.classifier.classify_file(
+            file_path, max_retries=max_retries, ingested=ingested, use_rules=use_rules
+        )
+        if identity is not None and result.get("source") != "rules":
+            # Giữ thiết bị chung để không tách thành device_slug khác
+            result.update({k: identity[k] for k in ("vendor", "model", "category_slug")})
+        return result
+
+    async def _gather(self, group: _Group) -> None:
+        """Chờ (tối đa `gather_seconds`) tới khi đủ file có buffer để làm preview."""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.gather_seconds
+        while True:
+            todo = [p for p in group.members if p not in group.resolved]
+            wanted = min(len(todo), self.base.folder_group_context_files)
+            if all(p in group.arrived for p in todo) or len(group.ingested) >= wanted:
+                return
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                return
+            group.changed.clear()
+            try:
+                await asyncio.wait_for(group.changed.wait(), remaining)
+            except asyncio.TimeoutError:
+                return
+
+    async def _classify_group(
+        self, group: _Group, max_retries: int | None
+    ) -> tuple[dict | None, dict[str, dict]]:
+        await self._gather(group)
+        # Bỏ file đã có kết quả từ luật; file đã đọc sẵn đứng đầu để nhận preview
+        todo = [p for p in group.members if p not in group.resolved]
+        todo.sort(key=lambda p: p not in group.ingested)
+        if len(todo) < 2:
+            return None, {}
+        items = [(path, group.ingested.get(path)) for path in todo]
+        try:
+            identity, results = await self.base.classify_folder(items, max_retries)
+        except BudgetExceededError:
+            raise
+        except Exception as e:
+            logger.warning(
+                "Phân loại nhóm %s lỗi (%s), phân loại từng file", Path(items[0][0]).parent, e
+            )
+            return None, {}
+        self.groups_classified += 1
+        return identity, results
+
+    async def close(self) -> None:
+        """Chờ các nhóm đang phân loại rồi đóng classifier bên trong."""
+        tasks = [g.task for g in self._groups.values() if g.task is not None]
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._groups.clear()
+        await self.classifier.close()
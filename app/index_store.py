@@ -31,6 +31,7 @@ CREATE TABLE IF NOT EXISTS files (
     vendor       TEXT,
     model        TEXT,
     summary      TEXT,
+    confidence   REAL,         -- độ tin cậy lúc phân loại (NULL: không rõ)
     size_bytes   INTEGER NOT NULL DEFAULT 0,
     confirmed    INTEGER NOT NULL DEFAULT 0,  -- 0: chờ confirm, 1: đã confirm
     created_at   TEXT    NOT NULL,
@@ -50,6 +51,36 @@ CREATE TABLE IF NOT EXISTS events (
     ts         TEXT    NOT NULL,
     processed  INTEGER NOT NULL DEFAULT 0
 );
+
+-- Usage gọi AI: một dòng / lần phân loại (batch chia đều cho từng file)
+CREATE TABLE IF NOT EXISTS llm_usage (
+    id                INTEGER PRIMARY KEY AUTOINCREMENT,
+    ts                TEXT    NOT NULL,
+    day               TEXT    NOT NULL,  -- YYYY-MM-DD giờ địa phương (tổng hợp ngày/tháng)
+    path              TEXT,
+    model             TEXT,
+    doc_type          TEXT,
+    priority          TEXT,              -- interactive / bulk
+    files             INTEGER NOT NULL DEFAULT 1,
+    requests          INTEGER NOT NULL DEFAULT 0,
+    retries           INTEGER NOT NULL DEFAULT 0,
+    prompt_tokens     INTEGER NOT NULL DEFAULT 0,
+    completion_tokens INTEGER NOT NULL DEFAULT 0,
+    latency_ms        INTEGER NOT NULL DEFAULT 0,
+    estimated         INTEGER NOT NULL DEFAULT 0  -- 1: token ước lượng (gateway không trả usage)
+);
+
+CREATE INDEX IF NOT EXISTS idx_usage_day ON llm_usage(day);
+"""
+
+_USAGE_COLUMNS = (
+    "ts", "day", "path", "model", "doc_type", "priority", "files", "requests", "retries",
+    "prompt_tokens", "completion_tokens", "latency_ms", "estimated",
+)
+_USAGE_TOTALS_SQL = """
+SELECT COALESCE(SUM(files), 0), COALESCE(SUM(requests), 0), COALESCE(SUM(retries), 0),
+       COALESCE(SUM(prompt_tokens + completion_tokens), 0), COALESCE(SUM(latency_ms), 0)
+FROM llm_usage WHERE day BETWEEN ? AND ?
 """
 
 
@@ -111,6 +142,9 @@ class IndexStore:
         if "search_text" not in columns:
             logger.info("⚡️ Migrating DB: Adding column 'search_text'")
             await self._conn.execute("ALTER TABLE files ADD COLUMN search_text TEXT")
+        if "confidence" not in columns:
+            logger.info("⚡️ Migrating DB: Adding column 'confidence'")
+            await self._conn.execute("ALTER TABLE files ADD COLUMN confidence REAL")
 
         # Tạo index cho cột mới sau khi chắc chắn cột đã tồn tại
         await self._conn.execute("CREATE INDEX IF NOT EXISTS idx_vendor ON files(vendor)")
@@ -171,6 +205,7 @@ class IndexStore:
         summary: str | None = None,
         size_bytes: int | None = None,
         confirmed: bool = False,
+        confidence: float | None = None,
     ) -> int:
         """
         Thêm hoặc cập nhật record file (idempotent theo path).
@@ -184,6 +219,7 @@ class IndexStore:
             group_slug: Slug group
             size_bytes: Kích thước file (bytes)
             confirmed: Đã được user confirm chưa
+            confidence: Độ tin cậy phân loại (hiển thị lại khi render draft)
 
         Returns:
             ID của record (mới hoặc cập nhật)
@@ -220,8 +256,8 @@ class IndexStore:
                     sha256 = ?, doc_type = ?, device_slug = ?,
                     category_slug = ?, group_slug = ?,
                     vendor = ?, model = ?, summary = ?,
-                    size_bytes = ?, confirmed = ?, updated_at = ?, indexed_at = ?,
-                    search_text = ?
+                    size_bytes = ?, confirmed = ?, confidence = ?,
+                    updated_at = ?, indexed_at = ?, search_text = ?
                 WHERE path = ?
                 """,
                 (
@@ -235,6 +271,7 @@ class IndexStore:
                     summary,
                     size_bytes,
                     int(confirmed),
+                    confidence,
                     now,
                     now,
                     search_text,
@@ -250,8 +287,9 @@ class IndexStore:
                 INSERT INTO files
                     (path, sha256, doc_type, device_slug, category_slug, group_slug,
                         vendor, model, summary,
-                        size_bytes, confirmed, created_at, updated_at, indexed_at, search_text)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                        size_bytes, confirmed, confidence,
+                        created_at, updated_at, indexed_at, search_text)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
                 """,
                 (
                     path_str,
@@ -265,6 +303,7 @@ class IndexStore:
                     summary,
                     size_bytes,
                     int(confirmed),
+                    confidence,
                     now,
                     now,
                     now,
@@ -307,6 +346,42 @@ class IndexStore:
             row = await cursor.fetchone()
             return dict(row) if row else None
 
+    async def get_indexed_paths(self, prefix: str | None = None) -> set[str]:
+        """
+        Lấy toàn bộ path đã có trong index bằng một truy vấn (dùng cho bulk ingest).
+
+        Args:
+            prefix: Chỉ lấy path bắt đầu bằng chuỗi này (tùy chọn)
+
+        Returns:
+            Set các path
+        """
+        if not self._conn:
+            await self.init()
+        if prefix:
+            escaped = prefix.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+            sql = "SELECT path FROM files WHERE path LIKE ? ESCAPE '\\'"
+            params: tuple = (f"{escaped}%",)
+        else:
+            sql, params = "SELECT path FROM files", ()
+        async with self._conn.execute(sql, params) as cursor:
+            return {row[0] for row in await cursor.fetchall()}
+
+    async def get_confirmed_files(self) -> list[dict[str, Any]]:
+        """
+        Lấy các file đã được user confirm (dữ liệu có nhãn cho mô hình cục bộ).
+
+        Returns:
+            List dict (id, path, sha256, doc_type, category_slug, group_slug, vendor)
+        """
+        if not self._conn:
+            await self.init()
+        async with self._conn.execute(
+            "SELECT id, path, sha256, doc_type, category_slug, group_slug, vendor "
+            "FROM files WHERE confirmed = 1 ORDER BY id"
+        ) as cursor:
+            return [dict(row) for row in await cursor.fetchall()]
+
     async def get_file_by_id(self, file_id: int) -> dict[str, Any] | None:
         """
         Lấy thông tin file theo ID.
@@ -529,6 +604,45 @@ class IndexStore:
         )
         await self._conn.commit()
 
+    async def record_usage(self, rows: list[dict[str, Any]]) -> None:
+        """Ghi các dòng usage gọi AI (xem app.usage)."""
+        if not rows:
+            return
+        if not self._conn:
+            await self.init()
+        placeholders = ", ".join("?" for _ in _USAGE_COLUMNS)
+        await self._conn.executemany(
+            f"INSERT INTO llm_usage ({', '.join(_USAGE_COLUMNS)}) VALUES ({placeholders})",
+            [tuple(row.get(col) for col in _USAGE_COLUMNS) for row in rows],
+        )
+        await self._conn.commit()
+
+    async def usage_summary(self, day: str) -> dict[str, Any]:
+        """
+        Tổng usage gọi AI của ngày `day` (YYYY-MM-DD) và của tháng chứa ngày đó.
+
+        Returns:
+            {"date", "day": {...}, "month": {...}, "by_doc_type": {doc_type: {...}}}
+            với files, requests, retries, tokens, latency_ms
+        """
+        if not self._conn:
+            await self.init()
+        keys = ("files", "requests", "retries", "tokens", "latency_ms")
+        month_start = f"{day[:7]}-01"
+        result: dict[str, Any] = {"date": day}
+        for period, start in (("day", day), ("month", month_start)):
+            async with self._conn.execute(_USAGE_TOTALS_SQL, (start, day)) as cur:
+                result[period] = dict(zip(keys, await cur.fetchone()))
+        async with self._conn.execute(
+            "SELECT doc_type, SUM(files), SUM(prompt_tokens + completion_tokens) "
+            "FROM llm_usage WHERE day BETWEEN ? AND ? GROUP BY doc_type",
+            (month_start, day),
+        ) as cur:
+            result["by_doc_type"] = {
+                row[0]: {"files": row[1], "tokens": row[2]} for row in await cur.fetchall()
+            }
+        return result
+
     async def stats(self) -> dict[str, Any]:
         """
         Thống kê tổng quan index.
@@ -0,0 +1,155 @@
+"""
+ingest.py — Đọc file một lần duy nhất cho pipeline xử lý.
+
+Stat file một lần, tính sha256 trong lúc đọc và giữ lại buffer để
+extractor dùng chung (kreuzberg.extract_bytes). Mỗi tài liệu chỉ đi qua
+mạng NAS một lần thay vì đọc lại riêng cho hash và cho extract.
+Text/CSV/DOCX/XLSX/PPTX được trích xuất bằng reader native
+(`app.native_extract`), kreuzberg chỉ là fallback cho các định dạng này.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import logging
+import mimetypes
+import os
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any
+
+from kreuzberg import extract_bytes, extract_file
+
+from app.extract_cache import ExtractionCache
+from app.extract_pool import ExtractionPool
+from app.native_extract import NATIVE_ERRORS, extract_native, supports_native
+
+logger = logging.getLogger(__name__)
+
+# Kích thước chunk khi đọc stream (1MB — hợp với NAS/SMB)
+_CHUNK_SIZE = 1024 * 1024
+
+# File lớn hơn ngưỡng này chỉ hash theo stream, không giữ buffer trong RAM
+# (extractor đọc lại từ đĩa). Nhiều worker bulk giữ buffer cùng lúc nên ngưỡng
+# phải nhỏ: 32MB bao phủ gần hết tài liệu, bản scan/catalog lớn đi đường stream.
+DEFAULT_MAX_BUFFER_BYTES = 32 * 1024 * 1024
+
+
+@dataclass
+class IngestedFile:
+    """
+    Kết quả đọc file một lần.
+
+    Attributes:
+        path: Đường dẫn file
+        size_bytes: Kích thước lấy từ một lần stat duy nhất
+        mtime: Thời điểm sửa đổi cuối (epoch seconds)
+        sha256: Hash SHA256 tính trong lúc đọc
+        mime_type: MIME type đoán theo extension (None nếu không rõ)
+        data: Nội dung file đã đọc, None nếu file vượt ngưỡng buffer
+    """
+
+    path: Path
+    size_bytes: int
+    mtime: float
+    sha256: str
+    mime_type: str | None
+    data: bytes | None = None
+
+    @property
+    def buffered(self) -> bool:
+        """File đã được giữ trong RAM để extractor dùng lại."""
+        return self.data is not None
+
+
+def _read_file(path: Path, max_buffer_bytes: int) -> IngestedFile:
+    """Stat + đọc + hash đồng bộ (chạy trong thread pool)."""
+    sha = hashlib.sha256()
+    with open(path, "rb") as f:
+        st = os.fstat(f.fileno())
+        keep = st.st_size <= max_buffer_bytes
+        buf = bytearray() if keep else None
+        for chunk in iter(lambda: f.read(_CHUNK_SIZE), b""):
+            sha.update(chunk)
+            if buf is not None:
+                buf.extend(chunk)
+
+    return IngestedFile(
+        path=path,
+        size_bytes=st.st_size,
+        mtime=st.st_mtime,
+        sha256=sha.hexdigest(),
+        mime_type=mimetypes.guess_type(path.name)[0],
+        data=bytes(buf) if buf is not None else None,
+    )
+
+
+async def ingest_file(
+    file_path: str | Path, max_buffer_bytes: int = DEFAULT_MAX_BUFFER_BYTES
+) -> IngestedFile:
+    """
+    Đọc file một lần: stat, hash và giữ buffer cho extractor.
+
+    Args:
+        file_path: Đường dẫn file
+        max_buffer_bytes: Ngưỡng giữ nội dung trong RAM
+
+    Returns:
+        IngestedFile
+
+    Raises:
+        OSError: Nếu không đọc được file
+    """
+    path = Path(file_path)
+    ingested = await asyncio.to_thread(_read_file, path, max_buffer_bytes)
+    logger.debug(
+        "Đã đọc %s (%d bytes, buffered=%s)", path.name, ingested.size_bytes, ingested.buffered
+    )
+    return ingested
+
+
+async def extract_content(
+    ingested: IngestedFile,
+    cache: ExtractionCache | None = None,
+    pool: ExtractionPool | None = None,
+    native: bool = True,
+) -> Any:
+    """
+    Trích xuất nội dung từ file đã đọc.
+
+    Nếu có `cache`, tra theo sha256 trước và lưu kết quả sau khi trích xuất.
+    Dùng lại buffer trong RAM nếu có (không đọc lại từ đĩa), ngược lại
+    fallback về kreuzberg.extract_file. Có `pool` thì trích xuất trong
+    worker process (timeout/giới hạn RAM), gửi kèm buffer nếu có. Định dạng đơn giản dùng reader
+    native (trong thread, không qua pool); lỗi hoặc `native=False` → kreuzberg.
+
+    Raises:
+        ExtractionError: Nếu worker trong `pool` timeout/vượt RAM/crash
+    """
+    if cache is not None:
+        cached = await cache.get(ingested.sha256)
+        if cached is not None:
+            logger.debug("Cache trích xuất hit: %s", ingested.path.name)
+            return cached
+
+    result = None
+    if native and supports_native(ingested.mime_type):
+        try:
+            result = await asyncio.to_thread(extract_native, ingested)
+        except NATIVE_ERRORS as e:
+            logger.debug("Reader native lỗi với %s (%s), dùng kreuzberg", ingested.path.name, e)
+
+    if result is None:
+        if pool is not None:
+            # Gửi buffer đã đọc (cùng lần đọc với sha256); chỉ file không buffer
+            # (> max_buffer_bytes) mới để worker đọc lại từ đường dẫn
+            result = await pool.extract(ingested.path, ingested.data, ingested.mime_type)
+        elif ingested.buffered and ingested.mime_type:
+            result = await extract_bytes(ingested.data, ingested.mime_type)
+        else:
+            result = await extract_file(ingested.path)
+
+    if cache is not None:
+        await cache.put(ingested.sha256, result)
+    return result
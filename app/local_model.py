@@ -0,0 +1,330 @@
+"""
+local_model.py — Bộ phân loại thống kê cục bộ (tầng 2, giữa luật và AI).
+
+Các file đã được user confirm (`files.confirmed = 1`) là dữ liệu có nhãn.
+`LocalModel` học từ chúng một mô hình tuyến tính chạy trên CPU (Python
+thuần, không cần NumPy):
+- Đặc trưng: n-gram băm (hashing trick, 2^18 chiều) của tên file (từ,
+  cặp từ, trigram ký tự) và preview nội dung (từ), TF log + chuẩn hóa L2
+- Mỗi đầu ra (doc_type, category/group, vendor) là một Naive Bayes đa
+  thức trên vector thưa; học tăng dần bằng cộng dồn từng dòng mới confirm
+- Confidence được hiệu chỉnh bằng temperature scaling trên tập giữ lại
+- Mỗi nội dung (sha256) là một mẫu; nhãn bị sửa thì huấn luyện lại từ đầu
+  để nhãn cũ không còn được tính
+
+Chỉ dùng tên file (không dùng thư mục): file đã confirm nằm trong thư mục
+category/device đúng nhãn, học theo đường dẫn sẽ bị rò rỉ nhãn.
+
+Sử dụng:
+    model = LocalModel.from_config(config)
+    model.fit([(row_key, featurize(name, preview), labels), ...])
+    prediction = model.predict(featurize(file_name, preview))
+"""
+
+from __future__ import annotations
+
+import copy
+import gzip
+import json
+import logging
+import math
+import random
+import zlib
+from collections import Counter
+from pathlib import Path
+from typing import Any
+
+from app.slug import normalize
+
+logger = logging.getLogger(__name__)
+
+MODEL_VERSION = 2
+HEADS = ("doc_type", "category", "vendor")
+
+DEFAULT_THRESHOLD = 0.9
+DEFAULT_MIN_ROWS = 200
+
+_N_FEATURES = 1 << 18
+# Làm mịn Laplace (trên số đặc trưng đã gặp, không phải kích thước không gian băm)
+_ALPHA = 0.1
+# Số từ nội dung khác nhau tối đa mỗi tài liệu (giới hạn chi phí chấm điểm)
+_MAX_CONTENT_WORDS = 150
+_HOLDOUT_FRACTION = 0.2
+_TEMPERATURES = (0.25, 0.5, 0.75, 1.0, 1.5, 2.0, 3.0, 4.0, 6.0, 8.0)
+
+Features = dict[int, float]
+
+
+def _hash(feature: str) -> int:
+    # crc32 ổn định giữa các tiến trình (hash() bị random hóa theo PYTHONHASHSEED)
+    return zlib.crc32(feature.encode("utf-8")) & (_N_FEATURES - 1)
+
+
+def _words(text: str) -> list[str]:
+    return [w for w in normalize(text).split("_") if len(w) > 1 or w.isdigit()]
+
+
+def featurize(file_name: str, text: str = "") -> Features:
+    """Vector đặc trưng thưa (chỉ số băm → trọng số) từ tên file và preview."""
+    counts: Counter[str] = Counter()
+    path = Path(file_name)
+    name_words = _words(path.stem)
+    if path.suffix:
+        counts[f"x:{path.suffix.lower()}"] += 1
+    for i, word in enumerate(name_words):
+        counts[f"f:{word}"] += 1
+        if i:
+            counts[f"f2:{name_words[i - 1]}_{word}"] += 1
+        if len(word) >= 3 and not word.isdigit():
+            padded = f"#{word}#"
+            for j in range(len(padded) - 2):
+                counts[f"g:{padded[j:j + 3]}"] += 1
+    content = Counter(w for w in _words(text) if not w.isdigit())
+    for word, count in content.most_common(_MAX_CONTENT_WORDS):
+        counts[f"c:{word}"] += count
+
+    features: Features = {}
+    for feature, count in counts.items():
+        index = _hash(feature)
+        features[index] = features.get(index, 0.0) + 1.0 + math.log(count)
+    norm = math.sqrt(sum(v * v for v in features.values())) or 1.0
+    return {i: v / norm for i, v in features.items()}
+
+
+def _softmax(scores: dict[str, float], temperature: float) -> dict[str, float]:
+    top = max(scores.values())
+    exps = {label: math.exp((z - top) / temperature) for label, z in scores.items()}
+    total = sum(exps.values())
+    return {label: e / total for label, e in exps.items()}
+
+
+def row_labels(row: dict[str, Any]) -> dict[str, str]:
+    """Nhãn huấn luyện từ một dòng `files` (category gộp "nhom_lon/nhom_con")."""
+    category = row.get("category_slug") or "chua_phan_loai"
+    if row.get("group_slug"):
+        category = f"{category}/{row['group_slug']}"
+    return {
+        "doc_type": row.get("doc_type") or "khac",
+        "category": category,
+        "vendor": row.get("vendor") or "Unknown",
+    }
+
+
+def label_key(labels: dict[str, str]) -> str:
+    """Chuỗi đại diện bộ nhãn của một mẫu (phát hiện nhãn bị sửa)."""
+    return ":".join(labels[name] for name in HEADS)
+
+
+class _NaiveBayesHead:
+    """
+    Naive Bayes đa thức cho một đầu ra (tuyến tính trong không gian log).
+
+    Chỉ lưu tổng trọng số đặc trưng theo nhãn nên học tăng dần là chính xác
+    (cộng dồn), không cần lặp nhiều epoch.
+    """
+
+    def __init__(self) -> None:
+        self.counts: dict[int, dict[str, float]] = {}
+        self.totals: dict[str, float] = {}
+        self.docs: dict[str, int] = {}
+        self.temperature = 1.0
+        # log(count + α) - log(α), tính sẵn để chấm điểm không phải gọi log
+        self._log_weights: dict[int, dict[str, float]] = {}
+
+    def learn(self, x: Features, label: str) -> None:
+        self.docs[label] = self.docs.get(label, 0) + 1
+        self.totals[label] = self.totals.get(label, 0.0) + sum(x.values())
+        for i, v in x.items():
+            row = self.counts.setdefault(i, {})
+            row[label] = count = row.get(label, 0.0) + v
+            self._log_weights.setdefault(i, {})[label] = math.log(count / _ALPHA + 1.0)
+
+    def _log_scores(self, x: Features) -> dict[str, float]:
+        # log P(c) + Σ v·log P(f|c); phần Σ v·log(α) chung mọi nhãn được bỏ đi
+        n_docs = sum(self.docs.values())
+        smoothing = _ALPHA * max(len(self.counts), 1)
+        mass = sum(x.values())
+        scores = {
+            label: math.log(n / n_docs) - mass * math.log(self.totals[label] + smoothing)
+            for label, n in self.docs.items()
+        }
+        log_weights = self._log_weights
+        for i, v in x.items():
+            row = log_weights.get(i)
+            if row:
+                for label, w in row.items():
+                    scores[label] += v * w
+        return scores
+
+    def proba(self, x: Features) -> dict[str, float]:
+        if not self.docs:
+            return {}
+        return _softmax(self._log_scores(x), self.temperature)
+
+    def calibrate(self, examples: list[tuple[Features, str]]) -> None:
+        """Chọn temperature có log-loss nhỏ nhất trên tập giữ lại."""
+        scored = [(self._log_scores(x), y) for x, y in examples if y in self.docs]
+        if len(self.docs) < 2 or not scored:
+            return
+
+        def nll(t: float) -> float:
+            return -sum(math.log(max(_softmax(s, t)[y], 1e-12)) for s, y in scored)
+
+        self.temperature = min(_TEMPERATURES, key=nll)
+
+    def to_dict(self) -> dict[str, Any]:
+        return {
+            "counts": {
+                str(i): {c: round(v, 4) for c, v in row.items()} for i, row in self.counts.items()
+            },
+            "totals": self.totals,
+            "docs": self.docs,
+            "temperature": self.temperature,
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict[str, Any]) -> _NaiveBayesHead:
+        head = cls()
+        head.counts = {int(i): row for i, row in data.get("counts", {}).items()}
+        head._log_weights = {
+            i: {c: math.log(v / _ALPHA + 1.0) for c, v in row.items()}
+            for i, row in head.counts.items()
+        }
+        head.totals = dict(data.get("totals", {}))
+        head.docs = dict(data.get("docs", {}))
+        head.temperature = data.get("temperature", 1.0)
+        return head
+
+
+class LocalModel:
+    """
+    Ba đầu ra (doc_type, category, vendor) trên cùng vector đặc trưng.
+
+    Args:
+        path: File lưu mô hình (JSON nén gzip); None = không lưu
+        threshold: Confidence tối thiểu để dùng kết quả thay cho AI
+        min_rows: Số dòng đã học tối thiểu trước khi dự đoán
+    """
+
+    def __init__(
+        self,
+        path: str | Path | None = None,
+        threshold: float = DEFAULT_THRESHOLD,
+        min_rows: int = DEFAULT_MIN_ROWS,
+    ) -> None:
+        self.path = Path(path).expanduser() if path else None
+        self.threshold = threshold
+        self.min_rows = max(1, min_rows)
+        self.heads = {name: _NaiveBayesHead() for name in HEADS}
+        # Mẫu đã học: khóa (sha256) → nhãn đã học (label_key)
+        self.trained: dict[str, str] = {}
+
+    @classmethod
+    def from_config(cls, config: dict[str, Any]) -> LocalModel | None:
+        """Tạo (và nạp nếu đã lưu) từ `classifier.local_model_*`; None nếu tắt."""
+        cfg = config.get("classifier", {})
+        if not cfg.get("local_model_enabled", False):
+            return None
+        model = cls(
+            cfg.get("local_model_file"),
+            threshold=cfg.get("local_model_threshold", DEFAULT_THRESHOLD),
+            min_rows=cfg.get("local_model_min_rows", DEFAULT_MIN_ROWS),
+        )
+        model.load()
+        return model
+
+    @property
+    def ready(self) -> bool:
+        return len(self.trained) >= self.min_rows
+
+    def fit(self, examples: list[tuple[str, Features, dict[str, str]]]) -> None:
+        """
+        Huấn luyện từ đầu: học phần lớn dữ liệu, hiệu chỉnh temperature trên
+        phần giữ lại, rồi học nốt phần giữ lại.
+
+        Args:
+            examples: Danh sách (khóa dòng, đặc trưng, nhãn theo từng đầu ra)
+        """
+        self.heads = {name: _NaiveBayesHead() for name in HEADS}
+        self.trained = {}
+        examples = list(examples)
+        random.Random(0).shuffle(examples)
+        n_holdout = int(len(examples) * _HOLDOUT_FRACTION) if len(examples) >= 10 else 0
+        holdout, train = examples[:n_holdout], examples[n_holdout:]
+
+        self.partial_fit(train)
+        for name, head in self.heads.items():
+            head.calibrate([(x, labels[name]) for _, x, labels in holdout])
+        self.partial_fit(holdout)
+
+    def partial_fit(self, examples: list[tuple[str, Features, dict[str, str]]]) -> None:
+        """
+        Học tăng dần các mẫu mới (giữ temperature đã hiệu chỉnh). Mẫu đã học với
+        nhãn khác cần `fit` lại từ đầu (Naive Bayes chỉ cộng dồn, không gỡ được).
+        """
+        for key, x, labels in examples:
+            if key in self.trained:
+                raise ValueError(f"Mẫu {key} đã học, nhãn mới cần fit lại từ đầu")
+            for name, head in self.heads.items():
+                head.learn(x, labels[name])
+            self.trained[key] = label_key(labels)
+
+    def copy(self) -> LocalModel:
+        """Bản sao độc lập (học trong thread rồi thay thế, predict không thấy trạng thái dở)."""
+        return copy.deepcopy(self)
+
+    def predict(self, x: Features) -> dict[str, Any] | None:
+        """
+        Nhãn có xác suất cao nhất của mỗi đầu ra.
+
+        Returns:
+            {"doc_type", "category", "vendor", "confidence"} với confidence là
+            xác suất nhỏ nhất trong ba đầu ra; None nếu chưa đủ dữ liệu.
+        """
+        if not self.ready:
+            return None
+        prediction: dict[str, Any] = {}
+        confidence = 1.0
+        for name, head in self.heads.items():
+            proba = head.proba(x)
+            if not proba:
+                return None
+            label, p = max(proba.items(), key=lambda item: item[1])
+            prediction[name] = label
+            confidence = min(confidence, p)
+        prediction["confidence"] = confidence
+        return prediction
+
+    def save(self) -> None:
+        if self.path is None:
+            return
+        data = {
+            "version": MODEL_VERSION,
+            "n_features": _N_FEATURES,
+            "trained": self.trained,
+            "heads": {name: head.to_dict() for name, head in self.heads.items()},
+        }
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_name(self.path.name + ".tmp")
+        with gzip.open(tmp, "wt", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, separators=(",", ":"))
+        tmp.replace(self.path)
+
+    def load(self) -> bool:
+        """Nạp mô hình đã lưu; False nếu chưa có hoặc khác phiên bản đặc trưng."""
+        if self.path is None or not self.path.exists():
+            return False
+        try:
+            with gzip.open(self.path, "rt", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, EOFError, json.JSONDecodeError) as e:
+            logger.warning(f"Không đọc được mô hình cục bộ {self.path}: {e}")
+            return False
+        if data.get("version") != MODEL_VERSION or data.get("n_features") != _N_FEATURES:
+            logger.info("Mô hình cục bộ khác phiên bản, sẽ huấn luyện lại.")
+            return False
+        self.heads = {
+            name: _NaiveBayesHead.from_dict(data.get("heads", {}).get(name, {})) for name in HEADS
+        }
+        self.trained = dict(data.get("trained", {}))
+        return True
@@ -0,0 +1,315 @@
+"""
+native_extract.py — Trích xuất nhanh không qua kreuzberg cho định dạng đơn giản.
+
+Báo giá, file cấu hình thường là txt/csv/docx/xlsx/pptx: đọc trực tiếp nhẹ
+hơn nhiều so với đường trích xuất tổng quát của kreuzberg (không cần worker
+process, không dựng cả cây XML):
+- Text (txt/md/json/xml...): đọc stream, nhận diện encoding (BOM, UTF-8,
+  fallback cp1258 cho file Windows tiếng Việt, chuẩn hóa về NFC)
+- CSV: đọc từng dòng bằng `csv` (tự đoán dấu phân cách), cột nối bằng tab
+- DOCX/PPTX: đọc XML trong zip, iterparse đoạn văn/slide
+- XLSX: duyệt từng dòng của sheet bằng iterparse (read-only), không nạp cả sheet
+Mọi reader dừng ngay khi đủ `max_chars` ký tự (preview). Lỗi định dạng được
+báo bằng các exception trong `NATIVE_ERRORS` để caller fallback về kreuzberg.
+
+Sử dụng:
+    if supports_native(ingested.mime_type):
+        result = extract_native(ingested, max_pages=3, max_chars=20000)
+"""
+
+from __future__ import annotations
+
+import codecs
+import csv
+import io
+import unicodedata
+import zipfile
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import IO, TYPE_CHECKING, Any
+from xml.etree import ElementTree
+
+if TYPE_CHECKING:
+    from app.ingest import IngestedFile
+
+DOCX = "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+XLSX = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+PPTX = "application/vnd.openxmlformats-officedocument.presentationml.presentation"
+_CSV_MIME_TYPES = {"text/csv", "application/csv"}
+_TEXT_MIME_TYPES = {"application/json", "application/xml", "application/csv"}
+
+# Lỗi của reader native → caller fallback về kreuzberg
+NATIVE_ERRORS = (zipfile.BadZipFile, KeyError, ElementTree.ParseError, ValueError, csv.Error)
+
+# Số byte đầu dùng để nhận diện encoding / đoán dấu phân cách CSV
+_SNIFF_BYTES = 64 * 1024
+_SNIFF_CHARS = 8192
+_BOMS = (
+    (codecs.BOM_UTF8, "utf-8-sig"),
+    (codecs.BOM_UTF16_LE, "utf-16"),
+    (codecs.BOM_UTF16_BE, "utf-16"),
+)
+# Không phải UTF-8 → nhiều khả năng là file Windows tiếng Việt
+_FALLBACK_ENCODING = "cp1258"
+
+
+@dataclass
+class NativeResult:
+    """Kết quả trích xuất native (cùng thuộc tính chính với ExtractionResult)."""
+
+    content: str
+    mime_type: str | None = None
+    metadata: dict[str, Any] = field(default_factory=dict)
+    complete: bool = True  # False → dừng sớm vì đủ max_chars/max_pages
+
+
+def supports_native(mime_type: str | None) -> bool:
+    """Định dạng có reader native."""
+    mime = mime_type or ""
+    return mime.startswith("text/") or mime in _TEXT_MIME_TYPES or mime in (DOCX, XLSX, PPTX)
+
+
+def _local(tag: str) -> str:
+    """Tên thẻ XML bỏ namespace."""
+    return tag.rsplit("}", 1)[-1]
+
+
+def _source(ingested: IngestedFile) -> io.BytesIO | Path:
+    return io.BytesIO(ingested.data) if ingested.buffered else ingested.path
+
+
+def _open_binary(ingested: IngestedFile) -> IO[bytes]:
+    return io.BytesIO(ingested.data) if ingested.buffered else open(ingested.path, "rb")
+
+
+# ----------------------------------------------------------------------
+# Text / CSV
+# ----------------------------------------------------------------------
+
+
+def detect_encoding(head: bytes) -> str:
+    """Encoding của text theo BOM, UTF-8 hợp lệ, hoặc fallback cp1258."""
+    for bom, encoding in _BOMS:
+        if head.startswith(bom):
+            return encoding
+    try:
+        # final=False: ký tự nhiều byte bị cắt ở cuối đoạn đầu không tính là lỗi
+        codecs.getincrementaldecoder("utf-8")().decode(head, final=False)
+        return "utf-8"
+    except UnicodeDecodeError:
+        return _FALLBACK_ENCODING
+
+
+def _nfc(text: str, encoding: str) -> str:
+    # cp1258 lưu dấu thanh dạng tổ hợp (ơ + ◌̉) → ghép về dạng dựng sẵn (ở)
+    return unicodedata.normalize("NFC", text) if encoding == _FALLBACK_ENCODING else text
+
+
+def _open_text(ingested: IngestedFile) -> tuple[io.TextIOWrapper, str]:
+    raw = _open_binary(ingested)
+    if ingested.buffered:
+        head = ingested.data[:_SNIFF_BYTES]
+    else:
+        head = raw.read(_SNIFF_BYTES)
+        raw.seek(0)
+    encoding = detect_encoding(head)
+    return io.TextIOWrapper(raw, encoding=encoding, errors="replace", newline=""), encoding
+
+
+def _plain_text(ingested: IngestedFile, max_chars: int | None) -> NativeResult:
+    stream, encoding = _open_text(ingested)
+    with stream:
+        if max_chars is None:
+            content, complete = stream.read(), True
+        else:
+            content = stream.read(max_chars)
+            complete = not stream.read(1)
+    content = _nfc(content, encoding)
+    return NativeResult(content, ingested.mime_type, {"encoding": encoding}, complete)
+
+
+def _csv_text(ingested: IngestedFile, max_chars: int | None) -> NativeResult:
+    stream, encoding = _open_text(ingested)
+    with stream:
+        sample = stream.read(_SNIFF_CHARS)
+        stream.seek(0)
+        try:
+            dialect: Any = csv.Sniffer().sniff(sample, delimiters=",;\t|")
+        except csv.Error:
+            dialect = csv.excel
+        lines, size, rows = [], 0, 0
+        for row in csv.reader(stream, dialect):
+            cells = [cell.strip() for cell in row if cell.strip()]
+            if not cells:
+                continue
+            line = _nfc("\t".join(cells), encoding)
+            lines.append(line)
+            rows += 1
+            size += len(line)
+            if max_chars is not None and size >= max_chars:
+                return NativeResult(
+                    "\n".join(lines), ingested.mime_type, {"encoding": encoding}, complete=False
+                )
+    metadata = {"encoding": encoding, "row_count": rows}
+    return NativeResult("\n".join(lines), ingested.mime_type, metadata)
+
+
+# ----------------------------------------------------------------------
+# Office Open XML (đọc trực tiếp từ zip, không cần thư viện ngoài)
+# ----------------------------------------------------------------------
+
+
+def _rels(zf: zipfile.ZipFile, rels_path: str, base_dir: str) -> dict[str, str]:
+    """Map rId → đường dẫn part trong zip."""
+    root = ElementTree.fromstring(zf.read(rels_path))
+    result = {}
+    for rel in root:
+        target = rel.get("Target", "")
+        path = target.lstrip("/") if target.startswith("/") else f"{base_dir}/{target}"
+        result[rel.get("Id")] = path
+    return result
+
+
+def _ordered_parts(zf: zipfile.ZipFile, main: str, rels_path: str, list_tag: str) -> list[str]:
+    """Các part (sheet/slide) theo đúng thứ tự khai báo trong part chính."""
+    base_dir = main.rsplit("/", 1)[0]
+    rels = _rels(zf, rels_path, base_dir)
+    parts = []
+    for el in ElementTree.fromstring(zf.read(main)).iter():
+        if _local(el.tag) == list_tag:
+            rid = next((v for k, v in el.attrib.items() if _local(k) == "id" and k != "id"), None)
+            if rid in rels:
+                parts.append(rels[rid])
+    return parts
+
+
+def _paragraph_texts(xml: bytes, para_tag: str, text_tag: str) -> list[str]:
+    paragraphs = []
+    for el in ElementTree.fromstring(xml).iter():
+        if _local(el.tag) == para_tag:
+            text = "".join(t.text or "" for t in el.iter() if _local(t.tag) == text_tag)
+            if text.strip():
+                paragraphs.append(text)
+    return paragraphs
+
+
+def _pptx_text(
+    ingested: IngestedFile, max_slides: int | None, max_chars: int | None
+) -> NativeResult:
+    with zipfile.ZipFile(_source(ingested)) as zf:
+        slides = _ordered_parts(
+            zf, "ppt/presentation.xml", "ppt/_rels/presentation.xml.rels", "sldId"
+        )
+        chunks, size = [], 0
+        for no, part in enumerate(slides[:max_slides], start=1):
+            text = "\n".join(_paragraph_texts(zf.read(part), "p", "t"))
+            chunks.append(f"--- Slide {no} ---\n{text}")
+            size += len(text)
+            if max_chars is not None and size >= max_chars:
+                break
+        complete = len(chunks) == len(slides)
+        return NativeResult("\n".join(chunks), PPTX, {"slide_count": len(slides)}, complete)
+
+
+def _shared_strings(zf: zipfile.ZipFile) -> list[str]:
+    if "xl/sharedStrings.xml" not in zf.namelist():
+        return []
+    shared: list[str] = []
+    with zf.open("xl/sharedStrings.xml") as f:
+        for _, el in ElementTree.iterparse(f, events=("end",)):
+            if _local(el.tag) == "si":
+                shared.append("".join(t.text or "" for t in el.iter() if _local(t.tag) == "t"))
+                el.clear()
+    return shared
+
+
+def _cell_value(cell: ElementTree.Element, shared: list[str]) -> str | None:
+    value = next((v.text for v in cell if _local(v.tag) == "v"), None)
+    if cell.get("t") == "s" and value is not None:
+        index = int(value)
+        return shared[index] if index < len(shared) else ""
+    if cell.get("t") == "inlineStr":
+        return "".join(t.text or "" for t in cell.iter() if _local(t.tag) == "t")
+    return value
+
+
+def _xlsx_text(
+    ingested: IngestedFile, max_sheets: int | None, max_chars: int | None
+) -> NativeResult:
+    with zipfile.ZipFile(_source(ingested)) as zf:
+        shared = _shared_strings(zf)
+        workbook = ElementTree.fromstring(zf.read("xl/workbook.xml"))
+        names = [el.get("name", "") for el in workbook.iter() if _local(el.tag) == "sheet"]
+        sheets = _ordered_parts(zf, "xl/workbook.xml", "xl/_rels/workbook.xml.rels", "sheet")
+        metadata = {"sheet_count": len(sheets)}
+
+        lines, size = [], 0
+        selected = list(zip(names, sheets))[:max_sheets]
+        for name, part in selected:
+            lines.append(f"--- Sheet {name} ---")
+            with zf.open(part) as f:
+                # Duyệt từng dòng rồi giải phóng, không dựng cả sheet trong RAM
+                for _, row in ElementTree.iterparse(f, events=("end",)):
+                    if _local(row.tag) != "row":
+                        continue
+                    cells = [v for v in (_cell_value(c, shared) for c in row) if v]
+                    row.clear()
+                    if not cells:
+                        continue
+                    line = "\t".join(cells)
+                    lines.append(line)
+                    size += len(line)
+                    if max_chars is not None and size >= max_chars:
+                        return NativeResult("\n".join(lines), XLSX, metadata, complete=False)
+        return NativeResult("\n".join(lines), XLSX, metadata, len(selected) == len(sheets))
+
+
+def _docx_text(ingested: IngestedFile, max_chars: int | None) -> NativeResult:
+    with zipfile.ZipFile(_source(ingested)) as zf:
+        paragraphs, size = [], 0
+        with zf.open("word/document.xml") as f:
+            # iterparse: dừng ngay khi đủ ký tự, không parse phần còn lại
+            for _, el in ElementTree.iterparse(f, events=("end",)):
+                if _local(el.tag) != "p":
+                    continue
+                text = "".join(t.text or "" for t in el.iter() if _local(t.tag) == "t")
+                el.clear()
+                if text.strip():
+                    paragraphs.append(text)
+                    size += len(text)
+                    if max_chars is not None and size >= max_chars:
+                        return NativeResult("\n".join(paragraphs), DOCX, {}, complete=False)
+        return NativeResult("\n".join(paragraphs), DOCX, {})
+
+
+# ----------------------------------------------------------------------
+# API
+# ----------------------------------------------------------------------
+
+
+def extract_native(
+    ingested: IngestedFile, max_pages: int | None = None, max_chars: int | None = None
+) -> NativeResult:
+    """
+    Trích xuất bằng reader native (đồng bộ, chạy trong thread).
+
+    Args:
+        max_pages: Số sheet/slide tối đa; None → toàn bộ
+        max_chars: Dừng khi đủ số ký tự; None → toàn bộ
+
+    Raises:
+        ValueError: Định dạng không có reader native
+        NATIVE_ERRORS: File hỏng/không đúng định dạng
+    """
+    mime = ingested.mime_type or ""
+    if mime in _CSV_MIME_TYPES:
+        return _csv_text(ingested, max_chars)
+    if mime.startswith("text/") or mime in _TEXT_MIME_TYPES:
+        return _plain_text(ingested, max_chars)
+    if mime == DOCX:
+        return _docx_text(ingested, max_chars)
+    if mime == XLSX:
+        return _xlsx_text(ingested, max_pages, max_chars)
+    if mime == PPTX:
+        return _pptx_text(ingested, max_pages, max_chars)
+    raise ValueError(f"Không có reader native cho {mime or ingested.path.suffix}")
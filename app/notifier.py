@@ -0,0 +1,301 @@
+"""
+notifier.py — Dịch vụ gửi thông báo Telegram dùng chung cho pipeline.
+
+Một Bot duy nhất với connection pool HTTP, hàng đợi gửi tin có giới hạn
+tốc độ theo chat (tôn trọng RetryAfter của Telegram) và chế độ digest:
+gom các draft trong cùng một đợt import thành tin nhắn tóm tắt phân trang
+thay vì gửi hàng trăm tin riêng lẻ. Digest chỉ bật cho luồng bulk hoặc khi
+draft đến dồn dập; một draft tương tác đơn lẻ được gửi ngay.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import html
+import logging
+import os
+import time
+from collections import deque
+from pathlib import Path
+from typing import Any
+
+from telegram import Bot, InlineKeyboardMarkup
+from telegram.constants import ParseMode
+from telegram.error import RetryAfter, TelegramError
+from telegram.request import HTTPXRequest
+
+from app.scheduler import BULK, current_priority
+from app.ui import render_digest_page, render_draft_message
+
+logger = logging.getLogger(__name__)
+
+# Sentinel dừng worker
+_STOP = object()
+
+# Số lần thử lại khi Telegram trả 429 (RetryAfter)
+_MAX_SEND_ATTEMPTS = 3
+
+
+class TelegramNotifier:
+    """
+    Notifier Telegram sống suốt vòng đời daemon.
+
+    Ví dụ sử dụng:
+        notifier = TelegramNotifier.from_config(config)
+        await notifier.start()
+        await notifier.notify_draft(file_info, confidence=0.9, is_confident=True)
+        await notifier.close()  # flush digest + hàng đợi, đóng HTTP pool
+    """
+
+    def __init__(
+        self,
+        token: str | None,
+        chat_id: str | None,
+        config: dict[str, Any],
+        bot: Bot | None = None,
+    ) -> None:
+        """
+        Khởi tạo notifier.
+
+        Args:
+            token: TELEGRAM_BOT_TOKEN (None → notifier bị tắt)
+            chat_id: group_chat_id nhận thông báo
+            config: Dict cấu hình đầy đủ (dùng cho render và services.telegram)
+            bot: Bot đã tạo sẵn (tùy chọn, dùng cho test)
+        """
+        tg_config = config.get("services", {}).get("telegram", {})
+        self._config = config
+        self._chat_id = str(chat_id) if chat_id else None
+        self.enabled = bool(self._chat_id and (token or bot))
+
+        self._min_interval = float(tg_config.get("min_send_interval_seconds", 3.0))
+        self._digest_enabled = bool(tg_config.get("digest_enabled", True))
+        self._digest_window = float(tg_config.get("digest_window_seconds", 10.0))
+        self._digest_min_items = int(tg_config.get("digest_min_items", 3))
+        self._digest_page_size = int(tg_config.get("digest_page_size", 10))
+        self._digest_max_wait = float(tg_config.get("digest_max_wait_seconds", 60.0))
+        self._digest_max_items = int(tg_config.get("digest_max_items", 50))
+
+        if bot is None and self.enabled:
+            request = HTTPXRequest(
+                connection_pool_size=int(tg_config.get("connection_pool_size", 8))
+            )
+            bot = Bot(token=token, request=request)
+        self._bot = bot
+
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self._worker: asyncio.Task | None = None
+        self._last_sent: dict[str, float] = {}
+
+        # Digest state: drafts đang gom trong đợt hiện tại
+        self._drafts: list[dict[str, Any]] = []
+        self._first_draft_at = 0.0
+        self._last_draft_at = 0.0
+        # Thời điểm các draft tương tác gần đây (phát hiện đợt dồn dập)
+        self._recent_drafts: deque[float] = deque()
+        self._digest_task: asyncio.Task | None = None
+
+    @classmethod
+    def from_config(cls, config: dict[str, Any]) -> TelegramNotifier:
+        """Tạo notifier từ config + biến môi trường TELEGRAM_BOT_TOKEN."""
+        token = os.getenv("TELEGRAM_BOT_TOKEN")
+        chat_id = config.get("services", {}).get("telegram", {}).get("group_chat_id")
+        return cls(token, chat_id, config)
+
+    async def start(self) -> None:
+        """Khởi động worker gửi tin."""
+        if self.enabled and self._worker is None:
+            self._worker = asyncio.create_task(self._run())
+
+    async def close(self) -> None:
+        """Flush digest đang chờ, gửi hết hàng đợi rồi đóng HTTP pool."""
+        if self._digest_task and not self._digest_task.done():
+            self._digest_task.cancel()
+        self._flush_drafts()
+
+        if self._worker is not None:
+            await self._queue.put(_STOP)
+            await self._worker
+            self._worker = None
+
+        if self._bot is not None:
+            try:
+                await self._bot.shutdown()
+            except Exception as e:
+                logger.debug("Lỗi đóng Telegram Bot: %s", e)
+
+    # ------------------------------------------------------------------
+    # API cho pipeline
+    # ------------------------------------------------------------------
+
+    async def send(self, text: str, reply_markup: InlineKeyboardMarkup | None = None) -> None:
+        """Đưa một tin nhắn HTML vào hàng đợi gửi tới group chat."""
+        if not self.enabled:
+            return
+        await self.start()
+        await self._queue.put((self._chat_id, text, reply_markup))
+
+    async def notify_error(self, file_path: str, error: Exception | str) -> None:
+        """Báo lỗi phân loại một file."""
+        safe_filename = html.escape(Path(file_path).name)
+        safe_error = html.escape(str(error))
+        await self.send(
+            f"❌ <b>Lỗi phân loại tài liệu!</b>\n\n"
+            f"<b>File:</b> <code>{safe_filename}</code>\n"
+            f"<b>Lỗi:</b> {safe_error}\n\n"
+            f"Vui lòng kiểm tra lại quota hoặc thử lại sau."
+        )
+
+    async def notify_draft(
+        self, file_info: dict[str, Any], confidence: float | None, is_confident: bool
+    ) -> None:
+        """
+        Gửi thông báo draft chờ phê duyệt.
+
+        Digest chỉ áp dụng cho luồng bulk, hoặc khi đã có đợt đang gom, hoặc khi
+        `digest_min_items` draft tương tác đến trong cùng `digest_window_seconds`;
+        các trường hợp còn lại gửi ngay. Đợt được flush sau `digest_window_seconds`
+        yên lặng, nhưng không muộn hơn `digest_max_wait_seconds` kể từ draft đầu
+        tiên và ngay khi gom đủ `digest_max_items`.
+        """
+        if not self.enabled:
+            return
+        if not self._should_digest():
+            report, reply_markup = render_draft_message(
+                file_info, self._config, confidence, is_confident
+            )
+            await self.send(report, reply_markup)
+            return
+
+        now = time.monotonic()
+        if not self._drafts:
+            self._first_draft_at = now
+        self._drafts.append(
+            {"file_info": file_info, "confidence": confidence, "is_confident": is_confident}
+        )
+        self._last_draft_at = now
+        if len(self._drafts) >= self._digest_max_items:
+            if self._digest_task and not self._digest_task.done():
+                self._digest_task.cancel()
+            self._digest_task = None
+            self._flush_drafts()
+            return
+        if self._digest_task is None or self._digest_task.done():
+            self._digest_task = asyncio.create_task(self._digest_after_quiet())
+
+    # ------------------------------------------------------------------
+    # Digest
+    # ------------------------------------------------------------------
+
+    def _should_digest(self) -> bool:
+        """Draft hiện tại có nên gom vào digest không."""
+        if not self._digest_enabled:
+            return False
+        if self._drafts or current_priority() == BULK:
+            return True
+        now = time.monotonic()
+        while self._recent_drafts and now - self._recent_drafts[0] > self._digest_window:
+            self._recent_drafts.popleft()
+        self._recent_drafts.append(now)
+        return len(self._recent_drafts) >= self._digest_min_items
+
+    async def _digest_after_quiet(self) -> None:
+        """Chờ đợt draft yên lặng `digest_window_seconds` (tối đa `digest_max_wait_seconds`)."""
+        try:
+            while True:
+                now = time.monotonic()
+                remaining = min(
+                    self._last_draft_at + self._digest_window,
+                    self._first_draft_at + self._digest_max_wait,
+                ) - now
+                if remaining <= 0:
+                    break
+                await asyncio.sleep(remaining)
+        except asyncio.CancelledError:
+            return
+        self._flush_drafts()
+
+    def _flush_drafts(self) -> None:
+        """Chuyển các draft đang gom thành tin nhắn trong hàng đợi."""
+        drafts, self._drafts = self._drafts, []
+        if not drafts or not self.enabled:
+            return
+        if self._worker is None:
+            self._worker = asyncio.create_task(self._run())
+
+        if len(drafts) < self._digest_min_items:
+            for d in drafts:
+                report, reply_markup = render_draft_message(
+                    d["file_info"], self._config, d["confidence"], d["is_confident"]
+                )
+                self._queue.put_nowait((self._chat_id, report, reply_markup))
+            return
+
+        size = max(1, self._digest_page_size)
+        pages = [drafts[i : i + size] for i in range(0, len(drafts), size)]
+        logger.info("Gửi digest %d draft (%d trang)", len(drafts), len(pages))
+        for page_no, page in enumerate(pages, 1):
+            text, reply_markup = render_digest_page(
+                [d["file_info"] for d in page], page_no, len(pages), len(drafts)
+            )
+            self._queue.put_nowait((self._chat_id, text, reply_markup))
+
+    # ------------------------------------------------------------------
+    # Worker gửi tin
+    # ------------------------------------------------------------------
+
+    async def _wait_for_slot(self, chat_id: str) -> None:
+        """Giữ khoảng cách tối thiểu giữa 2 tin nhắn tới cùng một chat."""
+        last = self._last_sent.get(chat_id)
+        if last is not None:
+            wait = last + self._min_interval - time.monotonic()
+            if wait > 0:
+                await asyncio.sleep(wait)
+
+    async def _deliver(
+        self, chat_id: str, text: str, reply_markup: InlineKeyboardMarkup | None
+    ) -> None:
+        """Gửi 1 tin nhắn, chờ theo RetryAfter nếu bị Telegram giới hạn."""
+        for attempt in range(_MAX_SEND_ATTEMPTS):
+            await self._wait_for_slot(chat_id)
+            try:
+                await self._bot.send_message(
+                    chat_id=chat_id,
+                    text=text,
+                    parse_mode=ParseMode.HTML,
+                    reply_markup=reply_markup,
+                )
+                self._last_sent[chat_id] = time.monotonic()
+                return
+            except RetryAfter as e:
+                retry_after = e.retry_after
+                delay = (
+                    retry_after.total_seconds()
+                    if hasattr(retry_after, "total_seconds")
+                    else float(retry_after)
+                )
+                logger.warning(
+                    "Telegram giới hạn tốc độ (429), chờ %.1fs (lần %d/%d)",
+                    delay,
+                    attempt + 1,
+                    _MAX_SEND_ATTEMPTS,
+                )
+                self._last_sent[chat_id] = time.monotonic() + delay
+            except TelegramError as e:
+                logger.error("Lỗi gửi Telegram: %s", e)
+                return
+        logger.error("Bỏ tin nhắn Telegram sau %d lần bị giới hạn tốc độ", _MAX_SEND_ATTEMPTS)
+
+    async def _run(self) -> None:
+        """Vòng lặp worker: lấy tin từ hàng đợi và gửi tuần tự theo rate limit."""
+        while True:
+            item = await self._queue.get()
+            if item is _STOP:
+                break
+            chat_id, text, reply_markup = item
+            try:
+                await self._deliver(chat_id, text, reply_markup)
+            except Exception as e:
+                # Không để 1 tin lỗi làm chết worker
+                logger.error("Lỗi worker Telegram: %s", e)
+
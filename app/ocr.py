@@ -0,0 +1,217 @@
+"""
+ocr.py — OCR song song theo trang cho PDF scan (báo giá, quyết định trúng thầu...).
+
+PDF chỉ có ảnh cho ra rất ít text, classifier khi đó chỉ còn tên file.
+`PageOcr` chỉ chạy khi mật độ text thấp (< `ocr_min_chars_per_page` ký tự
+mỗi trang), tách PDF thành từng trang (`pypdf`) và OCR (tesseract qua
+kreuzberg) nhiều trang cùng lúc:
+- Preview: dừng giao trang mới ngay khi đã đủ `ocr_target_chars` ký tự (các
+  trang đang OCR dở được chờ xong), không OCR cả tài liệu
+- Nền: OCR toàn bộ trang cho tìm kiếm/tóm tắt (FullExtractionQueue)
+Có ExtractionPool thì mỗi trang chạy trong worker process (số trang song
+song bị giới hạn thêm bởi `pool_workers`).
+
+Sử dụng:
+    ocr = PageOcr.from_config(config, pool)
+    if ocr and await ocr.is_sparse(ingested, text, pages=3):
+        scanned = await ocr.run(ingested, target_chars=ocr.target_chars)
+"""
+
+from __future__ import annotations
+
+import asyncio
+import io
+import logging
+import os
+from dataclasses import dataclass, field
+from typing import Any
+
+from app.extract_pool import ExtractionPool
+from app.ingest import IngestedFile
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MIN_CHARS_PER_PAGE = 100
+DEFAULT_LANGUAGE = "eng"
+DEFAULT_MAX_PAGES = 10
+DEFAULT_TARGET_CHARS = 4000
+
+_PDF = "application/pdf"
+
+
+@dataclass
+class OcrResult:
+    """Text OCR theo thứ tự trang."""
+
+    content: str
+    page_count: int
+    pages: list[int] = field(default_factory=list)  # Chỉ số trang đã OCR (từ 0)
+
+    @property
+    def complete(self) -> bool:
+        return len(self.pages) >= self.page_count
+
+
+def _open_pdf(ingested: IngestedFile) -> Any | None:
+    try:
+        from pypdf import PdfReader
+    except ImportError:
+        return None
+    try:
+        source = io.BytesIO(ingested.data) if ingested.buffered else ingested.path
+        return PdfReader(source)
+    except Exception as e:  # PDF mã hóa/hỏng
+        logger.debug("Không mở được PDF %s để OCR: %s", ingested.path.name, e)
+        return None
+
+
+def _page_pdf(reader: Any, index: int) -> bytes:
+    """Một trang thành PDF riêng (để OCR song song từng trang)."""
+    from pypdf import PdfWriter
+
+    writer = PdfWriter()
+    writer.add_page(reader.pages[index])
+    buf = io.BytesIO()
+    writer.write(buf)
+    return buf.getvalue()
+
+
+def _visible_chars(text: str) -> int:
+    return sum(1 for ch in text if not ch.isspace())
+
+
+class PageOcr:
+    """
+    OCR song song theo trang với dừng sớm.
+
+    Args:
+        min_chars_per_page: Mật độ text tối thiểu; thấp hơn → coi là bản scan
+        language: Ngôn ngữ tesseract (VD "eng", "vie+eng" nếu đã cài gói vie)
+        workers: Số trang OCR song song (0 → số CPU)
+        max_pages: Số trang tối đa OCR cho preview
+        target_chars: Preview dừng sớm khi đã có ngần này ký tự
+        pool: ExtractionPool (None → kreuzberg trong tiến trình chính)
+    """
+
+    def __init__(
+        self,
+        min_chars_per_page: int = DEFAULT_MIN_CHARS_PER_PAGE,
+        language: str = DEFAULT_LANGUAGE,
+        workers: int = 0,
+        max_pages: int = DEFAULT_MAX_PAGES,
+        target_chars: int = DEFAULT_TARGET_CHARS,
+        pool: ExtractionPool | None = None,
+    ):
+        self.min_chars_per_page = min_chars_per_page
+        self.language = language
+        self.workers = max(1, workers or os.cpu_count() or 1)
+        self.max_pages = max(1, max_pages)
+        self.target_chars = target_chars
+        self.pool = pool
+
+    @classmethod
+    def from_config(
+        cls, config: dict[str, Any], pool: ExtractionPool | None = None
+    ) -> PageOcr | None:
+        """Tạo từ `extraction.ocr_*` trong config.yaml; None nếu tắt."""
+        cfg = config.get("extraction", {})
+        if not cfg.get("ocr_enabled", True):
+            return None
+        return cls(
+            min_chars_per_page=cfg.get("ocr_min_chars_per_page", DEFAULT_MIN_CHARS_PER_PAGE),
+            language=cfg.get("ocr_language", DEFAULT_LANGUAGE),
+            workers=cfg.get("ocr_workers", 0),
+            max_pages=cfg.get("ocr_max_pages", DEFAULT_MAX_PAGES),
+            target_chars=cfg.get("ocr_target_chars", DEFAULT_TARGET_CHARS),
+            pool=pool,
+        )
+
+    async def is_sparse(
+        self, ingested: IngestedFile, content: str, pages: int | None = None
+    ) -> bool:
+        """
+        PDF có quá ít text so với số trang (nhiều khả năng là bản scan).
+
+        Args:
+            pages: Số trang `content` bao phủ; None → đếm toàn bộ trang của file
+        """
+        if (ingested.mime_type or "") != _PDF:
+            return False
+        if pages is None:
+            reader = await asyncio.to_thread(_open_pdf, ingested)
+            pages = len(reader.pages) if reader is not None else 1
+        return _visible_chars(content) < self.min_chars_per_page * max(1, pages)
+
+    async def _ocr_page(self, ingested: IngestedFile, index: int, data: bytes) -> str:
+        """OCR một trang (PDF một trang), "" nếu lỗi."""
+        try:
+            if self.pool is not None:
+                result = await self.pool.extract(
+                    ingested.path, data, _PDF, ocr_language=self.language
+                )
+            else:
+                from kreuzberg import ExtractionConfig, OcrConfig, extract_bytes
+
+                config = ExtractionConfig(
+                    force_ocr=True, ocr=OcrConfig(backend="tesseract", language=self.language)
+                )
+                result = await extract_bytes(data, _PDF, config=config)
+            return result.content or ""
+        except Exception as e:
+            logger.warning(f"OCR trang {index + 1} của {ingested.path.name} lỗi: {e}")
+            return ""
+
+    async def run(
+        self,
+        ingested: IngestedFile,
+        target_chars: int | None = None,
+        max_pages: int | None = None,
+    ) -> OcrResult:
+        """
+        OCR các trang đầu theo thứ tự, tối đa `workers` trang cùng lúc.
+
+        Args:
+            target_chars: Dừng giao trang mới khi các trang liên tiếp từ đầu
+                đã đủ số ký tự này; None → OCR mọi trang
+            max_pages: Số trang tối đa; None → toàn bộ tài liệu
+
+        Returns:
+            OcrResult (page_count là tổng số trang của file)
+        """
+        reader = await asyncio.to_thread(_open_pdf, ingested)
+        if reader is None:
+            return OcrResult("", 0)
+        total = len(reader.pages)
+        limit = min(total, max_pages) if max_pages else total
+
+        texts: dict[int, str] = {}
+        running: dict[asyncio.Task, int] = {}
+        next_page = 0
+        enough = False
+        try:
+            while running or (next_page < limit and not enough):
+                while not enough and next_page < limit and len(running) < self.workers:
+                    # pypdf không thread-safe: tách trang tuần tự, OCR song song
+                    data = await asyncio.to_thread(_page_pdf, reader, next_page)
+                    task = asyncio.create_task(self._ocr_page(ingested, next_page, data))
+                    running[task] = next_page
+                    next_page += 1
+                done, _ = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    texts[running.pop(task)] = task.result()
+                if target_chars is not None and not enough:
+                    prefix = 0
+                    while prefix in texts:
+                        prefix += 1
+                    enough = sum(len(texts[i]) for i in range(prefix)) >= target_chars
+        finally:
+            for task in running:
+                task.cancel()
+
+        pages = sorted(texts)
+        content = "\n\n".join(texts[i].strip() for i in pages if texts[i].strip())
+        logger.info(
+            f"OCR {len(pages)}/{total} trang của {ingested.path.name}: {len(content)} ký tự"
+            + (" (dừng sớm)" if enough and len(pages) < limit else "")
+        )
+        return OcrResult(content, total, pages)
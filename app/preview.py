@@ -0,0 +1,295 @@
+"""
+preview.py — Trích xuất preview có giới hạn trang cho bước phân loại.
+
+Classifier chỉ cần vài nghìn ký tự đầu, nên thay vì parse (và OCR) toàn bộ
+tài liệu, preview dừng sớm theo từng định dạng:
+- PDF: cắt N trang đầu thành PDF mới rồi mới đưa cho kreuzberg (cần `pypdf`)
+- Text/CSV/DOCX/XLSX/PPTX: reader native (`app.native_extract`), N sheet/slide
+  đầu, dừng khi đủ ký tự
+Định dạng khác (hoặc thiếu `pypdf`, file Office hỏng) dùng trích xuất đầy đủ như cũ.
+PDF gần như không có text (bản scan) được OCR song song theo trang, dừng
+sớm khi đủ ký tự cho phân loại (`app.ocr.PageOcr`).
+
+Bản trích xuất đầy đủ được dời sang `FullExtractionQueue` chạy nền, ghi
+vào cache trích xuất để tìm kiếm/tóm tắt dùng sau.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import io
+import logging
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any
+
+from kreuzberg import extract_bytes
+
+from app.extract_cache import ExtractionCache
+from app.extract_pool import ExtractionPool
+from app.ingest import IngestedFile, extract_content, ingest_file
+from app.native_extract import NATIVE_ERRORS, extract_native, supports_native
+from app.ocr import PageOcr
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PREVIEW_PAGES = 3
+DEFAULT_PREVIEW_CHARS = 3000
+PREVIEW_VARIANT = "preview"
+# Tổng buffer (bytes) hàng đợi trích xuất nền được giữ lại từ lần đọc đầu
+DEFAULT_MAX_HELD_BYTES = 128 * 1024 * 1024
+
+_PDF = "application/pdf"
+
+
+@dataclass
+class PreviewResult:
+    """Kết quả preview (cùng thuộc tính chính với ExtractionResult)."""
+
+    content: str
+    mime_type: str | None = None
+    metadata: dict[str, Any] = field(default_factory=dict)
+    partial: bool = True  # False → đã là bản trích xuất đầy đủ
+
+
+def _source(ingested: IngestedFile) -> io.BytesIO | Path:
+    return io.BytesIO(ingested.data) if ingested.buffered else ingested.path
+
+
+# ----------------------------------------------------------------------
+# PDF
+# ----------------------------------------------------------------------
+
+
+def _slice_pdf(ingested: IngestedFile, max_pages: int) -> tuple[bytes, int] | None:
+    """
+    Cắt N trang đầu thành PDF mới.
+
+    Returns:
+        (pdf_bytes, tổng số trang) hoặc None nếu không cần/không cắt được
+    """
+    try:
+        from pypdf import PdfReader, PdfWriter
+    except ImportError:
+        return None
+    try:
+        reader = PdfReader(_source(ingested))
+        total = len(reader.pages)
+        if total <= max_pages:
+            return None
+        writer = PdfWriter()
+        for page in reader.pages[:max_pages]:
+            writer.add_page(page)
+        buf = io.BytesIO()
+        writer.write(buf)
+        return buf.getvalue(), total
+    except Exception as e:  # PDF mã hóa/hỏng → để kreuzberg xử lý đầy đủ
+        logger.debug("Không cắt được PDF %s: %s", ingested.path.name, e)
+        return None
+
+
+# ----------------------------------------------------------------------
+# API
+# ----------------------------------------------------------------------
+
+
+async def extract_preview(
+    ingested: IngestedFile,
+    cache: ExtractionCache | None = None,
+    max_pages: int = DEFAULT_PREVIEW_PAGES,
+    max_chars: int = DEFAULT_PREVIEW_CHARS,
+    pool: ExtractionPool | None = None,
+    ocr: PageOcr | None = None,
+    native: bool = True,
+) -> PreviewResult:
+    """
+    Trích xuất preview: tối đa `max_pages` trang/sheet/slide và `max_chars` ký tự.
+
+    Ưu tiên bản đầy đủ trong cache nếu đã có; preview được cache riêng.
+    Khi định dạng không hỗ trợ cắt trang, trích xuất đầy đủ (và cache lại).
+    Phần chạy kreuzberg đi qua `pool` nếu có. Có `ocr` thì PDF scan được OCR
+    các trang đầu tới khi đủ ký tự cho phân loại. `native=False` → text/Office
+    cũng trích xuất đầy đủ bằng kreuzberg.
+    """
+    if cache is not None:
+        full = await cache.get(ingested.sha256)
+        if full is not None and not (
+            ocr is not None
+            and not full.metadata.get("ocr_pages")
+            and await ocr.is_sparse(ingested, full.content)
+        ):
+            return PreviewResult(full.content[:max_chars], full.mime_type, full.metadata, False)
+        cached = await cache.get(ingested.sha256, variant=PREVIEW_VARIANT)
+        if cached is not None:
+            return PreviewResult(cached.content[:max_chars], cached.mime_type, cached.metadata)
+
+    mime = ingested.mime_type or ""
+    result: PreviewResult | None = None
+    try:
+        if native and supports_native(mime):
+            extracted = await asyncio.to_thread(extract_native, ingested, max_pages, max_chars)
+            result = PreviewResult(
+                extracted.content, mime, extracted.metadata, not extracted.complete
+            )
+            if cache is not None and extracted.complete:
+                # Tài liệu ngắn đã đọc hết: đây chính là bản đầy đủ
+                await cache.put(ingested.sha256, extracted)
+        elif mime == _PDF:
+            sliced = await asyncio.to_thread(_slice_pdf, ingested, max_pages)
+            if sliced is not None:
+                data, total = sliced
+                if pool is not None:
+                    extracted = await pool.extract(ingested.path, data, _PDF)
+                else:
+                    extracted = await extract_bytes(data, _PDF)
+                result = PreviewResult(extracted.content, mime, {"page_count": total})
+    except NATIVE_ERRORS as e:
+        logger.debug("Preview nhanh lỗi với %s (%s), trích xuất đầy đủ", ingested.path.name, e)
+        result = None
+
+    if result is None:
+        # Reader native vừa lỗi → kreuzberg
+        full = await extract_content(ingested, cache=cache, pool=pool, native=False)
+        result = PreviewResult(full.content, getattr(full, "mime_type", mime), {}, partial=False)
+
+    if ocr is not None and mime == _PDF:
+        result = await _ocr_preview(ingested, result, cache, max_pages, max_chars, ocr)
+
+    result.content = result.content[:max_chars]
+    if cache is not None and result.partial:
+        await cache.put(ingested.sha256, result, variant=PREVIEW_VARIANT)
+    return result
+
+
+async def _ocr_preview(
+    ingested: IngestedFile,
+    result: PreviewResult,
+    cache: ExtractionCache | None,
+    max_pages: int,
+    max_chars: int,
+    ocr: PageOcr,
+) -> PreviewResult:
+    """Thay text của PDF scan bằng text OCR các trang đầu (dừng sớm khi đủ ký tự)."""
+    pages = min(max_pages, result.metadata["page_count"]) if result.partial else None
+    if not await ocr.is_sparse(ingested, result.content, pages):
+        return result
+    scanned = await ocr.run(
+        ingested, target_chars=min(max_chars, ocr.target_chars), max_pages=ocr.max_pages
+    )
+    if len(scanned.content) <= len(result.content.strip()):
+        return result
+    ocr_result = PreviewResult(
+        scanned.content,
+        _PDF,
+        {"page_count": scanned.page_count, "ocr_pages": len(scanned.pages)},
+        partial=not scanned.complete,
+    )
+    if cache is not None and scanned.complete:
+        # Đã OCR hết tài liệu ngắn: đây chính là bản đầy đủ
+        await cache.put(ingested.sha256, ocr_result)
+    return ocr_result
+
+
+class FullExtractionQueue:
+    """
+    Trích xuất đầy đủ chạy nền (sau khi đã phân loại bằng preview) để lấp
+    cache cho tìm kiếm/tóm tắt. Không có cache thì không làm gì.
+
+    File được nộp kèm `IngestedFile` của lần đọc đầu thì dùng lại buffer đó
+    (không đọc/hash lại qua NAS). Tổng buffer giữ trong hàng đợi tối đa
+    `max_held_bytes`; vượt ngưỡng thì file đó được đọc lại khi tới lượt.
+    """
+
+    def __init__(
+        self,
+        cache: ExtractionCache | None,
+        max_buffer_bytes: int | None = None,
+        pool: ExtractionPool | None = None,
+        ocr: PageOcr | None = None,
+        native: bool = True,
+        max_held_bytes: int = DEFAULT_MAX_HELD_BYTES,
+    ):
+        self._cache = cache
+        self._pool = pool
+        self._ocr = ocr
+        self._native = native
+        self._max_buffer_bytes = max_buffer_bytes
+        self._max_held_bytes = max_held_bytes
+        self._held_bytes = 0
+        self._queue: asyncio.Queue[tuple[Path, str, IngestedFile | None]] = asyncio.Queue()
+        self._queued: set[str] = set()
+        self._worker: asyncio.Task | None = None
+
+    def submit(
+        self, path: str | Path, sha256: str, ingested: IngestedFile | None = None
+    ) -> None:
+        """Đưa file vào hàng đợi (bỏ qua nếu đã chờ sẵn), kèm lần đọc đầu nếu có."""
+        if self._cache is None or sha256 in self._queued:
+            return
+        if ingested is not None and ingested.buffered:
+            if self._held_bytes + ingested.size_bytes > self._max_held_bytes:
+                ingested = None
+            else:
+                self._held_bytes += ingested.size_bytes
+        self._queued.add(sha256)
+        self._queue.put_nowait((Path(path), sha256, ingested))
+        if self._worker is None or self._worker.done():
+            self._worker = asyncio.create_task(self._run())
+
+    async def _run(self) -> None:
+        while not self._queue.empty():
+            path, sha256, held = await self._queue.get()
+            try:
+                cached = await self._cache.get(sha256)
+                # Bản đầy đủ của PDF scan (chưa OCR) cũng cần làm lại
+                if cached is None or (
+                    self._ocr is not None
+                    and cached.mime_type == _PDF
+                    and not cached.metadata.get("ocr_pages")
+                ):
+                    ingested = held
+                    if ingested is None:
+                        kwargs = {}
+                        if self._max_buffer_bytes is not None:
+                            kwargs["max_buffer_bytes"] = self._max_buffer_bytes
+                        ingested = await ingest_file(path, **kwargs)
+                    full = await extract_content(
+                        ingested, cache=self._cache, pool=self._pool, native=self._native
+                    )
+                    if self._ocr is not None and await self._ocr.is_sparse(ingested, full.content):
+                        await self._ocr_full(ingested, full.content)
+                    logger.debug("Đã trích xuất đầy đủ (nền): %s", path.name)
+            except Exception as e:
+                logger.warning(f"Trích xuất nền lỗi {path.name}: {e}")
+            finally:
+                self._queued.discard(sha256)
+                if held is not None and held.buffered:
+                    self._held_bytes -= held.size_bytes
+
+    async def _ocr_full(self, ingested: IngestedFile, text: str) -> None:
+        """OCR mọi trang của PDF scan và thay bản đầy đủ trong cache."""
+        scanned = await self._ocr.run(ingested)
+        if len(scanned.content) > len(text.strip()):
+            await self._cache.put(
+                ingested.sha256,
+                PreviewResult(
+                    scanned.content,
+                    _PDF,
+                    {"page_count": scanned.page_count, "ocr_pages": len(scanned.pages)},
+                    partial=False,
+                ),
+            )
+
+    @property
+    def pending(self) -> int:
+        return self._queue.qsize()
+
+    async def close(self) -> None:
+        """Dừng worker nền (các file còn chờ sẽ được trích xuất ở lần sau)."""
+        if self._worker is not None and not self._worker.done():
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+        self._worker = None
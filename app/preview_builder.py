@@ -0,0 +1,192 @@
+"""
+preview_builder.py — Chọn đoạn nội dung giàu thông tin nhất cho prompt phân loại.
+
+Vài nghìn ký tự đầu tài liệu thường là trang bìa, mục lục hoặc điều khoản
+pháp lý. Thay vì cắt đầu văn bản, `PreviewBuilder` chấm điểm từng dòng:
+- Khối tiêu đề (các dòng đầu tài liệu)
+- Dòng có tên hãng (`classifier.vendor_aliases`) hoặc trông giống model
+- Bảng thông số (cặp khóa: giá trị, số + đơn vị, cột phân cách)
+- Header/footer (dòng ngắn lặp lại giữa các trang — giữ một bản)
+Mục lục và boilerplate pháp lý bị trừ điểm. Các dòng được chọn tham lam
+theo điểm trong ngân sách token (ước lượng cục bộ, không cần tokenizer),
+rồi ghép lại theo thứ tự gốc.
+
+Sử dụng:
+    builder = PreviewBuilder.from_config(config)
+    preview = builder.build(extracted_text, token_budget=750)
+"""
+
+from __future__ import annotations
+
+import math
+import re
+from collections import Counter
+from typing import Any
+
+from app.rule_classifier import compile_keywords
+from app.slug import normalize
+
+DEFAULT_TOKEN_BUDGET = 750
+
+_GAP = "[...]"
+
+_TOKEN_RE = re.compile(r"[^\W\d_]+|\d+|[^\w\s]+")
+_SENTENCE_SPLIT_RE = re.compile(r"(?<=[.!?;])\s+")
+# Dòng dài hơn ngưỡng này được tách theo câu trước khi chấm điểm
+_MAX_SEGMENT_CHARS = 300
+
+_TITLE_LINES = 8
+_HEADER_MAX_CHARS = 120
+
+_MODEL_RE = re.compile(
+    r"\b(?:[A-Z][A-Za-z]*[- ]?\d{1,5}[A-Za-z]*|[A-Z]{2,}\d*[A-Z]*-?\d+\w*)\b"
+)
+_MODEL_LABEL_RE = re.compile(
+    r"\b(model|type|part no|ref|ký hiệu|mã hiệu|mã sản phẩm|hãng sản xuất|manufacturer|xuất xứ)\b",
+    re.IGNORECASE,
+)
+_UNIT_RE = re.compile(
+    r"\d+(?:[.,]\d+)?\s*(?:mm|cm|m|kg|g|v|vac|vdc|hz|khz|mhz|w|kw|va|kva|a|ma|ml|l|"
+    r"inch|°c|bar|kpa|mmhg|fps|px|kv|mas|tesla|t|gb|tb)\b",
+    re.IGNORECASE,
+)
+_KEY_VALUE_RE = re.compile(r"^[^:]{2,40}:\s*\S")
+_TABLE_RE = re.compile(r"\t|\s\|\s|\S {3,}\S")
+_DOC_TYPE_RE = re.compile(
+    r"\b(báo giá|quotation|hợp đồng|contract|thông số|specification|cấu hình|configuration|"
+    r"hướng dẫn sử dụng|user manual|service manual|trúng thầu|so sánh|catalog)\b",
+    re.IGNORECASE,
+)
+_TOC_RE = re.compile(
+    r"(\.{4,}|…{2,})\s*\d+\s*$|^(mục lục|table of contents|contents)\b", re.IGNORECASE
+)
+_LEGAL_RE = re.compile(
+    r"(copyright|©|all rights reserved|bản quyền|disclaimer|trademark|confidential|"
+    r"miễn trừ|liability|without prior written|không được sao chép)",
+    re.IGNORECASE,
+)
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Ước lượng số token BPE của văn bản (sai số ~±20%, đủ để chia ngân sách).
+
+    Từ ASCII ~4 ký tự/token, từ tiếng Việt có dấu ~2 ký tự/token,
+    số ~3 chữ số/token, dấu câu ~2 ký tự/token.
+    """
+    total = 0
+    for m in _TOKEN_RE.finditer(text):
+        piece = m.group()
+        if piece[0].isdigit():
+            total += math.ceil(len(piece) / 3)
+        elif piece[0].isalpha():
+            total += math.ceil(len(piece) / (4 if piece.isascii() else 2))
+        else:
+            total += math.ceil(len(piece) / 2)
+    return total
+
+
+def _segments(text: str) -> list[str]:
+    """Tách văn bản thành các dòng (dòng quá dài tách tiếp theo câu)."""
+    segments = []
+    for line in text.splitlines():
+        line = " ".join(line.split()) if "\t" not in line else line.strip()
+        if not line:
+            continue
+        if len(line) <= _MAX_SEGMENT_CHARS:
+            segments.append(line)
+        else:
+            segments.extend(s for s in _SENTENCE_SPLIT_RE.split(line) if s)
+    return segments
+
+
+class PreviewBuilder:
+    """
+    Chấm điểm và chọn dòng cho preview trong ngân sách token.
+
+    Args:
+        vendor_aliases: Từ điển hãng (alias → tên chuẩn); cả alias lẫn tên
+            chuẩn đều được nhận diện
+    """
+
+    def __init__(self, vendor_aliases: dict[str, str] | None = None):
+        names = dict(vendor_aliases or {})
+        names.update({v: v for v in names.values()})
+        self._vendor_pattern = compile_keywords(names)
+
+    @classmethod
+    def from_config(cls, config: dict[str, Any]) -> PreviewBuilder:
+        return cls(config.get("classifier", {}).get("vendor_aliases", {}))
+
+    def score(self, line: str, index: int, repeated: bool) -> float:
+        """Điểm thông tin của một dòng (âm → boilerplate)."""
+        score = 0.0
+        if index < _TITLE_LINES:
+            score += 3.0 - index * 0.25
+        if self._vendor_pattern is not None and self._vendor_pattern.search(normalize(line)):
+            score += 4.0
+        if _MODEL_LABEL_RE.search(line):
+            score += 2.5
+        elif _MODEL_RE.search(line):
+            score += 1.5
+        if _DOC_TYPE_RE.search(line):
+            score += 2.0
+        if _UNIT_RE.search(line):
+            score += 2.0
+        if _KEY_VALUE_RE.search(line):
+            score += 1.0
+        if _TABLE_RE.search(line):
+            score += 1.0
+        if repeated:
+            score += 2.0
+        if _TOC_RE.search(line):
+            score -= 6.0
+        if _LEGAL_RE.search(line):
+            score -= 6.0
+        if len(line) < 4 or not any(ch.isalpha() for ch in line):
+            score -= 2.0
+        return score
+
+    def build(self, text: str, token_budget: int = DEFAULT_TOKEN_BUDGET) -> str:
+        """
+        Ghép preview từ các dòng điểm cao nhất, tối đa `token_budget` token.
+
+        Văn bản vừa ngân sách được trả về nguyên vẹn. Các đoạn không liền
+        nhau được nối bằng "[...]".
+        """
+        text = text.strip()
+        if not text or estimate_tokens(text) <= token_budget:
+            return text
+
+        segments = _segments(text)
+        counts = Counter(s for s in segments if len(s) <= _HEADER_MAX_CHARS)
+        seen: set[str] = set()
+        candidates = []
+        for i, seg in enumerate(segments):
+            if seg in seen:
+                continue  # Header/footer lặp lại: chỉ giữ lần đầu
+            seen.add(seg)
+            candidates.append((self.score(seg, i, counts[seg] > 1), i, seg))
+
+        # Tham lam theo điểm (dòng thường lấp chỗ trống theo thứ tự gốc);
+        # mục lục/boilerplate (điểm âm) bị bỏ
+        chosen: dict[int, str] = {}
+        used = 0
+        gap_cost = estimate_tokens(_GAP) + 1
+        for score, i, seg in sorted(candidates, key=lambda c: (-c[0], c[1])):
+            if score < 0:
+                break
+            cost = estimate_tokens(seg) + gap_cost
+            if used + cost > token_budget:
+                continue
+            chosen[i] = seg
+            used += cost
+
+        lines = []
+        prev = -1
+        for i in sorted(chosen):
+            if i != prev + 1:
+                lines.append(_GAP)
+            lines.append(chosen[i])
+            prev = i
+        return "\n".join(lines)
@@ -1,5 +1,4 @@
 import asyncio
-import html
 import json
 import logging
 import os
@@ -9,16 +8,19 @@ from pathlib import Path
 
 import yaml
 from dotenv import load_dotenv
-from telegram import Bot
-from telegram.constants import ParseMode
 
 from app.classifier import MedicalClassifier
 from app.index_store import IndexStore
+from app.ingest import DEFAULT_MAX_BUFFER_BYTES, ingest_file
+from app.notifier import TelegramNotifier
 from app.slug import build_device_slug
 from app.taxonomy import Taxonomy
-from app.utils import clean_name, compute_sha256
+from app.taxonomy_resolver import CATEGORY_ALIASES, GROUP_ALIASES, get_resolver
+from app.tracing import annotate, configure_tracing, span, trace_file
+from app.usage import BudgetExceededError
+from app.utils import clean_name
 from app.wiki_generator import WikiGenerator
-from app.ui import DOC_TYPE_MAP, render_draft_message
+from app.ui import DOC_TYPE_MAP
 
 load_dotenv(override=False)
 
@@ -30,30 +32,13 @@ logger = logging.getLogger(__name__)
 
 # clean_name moved to app.utils
 
-# Correction maps for AI hallucinations — module-level constants (created once)
-_CATEGORY_MAP: dict[str, str] = {
-    "ngoai_khoa": "thiet_bi_phong_mo",
-    "phau_thuat": "thiet_bi_phong_mo",
-    "phong_mo": "thiet_bi_phong_mo",
-    "trang_thiet_bi_phong_mo": "thiet_bi_phong_mo",
-    "thiet-bi-phong-mo": "thiet_bi_phong_mo",
-    "thiet_bi_hoi_suc": "hoi_suc_cap_cuu",
-    "thiet_bi_hoi_suc_gay_me": "gay_me_may_tho",
-    "Unknown": "chua_phan_loai",
-    "khac": "chua_phan_loai",
-}
-
-_GROUP_MAP: dict[str, str] = {
-    "Unknown": "khac",
-    "may_tho": "may_tho_hoi_suc",
-    "phong_mo": "khac",
-    "thiet_bi_phong_mo": "khac",
-    "ban-mo": "ban_mo",
-    "monitor_benh_nhan": "monitor",
-    "may_theo_doi_benh_nhan": "monitor",
-    "bon_rua_tay_phau_thuat": "bon_rua_tay",
-}
+# Correction maps for AI hallucinations — module-level constants (created once).
+# Nguồn duy nhất nằm ở app.taxonomy_resolver; giữ tên cũ cho các script/test.
+_CATEGORY_MAP: dict[str, str] = CATEGORY_ALIASES
+_GROUP_MAP: dict[str, str] = GROUP_ALIASES
 
+# Giá trị trả về khi file đã có trong DB (phân biệt với None = lỗi)
+SKIPPED = "skipped"
 
 
 def detect_manual_placement(file_path: str, config: dict) -> dict | None:
@@ -95,7 +80,8 @@ def detect_manual_placement(file_path: str, config: dict) -> dict | None:
             "model": model,
             "confidence": 1.0,
             "summary": f"Đặt thủ công tại /{sub_dir}",
-            "device_slug": device_slug  # Keep consistency
+            "device_slug": device_slug,  # Keep consistency
+            "source": "manual",
         }
     except Exception:
         return None
@@ -108,19 +94,55 @@ async def process_new_file(
     store: IndexStore,
     wiki: WikiGenerator,
     taxonomy: Taxonomy,
+    notifier: TelegramNotifier | None = None,
 ):
     """
     Orchestrates the processing of a new document.
+
+    Notifications go through the shared `notifier` (pooled HTTP client,
+    rate-aware queue, digest mode). Without a notifier nothing is sent.
+    Every stage is timed as a span under one per-file trace ID (app.tracing).
+
+    Returns the draft file_info (including the classification "source":
+    manual / rules / llm), SKIPPED if the path is already indexed, or None
+    if processing failed.
     """
+    with trace_file(file_path):
+        return await _process_new_file(
+            file_path, config, classifier, store, wiki, taxonomy, notifier
+        )
+
+
+async def _process_new_file(
+    file_path: str,
+    config: dict,
+    classifier: MedicalClassifier,
+    store: IndexStore,
+    wiki: WikiGenerator,
+    taxonomy: Taxonomy,
+    notifier: TelegramNotifier | None,
+):
     logger.info(f"--- Bắt đầu xử lý: {Path(file_path).name} ---")
 
     # 0. Kiểm tra nếu file đã có trong DB ở đường dẫn hiện tại thì bỏ qua (chống loop của watcher)
-    existing = await store.get_file(file_path)
+    with span("db_lookup"):
+        existing = await store.get_file(file_path)
     if existing:
         logger.info(f"File đã tồn tại trong DB, bỏ qua: {file_path}")
-        return
+        annotate(skipped=True)
+        return SKIPPED
 
-    # 1. Phân loại
+    # 1. Đọc file một lần: stat + sha256 + buffer cho extractor (Strict Integrity)
+    max_buffer = config.get("watcher", {}).get("max_buffer_bytes", DEFAULT_MAX_BUFFER_BYTES)
+    try:
+        with span("ingest") as sp:
+            ingested = await ingest_file(file_path, max_buffer_bytes=max_buffer)
+            sp["bytes"] = ingested.size_bytes
+    except Exception as e:
+        logger.error(f"Lỗi nghiêm trọng: Không thể đọc/tính sha256 cho {file_path}. Hủy xử lý. {e}")
+        raise  # Strict integrity
+
+    # 2. Phân loại
     classification = None
     manual_info = detect_manual_placement(file_path, config)
     
@@ -129,29 +151,16 @@ async def process_new_file(
         classification = manual_info
     else:
         try:
-            classification = await classifier.classify_file(file_path)
+            with span("classify"):
+                classification = await classifier.classify_file(file_path, ingested=ingested)
             logger.info(f"Kết quả phân loại AI: {json.dumps(classification, ensure_ascii=False)}")
+        except BudgetExceededError:
+            # Không phải lỗi: watcher/bulk ingest hoãn file lại tới khi còn ngân sách
+            raise
         except Exception as e:
             logger.error(f"Dừng tiến trình do lỗi phân loại AI: {e}")
-            # ... handle error as before ...
-            token = os.getenv("TELEGRAM_BOT_TOKEN")
-            group_chat_id = config["services"]["telegram"].get("group_chat_id")
-            if token and group_chat_id:
-                try:
-                    bot = Bot(token=token)
-                    safe_filename = html.escape(Path(file_path).name)
-                    safe_error = html.escape(str(e))
-                    error_report = (
-                        f"❌ <b>Lỗi phân loại tài liệu!</b>\n\n"
-                        f"<b>File:</b> <code>{safe_filename}</code>\n"
-                        f"<b>Lỗi:</b> {safe_error}\n\n"
-                        f"Vui lòng kiểm tra lại quota hoặc thử lại sau."
-                    )
-                    await bot.send_message(
-                        chat_id=group_chat_id, text=error_report, parse_mode=ParseMode.HTML
-                    )
-                except Exception as tg_err:
-                    logger.error(f"Lỗi gửi Telegram báo lỗi: {tg_err}")
+            if notifier:
+                await notifier.notify_error(file_path, e)
             return
 
     # Extract classified data
@@ -180,8 +189,8 @@ async def process_new_file(
     # Mapping doc_type sang tiếng Việt
     doc_type_vi = DOC_TYPE_MAP.get(doc_type, doc_type)
 
-    # 2. Tạo slugs
-    device_slug = build_device_slug(vendor, model)
+    # 3. Tạo slugs (giữ device_slug của thư mục có sẵn nếu tầng luật/đặt thủ công trả về)
+    device_slug = classification.get("device_slug") or build_device_slug(vendor, model)
     full_category_slug = classification.get("category_slug", "")
 
     if "/" in full_category_slug:
@@ -192,25 +201,36 @@ async def process_new_file(
         category_slug = clean_name(full_category_slug) if full_category_slug else "chua_phan_loai"
         group_slug = "khac"
 
-    category_slug = _CATEGORY_MAP.get(category_slug, category_slug)
-    group_slug = _GROUP_MAP.get(group_slug, group_slug)
-
-    # --- Strict Taxonomy Validation ---
-    if not taxonomy.get_category(category_slug):
+    # --- Strict Taxonomy Validation: alias + so khớp mờ trên index tính sẵn ---
+    with span("taxonomy_resolve") as sp:
+        resolver = get_resolver(taxonomy, config)
+        resolution = resolver.resolve(category_slug, group_slug)
+        sp["method"] = resolution.method
+    if resolution.category_slug is None:
         logger.warning(f"AI sinh category_slug ảo '{category_slug}', fallback về 'chua_phan_loai'.")
         category_slug = "chua_phan_loai"
         group_slug = "khac"
-    elif not taxonomy.get_group(category_slug, group_slug):
-        logger.warning(
-            f"AI sinh group_slug ảo '{group_slug}' (thuộc {category_slug}), fallback về 'khac'."
-        )
-        group_slug = "khac"
+    else:
+        if resolution.method in ("fuzzy", "group"):
+            logger.info(
+                f"Snap taxonomy '{category_slug}/{group_slug}' → "
+                f"'{resolution.category_slug}/{resolution.group_slug}' "
+                f"({resolution.method}, score={resolution.score:.2f})"
+            )
+            resolver.learn(category_slug, group_slug, resolution)
+        if resolution.group_slug is None:
+            logger.warning(
+                f"AI sinh group_slug ảo '{group_slug}' (thuộc {resolution.category_slug}), "
+                "fallback về 'khac'."
+            )
+        category_slug = resolution.category_slug
+        group_slug = resolution.group_slug or "khac"
 
     # --- Always require manual confirmation as per SPECS (UC1) ---
     threshold = config.get("classifier", {}).get("confidence_threshold", 0.7)
     is_confident = confidence >= threshold
 
-    # 3. Tính toán vị trí tương lai (nhưng CHƯA di chuyển)
+    # 4. Tính toán vị trí tương lai (nhưng CHƯA di chuyển)
     root = Path(os.path.expandvars(os.path.expanduser(config["paths"]["medical_devices_root"])))
     target_relative = Path(category_slug) / group_slug / device_slug
 
@@ -219,34 +239,25 @@ async def process_new_file(
 
     logger.info(f"Chờ người dùng xác nhận thủ công cho file: {file_path}")
 
-    # 4. Lưu vào Database (Strict Integrity)
-    try:
-        sha256 = compute_sha256(file_path)
-    except Exception as e:
-        logger.error(f"Lỗi nghiêm trọng: Không thể tính sha256 cho {file_path}. Hủy xử lý. {e}")
-        raise  # Strict integrity
-
-    try:
-        size_bytes = os.path.getsize(file_path)
-    except OSError:
-        size_bytes = 0
-
-    file_id = await store.upsert_file(
-        path=file_path,
-        sha256=sha256,
-        doc_type=doc_type,
-        device_slug=device_slug,
-        category_slug=category_slug,
-        group_slug=group_slug,
-        vendor=vendor,
-        model=model,
-        summary=summary,
-        size_bytes=size_bytes,
-        confirmed=False,  # ALWAYS False until user clicks approve
-    )
+    # 5. Lưu vào Database (sha256/size lấy từ lần đọc duy nhất ở bước 1)
+    with span("db_upsert"):
+        file_id = await store.upsert_file(
+            path=file_path,
+            sha256=ingested.sha256,
+            doc_type=doc_type,
+            device_slug=device_slug,
+            category_slug=category_slug,
+            group_slug=group_slug,
+            vendor=vendor,
+            model=model,
+            summary=summary,
+            size_bytes=ingested.size_bytes,
+            confirmed=False,  # ALWAYS False until user clicks approve
+            confidence=confidence,
+        )
     logger.info(f"Đã lưu vào DB (DRAFT): {file_path} (ID: {file_id})")
 
-    # 5. Cập nhật Wiki -> Bỏ qua, chỉ làm khi user ấn Confirm
+    # 6. Cập nhật Wiki -> Bỏ qua, chỉ làm khi user ấn Confirm
 
     file_info = {
         "id": file_id,
@@ -257,28 +268,18 @@ async def process_new_file(
         "summary": summary,
         "category_slug": category_slug,
         "group_slug": group_slug,
-        "device_slug": device_slug
+        "device_slug": device_slug,
+        "source": classification.get("source", "llm"),
     }
     
-    report, reply_markup = render_draft_message(file_info, config, confidence, is_confident)
-
-    token = os.getenv("TELEGRAM_BOT_TOKEN")
-    group_chat_id = config["services"]["telegram"].get("group_chat_id")
-
-    if token and group_chat_id:
-        try:
-            bot = Bot(token=token)
-            await bot.send_message(
-                chat_id=group_chat_id,
-                text=report,
-                parse_mode=ParseMode.HTML,
-                reply_markup=reply_markup,
-            )
-            logger.info(f"Đã gửi báo cáo Telegram tới: {group_chat_id}")
-        except Exception as e:
-            logger.error(f"Lỗi gửi Telegram: {e}")
+    annotate(source=file_info["source"])
+    if notifier:
+        with span("notify"):
+            await notifier.notify_draft(file_info, confidence, is_confident)
+        logger.info("Đã đưa báo cáo draft vào hàng đợi Telegram")
 
     logger.info("--- Xử lý hoàn tất ---")
+    return file_info
 
 
 async def main_cli():
@@ -298,10 +299,17 @@ async def main_cli():
     await store.init()
     wiki = WikiGenerator(config_path)
     taxonomy = Taxonomy(config["paths"]["taxonomy_file"])
+    notifier = TelegramNotifier.from_config(config)
+    await notifier.start()
+    trace_path = config.get("logging", {}).get("trace_file")
+    if trace_path:
+        configure_tracing(trace_path)
 
     try:
-        await process_new_file(sys.argv[1], config, classifier, store, wiki, taxonomy)
+        await process_new_file(sys.argv[1], config, classifier, store, wiki, taxonomy, notifier)
     finally:
+        await notifier.close()
+        await classifier.close()
         await store.close()
 
 
@@ -0,0 +1,321 @@
+"""
+rate_limiter.py — Token bucket thích ứng cho các lần gọi 9router.
+
+Thay cho lock + khoảng cách cố định `rate_limit_seconds`: cho phép burst và
+nhiều request song song (giới hạn bằng semaphore), tự giảm tốc độ khi gặp 429
+(AIMD: giảm một nửa, tăng dần khi thành công) và tôn trọng `Retry-After` /
+`X-RateLimit-*` của gateway (reset dạng số giây hoặc epoch s/ms; mọi lần chặn
+tối đa `rate_limit_max_block_seconds`). Một limiter dùng chung cho mọi worker
+trong tiến trình (theo base_url + cấu hình rate limit) qua `get_shared_limiter`.
+
+Slot và token được trao theo hạn chót sớm nhất (EDF): request chạy trong
+`request_deadline(...)` (do ClassificationScheduler đặt) vượt lên trước các
+request bulk đang xếp hàng; request không có hạn chót được coi như hạn
+= lúc bắt đầu chờ + `DEFAULT_SLACK_SECONDS` (giữa chúng vẫn là FIFO).
+
+Sử dụng:
+    limiter = get_shared_limiter(router_config)
+    async with limiter.acquire() as waited:
+        response = await client.post(...)
+    limiter.on_success(response.headers)   # hoặc limiter.on_throttle(retry_after)
+"""
+
+from __future__ import annotations
+
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from collections.abc import AsyncIterator, Iterator, Mapping
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+from datetime import UTC, datetime
+from email.utils import parsedate_to_datetime
+from typing import Any
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_RATE_LIMIT_SECONDS = 6.0
+DEFAULT_BURST = 1
+DEFAULT_MAX_CONCURRENCY = 1
+DEFAULT_MAX_RATE = 2.0  # request/giây
+# Hệ số giảm tốc khi bị 429 và mức tăng (tỉ lệ so với tốc độ ban đầu) mỗi lần thành công
+_DECREASE_FACTOR = 0.5
+_INCREASE_RATIO = 0.1
+# Hạn chót mặc định (giây kể từ lúc chờ) cho request không khai báo hạn chót
+DEFAULT_SLACK_SECONDS = 60.0
+# Thời gian chặn tối đa cho một Retry-After / X-RateLimit-Reset
+DEFAULT_MAX_BLOCK_SECONDS = 300.0
+# Giá trị reset lớn hơn các ngưỡng này là epoch (ms / giây), không phải số giây
+_EPOCH_MS_THRESHOLD = 1e12
+_EPOCH_S_THRESHOLD = 1e9
+
+# Hạn chót (time.monotonic) của request đang chạy trong context hiện tại
+_deadline: ContextVar[float | None] = ContextVar("medicaldocbot_deadline", default=None)
+
+
+@contextmanager
+def request_deadline(deadline: float | None) -> Iterator[None]:
+    """
+    Đặt hạn chót (theo time.monotonic) cho các request gửi trong khối này.
+
+    Sử dụng:
+        with request_deadline(time.monotonic() + 10):
+            await classifier.classify_file(path)
+    """
+    token = _deadline.set(deadline)
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def parse_retry_after(value: str | None) -> float | None:
+    """
+    Đọc header Retry-After (số giây hoặc HTTP-date).
+
+    Returns:
+        Số giây cần chờ, None nếu không có/không hợp lệ
+    """
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except (TypeError, ValueError):
+        pass
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=UTC)
+    return max(0.0, (when - datetime.now(UTC)).total_seconds())
+
+
+def parse_rate_limit_reset(value: str | None, now: float | None = None) -> float | None:
+    """
+    Đọc header X-RateLimit-Reset: số giây còn lại, hoặc epoch tính bằng giây / ms
+    (OpenAI/OpenRouter-style).
+
+    Args:
+        value: Giá trị header
+        now: time.time() hiện tại (để test)
+
+    Returns:
+        Số giây cần chờ, None nếu không có/không hợp lệ
+    """
+    if value is None:
+        return None
+    try:
+        reset = float(value)
+    except (TypeError, ValueError):
+        return None
+    if reset >= _EPOCH_S_THRESHOLD:
+        if reset >= _EPOCH_MS_THRESHOLD:
+            reset /= 1000
+        reset -= time.time() if now is None else now
+    return max(0.0, reset)
+
+
+class _DeadlineSemaphore:
+    """Semaphore trao slot cho người chờ có hạn chót sớm nhất (cùng hạn → FIFO)."""
+
+    def __init__(self, value: int) -> None:
+        self._value = value
+        self._waiters: list[tuple[float, int, asyncio.Future]] = []
+        self._seq = itertools.count()
+
+    def _has_waiters(self) -> bool:
+        # Bỏ các người chờ đã hủy ở đầu heap
+        while self._waiters and self._waiters[0][2].done():
+            heapq.heappop(self._waiters)
+        return bool(self._waiters)
+
+    async def acquire(self, deadline: float) -> None:
+        if self._value > 0 and not self._has_waiters():
+            self._value -= 1
+            return
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (deadline, next(self._seq), future))
+        try:
+            await future
+        except asyncio.CancelledError:
+            # Đã được trao slot nhưng bị hủy trước khi chạy → trả lại cho người sau
+            if future.done() and not future.cancelled():
+                self.release()
+            raise
+
+    def release(self) -> None:
+        while self._waiters:
+            *_, future = heapq.heappop(self._waiters)
+            if not future.done():
+                future.set_result(None)
+                return
+        self._value += 1
+
+
+class AdaptiveRateLimiter:
+    """
+    Token bucket + semaphore, tốc độ điều chỉnh theo phản hồi của gateway.
+
+    Args:
+        rate: Số request/giây ban đầu (1 / rate_limit_seconds)
+        burst: Số token tối đa tích lũy (request gửi liền nhau)
+        max_concurrency: Số request đang chạy đồng thời tối đa
+        min_rate / max_rate: Biên cho tốc độ thích ứng
+        adaptive: False → giữ nguyên tốc độ, chỉ tôn trọng Retry-After
+        max_block_seconds: Thời gian chặn tối đa cho một Retry-After/Reset
+    """
+
+    def __init__(
+        self,
+        rate: float,
+        burst: int = DEFAULT_BURST,
+        max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+        min_rate: float | None = None,
+        max_rate: float | None = None,
+        adaptive: bool = True,
+        max_block_seconds: float = DEFAULT_MAX_BLOCK_SECONDS,
+    ) -> None:
+        self.rate = rate
+        self.burst = max(1, burst)
+        self.min_rate = min_rate if min_rate is not None else rate / 4
+        self.max_rate = max(max_rate if max_rate is not None else rate, rate)
+        self.adaptive = adaptive
+        self.max_block_seconds = max_block_seconds
+        self._increase = rate * _INCREASE_RATIO
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._blocked_until = 0.0
+        self._lock = _DeadlineSemaphore(1)
+        self._semaphore = _DeadlineSemaphore(max(1, max_concurrency))
+        self.max_concurrency = max(1, max_concurrency)
+        self.throttled = 0
+
+    @classmethod
+    def from_config(cls, router_config: dict[str, Any]) -> AdaptiveRateLimiter:
+        """Tạo limiter từ `services.9router` trong config.yaml."""
+        interval = router_config.get("rate_limit_seconds", DEFAULT_RATE_LIMIT_SECONDS)
+        rate = 1.0 / interval if interval > 0 else DEFAULT_MAX_RATE
+        return cls(
+            rate=rate,
+            burst=router_config.get("rate_limit_burst", DEFAULT_BURST),
+            max_concurrency=router_config.get("max_concurrency", DEFAULT_MAX_CONCURRENCY),
+            min_rate=router_config.get("rate_limit_min_per_second"),
+            max_rate=router_config.get("rate_limit_max_per_second", DEFAULT_MAX_RATE),
+            adaptive=router_config.get("rate_limit_adaptive", True),
+            max_block_seconds=router_config.get(
+                "rate_limit_max_block_seconds", DEFAULT_MAX_BLOCK_SECONDS
+            ),
+        )
+
+    def _refill(self, now: float) -> None:
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def _take_token(self, deadline: float) -> None:
+        # Lock xếp các worker đang chờ token theo hạn chót (cùng hạn → FIFO)
+        await self._lock.acquire(deadline)
+        try:
+            while True:
+                now = time.monotonic()
+                self._refill(now)
+                if now < self._blocked_until:
+                    await asyncio.sleep(self._blocked_until - now)
+                    continue
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+        finally:
+            self._lock.release()
+
+    @asynccontextmanager
+    async def acquire(self) -> AsyncIterator[float]:
+        """
+        Chờ tới lượt gửi request (hạn chót sớm hơn được phục vụ trước).
+
+        Yields:
+            Số giây đã chờ (semaphore + token)
+        """
+        started = time.monotonic()
+        deadline = _deadline.get()
+        if deadline is None:
+            deadline = started + DEFAULT_SLACK_SECONDS
+        await self._semaphore.acquire(deadline)
+        try:
+            await self._take_token(deadline)
+            yield time.monotonic() - started
+        finally:
+            self._semaphore.release()
+
+    def on_success(self, headers: Mapping[str, str] | None = None) -> None:
+        """Request thành công: tăng dần tốc độ, tôn trọng X-RateLimit-Remaining/Reset."""
+        if self.adaptive and self.rate < self.max_rate:
+            self.rate = min(self.max_rate, self.rate + self._increase)
+        if not headers:
+            return
+        try:
+            remaining = headers.get("x-ratelimit-remaining")
+            if remaining is None or int(float(remaining)) > 0:
+                return
+        except (TypeError, ValueError):
+            return
+        reset = parse_rate_limit_reset(headers.get("x-ratelimit-reset"))
+        if reset is not None:
+            self._block_for(reset)
+
+    def on_throttle(self, retry_after: float | None = None, fallback: float | None = None) -> None:
+        """
+        Gateway trả 429: giảm tốc độ một nửa và chặn tới khi hết Retry-After.
+
+        Args:
+            retry_after: Giá trị từ header Retry-After (giây)
+            fallback: Thời gian chờ nếu không có Retry-After (VD backoff lũy thừa)
+        """
+        self.throttled += 1
+        if self.adaptive:
+            self.rate = max(self.min_rate, self.rate * _DECREASE_FACTOR)
+        self._tokens = 0.0
+        delay = retry_after if retry_after is not None else fallback
+        if delay is None:
+            delay = 1.0 / self.rate
+        self._block_for(delay)
+        logger.warning(
+            f"9router giới hạn tốc độ (429): chờ {delay:.1f}s, tốc độ mới {self.rate * 60:.1f} req/phút"
+        )
+
+    def _block_for(self, seconds: float) -> None:
+        if seconds > self.max_block_seconds:
+            logger.warning(
+                f"9router yêu cầu chờ {seconds:.0f}s, chỉ chặn tối đa {self.max_block_seconds:.0f}s"
+            )
+            seconds = self.max_block_seconds
+        self._blocked_until = max(self._blocked_until, time.monotonic() + max(0.0, seconds))
+
+
+_shared: dict[tuple, AdaptiveRateLimiter] = {}
+# Các key cấu hình của limiter: hai config khác nhau trên cùng gateway (VD so sánh
+# cấu hình trong evaluate) không dùng chung tốc độ của config tạo trước
+_LIMIT_KEYS = (
+    "rate_limit_seconds",
+    "rate_limit_burst",
+    "max_concurrency",
+    "rate_limit_min_per_second",
+    "rate_limit_max_per_second",
+    "rate_limit_adaptive",
+    "rate_limit_max_block_seconds",
+)
+
+
+def get_shared_limiter(router_config: dict[str, Any]) -> AdaptiveRateLimiter:
+    """Limiter dùng chung cho mọi classifier/worker gọi cùng gateway với cùng cấu hình."""
+    key = (router_config.get("base_url", ""),) + tuple(
+        router_config.get(k) for k in _LIMIT_KEYS
+    )
+    limiter = _shared.get(key)
+    if limiter is None:
+        limiter = AdaptiveRateLimiter.from_config(router_config)
+        _shared[key] = limiter
+    return limiter
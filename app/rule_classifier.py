@@ -0,0 +1,205 @@
+"""
+rule_classifier.py — Phân loại nhanh bằng luật (tầng 1, không gọi AI).
+
+Áp dụng `classifier.filename_rules`, `classifier.subfolder_rules`,
+vị trí thư mục một phần (category/group/device) và từ điển hãng
+`classifier.vendor_aliases`. Trả về kết quả cùng định dạng với
+MedicalClassifier kèm confidence; chỉ khi tầng này không chắc chắn
+mới cần gọi 9router gateway.
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+import re
+from pathlib import Path
+from typing import Any
+
+from app.slug import normalize
+from app.taxonomy import Taxonomy
+
+logger = logging.getLogger(__name__)
+
+# Trọng số từng tín hiệu khi cộng confidence
+_W_DOC_TYPE_PATH = 0.35  # doc_type suy ra từ subfolder (tech/, config/...)
+_W_DOC_TYPE_NAME = 0.3  # doc_type suy ra từ từ khóa trong tên file
+_W_CATEGORY = 0.15
+_W_GROUP = 0.15
+_W_DEVICE = 0.2  # Thư mục thiết bị có sẵn
+_W_VENDOR = 0.1
+
+# Ngưỡng mặc định để bỏ qua gọi AI
+DEFAULT_RULES_THRESHOLD = 0.8
+
+
+def compile_keywords(mapping: dict[str, str]) -> re.Pattern | None:
+    """
+    Gộp các từ khóa thành một regex alternation duy nhất.
+
+    Từ khóa được normalize về dạng slug và so khớp theo ranh giới token
+    (chữ cái), dài trước ngắn sau để ưu tiên cụm dài.
+    """
+    keys = sorted({normalize(k) for k in mapping if normalize(k)}, key=len, reverse=True)
+    if not keys:
+        return None
+    alternation = "|".join(re.escape(k) for k in keys)
+    return re.compile(rf"(?<![a-z])({alternation})(?![a-z])")
+
+
+class RuleClassifier:
+    """
+    Phân loại tài liệu bằng luật tĩnh từ config.yaml.
+
+    Ví dụ sử dụng:
+        rules = RuleClassifier(config, taxonomy)
+        result = rules.classify("~/MedicalDevices/noi_soi/noi_soi_tmh/bao_gia_olympus.pdf")
+        if result and result["confidence"] >= rules.threshold:
+            ...  # Không cần gọi AI
+    """
+
+    def __init__(self, config: dict[str, Any], taxonomy: Taxonomy | None = None) -> None:
+        """
+        Khởi tạo và biên dịch luật từ config.
+
+        Args:
+            config: Dict cấu hình đã load từ config.yaml
+            taxonomy: Taxonomy để validate category/group (tùy chọn)
+        """
+        cls_config = config.get("classifier", {})
+        self._taxonomy = taxonomy
+        root = config.get("paths", {}).get("medical_devices_root", "~/MedicalDevices")
+        self._root = Path(os.path.expandvars(os.path.expanduser(root)))
+        self.threshold = float(cls_config.get("rules_confidence_threshold", DEFAULT_RULES_THRESHOLD))
+
+        self._subfolder_rules: dict[str, str] = {
+            normalize(k): v for k, v in cls_config.get("subfolder_rules", {}).items()
+        }
+        self._filename_rules: dict[str, str] = {
+            normalize(k): v for k, v in cls_config.get("filename_rules", {}).items()
+        }
+        self._filename_re = compile_keywords(cls_config.get("filename_rules", {}))
+
+        # alias (slug) → tên hãng chuẩn
+        self._vendor_aliases: dict[str, str] = {}
+        for alias, vendor in cls_config.get("vendor_aliases", {}).items():
+            self._vendor_aliases[normalize(alias)] = vendor
+            self._vendor_aliases.setdefault(normalize(vendor), vendor)
+        self._vendor_re = compile_keywords(self._vendor_aliases)
+
+    def _relative_parts(self, file_path: Path) -> tuple[str, ...]:
+        """Các thành phần thư mục tương đối so với root (không gồm tên file)."""
+        try:
+            rel = file_path.resolve().relative_to(self._root.resolve())
+        except (ValueError, OSError):
+            return ()
+        return rel.parts[:-1]
+
+    def _match_placement(self, dirs: tuple[str, ...]) -> dict[str, Any]:
+        """
+        Suy ra category/group/device/doc_type từ vị trí thư mục (có thể thiếu tầng).
+
+        Cấu trúc chuẩn: category / group / device / sub_dir
+        """
+        found: dict[str, Any] = {}
+        if not dirs:
+            return found
+
+        # Subfolder doc_type có thể nằm ở bất kỳ tầng nào (VD: ROOT/inbox/tech/file.pdf)
+        for part in reversed(dirs):
+            doc_type = self._subfolder_rules.get(normalize(part))
+            if doc_type:
+                found["doc_type"] = doc_type
+                break
+
+        category = dirs[0]
+        if self._taxonomy is None or not self._taxonomy.is_valid_category(category):
+            return found
+        found["category"] = category
+
+        if len(dirs) >= 2 and self._taxonomy.is_valid_group(category, dirs[1]):
+            found["group"] = dirs[1]
+            if len(dirs) >= 3 and normalize(dirs[2]) not in self._subfolder_rules:
+                found["device_slug"] = dirs[2]
+        return found
+
+    def match_vendor(self, text: str) -> str | None:
+        """Tìm tên hãng chuẩn xuất hiện trong chuỗi (tên file, đường dẫn...)."""
+        if self._vendor_re is None:
+            return None
+        m = self._vendor_re.search(normalize(text))
+        return self._vendor_aliases.get(m.group(1)) if m else None
+
+    def match_doc_type(self, filename: str) -> str | None:
+        """Suy ra doc_type từ từ khóa trong tên file."""
+        if self._filename_re is None:
+            return None
+        m = self._filename_re.search(normalize(Path(filename).stem))
+        return self._filename_rules.get(m.group(1)) if m else None
+
+    def classify(self, file_path: str | Path) -> dict[str, Any] | None:
+        """
+        Phân loại file bằng luật.
+
+        Args:
+            file_path: Đường dẫn file
+
+        Returns:
+            Dict cùng định dạng với MedicalClassifier.classify_file, thêm
+            key "source" = "rules"; None nếu không có tín hiệu nào.
+        """
+        path = Path(file_path)
+        placement = self._match_placement(self._relative_parts(path))
+        confidence = 0.0
+
+        doc_type = placement.get("doc_type")
+        if doc_type:
+            confidence += _W_DOC_TYPE_PATH
+        else:
+            doc_type = self.match_doc_type(path.name)
+            if doc_type:
+                confidence += _W_DOC_TYPE_NAME
+
+        category_slug = ""
+        if "category" in placement:
+            confidence += _W_CATEGORY
+            category_slug = placement["category"]
+            if "group" in placement:
+                confidence += _W_GROUP
+                category_slug = f"{category_slug}/{placement['group']}"
+
+        vendor = self.match_vendor(path.name) or (
+            self.match_vendor(placement["device_slug"]) if "device_slug" in placement else None
+        )
+        if "device_slug" in placement:
+            confidence += _W_DEVICE
+        elif vendor:
+            confidence += _W_VENDOR
+
+        if confidence == 0.0:
+            return None
+
+        result: dict[str, Any] = {
+            "doc_type": doc_type or "khac",
+            "vendor": vendor or "Unknown",
+            "model": "Unknown",
+            "category_slug": category_slug,
+            "summary": "Phân loại theo quy tắc tên file/thư mục",
+            "confidence": round(min(confidence, 1.0), 2),
+            "source": "rules",
+        }
+        if "device_slug" in placement:
+            # Giữ nguyên thư mục thiết bị đã có để không tách thành slug mới
+            device_slug = placement["device_slug"]
+            result["device_slug"] = device_slug
+            vendor_slug = normalize(vendor) if vendor else ""
+            if vendor_slug and device_slug.startswith(vendor_slug + "_"):
+                result["model"] = device_slug[len(vendor_slug) + 1 :]
+            else:
+                result["model"] = device_slug
+        logger.debug("Rule classifier: %s → %s", path.name, result)
+        return result
+
+    def is_confident(self, result: dict[str, Any] | None) -> bool:
+        """Kết quả luật đủ chắc chắn để bỏ qua gọi AI."""
+        return bool(result) and result["doc_type"] != "khac" and result["confidence"] >= self.threshold
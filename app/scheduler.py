@@ -0,0 +1,239 @@
+"""
+scheduler.py — Lập lịch phân loại theo độ ưu tiên (file thả lẻ vs nạp hàng loạt).
+
+Mọi lần phân loại dùng chung một lượng slot gọi 9router (rate limit ~6s/request):
+khi watcher đang xử lý một đợt copy cả thư mục, file người dùng vừa thả vào
+không nên phải chờ hết hàng đợi. `ClassificationScheduler` đứng trước
+MedicalClassifier (cùng interface classify_file/close) với hai lớp:
+
+- interactive: file thả lẻ, hạn chót mặc định vài giây
+- bulk: đợt nạp hàng loạt, hạn chót dài
+
+Slot được chia theo trọng số giữa các lớp đang có hàng đợi (stride scheduling:
+bulk vẫn đi đều, không bị đói), trong mỗi lớp theo hạn chót sớm nhất; request
+đã quá hạn chót được phục vụ trước mọi lớp. Hạn chót cũng được truyền xuống
+AdaptiveRateLimiter (`request_deadline`) để request interactive vượt lên trước
+các request bulk đang chờ token.
+
+Sử dụng:
+    scheduler = ClassificationScheduler.from_config(classifier, config)
+    with classification_priority(BULK):
+        await process_new_file(path, config, scheduler, ...)
+"""
+
+from __future__ import annotations
+
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from collections.abc import Iterator
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Any
+
+from app.ingest import IngestedFile
+from app.rate_limiter import DEFAULT_MAX_CONCURRENCY, request_deadline
+from app.tracing import annotate, record
+
+logger = logging.getLogger(__name__)
+
+INTERACTIVE = "interactive"
+BULK = "bulk"
+PRIORITIES = (INTERACTIVE, BULK)
+
+DEFAULT_WEIGHTS = {INTERACTIVE: 4, BULK: 1}
+DEFAULT_DEADLINES = {INTERACTIVE: 10.0, BULK: 300.0}
+
+# Lớp ưu tiên của các lần phân loại trong context hiện tại (watcher đặt theo đợt event)
+_priority: ContextVar[str] = ContextVar("medicaldocbot_priority", default=INTERACTIVE)
+
+
+@contextmanager
+def classification_priority(priority: str) -> Iterator[None]:
+    """Đặt lớp ưu tiên cho các lần classify_file qua scheduler trong khối này."""
+    if priority not in PRIORITIES:
+        raise ValueError(f"Lớp ưu tiên không hợp lệ: {priority}")
+    token = _priority.set(priority)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+def current_priority() -> str:
+    """Lớp ưu tiên của context hiện tại (mặc định interactive)."""
+    return _priority.get()
+
+
+@dataclass(order=True)
+class _Waiter:
+    deadline: float
+    seq: int
+    priority: str = field(compare=False)
+    future: asyncio.Future = field(compare=False)
+
+
+class ClassificationScheduler:
+    """
+    Hàng đợi ưu tiên trước classifier.
+
+    Args:
+        classifier: MedicalClassifier (hoặc BatchingClassifier)
+        concurrency: Số lần phân loại chạy đồng thời (thường = max_concurrency của 9router)
+        weights: Tỉ lệ chia slot giữa các lớp khi cùng có hàng đợi
+        deadlines: Hạn chót mặc định (giây) theo lớp
+        bulk_reserve: Số slot luôn để dành cho interactive (bulk không chiếm hết)
+    """
+
+    def __init__(
+        self,
+        classifier: Any,
+        concurrency: int = DEFAULT_MAX_CONCURRENCY,
+        weights: dict[str, float] | None = None,
+        deadlines: dict[str, float] | None = None,
+        bulk_reserve: int = 1,
+    ) -> None:
+        self.classifier = classifier
+        self.concurrency = max(1, concurrency)
+        self.weights = {**DEFAULT_WEIGHTS, **(weights or {})}
+        self.deadlines = {**DEFAULT_DEADLINES, **(deadlines or {})}
+        # Bulk tối đa concurrency - bulk_reserve slot (ít nhất 1)
+        self._limits = {
+            INTERACTIVE: self.concurrency,
+            BULK: max(1, self.concurrency - max(0, bulk_reserve)),
+        }
+        self._queues: dict[str, list[_Waiter]] = {p: [] for p in PRIORITIES}
+        self._active = dict.fromkeys(PRIORITIES, 0)
+        self._served = dict.fromkeys(PRIORITIES, 0)
+        self._pass = dict.fromkeys(PRIORITIES, 0.0)
+        self._virtual = 0.0
+        self._seq = itertools.count()
+
+    @classmethod
+    def from_config(cls, classifier: Any, config: dict[str, Any]) -> ClassificationScheduler:
+        """Tạo từ `classifier.scheduler_*` và `services.9router.max_concurrency`."""
+        cfg = config.get("classifier", {})
+        router = config.get("services", {}).get("9router", {})
+        return cls(
+            classifier,
+            concurrency=router.get("max_concurrency", DEFAULT_MAX_CONCURRENCY),
+            weights={
+                INTERACTIVE: cfg.get("scheduler_weight_interactive", DEFAULT_WEIGHTS[INTERACTIVE]),
+                BULK: cfg.get("scheduler_weight_bulk", DEFAULT_WEIGHTS[BULK]),
+            },
+            deadlines={
+                INTERACTIVE: cfg.get(
+                    "scheduler_interactive_deadline_seconds", DEFAULT_DEADLINES[INTERACTIVE]
+                ),
+                BULK: cfg.get("scheduler_bulk_deadline_seconds", DEFAULT_DEADLINES[BULK]),
+            },
+        )
+
+    async def classify_file(
+        self,
+        file_path: str,
+        max_retries: int | None = None,
+        ingested: IngestedFile | None = None,
+        use_rules: bool = True,
+        priority: str | None = None,
+        deadline_seconds: float | None = None,
+    ) -> dict:
+        """
+        Chờ tới lượt rồi phân loại bằng classifier bên trong.
+
+        Args:
+            priority: INTERACTIVE/BULK; None → theo `classification_priority` (mặc định interactive)
+            deadline_seconds: Gợi ý hạn chót (giây kể từ bây giờ); None → mặc định của lớp
+        """
+        priority = priority or _priority.get()
+        if priority not in PRIORITIES:
+            raise ValueError(f"Lớp ưu tiên không hợp lệ: {priority}")
+        started = time.monotonic()
+        if deadline_seconds is None:
+            deadline_seconds = self.deadlines[priority]
+        deadline = started + deadline_seconds
+
+        await self._acquire(priority, deadline)
+        waited = time.monotonic() - started
+        record("schedule_wait", waited * 1000, priority=priority)
+        annotate(priority=priority)
+        try:
+            with request_deadline(deadline):
+                return await self.classifier.classify_file(
+                    file_path, max_retries=max_retries, ingested=ingested, use_rules=use_rules
+                )
+        finally:
+            self._release(priority)
+
+    async def _acquire(self, priority: str, deadline: float) -> None:
+        queue = self._queues[priority]
+        if not queue and self._active[priority] == 0:
+            # Lớp vừa có việc trở lại: không được cộng dồn "lượt" đã bỏ qua
+            self._pass[priority] = max(self._pass[priority], self._virtual)
+        waiter = _Waiter(
+            deadline, next(self._seq), priority, asyncio.get_running_loop().create_future()
+        )
+        heapq.heappush(queue, waiter)
+        self._dispatch()
+        try:
+            await waiter.future
+        except asyncio.CancelledError:
+            # Đã được trao slot nhưng bị hủy trước khi chạy → trả slot
+            if waiter.future.done() and not waiter.future.cancelled():
+                self._release(priority)
+            raise
+
+    def _release(self, priority: str) -> None:
+        self._active[priority] -= 1
+        self._served[priority] += 1
+        self._dispatch()
+
+    def _head(self, priority: str) -> _Waiter | None:
+        queue = self._queues[priority]
+        while queue and queue[0].future.done():
+            heapq.heappop(queue)
+        return queue[0] if queue else None
+
+    def _pick(self) -> str | None:
+        """Lớp được trao slot tiếp theo: quá hạn chót trước, sau đó theo trọng số."""
+        heads = {}
+        for priority in PRIORITIES:
+            head = self._head(priority)
+            if head is not None and self._active[priority] < self._limits[priority]:
+                heads[priority] = head
+        if not heads:
+            return None
+        now = time.monotonic()
+        overdue = [p for p, head in heads.items() if head.deadline <= now]
+        if overdue:
+            return min(overdue, key=lambda p: heads[p])
+        return min(heads, key=lambda p: (self._pass[p], PRIORITIES.index(p)))
+
+    def _dispatch(self) -> None:
+        while sum(self._active.values()) < self.concurrency:
+            priority = self._pick()
+            if priority is None:
+                return
+            waiter = heapq.heappop(self._queues[priority])
+            self._virtual = self._pass[priority]
+            self._pass[priority] += 1.0 / max(self.weights[priority], 1e-9)
+            self._active[priority] += 1
+            waiter.future.set_result(None)
+
+    def stats(self) -> dict[str, dict[str, int]]:
+        """Số request đang chờ/đang chạy/đã xong theo lớp."""
+        return {
+            p: {
+                "queued": sum(1 for w in self._queues[p] if not w.future.done()),
+                "active": self._active[p],
+                "served": self._served[p],
+            }
+            for p in PRIORITIES
+        }
+
+    async def close(self) -> None:
+        """Đóng classifier bên trong."""
+        await self.classifier.close()
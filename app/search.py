@@ -3,6 +3,7 @@ search.py — Module xử lý truy vấn tìm kiếm thông minh từ Telegram b
 """
 
 import re
+import unicodedata
 from typing import Any
 
 from app.index_store import IndexStore
@@ -28,33 +29,53 @@ KEYWORD_TO_DOC_TYPE = {
 }
 
 
+def _fold(text: str) -> str:
+    """
+    Bỏ dấu tiếng Việt, giữ nguyên độ dài chuỗi (mỗi ký tự → một ký tự) để vị trí
+    match trên chuỗi đã bỏ dấu dùng được để cắt chuỗi gốc.
+    """
+    return "".join("d" if ch == "đ" else unicodedata.normalize("NFD", ch)[0] for ch in text)
+
+
+def _compile_doc_type_keywords(mapping: dict[str, str]) -> re.Pattern:
+    """
+    Gộp các từ khóa thành một regex alternation duy nhất (dài trước ngắn sau).
+
+    Từ khóa được bỏ dấu nên khớp cả "hợp đồng" lẫn "hop dong"; ranh giới chữ/số
+    hai bên để alias ngắn (hd, tt, ch) không khớp bên trong một từ.
+    """
+    keys = sorted({_fold(k.lower()) for k in mapping}, key=len, reverse=True)
+    alternation = "|".join(r"\s+".join(map(re.escape, k.split())) for k in keys)
+    return re.compile(rf"(?<![^\W_])(?:{alternation})(?![^\W_])")
+
+
+_DOC_TYPE_BY_FOLDED = {_fold(k.lower()): v for k, v in KEYWORD_TO_DOC_TYPE.items()}
+_DOC_TYPE_RE = _compile_doc_type_keywords(KEYWORD_TO_DOC_TYPE)
+
+
 def parse_search_query(raw_query: str) -> tuple[list[str], str | None]:
     """
     Phân tách chuỗi truy vấn để nhận diện doc_type và keyword.
     Trả về: (mảng doc_types, remaining_keyword)
     Ví dụ: "cấu hình hợp đồng ge" => (["cau_hinh", "hop_dong"], "ge")
+
+    Một lần quét regex trên chuỗi đã bỏ dấu; phần không khớp giữ nguyên dấu.
     """
-    raw_query = raw_query.lower().strip()
-    detected_doc_types = []
-    remaining_keyword = raw_query
-
-    # Sort keys theo độ dài giảm dần để ưu tiên match từ khóa dài trước (ví dụ "hướng dẫn" trước "hướng")
-    for kw in sorted(KEYWORD_TO_DOC_TYPE.keys(), key=len, reverse=True):
-        if kw in remaining_keyword:
-            dt = KEYWORD_TO_DOC_TYPE[kw]
-            if dt not in detected_doc_types:
-                detected_doc_types.append(dt)
-            # Xóa keyword khỏi chuỗi để nhường chỗ cho model/vendor
-            # Dùng regex cẩn thận cho chuỗi Unicode tiếng Việt để tránh xóa một phần chữ
-            pattern = re.compile(r"(^|\s)" + re.escape(kw) + r"(?=\s|$|\W)", flags=re.IGNORECASE)
-            remaining_keyword = pattern.sub(" ", remaining_keyword).strip()
-            # Xử lý whitespace thừa
-            remaining_keyword = re.sub(r"\s+", " ", remaining_keyword)
+    query = unicodedata.normalize("NFC", raw_query).lower()
+    detected_doc_types: list[str] = []
+    remaining: list[str] = []
+    start = 0
+    for match in _DOC_TYPE_RE.finditer(_fold(query)):
+        dt = _DOC_TYPE_BY_FOLDED[" ".join(match.group().split())]
+        if dt not in detected_doc_types:
+            detected_doc_types.append(dt)
+        # Xóa keyword khỏi chuỗi để nhường chỗ cho model/vendor
+        remaining.append(query[start : match.start()])
+        start = match.end()
+    remaining.append(query[start:])
 
     # Nếu còn lại chuỗi rỗng thì cho thành None
-    if not remaining_keyword:
-        remaining_keyword = None
-
+    remaining_keyword = " ".join(" ".join(remaining).split()) or None
     return detected_doc_types, remaining_keyword
 
 
@@ -0,0 +1,381 @@
+"""
+taxonomy_resolver.py — Đưa category/group slug "ảo" của AI về taxonomy chuẩn.
+
+Index được tính sẵn một lần cho toàn bộ slug + label_vi + label_en (đã bỏ dấu):
+token (có trọng số IDF) và trigram ký tự. Slug sai lệch nhẹ (thiếu/thừa từ,
+gõ sai, dùng label thay vì slug, tiếng Anh) được snap về group hợp lệ gần
+nhất, nhưng chỉ khi hơn hẳn ứng viên thứ hai (`match_margin`); khớp mờ không
+rõ ràng để lại cho người dùng phân loại. Alias tĩnh và alias học được (lưu
+JSON) được tra trước bằng dict.
+
+Sử dụng:
+    resolver = get_resolver(taxonomy, config)
+    res = resolver.resolve("chuan_doan_hinh_anh", "sieu_am_chan_doan")
+    res.category_slug, res.group_slug  # ("chan_doan_hinh_anh", "sieu_am")
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import math
+import os
+import weakref
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any
+
+from app.slug import normalize
+from app.taxonomy import Taxonomy
+
+logger = logging.getLogger(__name__)
+
+# Alias tĩnh cho các slug AI hay "bịa" (trước đây nằm rải rác trong
+# process_event.py và scripts/full_regen.py). Alias trỏ tới slug không có
+# trong taxonomy (VD "chua_phan_loai") nghĩa là cố ý không phân loại.
+CATEGORY_ALIASES: dict[str, str] = {
+    "ngoai_khoa": "thiet_bi_phong_mo",
+    "phau_thuat": "thiet_bi_phong_mo",
+    "phong_mo": "thiet_bi_phong_mo",
+    "trang_thiet_bi_phong_mo": "thiet_bi_phong_mo",
+    "thiet-bi-phong-mo": "thiet_bi_phong_mo",
+    "thiet_bi_hoi_suc": "hoi_suc_cap_cuu",
+    "thiet_bi_hoi_suc_gay_me": "gay_me_may_tho",
+    "Unknown": "chua_phan_loai",
+    "khac": "chua_phan_loai",
+}
+
+GROUP_ALIASES: dict[str, str] = {
+    "Unknown": "khac",
+    "may_tho": "may_tho_hoi_suc",
+    "phong_mo": "khac",
+    "thiet_bi_phong_mo": "khac",
+    "ban-mo": "ban_mo",
+    "monitor_benh_nhan": "monitor",
+    "may_theo_doi_benh_nhan": "monitor",
+    "bon_rua_tay_phau_thuat": "bon_rua_tay",
+}
+
+DEFAULT_MATCH_THRESHOLD = 0.6
+# Chỉ ghi nhớ (learn) các kết quả khớp mờ đủ chắc chắn
+DEFAULT_LEARN_THRESHOLD = 0.8
+# Khớp mờ phải hơn ứng viên thứ hai ít nhất chừng này điểm (VD "xet_nghiem" gần
+# như bằng điểm với mọi category xet_nghiem_*)
+DEFAULT_MATCH_MARGIN = 0.1
+
+# Trọng số giữa độ giống trigram và độ phủ token (IDF)
+_W_TRIGRAM = 0.6
+_W_TOKEN = 0.4
+
+
+def _trigrams(text: str) -> frozenset[str]:
+    padded = f" {text.replace('_', ' ')} "
+    return frozenset(padded[i : i + 3] for i in range(len(padded) - 2))
+
+
+def _dice(a: frozenset[str], b: frozenset[str]) -> float:
+    if not a or not b:
+        return 0.0
+    return 2 * len(a & b) / (len(a) + len(b))
+
+
+@dataclass(frozen=True)
+class _Entry:
+    """Một đích có thể snap tới (category hoặc category/group)."""
+
+    category_slug: str
+    group_slug: str | None
+    tokens: frozenset[str]
+    names: tuple[frozenset[str], ...]  # trigram của slug và từng label
+
+
+@dataclass(frozen=True)
+class Resolution:
+    """Kết quả resolve. category_slug None → không xác định được."""
+
+    category_slug: str | None
+    group_slug: str | None
+    method: str  # exact / alias / group / fuzzy / none
+    score: float = 1.0
+    # False nếu category chỉ suy ra từ group (không ghi nhớ thành alias category)
+    learnable: bool = True
+
+
+class _Index:
+    """Index token + trigram cho một tập entry, tra cứu ứng viên qua inverted index."""
+
+    def __init__(self, entries: list[_Entry]) -> None:
+        self.entries = entries
+        self._by_trigram: dict[str, list[int]] = {}
+        self._by_token: dict[str, list[int]] = {}
+        for i, entry in enumerate(entries):
+            for gram in set().union(*entry.names):
+                self._by_trigram.setdefault(gram, []).append(i)
+            for token in entry.tokens:
+                self._by_token.setdefault(token, []).append(i)
+        n = max(len(entries), 1)
+        self._idf = {t: math.log(1 + n / len(ids)) for t, ids in self._by_token.items()}
+        self._max_idf = math.log(1 + n)
+
+    def best(
+        self, query: str, allowed: set[int] | None = None
+    ) -> tuple[_Entry | None, float, float]:
+        """Entry giống query nhất, điểm của nó và điểm của ứng viên thứ hai (0..1)."""
+        grams = _trigrams(query)
+        tokens = set(query.split("_"))
+        candidates: set[int] = set()
+        for gram in grams:
+            candidates.update(self._by_trigram.get(gram, ()))
+        if allowed is not None:
+            candidates &= allowed
+
+        token_weight = sum(self._idf.get(t, self._max_idf) for t in tokens) or 1.0
+        best_entry, best_score, runner_up = None, 0.0, 0.0
+        for i in candidates:
+            entry = self.entries[i]
+            trigram_score = max(_dice(grams, name) for name in entry.names)
+            token_score = sum(self._idf[t] for t in tokens & entry.tokens) / token_weight
+            score = _W_TRIGRAM * trigram_score + _W_TOKEN * token_score
+            if score > best_score:
+                best_entry, best_score, runner_up = entry, score, best_score
+            elif score > runner_up:
+                runner_up = score
+        return best_entry, best_score, runner_up
+
+
+class TaxonomyResolver:
+    """
+    Resolve category/group slug về taxonomy hợp lệ.
+
+    Thứ tự: slug hợp lệ → alias (tĩnh + học được) → group hợp lệ duy nhất
+    (suy ra category) → so khớp mờ trên index tính sẵn (đạt `threshold` và hơn
+    ứng viên thứ hai ít nhất `margin`).
+    """
+
+    def __init__(
+        self,
+        taxonomy: Taxonomy,
+        threshold: float = DEFAULT_MATCH_THRESHOLD,
+        learn_threshold: float = DEFAULT_LEARN_THRESHOLD,
+        margin: float = DEFAULT_MATCH_MARGIN,
+        category_aliases: dict[str, str] | None = None,
+        group_aliases: dict[str, str] | None = None,
+        learned_aliases_file: str | Path | None = None,
+    ) -> None:
+        self._taxonomy = taxonomy
+        self.threshold = threshold
+        self.learn_threshold = learn_threshold
+        self.margin = margin
+        self._category_aliases = {
+            normalize(k): v for k, v in (category_aliases or CATEGORY_ALIASES).items()
+        }
+        self._group_aliases = {normalize(k): v for k, v in (group_aliases or GROUP_ALIASES).items()}
+        self._learned_file = Path(learned_aliases_file) if learned_aliases_file else None
+        self._learned: dict[str, dict[str, str]] = {"category": {}, "group": {}}
+        self._load_learned()
+
+        categories: list[_Entry] = []
+        groups: list[_Entry] = []
+        self._groups_by_slug: dict[str, list[str]] = {}
+        for cat in taxonomy.list_categories():
+            cat_slug = cat["slug"]
+            names = [cat_slug, normalize(cat["label_vi"]), normalize(cat["label_en"])]
+            categories.append(self._entry(cat_slug, None, names))
+            for group in taxonomy.list_groups(cat_slug):
+                group_names = [group["slug"], normalize(group["label_vi"])]
+                groups.append(self._entry(cat_slug, group["slug"], group_names))
+                self._groups_by_slug.setdefault(group["slug"], []).append(cat_slug)
+
+        self._categories = _Index(categories)
+        self._groups = _Index(groups)
+        self._group_ids_by_category: dict[str, set[int]] = {}
+        for i, entry in enumerate(groups):
+            self._group_ids_by_category.setdefault(entry.category_slug, set()).add(i)
+
+    @staticmethod
+    def _entry(category_slug: str, group_slug: str | None, names: list[str]) -> _Entry:
+        names = [n for n in names if n]
+        tokens = frozenset(t for n in names for t in n.split("_"))
+        return _Entry(category_slug, group_slug, tokens, tuple(_trigrams(n) for n in names))
+
+    # ------------------------------------------------------------------
+    # Alias học được
+    # ------------------------------------------------------------------
+
+    def _load_learned(self) -> None:
+        if not self._learned_file or not self._learned_file.exists():
+            return
+        try:
+            with open(self._learned_file, encoding="utf-8") as f:
+                data = json.load(f)
+            self._learned["category"].update(data.get("category", {}))
+            self._learned["group"].update(data.get("group", {}))
+        except (OSError, json.JSONDecodeError) as e:
+            logger.warning(f"Không đọc được alias taxonomy đã học {self._learned_file}: {e}")
+
+    def _save_learned(self) -> None:
+        if not self._learned_file:
+            return
+        try:
+            self._learned_file.parent.mkdir(parents=True, exist_ok=True)
+            tmp = self._learned_file.with_suffix(".tmp")
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(self._learned, f, ensure_ascii=False, indent=2, sort_keys=True)
+            os.replace(tmp, self._learned_file)
+        except OSError as e:
+            logger.warning(f"Không lưu được alias taxonomy: {e}")
+
+    def learn(self, raw_category: str, raw_group: str, resolution: Resolution) -> None:
+        """
+        Ghi nhớ raw slug → kết quả để lần sau tra dict, không so khớp mờ lại.
+        Không ghi nhớ kết quả có category chỉ suy ra từ group.
+        """
+        if (
+            resolution.category_slug is None
+            or not resolution.learnable
+            or resolution.score < self.learn_threshold
+        ):
+            return
+        raw_cat = normalize(raw_category)
+        raw_grp = normalize(raw_group)
+        changed = False
+        if raw_cat and raw_cat != resolution.category_slug:
+            changed |= self._learned["category"].get(raw_cat) != resolution.category_slug
+            self._learned["category"][raw_cat] = resolution.category_slug
+        if raw_grp and resolution.group_slug and raw_grp != resolution.group_slug:
+            key = f"{resolution.category_slug}/{raw_grp}"
+            changed |= self._learned["group"].get(key) != resolution.group_slug
+            self._learned["group"][key] = resolution.group_slug
+        if changed:
+            self._save_learned()
+
+    # ------------------------------------------------------------------
+    # Resolve
+    # ------------------------------------------------------------------
+
+    def _match(
+        self, index: _Index, query: str, allowed: set[int] | None = None
+    ) -> tuple[_Entry | None, float]:
+        """Khớp mờ đạt ngưỡng và rõ ràng (hơn ứng viên thứ hai >= margin)."""
+        entry, score, runner_up = index.best(query, allowed)
+        if entry is None or score < self.threshold:
+            return None, score
+        if score - runner_up < self.margin:
+            logger.info(
+                f"Khớp mờ taxonomy '{query}' không rõ ràng "
+                f"({score:.2f} so với {runner_up:.2f}), không snap."
+            )
+            return None, score
+        return entry, score
+
+    def resolve_category(self, category: str, group: str = "") -> Resolution:
+        """Tìm category hợp lệ (chưa xét group)."""
+        cat = normalize(category)
+        if self._taxonomy.is_valid_category(cat):
+            return Resolution(cat, None, "exact")
+
+        alias = self._learned["category"].get(cat) or self._category_aliases.get(cat)
+        if alias is not None:
+            if self._taxonomy.is_valid_category(alias):
+                return Resolution(alias, None, "alias")
+            return Resolution(None, None, "alias")  # Cố ý không phân loại
+
+        grp = normalize(group)
+        owners = self._groups_by_slug.get(grp, [])
+        if len(owners) == 1:
+            return Resolution(owners[0], grp, "group", learnable=False)
+
+        if cat:
+            entry, score = self._match(self._categories, cat)
+            if entry is not None:
+                return Resolution(entry.category_slug, None, "fuzzy", score)
+
+        if grp:
+            entry, score = self._match(self._groups, grp)
+            if entry is not None:
+                return Resolution(
+                    entry.category_slug, entry.group_slug, "fuzzy", score, learnable=False
+                )
+
+        return Resolution(None, None, "none", 0.0)
+
+    def resolve_group(self, category_slug: str, group: str) -> tuple[str | None, str, float]:
+        """
+        Tìm group hợp lệ trong một category đã hợp lệ.
+
+        Returns:
+            (group_slug hoặc None, method, score)
+        """
+        grp = normalize(group)
+        if self._taxonomy.is_valid_group(category_slug, grp):
+            return grp, "exact", 1.0
+
+        alias = self._learned["group"].get(f"{category_slug}/{grp}") or self._group_aliases.get(grp)
+        if alias is not None:
+            if self._taxonomy.is_valid_group(category_slug, alias):
+                return alias, "alias", 1.0
+            return None, "alias", 0.0  # Cố ý không gán group
+
+        allowed = self._group_ids_by_category.get(category_slug)
+        if grp and allowed:
+            entry, score = self._match(self._groups, grp, allowed)
+            if entry is not None:
+                return entry.group_slug, "fuzzy", score
+        return None, "none", 0.0
+
+    def resolve(self, category: str, group: str = "") -> Resolution:
+        """
+        Resolve cặp category/group do AI sinh ra.
+
+        Returns:
+            Resolution; group_slug None nghĩa là không tìm được group phù hợp
+            trong category (caller tự fallback, VD "khac").
+        """
+        cat_res = self.resolve_category(category, group)
+        if cat_res.category_slug is None:
+            return cat_res
+        if cat_res.group_slug is not None:
+            return cat_res
+
+        group_slug, group_method, group_score = self.resolve_group(cat_res.category_slug, group)
+        if group_slug is None and cat_res.method == "fuzzy" and group:
+            # Category chỉ là đoán mờ: group khớp tốt ở category khác đáng tin hơn
+            entry, score = self._match(self._groups, normalize(group))
+            if entry is not None:
+                return Resolution(
+                    entry.category_slug, entry.group_slug, "fuzzy", score, learnable=False
+                )
+
+        method = cat_res.method
+        if group_method in ("alias", "fuzzy") and method == "exact":
+            method = group_method
+        return Resolution(
+            cat_res.category_slug,
+            group_slug,
+            method,
+            min(cat_res.score, group_score) if group_slug else cat_res.score,
+            cat_res.learnable,
+        )
+
+
+_resolvers: weakref.WeakKeyDictionary[Taxonomy, TaxonomyResolver] = weakref.WeakKeyDictionary()
+
+
+def get_resolver(taxonomy: Taxonomy, config: dict[str, Any] | None = None) -> TaxonomyResolver:
+    """Resolver dùng chung cho một Taxonomy (index chỉ tính một lần)."""
+    resolver = _resolvers.get(taxonomy)
+    if resolver is None:
+        config = config or {}
+        classifier_cfg = config.get("classifier", {})
+        learned = config.get("paths", {}).get("taxonomy_aliases_file")
+        resolver = TaxonomyResolver(
+            taxonomy,
+            threshold=classifier_cfg.get("taxonomy_match_threshold", DEFAULT_MATCH_THRESHOLD),
+            learn_threshold=classifier_cfg.get("taxonomy_learn_threshold", DEFAULT_LEARN_THRESHOLD),
+            margin=classifier_cfg.get("taxonomy_match_margin", DEFAULT_MATCH_MARGIN),
+            category_aliases={**CATEGORY_ALIASES, **classifier_cfg.get("category_aliases", {})},
+            group_aliases={**GROUP_ALIASES, **classifier_cfg.get("group_aliases", {})},
+            learned_aliases_file=os.path.expanduser(learned) if learned else None,
+        )
+        _resolvers[taxonomy] = resolver
+    return resolver
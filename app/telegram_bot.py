@@ -31,6 +31,7 @@ from telegram.ext import (
 )
 
 from app.index_store import IndexStore
+from app.usage import UsageBudget, format_usage, today
 
 # Setup logging
 logger = logging.getLogger(__name__)
@@ -195,6 +196,9 @@ async def status_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
             f"- 📡 Bot: Online\n"
             f"- 🧠 AI Model: <code>{html.escape(model_name)}</code>"
         )
+        usage = await store.usage_summary(today())
+        lines = format_usage(usage, UsageBudget.from_config(config or {}))
+        msg += "\n" + "\n".join(lines)
     except Exception as e:
         import html as _html
         msg = f"🔴 Lỗi lấy trạng thái: {_html.escape(str(e))}"
@@ -320,6 +324,16 @@ async def _safe_edit_markup(query, reply_markup=None):
             logger.error(f"Lỗi khi edit_message_reply_markup: {tg_err}")
 
 
+def _render_stored_draft(file_info: dict[str, Any]):
+    """Render draft từ record DB, giữ nguyên độ tin cậy lúc phân loại."""
+    from app.ui import render_draft_message
+
+    confidence = file_info.get("confidence")
+    threshold = config.get("classifier", {}).get("confidence_threshold", 0.7)
+    is_confident = confidence is None or confidence >= threshold
+    return render_draft_message(file_info, config, confidence, is_confident)
+
+
 async def button_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Xử lý sự kiện click vào nút Inline Keyboard"""
     query = update.callback_query
@@ -479,6 +493,24 @@ async def button_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
         file_id = int(data.split("_")[2])
         await _refresh_draft_message(query, context, file_id)
 
+    elif data.startswith("show_draft_"):
+        # Từ tin nhắn digest: gửi draft chi tiết thành tin nhắn riêng để phê duyệt/chỉnh sửa
+        file_id = int(data.split("_")[2])
+        file_info = await store.get_file_by_id(file_id) if store else None
+        if not file_info:
+            await context.bot.send_message(
+                chat_id=query.message.chat_id, text="❌ Tệp không còn tồn tại."
+            )
+            return
+        report, reply_markup = _render_stored_draft(file_info)
+        await context.bot.send_message(
+            chat_id=query.message.chat_id,
+            text=report,
+            parse_mode=ParseMode.HTML,
+            reply_markup=reply_markup,
+        )
+
+
 async def _refresh_draft_message(query, context, file_id: int):
     store: IndexStore | None = context.bot_data.get("store")
     if not store:
@@ -487,9 +519,8 @@ async def _refresh_draft_message(query, context, file_id: int):
     if not file_info:
         await _safe_edit(query, "❌ Tệp không còn tồn tại.")
         return
-    
-    from app.ui import render_draft_message
-    report, reply_markup = render_draft_message(file_info, config, confidence=None, is_confident=True)
+
+    report, reply_markup = _render_stored_draft(file_info)
     await _safe_edit(query, report, parse_mode=ParseMode.HTML, reply_markup=reply_markup)
 
 
@@ -533,9 +564,8 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
                             pass # Bot không có quyền xoá trong group? Vẫn tiếp tục
 
                         # Refresh lại thông báo Draft
-                        from app.ui import render_draft_message
                         updated_file_info = await store.get_file_by_id(file_id)
-                        report, reply_markup = render_draft_message(updated_file_info, config, confidence=None, is_confident=True)
+                        report, reply_markup = _render_stored_draft(updated_file_info)
                         try:
                             await context.bot.edit_message_text(
                                 chat_id=update.message.chat_id,
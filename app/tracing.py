@@ -0,0 +1,221 @@
+"""
+tracing.py — Đo thời gian từng stage của pipeline theo từng file.
+
+Mỗi file được gán một correlation ID (trace_id); mọi span bên trong
+(ingest, rules, extract, rate_limit_wait, gateway, db, notify...) được ghi
+thành một dòng JSON. Kèm bộ tổng hợp p50/p95/p99 theo stage trong một cửa
+sổ thời gian để profile hot path trên production.
+
+Sử dụng:
+    configure_tracing("logs/trace.jsonl")
+    with trace_file(path):
+        with span("ingest") as sp:
+            ...
+            sp["bytes"] = 1234
+
+    python -m app.tracing logs/trace.jsonl --window 3600
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import logging
+import time
+import uuid
+from collections.abc import Callable, Iterator
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import UTC, datetime, timedelta
+from pathlib import Path
+from typing import Any
+
+from app.utils import percentile
+
+logger = logging.getLogger(__name__)
+
+# Logger riêng cho span — ghi JSON Lines, không lẫn vào log thường
+_span_logger = logging.getLogger("app.tracing.spans")
+_span_logger.propagate = False
+
+# Trace hiện tại (theo asyncio task/context)
+_current: ContextVar[dict[str, Any] | None] = ContextVar("medicaldocbot_trace", default=None)
+
+# Các sink nhận span record (file JSONL, bench, test...)
+_sinks: list[Callable[[dict[str, Any]], None]] = []
+
+
+def _log_sink(record: dict[str, Any]) -> None:
+    _span_logger.info(json.dumps(record, ensure_ascii=False))
+
+
+def configure_tracing(trace_file: str | Path) -> None:
+    """Ghi span ra file JSON Lines (gọi một lần khi khởi động daemon)."""
+    path = Path(trace_file)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    handler = logging.FileHandler(path, encoding="utf-8")
+    handler.setFormatter(logging.Formatter("%(message)s"))
+    _span_logger.addHandler(handler)
+    _span_logger.setLevel(logging.INFO)
+    add_sink(_log_sink)
+
+
+def add_sink(sink: Callable[[dict[str, Any]], None]) -> None:
+    """Đăng ký sink nhận span record."""
+    if sink not in _sinks:
+        _sinks.append(sink)
+
+
+def remove_sink(sink: Callable[[dict[str, Any]], None]) -> None:
+    """Gỡ sink đã đăng ký."""
+    if sink in _sinks:
+        _sinks.remove(sink)
+
+
+def current_trace_id() -> str | None:
+    """Correlation ID của file đang xử lý (None nếu ngoài trace)."""
+    trace = _current.get()
+    return trace["trace_id"] if trace else None
+
+
+def record(stage: str, duration_ms: float, **attrs: Any) -> None:
+    """Ghi một span đã đo sẵn thời gian (VD: thời gian chờ rate limit)."""
+    if not _sinks:
+        return
+    trace = _current.get()
+    rec = {
+        "ts": datetime.now(UTC).isoformat(),
+        "trace_id": trace["trace_id"] if trace else None,
+        "file": trace["file"] if trace else None,
+        "stage": stage,
+        "duration_ms": round(duration_ms, 2),
+        **attrs,
+    }
+    for sink in list(_sinks):
+        try:
+            sink(rec)
+        except Exception as e:
+            logger.debug("Lỗi trace sink: %s", e)
+
+
+def annotate(**attrs: Any) -> None:
+    """Gắn thêm thuộc tính vào record tổng của file (VD: retries, source)."""
+    trace = _current.get()
+    if trace is not None:
+        trace["attrs"].update(attrs)
+
+
+@contextmanager
+def span(stage: str, **attrs: Any) -> Iterator[dict[str, Any]]:
+    """
+    Đo thời gian một stage. Yield dict thuộc tính để bổ sung trong lúc chạy.
+    Exception được ghi vào thuộc tính "error" rồi raise tiếp.
+    """
+    t0 = time.perf_counter()
+    try:
+        yield attrs
+    except BaseException as e:
+        attrs["error"] = type(e).__name__
+        raise
+    finally:
+        record(stage, (time.perf_counter() - t0) * 1000, **attrs)
+
+
+@contextmanager
+def trace_file(file_path: str | Path) -> Iterator[str]:
+    """
+    Mở trace cho một file: sinh correlation ID, cuối cùng ghi record "total".
+
+    Yields:
+        trace_id
+    """
+    trace = {"trace_id": uuid.uuid4().hex[:12], "file": Path(file_path).name, "attrs": {}}
+    token = _current.set(trace)
+    t0 = time.perf_counter()
+    try:
+        yield trace["trace_id"]
+    except BaseException as e:
+        trace["attrs"]["error"] = type(e).__name__
+        raise
+    finally:
+        record("total", (time.perf_counter() - t0) * 1000, **trace["attrs"])
+        _current.reset(token)
+
+
+# ----------------------------------------------------------------------
+# Tổng hợp
+# ----------------------------------------------------------------------
+
+
+def summarize(
+    records: list[dict[str, Any]], window_seconds: float | None = None
+) -> dict[str, dict[str, float]]:
+    """
+    Tính count/p50/p95/p99/max theo stage.
+
+    Args:
+        records: Danh sách span record
+        window_seconds: Chỉ tính các record trong N giây gần nhất (None → tất cả)
+
+    Returns:
+        {stage: {"count", "p50", "p95", "p99", "max"}}
+    """
+    cutoff = None
+    if window_seconds:
+        cutoff = datetime.now(UTC) - timedelta(seconds=window_seconds)
+
+    by_stage: dict[str, list[float]] = {}
+    for rec in records:
+        if cutoff is not None:
+            try:
+                if datetime.fromisoformat(rec["ts"]) < cutoff:
+                    continue
+            except (KeyError, ValueError):
+                continue
+        by_stage.setdefault(rec.get("stage", "?"), []).append(float(rec.get("duration_ms", 0)))
+
+    return {
+        stage: {
+            "count": len(values),
+            "p50": percentile(values, 50),
+            "p95": percentile(values, 95),
+            "p99": percentile(values, 99),
+            "max": max(values),
+        }
+        for stage, values in sorted(by_stage.items())
+    }
+
+
+def load_records(trace_file: str | Path) -> list[dict[str, Any]]:
+    """Đọc file trace JSONL (bỏ qua dòng hỏng)."""
+    records = []
+    with open(trace_file, encoding="utf-8") as f:
+        for line in f:
+            try:
+                records.append(json.loads(line))
+            except json.JSONDecodeError:
+                continue
+    return records
+
+
+def format_summary(summary: dict[str, dict[str, float]]) -> str:
+    """Bảng text cho kết quả summarize()."""
+    lines = [f"{'stage':<18}{'n':>7}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}"]
+    for stage, s in summary.items():
+        lines.append(
+            f"{stage:<18}{s['count']:>7}{s['p50']:>10.1f}{s['p95']:>10.1f}"
+            f"{s['p99']:>10.1f}{s['max']:>10.1f}"
+        )
+    return "\n".join(lines)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Tổng hợp latency theo stage từ trace JSONL")
+    parser.add_argument("trace_file", nargs="?", default="logs/trace.jsonl")
+    parser.add_argument("--window", type=float, default=None, help="Cửa sổ thời gian (giây)")
+    args = parser.parse_args()
+    print(format_summary(summarize(load_records(args.trace_file), args.window)))
+
+
+if __name__ == "__main__":
+    main()
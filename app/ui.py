@@ -74,6 +74,35 @@ def render_draft_message(file_info: dict, config: dict, confidence: float = None
     
     return report, reply_markup
 
+
+def render_digest_page(
+    file_infos: list[dict], page_no: int, total_pages: int, total_items: int
+) -> tuple[str, InlineKeyboardMarkup]:
+    """
+    Renders one page of a bulk-import digest (many drafts in one message).
+    Each file gets a button that opens its full draft message.
+    """
+    esc = html.escape
+    lines = [
+        f"📦 <b>{total_items} tài liệu mới chờ phê duyệt</b> (Trang {page_no}/{total_pages})\n"
+    ]
+    keyboard = []
+    for info in file_infos:
+        file_id = info.get("id")
+        name = Path(info.get("path", "")).name
+        doc_type_vi = DOC_TYPE_MAP.get(info.get("doc_type", "khac"), "Khác")
+        location = Path(info.get("category_slug", "chua_phan_loai")) / info.get("group_slug", "khac")
+        lines.append(
+            f"#{file_id} <code>{esc(name)}</code>\n"
+            f"   🏷 {esc(doc_type_vi)} | 🏭 {esc(str(info.get('vendor', 'Unknown')))} | 📁 {esc(str(location))}"
+        )
+        keyboard.append(
+            [InlineKeyboardButton(f"🔍 #{file_id} {name[:30]}", callback_data=f"show_draft_{file_id}")]
+        )
+    lines.append("\nBấm vào từng file để xem chi tiết và phê duyệt.")
+    return "\n".join(lines), InlineKeyboardMarkup(keyboard)
+
+
 def render_edit_menu(file_id: int) -> InlineKeyboardMarkup:
     """Renders the top-level edit menu keyboard."""
     keyboard = [
@@ -0,0 +1,260 @@
+"""
+usage.py — Thống kê token/latency gọi 9router và ngân sách gọi AI.
+
+Mỗi lần phân loại bằng AI ghi một dòng gọn vào bảng `llm_usage` của index
+(file, model, doc_type, lớp ưu tiên, số request/retry, prompt/completion
+token, latency). Token lấy từ trường `usage` của response; stream dừng sớm
+hoặc gateway không trả `usage` thì ước lượng cục bộ (`estimated`).
+
+Ngân sách theo ngày/tháng (`services.9router.budget_*`, 0 = không giới hạn):
+- Từ `budget_soft_ratio` ngân sách: mỗi request bulk chờ thêm
+  `budget_throttle_seconds` (giảm tốc nạp hàng loạt)
+- Vượt ngân sách: request bulk bị từ chối (`BudgetExceededError`) — watcher
+  hoãn event lại, bulk ingest dừng để chạy tiếp sau; file thả lẻ vẫn được phân loại
+Tổng đã dùng được đồng bộ lại từ DB mỗi lần ghi, nên nhiều tiến trình
+(watcher + bulk ingest) dùng chung một ngân sách (sai lệch tối đa một lần flush).
+
+Sử dụng:
+    tracker = UsageTracker.from_config(config)
+    await tracker.attach(store)
+    await tracker.admit(priority)          # trước khi gọi gateway
+    tracker.record(path=..., prompt_tokens=..., ...)
+"""
+
+from __future__ import annotations
+
+import asyncio
+import html
+import logging
+import time
+from dataclasses import dataclass
+from datetime import date, datetime
+from typing import Any
+
+from app.scheduler import BULK
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SOFT_RATIO = 0.8
+DEFAULT_THROTTLE_SECONDS = 10.0
+# Ghi xuống DB khi đủ N dòng hoặc sau N giây kể từ lần ghi trước
+_FLUSH_ROWS = 20
+_FLUSH_SECONDS = 30.0
+
+
+class BudgetExceededError(Exception):
+    """Đã hết ngân sách gọi AI cho việc nạp hàng loạt."""
+
+
+def today() -> str:
+    """Ngày theo giờ máy (ngân sách reset lúc 0h địa phương), dạng YYYY-MM-DD."""
+    return date.today().isoformat()
+
+
+@dataclass
+class UsageBudget:
+    """Ngân sách gọi AI; 0 = không giới hạn."""
+
+    daily_tokens: int = 0
+    monthly_tokens: int = 0
+    daily_requests: int = 0
+    soft_ratio: float = DEFAULT_SOFT_RATIO
+    throttle_seconds: float = DEFAULT_THROTTLE_SECONDS
+
+    @classmethod
+    def from_config(cls, config: dict[str, Any]) -> UsageBudget:
+        """Đọc `services.9router.budget_*` trong config.yaml."""
+        cfg = config.get("services", {}).get("9router", {})
+        return cls(
+            daily_tokens=int(cfg.get("budget_daily_tokens", 0) or 0),
+            monthly_tokens=int(cfg.get("budget_monthly_tokens", 0) or 0),
+            daily_requests=int(cfg.get("budget_daily_requests", 0) or 0),
+            soft_ratio=float(cfg.get("budget_soft_ratio", DEFAULT_SOFT_RATIO)),
+            throttle_seconds=float(cfg.get("budget_throttle_seconds", DEFAULT_THROTTLE_SECONDS)),
+        )
+
+    def limits(self, totals: dict[str, Any]) -> list[tuple[str, int, int]]:
+        """Các ngân sách đang bật: (tên, đã dùng, giới hạn)."""
+        pairs = [
+            ("token/ngày", totals["day"]["tokens"], self.daily_tokens),
+            ("token/tháng", totals["month"]["tokens"], self.monthly_tokens),
+            ("request/ngày", totals["day"]["requests"], self.daily_requests),
+        ]
+        return [(name, used, limit) for name, used, limit in pairs if limit > 0]
+
+    def usage_ratio(self, totals: dict[str, Any]) -> float:
+        """Tỉ lệ dùng cao nhất trên các ngân sách đang bật (0 nếu không có)."""
+        return max((used / limit for _, used, limit in self.limits(totals)), default=0.0)
+
+
+def _empty_totals(day: str) -> dict[str, Any]:
+    zero = {"files": 0, "requests": 0, "retries": 0, "tokens": 0, "latency_ms": 0}
+    return {"date": day, "day": dict(zero), "month": dict(zero)}
+
+
+class UsageTracker:
+    """
+    Đếm token/request trong bộ nhớ, ghi theo lô xuống `IndexStore.record_usage`
+    và chặn/giảm tốc việc bulk theo `UsageBudget`.
+    """
+
+    def __init__(self, budget: UsageBudget | None = None) -> None:
+        self.budget = budget or UsageBudget()
+        self._store: Any = None
+        self._buffer: list[dict[str, Any]] = []
+        self._totals = _empty_totals(today())
+        self._flushed_at = time.monotonic()
+        self._flush_task: asyncio.Task | None = None
+        self._warned = False
+
+    @classmethod
+    def from_config(cls, config: dict[str, Any]) -> UsageTracker:
+        return cls(UsageBudget.from_config(config))
+
+    async def attach(self, store: Any) -> None:
+        """Ghi usage vào `store` (IndexStore) và nạp tổng đã dùng hôm nay/tháng này."""
+        self._store = store
+        await self._sync()
+
+    async def _sync(self) -> None:
+        summary = await self._store.usage_summary(today())
+        totals = _empty_totals(summary["date"])
+        for period in ("day", "month"):
+            totals[period].update({k: summary[period][k] for k in totals[period]})
+        # Dòng chưa ghi xuống DB vẫn tính vào ngân sách
+        for row in self._buffer:
+            self._add(totals, row)
+        self._totals = totals
+
+    @staticmethod
+    def _add(totals: dict[str, Any], row: dict[str, Any]) -> None:
+        periods = ("day", "month") if row["day"] == totals["date"] else ()
+        if not periods and row["day"][:7] == totals["date"][:7]:
+            periods = ("month",)
+        for period in periods:
+            bucket = totals[period]
+            bucket["files"] += row["files"]
+            bucket["requests"] += row["requests"]
+            bucket["retries"] += row["retries"]
+            bucket["tokens"] += row["prompt_tokens"] + row["completion_tokens"]
+            bucket["latency_ms"] += row["latency_ms"]
+
+    def totals(self) -> dict[str, Any]:
+        """Tổng hôm nay/tháng này (sang ngày mới thì reset phần ngày/tháng)."""
+        day = today()
+        if self._totals["date"] != day:
+            month = self._totals["month"] if self._totals["date"][:7] == day[:7] else None
+            self._totals = _empty_totals(day)
+            if month is not None:
+                self._totals["month"] = month
+            self._warned = False
+        return self._totals
+
+    def record(
+        self,
+        path: str,
+        model: str,
+        prompt_tokens: int,
+        completion_tokens: int,
+        latency_ms: float,
+        requests: int = 1,
+        retries: int = 0,
+        files: int = 1,
+        doc_type: str | None = None,
+        priority: str | None = None,
+        estimated: bool = False,
+    ) -> None:
+        """Ghi usage của một lần phân loại (một file, hoặc phần chia đều của một batch)."""
+        row = {
+            "ts": datetime.now().astimezone().isoformat(),
+            "day": today(),
+            "path": path,
+            "model": model,
+            "doc_type": doc_type,
+            "priority": priority,
+            "files": files,
+            "requests": requests,
+            "retries": retries,
+            "prompt_tokens": int(prompt_tokens),
+            "completion_tokens": int(completion_tokens),
+            "latency_ms": int(latency_ms),
+            "estimated": int(estimated),
+        }
+        self._add(self.totals(), row)
+        if self._store is None:
+            return
+        self._buffer.append(row)
+        if (
+            len(self._buffer) >= _FLUSH_ROWS
+            or time.monotonic() - self._flushed_at >= _FLUSH_SECONDS
+        ) and (self._flush_task is None or self._flush_task.done()):
+            self._flush_task = asyncio.get_running_loop().create_task(self.flush())
+
+    async def flush(self) -> None:
+        """Ghi các dòng đang chờ xuống DB rồi đồng bộ tổng (gồm cả tiến trình khác)."""
+        if self._store is None:
+            return
+        rows, self._buffer = self._buffer, []
+        self._flushed_at = time.monotonic()
+        try:
+            if rows:
+                await self._store.record_usage(rows)
+            await self._sync()
+        except Exception as e:
+            logger.warning("Không ghi được usage gọi AI: %s", e)
+            self._buffer = rows + self._buffer
+
+    def exceeded(self) -> str | None:
+        """Ngân sách đã vượt (mô tả), None nếu còn."""
+        for name, used, limit in self.budget.limits(self.totals()):
+            if used >= limit:
+                return f"đã dùng {used}/{limit} {name}"
+        return None
+
+    async def admit(self, priority: str | None) -> None:
+        """
+        Kiểm tra ngân sách trước khi gọi gateway. Chỉ việc bulk bị chặn/giảm tốc.
+
+        Raises:
+            BudgetExceededError: Request bulk khi đã vượt ngân sách
+        """
+        if priority != BULK or not self.budget.limits(self.totals()):
+            return
+        reason = self.exceeded()
+        if reason is not None:
+            raise BudgetExceededError(f"Hết ngân sách gọi AI ({reason}), hoãn việc nạp hàng loạt.")
+        if self.budget.usage_ratio(self.totals()) >= self.budget.soft_ratio:
+            if not self._warned:
+                self._warned = True
+                logger.warning(
+                    f"Đã dùng >= {self.budget.soft_ratio:.0%} ngân sách gọi AI, giảm tốc "
+                    f"nạp hàng loạt ({self.budget.throttle_seconds:.0f}s/request)."
+                )
+            await asyncio.sleep(self.budget.throttle_seconds)
+
+    async def close(self) -> None:
+        """Ghi nốt các dòng đang chờ."""
+        if self._flush_task is not None and not self._flush_task.done():
+            await self._flush_task
+        await self.flush()
+
+
+def format_usage(summary: dict[str, Any], budget: UsageBudget) -> list[str]:
+    """Các dòng (HTML) tóm tắt usage cho lệnh /status của bot."""
+    lines = []
+    for period, label in (("day", "Hôm nay"), ("month", "Tháng này")):
+        s = summary[period]
+        avg = s["latency_ms"] / s["requests"] if s["requests"] else 0
+        lines.append(
+            f"- 🔢 {label}: <code>{s['tokens']:,}</code> token, "
+            f"<code>{s['requests']}</code> request ({s['retries']} retry), "
+            f"<code>{s['files']}</code> file, latency TB <code>{avg:.0f}ms</code>"
+        )
+    totals = {"day": summary["day"], "month": summary["month"]}
+    for name, used, limit in budget.limits(totals):
+        lines.append(f"- 💰 Ngân sách {name}: <code>{used:,}/{limit:,}</code> ({used / limit:.0%})")
+    top = sorted(summary.get("by_doc_type", {}).items(), key=lambda kv: -kv[1]["tokens"])[:5]
+    if top:
+        parts = ", ".join(f"{html.escape(doc_type or '?')} {v['tokens']:,}" for doc_type, v in top)
+        lines.append(f"- 📑 Token theo loại (tháng): {parts}")
+    return lines
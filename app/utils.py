@@ -23,3 +23,17 @@ def clean_name(s: str) -> str:
     s = s.replace("/", "_").replace("\\", "_")
     # Remove characters that are generally illegal in filenames across major OSs
     return re.sub(r'[<>:"|?*]', "", s).strip()
+
+
+def percentile(values: list[float], q: float) -> float:
+    """
+    Percentile theo nội suy tuyến tính (q trong khoảng 0-100).
+    Trả về 0.0 nếu danh sách rỗng.
+    """
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    k = (len(ordered) - 1) * q / 100.0
+    lo = int(k)
+    hi = min(lo + 1, len(ordered) - 1)
+    return ordered[lo] + (ordered[hi] - ordered[lo]) * (k - lo)
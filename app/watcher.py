@@ -4,6 +4,14 @@ watcher.py — File watcher cho ~/MedicalDevices.
 Theo dõi sự kiện file mới/thay đổi, debounce 3 giây,
 log JSON Lines, whitelist path, bỏ qua file tạm.
 Daemon không crash khi lỗi đơn lẻ.
+
+Một lần debounce có nhiều file (copy cả thư mục) được xử lý như nạp hàng loạt
+(lớp bulk, giới hạn song song); file thả lẻ là interactive (cũng giới hạn song
+song) và được ClassificationScheduler ưu tiên phân loại trước. Mỗi path chỉ
+được xử lý một lần tại một thời điểm: event mới của path đang xử lý được gộp
+lại và chạy sau khi lần trước xong. Các file cùng thư mục trong
+một đợt được phân loại theo nhóm (FolderGroupClassifier). Khi hết ngân sách
+gọi AI, event bulk được hoãn lại và chạy tiếp khi ngân sách reset.
 """
 
 from __future__ import annotations
@@ -25,11 +33,16 @@ from watchdog.events import FileSystemEvent, FileSystemEventHandler
 from watchdog.observers import Observer
 
 from app.classifier import MedicalClassifier
+from app.folder_group import FolderGroupClassifier
 from app.index_store import IndexStore
+from app.notifier import TelegramNotifier
 
 # Import logic xử lý từ process_event.py
 from app.process_event import process_new_file
+from app.scheduler import BULK, INTERACTIVE, ClassificationScheduler, classification_priority
 from app.taxonomy import Taxonomy
+from app.tracing import configure_tracing
+from app.usage import BudgetExceededError
 from app.wiki_generator import WikiGenerator
 
 logger = logging.getLogger(__name__)
@@ -60,14 +73,14 @@ class EventDebouncer:
 
     def __init__(self, debounce_seconds: float = 3.0) -> None:
         self._debounce = debounce_seconds
-        # path → (event_type, timestamp)
-        self._pending: dict[str, tuple[str, float]] = {}
+        # path → (event_type, timestamp, size_bytes)
+        self._pending: dict[str, tuple[str, float, int]] = {}
         self._lock = asyncio.Lock()
 
-    async def add(self, event_type: str, path: str) -> None:
-        """Thêm event vào pending queue."""
+    async def add(self, event_type: str, path: str, size_bytes: int = 0) -> None:
+        """Thêm event vào pending queue (giữ size của event mới nhất)."""
         async with self._lock:
-            self._pending[path] = (event_type, time.monotonic())
+            self._pending[path] = (event_type, time.monotonic(), size_bytes)
 
     async def flush(self) -> list[dict[str, Any]]:
         """
@@ -80,11 +93,11 @@ class EventDebouncer:
         ready = []
         async with self._lock:
             expired_keys = [
-                path for path, (_, ts) in self._pending.items() if now - ts >= self._debounce
+                path for path, (_, ts, _) in self._pending.items() if now - ts >= self._debounce
             ]
             for path in expired_keys:
-                event_type, _ = self._pending.pop(path)
-                ready.append({"event": event_type, "path": path})
+                event_type, _, size_bytes = self._pending.pop(path)
+                ready.append({"event": event_type, "path": path, "size_bytes": size_bytes})
         return ready
 
 
@@ -132,14 +145,6 @@ class MedicalFileHandler(FileSystemEventHandler):
             return True
         return False
 
-    def _is_valid_file(self, path: str) -> bool:
-        """Kiểm tra file tồn tại và đủ kích thước."""
-        try:
-            size = os.path.getsize(path)
-            return size >= self._min_size
-        except OSError:
-            return False
-
     def _enqueue(self, event_type: str, path: str) -> None:
         """Đưa event vào async queue (thread-safe)."""
         logger.info(f"🔎 DEBUG WATCHER: Caught {event_type} on {path}")
@@ -147,7 +152,9 @@ class MedicalFileHandler(FileSystemEventHandler):
         if self._should_ignore(path):
             logger.info(f"🚫 DEBUG WATCHER: Ignored by _should_ignore: {path}")
             return
-        if event_type in ("created", "modified") and not self._is_valid_file(path):
+        # Stat một lần duy nhất cho cả kiểm tra kích thước và payload event
+        size = self._get_size(path)
+        if event_type in ("created", "modified") and (size is None or size < self._min_size):
             logger.info(f"🚫 DEBUG WATCHER: Invalid file size or not found: {path} (size >={self._min_size} required)")
             return
 
@@ -157,17 +164,17 @@ class MedicalFileHandler(FileSystemEventHandler):
             "event": event_type,
             "path": path,
             "ts": _now_iso(),
-            "size_bytes": self._get_size(path),
+            "size_bytes": size or 0,
         }
         # Thread-safe: gọi từ watchdog thread sang asyncio loop
         self._loop.call_soon_threadsafe(self._queue.put_nowait, event)
 
-    def _get_size(self, path: str) -> int:
-        """Lấy kích thước file, trả 0 nếu lỗi."""
+    def _get_size(self, path: str) -> int | None:
+        """Lấy kích thước file, trả None nếu file không tồn tại/lỗi."""
         try:
             return os.path.getsize(path)
         except OSError:
-            return 0
+            return None
 
     def on_created(self, event: FileSystemEvent) -> None:
         if not event.is_directory:
@@ -204,18 +211,55 @@ class MedicalWatcher:
 
         # Services
         self._classifier = None
+        self._scheduler = None
+        self._grouping = None
         self._store = None
         self._wiki = None
         self._taxonomy = None
+        self._notifier = None
+        # Học định kỳ các file mới confirm cho mô hình phân loại cục bộ
+        self._local_model_refresh = self._config.get("classifier", {}).get(
+            "local_model_refresh_seconds", 3600
+        )
+        self._local_model_refreshed_at = 0.0
+        # Đợt debounce >= N file → lớp bulk, tối đa bulk_workers file song song
+        classifier_cfg = self._config.get("classifier", {})
+        self._bulk_threshold = classifier_cfg.get("scheduler_bulk_batch_threshold", 5)
+        bulk_workers = classifier_cfg.get("scheduler_bulk_workers", 4)
+        self._bulk_slots = asyncio.Semaphore(max(1, bulk_workers))
+        interactive_workers = classifier_cfg.get("scheduler_interactive_workers", 8)
+        self._interactive_slots = asyncio.Semaphore(max(1, interactive_workers))
+        self._tasks: set[asyncio.Task] = set()
+        # Path đang xử lý → event mới nhất đến trong lúc đó (None nếu chưa có)
+        self._in_flight: dict[str, dict[str, Any] | None] = {}
+        # Event bulk bị hoãn vì hết ngân sách gọi AI (chạy lại khi ngân sách reset)
+        self._deferred: list[dict[str, Any]] = []
 
     async def _init_services(self) -> None:
         """Khởi tạo các dịch vụ cần thiết."""
         self._classifier = MedicalClassifier("config.yaml")
+        if self._config.get("classifier", {}).get("folder_groups", True):
+            self._grouping = FolderGroupClassifier.from_config(self._classifier, self._config)
+        self._scheduler = ClassificationScheduler.from_config(
+            self._grouping or self._classifier, self._config
+        )
         self._store = IndexStore(self._config["paths"]["db_file"])
         await self._store.init()
+        await self._classifier.usage.attach(self._store)
         self._wiki = WikiGenerator("config.yaml")
         self._taxonomy = Taxonomy(self._config["paths"]["taxonomy_file"])
-        logger.info("✅ Đã khởi tạo các dịch vụ (Classifier, Store, Wiki, Taxonomy)")
+        self._notifier = TelegramNotifier.from_config(self._config)
+        await self._notifier.start()
+        await self._refresh_local_model()
+        logger.info("✅ Đã khởi tạo các dịch vụ (Classifier, Store, Wiki, Taxonomy, Notifier)")
+
+    async def _refresh_local_model(self) -> None:
+        """Cập nhật mô hình cục bộ từ các file đã confirm (lỗi không làm dừng watcher)."""
+        self._local_model_refreshed_at = time.monotonic()
+        try:
+            await self._classifier.refresh_local_model(self._store)
+        except Exception as e:
+            logger.warning("Không cập nhật được mô hình phân loại cục bộ: %s", e)
 
     def _setup_logging(self) -> None:
         """Cấu hình logging JSON Lines."""
@@ -237,6 +281,11 @@ class MedicalWatcher:
         root_logger.addHandler(file_handler)
         root_logger.addHandler(console_handler)
 
+        # Span timing theo stage cho từng file (JSON Lines riêng)
+        trace_file = self._config.get("logging", {}).get("trace_file")
+        if trace_file:
+            configure_tracing(_expand_path(trace_file))
+
     def _log_event(self, event: dict[str, Any]) -> None:
         """Ghi event ra log file JSON Lines."""
         log_file = self._log_dir / "watcher.jsonl"
@@ -264,16 +313,60 @@ class MedicalWatcher:
                 await process_new_file(
                     event["path"],
                     self._config,
-                    self._classifier,
+                    self._scheduler,
                     self._store,
                     self._wiki,
                     self._taxonomy,
+                    self._notifier,
                 )
 
+        except BudgetExceededError as e:
+            if not self._deferred:
+                logger.warning("%s", e)
+            self._deferred.append(event)
         except Exception as e:
             # Không crash daemon
             logger.error("Lỗi xử lý event %s: %s", event.get("path"), e)
 
+    async def _run_event(self, event: dict[str, Any], priority: str) -> None:
+        """Xử lý event theo lớp ưu tiên (mỗi lớp chờ slot song song riêng)."""
+        slots = self._bulk_slots if priority == BULK else self._interactive_slots
+        try:
+            with classification_priority(priority):
+                async with slots:
+                    await self._process_event(event)
+        finally:
+            again = self._in_flight.pop(event["path"], None)
+            if again is not None:
+                # File thay đổi tiếp trong lúc xử lý: chạy lại một lần với event mới nhất
+                self._start_event(again, priority)
+
+    def _start_event(self, event: dict[str, Any], priority: str) -> None:
+        """Tạo task cho event, hoặc gộp vào lần xử lý đang chạy của cùng path."""
+        path = event["path"]
+        if path in self._in_flight:
+            # Hai lần process_new_file song song cùng path đều qua kiểm tra DB → draft trùng
+            self._in_flight[path] = event
+            return
+        self._in_flight[path] = None
+        task = asyncio.create_task(self._run_event(event, priority))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    def _spawn_events(self, events: list[dict[str, Any]], priority: str | None = None) -> None:
+        """Chạy các event đã debounce song song, không chặn vòng consumer."""
+        if priority is None:
+            priority = BULK if len(events) >= self._bulk_threshold else INTERACTIVE
+        if priority == BULK:
+            logger.info("📦 %d file trong một đợt → xử lý như nạp hàng loạt", len(events))
+        if self._grouping is not None:
+            self._grouping.expect(
+                evt["path"] for evt in events if evt["event"] in ("created", "modified", "moved")
+            )
+        for evt in events:
+            evt["ts"] = _now_iso()
+            self._start_event(evt, priority)
+
     async def _consumer(self) -> None:
         """Vòng lặp consumer: lấy events từ queue, debounce, xử lý."""
         while self._running:
@@ -281,21 +374,27 @@ class MedicalWatcher:
                 # Lấy event từ queue (timeout để kiểm tra running)
                 try:
                     event = await asyncio.wait_for(self._event_queue.get(), timeout=1.0)
-                    await self._debouncer.add(event["event"], event["path"])
-                    # Cập nhật size/ts từ event gốc
+                    await self._debouncer.add(
+                        event["event"], event["path"], event.get("size_bytes", 0)
+                    )
                 except TimeoutError:
                     pass
 
                 # Flush events đã qua debounce window
+                # (size lấy từ event mới nhất; size chính xác do ingest_file stat khi đọc)
                 ready_events = await self._debouncer.flush()
-                for evt in ready_events:
-                    # Lấy lại size từ file thực tế
-                    try:
-                        evt["size_bytes"] = os.path.getsize(evt["path"])
-                    except OSError:
-                        evt["size_bytes"] = 0
-                    evt["ts"] = _now_iso()
-                    await self._process_event(evt)
+                if ready_events:
+                    self._spawn_events(ready_events)
+                if self._deferred and not self._classifier.usage.exceeded():
+                    deferred, self._deferred = self._deferred, []
+                    logger.info("💰 Còn ngân sách gọi AI, xử lý tiếp %d file hoãn", len(deferred))
+                    self._spawn_events(deferred, BULK)
+
+                if (
+                    self._local_model_refresh
+                    and time.monotonic() - self._local_model_refreshed_at >= self._local_model_refresh
+                ):
+                    await self._refresh_local_model()
 
             except Exception as e:
                 logger.error("Lỗi consumer loop: %s", e)
@@ -341,6 +440,15 @@ class MedicalWatcher:
             await self._init_services()
             await self._consumer()
         finally:
+            if self._tasks:
+                logger.info("Dừng %d event chưa xử lý xong", len(self._tasks))
+                for task in list(self._tasks):
+                    task.cancel()
+                await asyncio.gather(*self._tasks, return_exceptions=True)
+            if self._notifier:
+                await self._notifier.close()
+            if self._classifier:
+                await self._classifier.close()
             if self._store:
                 await self._store.close()
             observer.stop()
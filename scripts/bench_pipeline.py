@@ -0,0 +1,177 @@
+"""
+bench_pipeline.py — Benchmark throughput pipeline xử lý tài liệu.
+
+Sinh (hoặc dùng sẵn) một corpus tài liệu mẫu và replay qua pipeline thật
+(bulk_ingest → process_new_file → ingest → IndexStore) với classifier và
+notifier giả lập. Latency từng stage lấy từ span của app.tracing; in
+p50/p95/p99 theo stage và files/s end-to-end để phát hiện regression trước khi deploy.
+
+Sử dụng:
+    python scripts/bench_pipeline.py --generate 200 --size-kb 256 --workers 4
+    python scripts/bench_pipeline.py --corpus ~/Samples --extract > bench_output.txt
+    python scripts/bench_pipeline.py --classifier mymodule:make_classifier
+"""
+
+import argparse
+import asyncio
+import importlib
+import logging
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import yaml
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from app.bulk_ingest import bulk_ingest  # noqa: E402
+from app.index_store import IndexStore  # noqa: E402
+from app.ingest import extract_content  # noqa: E402
+from app.taxonomy import Taxonomy  # noqa: E402
+from app.tracing import add_sink, format_summary, remove_sink, span, summarize  # noqa: E402
+
+logger = logging.getLogger("bench_pipeline")
+
+_VENDORS = ["GE", "Philips", "Siemens", "Drager", "Mindray", "Olympus"]
+_DOC_WORDS = ["quotation", "manual", "contract", "config", "spec", "brochure"]
+
+
+class StubClassifier:
+    """
+    Thay thế MedicalClassifier: không gọi gateway, latency giả lập.
+
+    Latency lấy theo phân phối log-normal quanh `latency_ms` (span "gateway");
+    `extract=True` chạy extraction thật trên buffer đã ingest (span "extract").
+    """
+
+    def __init__(self, latency_ms: float, extract: bool, seed: int):
+        self._latency_ms = latency_ms
+        self._extract = extract
+        self._rng = random.Random(seed)
+
+    async def classify_file(self, file_path, max_retries=None, ingested=None, use_rules=True):
+        if self._extract and ingested is not None:
+            with span("extract"):
+                try:
+                    await extract_content(ingested)
+                except Exception as e:
+                    logger.debug("Extract lỗi %s: %s", file_path, e)
+        with span("gateway"):
+            if self._latency_ms > 0:
+                await asyncio.sleep(self._rng.lognormvariate(0, 0.5) * self._latency_ms / 1000)
+        return {
+            "doc_type": "bao_gia",
+            "vendor": self._rng.choice(_VENDORS),
+            "model": f"M{self._rng.randint(100, 999)}",
+            "category_slug": "chan_doan_hinh_anh/x_quang",
+            "summary": "bench",
+            "confidence": 0.9,
+            "source": "llm",
+        }
+
+
+class StubNotifier:
+    """Thay thế TelegramNotifier: chỉ đếm số lần gọi."""
+
+    def __init__(self) -> None:
+        self.drafts = 0
+        self.errors = 0
+
+    async def notify_draft(self, file_info, confidence, is_confident) -> None:
+        self.drafts += 1
+
+    async def notify_error(self, file_path, error) -> None:
+        self.errors += 1
+
+
+def generate_corpus(root: Path, count: int, size_kb: int, seed: int) -> None:
+    """Sinh corpus .txt/.csv với tên file giống thực tế."""
+    rng = random.Random(seed)
+    inbox = root / "inbox"
+    inbox.mkdir(parents=True, exist_ok=True)
+    line = "Thiet bi y te - thong so ky thuat, cau hinh, bao gia 0123456789\n"
+    body = (line * (size_kb * 1024 // len(line) + 1))[: size_kb * 1024]
+    for i in range(count):
+        ext = ".csv" if i % 4 == 0 else ".txt"
+        name = f"{rng.choice(_DOC_WORDS)}_{rng.choice(_VENDORS)}_{i:05d}{ext}"
+        (inbox / name).write_text(f"{name}\n{body}", encoding="utf-8")
+
+
+def _load_factory(spec: str):
+    """Import 'module:callable' cho classifier tùy chỉnh."""
+    module_name, _, attr = spec.partition(":")
+    return getattr(importlib.import_module(module_name), attr)
+
+
+async def run(args: argparse.Namespace) -> None:
+    with open(args.config, encoding="utf-8") as f:
+        config = yaml.safe_load(f)
+
+    records: list[dict] = []
+    with tempfile.TemporaryDirectory(prefix="mdb_bench_") as tmp:
+        tmp_path = Path(tmp)
+        if args.corpus:
+            root = Path(args.corpus).expanduser().absolute()
+        else:
+            root = tmp_path / "MedicalDevices"
+            generate_corpus(root, args.generate, args.size_kb, args.seed)
+
+        config["paths"]["medical_devices_root"] = str(root)
+        config["watcher"]["min_file_size_bytes"] = 0
+
+        store = IndexStore(tmp_path / "bench.db")
+        await store.init()
+        taxonomy = Taxonomy(config["paths"]["taxonomy_file"])
+        notifier = StubNotifier()
+        if args.classifier:
+            classifier = _load_factory(args.classifier)(config)
+        else:
+            classifier = StubClassifier(args.latency_ms, args.extract, args.seed)
+
+        # Gom span của pipeline (ingest, classify, db_*, notify, total...)
+        add_sink(records.append)
+        try:
+            stats = await bulk_ingest(
+                root, config, classifier, store, None, taxonomy,
+                notifier=notifier, workers=args.workers,
+            )
+        finally:
+            remove_sink(records.append)
+            if hasattr(classifier, "close"):
+                await classifier.close()
+            await store.close()
+
+    print(f"Corpus: {root}  workers={args.workers}  latency_ms={args.latency_ms}")
+    print(format_summary(summarize(records)))
+    print(stats.summary())
+
+    files_per_sec = stats.files / max(time.monotonic() - stats.started, 1e-9)
+    if args.min_files_per_sec and files_per_sec < args.min_files_per_sec:
+        print(f"❌ REGRESSION: {files_per_sec:.2f} files/s < {args.min_files_per_sec} files/s")
+        sys.exit(1)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark pipeline MedicalDocBot")
+    parser.add_argument("--config", default="config.yaml")
+    parser.add_argument("--corpus", help="Thư mục tài liệu có sẵn (bỏ qua --generate)")
+    parser.add_argument("--generate", type=int, default=200, help="Số file mẫu sinh ra")
+    parser.add_argument("--size-kb", type=int, default=64, help="Kích thước mỗi file mẫu (KB)")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--latency-ms", type=float, default=50.0, help="Latency classifier giả lập")
+    parser.add_argument("--extract", action="store_true", help="Chạy extraction thật (kreuzberg)")
+    parser.add_argument("--classifier", help="Factory 'module:callable(config)' thay StubClassifier")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument(
+        "--min-files-per-sec", type=float, default=0.0, help="Exit 1 nếu throughput thấp hơn"
+    )
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,3 +1,4 @@
+import argparse
 import asyncio
 import os
 import shutil
@@ -7,32 +8,11 @@ import yaml
 
 from app.index_store import IndexStore
 from app.taxonomy import Taxonomy
+from app.taxonomy_resolver import get_resolver
 from app.wiki_generator import WikiGenerator
 
-# Bản đồ dọn dẹp các slug rác (do AI hallucinate) về Taxonomy chuẩn
-CATEGORY_MAP = {
-    "Unknown": "chua_phan_loai",
-    "khac": "chua_phan_loai",
-    "ngoai_khoa": "thiet_bi_phong_mo",
-    "phau_thuat": "thiet_bi_phong_mo",
-    "phong_mo": "thiet_bi_phong_mo",
-    "thiet-bi-phong-mo": "thiet_bi_phong_mo",
-    "thiet_bi_hoi_suc": "hoi_suc_cap_cuu",
-    "thiet_bi_hoi_suc_gay_me": "gay_me_may_tho",
-}
-
-GROUP_MAP = {
-    "Unknown": "khac",
-    "may_tho": "may_tho_hoi_suc",
-    "phong_mo": "khac",
-    "thiet_bi_phong_mo": "khac",
-    "ban-mo": "ban_mo",
-    "monitor_benh_nhan": "monitor",
-    "may_theo_doi_benh_nhan": "monitor",
-}
-
-
-async def fix_and_regen():
+
+async def fix_and_regen(fuzzy: bool = False):
     print("🚀 Bắt đầu dọn dẹp Database và Sinh lại Wiki...")
     config_path = "config.yaml"
     with open(config_path, encoding="utf-8") as f:
@@ -46,11 +26,19 @@ async def fix_and_regen():
     async with store._conn.execute("SELECT id, category_slug, group_slug FROM files") as cursor:
         rows = await cursor.fetchall()
 
+    # Dọn dẹp các slug rác (do AI hallucinate) về Taxonomy chuẩn bằng alias; so khớp
+    # mờ (--fuzzy) sửa cả các dòng đã được người dùng xác nhận nên phải bật rõ ràng
+    taxonomy = Taxonomy(config["paths"]["taxonomy_file"])
+    resolver = get_resolver(taxonomy, config)
+
     updated = 0
     for row in rows:
         fid, cslug, gslug = row
-        new_cslug = CATEGORY_MAP.get(cslug, cslug)
-        new_gslug = GROUP_MAP.get(gslug, gslug)
+        resolution = resolver.resolve(cslug or "", gslug or "")
+        if not fuzzy and resolution.method not in ("exact", "alias"):
+            continue
+        new_cslug = resolution.category_slug or "chua_phan_loai"
+        new_gslug = resolution.group_slug or "khac"
         if new_cslug != cslug or new_gslug != gslug:
             await store._conn.execute(
                 "UPDATE files SET category_slug = ?, group_slug = ? WHERE id = ?",
@@ -70,7 +58,6 @@ async def fix_and_regen():
 
     # 3. Chạy lại Wiki Generator
     print("3. Đang render lại toàn bộ Markdown...")
-    taxonomy = Taxonomy(config["paths"]["taxonomy_file"])
     wiki = WikiGenerator(config_path)
 
     # Render các file thiết bị
@@ -100,4 +87,10 @@ async def fix_and_regen():
 
 
 if __name__ == "__main__":
-    asyncio.run(fix_and_regen())
+    parser = argparse.ArgumentParser(description="Dọn slug taxonomy trong DB và sinh lại Wiki")
+    parser.add_argument(
+        "--fuzzy",
+        action="store_true",
+        help="Snap cả slug lệch về taxonomy bằng so khớp mờ (mặc định chỉ dùng alias)",
+    )
+    asyncio.run(fix_and_regen(fuzzy=parser.parse_args().fuzzy))
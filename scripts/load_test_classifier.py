@@ -0,0 +1,192 @@
+"""
+load_test_classifier.py — Load test MedicalClassifier với gateway giả lập (offline).
+
+Chạy `app.fake_gateway` trong cùng tiến trình rồi gửi N lần phân loại đồng
+thời qua MedicalClassifier thật (rate limiter, retry, parse JSON, batch).
+In throughput, latency p50/p95/p99 theo stage (classify, gateway,
+rate_limit_wait), phân bố số lần retry và bộ đếm lỗi phía gateway.
+
+Sử dụng:
+    python scripts/load_test_classifier.py --requests 200 --concurrency 8 --latency-ms 300
+    python scripts/load_test_classifier.py --burst-429-prob 0.05 --malformed-rate 0.1 \\
+        --timeout-rate 0.02 --client-timeout 2 --rate-per-second 20
+    python scripts/load_test_classifier.py --batch-size 5 --min-throughput 5 --max-p99-ms 3000
+    python scripts/load_test_classifier.py --stream --verbose-suffix-chars 2000 --stream-chunk-delay-ms 20
+    python scripts/load_test_classifier.py --error-rate 0.6 --fallback --hedge --rate-per-second 20
+"""
+
+import argparse
+import asyncio
+import logging
+import random
+import sys
+import tempfile
+import time
+from collections import Counter
+from pathlib import Path
+
+import yaml
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from app.classifier import BatchingClassifier, MedicalClassifier  # noqa: E402
+from app.fake_gateway import (  # noqa: E402
+    FakeGateway,
+    GatewayProfile,
+    add_profile_arguments,
+    profile_from_args,
+)
+from app.tracing import add_sink, format_summary, remove_sink, span, summarize, trace_file  # noqa: E402
+
+logger = logging.getLogger("load_test_classifier")
+
+_VENDORS = ["GE", "Philips", "Siemens", "Drager", "Mindray", "Olympus"]
+_DOC_WORDS = ["quotation", "manual", "contract", "config", "spec", "brochure"]
+
+
+def _write_config(
+    args: argparse.Namespace, base_url: str, fallback_url: str | None, tmp_path: Path
+) -> Path:
+    """Config tạm: trỏ 9router về gateway giả lập, không ghi cache/không spawn worker."""
+    with open(args.config, encoding="utf-8") as f:
+        config = yaml.safe_load(f)
+    router = config["services"]["9router"]
+    router["base_url"] = base_url
+    router["timeout_seconds"] = args.client_timeout
+    router["max_retries"] = args.max_retries
+    router["batch_size"] = max(1, args.batch_size)
+    router["stream"] = args.stream
+    router["hedge_enabled"] = args.hedge
+    if fallback_url:
+        router["fallback_base_url"] = fallback_url
+    if args.rate_per_second:
+        router["rate_limit_seconds"] = 1.0 / args.rate_per_second
+        router["rate_limit_max_per_second"] = args.rate_per_second
+        router["rate_limit_burst"] = max(router.get("rate_limit_burst", 1), args.concurrency)
+        router["max_concurrency"] = args.concurrency
+    config["paths"]["extracted_cache_dir"] = str(tmp_path / "extracted")
+    config.setdefault("extraction", {})["pool_workers"] = 0
+
+    path = tmp_path / "config.yaml"
+    path.write_text(yaml.safe_dump(config, allow_unicode=True), encoding="utf-8")
+    return path
+
+
+async def run(args: argparse.Namespace) -> int:
+    rng = random.Random(args.seed)
+    names = [
+        f"{rng.choice(_DOC_WORDS)}_{rng.choice(_VENDORS)}_{i:05d}.pdf" for i in range(args.requests)
+    ]
+    records: list[dict] = []
+    outcomes: Counter[str] = Counter()
+
+    with tempfile.TemporaryDirectory(prefix="mdb_load_") as tmp:
+        tmp_path = Path(tmp)
+        profile = profile_from_args(args)
+        # Route dự phòng: gateway thứ hai cùng latency nhưng không lỗi
+        fallback = FakeGateway(
+            GatewayProfile(
+                latency_ms=profile.latency_ms,
+                latency_distribution=profile.latency_distribution,
+                latency_sigma=profile.latency_sigma,
+                seed=profile.seed + 1,
+            )
+        )
+        async with FakeGateway(profile) as gateway:
+            fallback_url = await fallback.start() if args.fallback else None
+            config_path = _write_config(args, gateway.base_url, fallback_url, tmp_path)
+            inner = MedicalClassifier(str(config_path))
+            classifier = inner
+            if args.batch_size > 1:
+                classifier = BatchingClassifier(inner, args.batch_size)
+
+            queue: asyncio.Queue[str] = asyncio.Queue()
+            for name in names:
+                queue.put_nowait(str(tmp_path / "inbox" / name))
+
+            async def worker() -> None:
+                while not queue.empty():
+                    file_path = queue.get_nowait()
+                    with trace_file(file_path), span("classify"):
+                        try:
+                            result = await classifier.classify_file(file_path, use_rules=False)
+                        except Exception as e:
+                            logger.debug("Phân loại lỗi %s: %s", file_path, e)
+                            outcomes["error"] += 1
+                            continue
+                    if result.get("degraded"):
+                        outcomes["degraded"] += 1
+                    elif result.get("doc_type") == "khac" and "vendor" not in result:
+                        outcomes["fallback"] += 1
+                    else:
+                        outcomes["ok"] += 1
+
+            add_sink(records.append)
+            started = time.monotonic()
+            try:
+                await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+            finally:
+                elapsed = time.monotonic() - started
+                remove_sink(records.append)
+                await classifier.close()
+                await fallback.stop()
+            gateway_stats = dict(gateway.stats)
+            fallback_stats = dict(fallback.stats)
+            throttled = inner.rate_limiter.throttled
+            breakers = {r.name: (r.breaker.state, r.breaker.opened) for r in inner.routes}
+
+    summary = summarize(records)
+    retries = Counter(r.get("retries", 0) for r in records if r.get("stage") == "total")
+    throughput = args.requests / max(elapsed, 1e-9)
+
+    print(
+        f"Requests: {args.requests}  concurrency={args.concurrency}  batch={args.batch_size}  "
+        f"latency_ms={args.latency_ms}  stream={args.stream}"
+    )
+    print(format_summary(summary))
+    print(f"Throughput: {throughput:.2f} file/s trong {elapsed:.1f}s")
+    print(f"Kết quả: {dict(outcomes)}")
+    print(f"Retry (số lần thử thêm → số file): {dict(sorted(retries.items()))}")
+    print(f"Gateway: {gateway_stats}  limiter throttled={throttled}")
+    if args.fallback:
+        print(f"Gateway dự phòng: {fallback_stats}")
+    print(f"Circuit breaker (trạng thái, số lần mở): {breakers}")
+
+    failed = False
+    if args.min_throughput and throughput < args.min_throughput:
+        print(f"❌ REGRESSION: {throughput:.2f} file/s < {args.min_throughput} file/s")
+        failed = True
+    p99 = summary.get("classify", {}).get("p99", 0.0)
+    if args.max_p99_ms and p99 > args.max_p99_ms:
+        print(f"❌ REGRESSION: p99 classify {p99:.0f}ms > {args.max_p99_ms:.0f}ms")
+        failed = True
+    return 1 if failed else 0
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Load test MedicalClassifier với gateway giả lập")
+    parser.add_argument("--config", default="config.yaml")
+    parser.add_argument("--requests", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--batch-size", type=int, default=1, help="> 1 → BatchingClassifier")
+    parser.add_argument("--client-timeout", type=float, default=5.0, help="Timeout HTTP classifier (giây)")
+    parser.add_argument("--max-retries", type=int, default=5)
+    parser.add_argument("--stream", action="store_true", help="Bật services.9router.stream (SSE)")
+    parser.add_argument("--fallback", action="store_true", help="Thêm gateway dự phòng khỏe mạnh")
+    parser.add_argument("--hedge", action="store_true", help="Bật services.9router.hedge_enabled")
+    parser.add_argument(
+        "--rate-per-second", type=float, default=0.0,
+        help="Ghi đè rate limit của config (0 → giữ nguyên như production)",
+    )
+    parser.add_argument("--min-throughput", type=float, default=0.0, help="Exit 1 nếu thấp hơn (file/s)")
+    parser.add_argument("--max-p99-ms", type=float, default=0.0, help="Exit 1 nếu p99 classify cao hơn")
+    add_profile_arguments(parser)
+    parser.set_defaults(latency_ms=300.0)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.ERROR)
+    sys.exit(asyncio.run(run(args)))
+
+
+if __name__ == "__main__":
+    main()
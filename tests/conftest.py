@@ -0,0 +1,70 @@
+"""Fixture dùng chung cho các test (không import helper chéo giữa các module test)."""
+
+import pytest
+import yaml
+
+from app.classifier import MedicalClassifier
+
+
+@pytest.fixture
+def make_classifier(tmp_path):
+    """
+    Tạo MedicalClassifier trỏ tới gateway giả lập (config.yaml thật, cache trong tmp_path).
+
+    Ví dụ:
+        async with make_classifier(gateway.base_url, max_retries=1) as classifier: ...
+    """
+
+    def _make(base_url: str, **router_overrides) -> MedicalClassifier:
+        with open("config.yaml", encoding="utf-8") as f:
+            config = yaml.safe_load(f)
+        router = config["services"]["9router"]
+        router.update(
+            base_url=base_url,
+            timeout_seconds=2,
+            max_retries=5,
+            rate_limit_seconds=0.01,
+            rate_limit_max_per_second=100,
+        )
+        router.update(router_overrides)
+        config["paths"]["extracted_cache_dir"] = str(tmp_path / "extracted")
+        config["extraction"]["pool_workers"] = 0
+        path = tmp_path / "config.yaml"
+        path.write_text(yaml.safe_dump(config, allow_unicode=True), encoding="utf-8")
+        return MedicalClassifier(str(path))
+
+    return _make
+
+
+@pytest.fixture
+def make_pdf():
+    """Tạo bytes của một PDF tối giản, mỗi trang một dòng text."""
+
+    def _make(pages: list[str]) -> bytes:
+        objs = ["<< /Type /Catalog /Pages 2 0 R >>"]
+        kids = " ".join(f"{3 + 2 * i} 0 R" for i in range(len(pages)))
+        objs.append(f"<< /Type /Pages /Kids [{kids}] /Count {len(pages)} >>")
+        font_id = 3 + 2 * len(pages)
+        for i, text in enumerate(pages):
+            stream = f"BT /F1 24 Tf 72 700 Td ({text}) Tj ET"
+            objs.append(
+                "<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+                f"/Resources << /Font << /F1 {font_id} 0 R >> >> /Contents {4 + 2 * i} 0 R >>"
+            )
+            objs.append(f"<< /Length {len(stream)} >>\nstream\n{stream}\nendstream")
+        objs.append("<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+
+        out = b"%PDF-1.4\n"
+        offsets = []
+        for n, body in enumerate(objs, start=1):
+            offsets.append(len(out))
+            out += f"{n} 0 obj\n{body}\nendobj\n".encode()
+        xref = len(out)
+        out += f"xref\n0 {len(objs) + 1}\n0000000000 65535 f \n".encode()
+        out += "".join(f"{o:010d} 00000 n \n" for o in offsets).encode()
+        out += (
+            f"trailer\n<< /Size {len(objs) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n"
+        ).encode()
+        return out
+
+    return _make
@@ -0,0 +1,93 @@
+from unittest.mock import AsyncMock, patch
+
+import pytest
+
+from app.bulk_ingest import Checkpoint, bulk_ingest, iter_candidate_files
+from app.index_store import IndexStore
+from app.process_event import SKIPPED
+
+CONFIG = {
+    "watcher": {
+        "ignore_patterns": ["wiki", "*.tmp"],
+        "allowed_extensions": [".pdf", ".docx"],
+        "min_file_size_bytes": 4,
+    }
+}
+
+
+@pytest.fixture
+def tree(tmp_path):
+    root = tmp_path / "root"
+    (root / "a" / "b").mkdir(parents=True)
+    (root / "wiki").mkdir()
+    (root / "a" / "one.pdf").write_bytes(b"x" * 10)
+    (root / "a" / "b" / "two.docx").write_bytes(b"x" * 20)
+    (root / "a" / "b" / "three.pdf").write_bytes(b"x" * 30)
+    (root / "a" / "tiny.pdf").write_bytes(b"x")
+    (root / "a" / "skip.tmp").write_bytes(b"x" * 10)
+    (root / "wiki" / "index.pdf").write_bytes(b"x" * 10)
+    return root
+
+
+@pytest.fixture
+async def store(tmp_path):
+    index_store = IndexStore(str(tmp_path / "test.db"))
+    await index_store.init()
+    yield index_store
+    await index_store.close()
+
+
+def test_iter_candidate_files_recursive_and_filtered(tree):
+    names = sorted(p.rsplit("/", 1)[-1] for p, _ in iter_candidate_files(tree, CONFIG))
+    assert names == ["one.pdf", "three.pdf", "two.docx"]
+
+
+@pytest.mark.asyncio
+async def test_bulk_ingest_skips_indexed_and_resumes(tree, store, tmp_path):
+    await store.upsert_file(str(tree / "a" / "one.pdf"), "h", "khac")
+    checkpoint = Checkpoint(tmp_path / "ckpt.jsonl")
+
+    fake = AsyncMock(side_effect=[{"source": "rules"}, None])
+    with patch("app.bulk_ingest.process_new_file", fake):
+        stats = await bulk_ingest(
+            tree, CONFIG, None, store, None, None, workers=2, checkpoint=checkpoint
+        )
+    checkpoint.close()
+
+    assert fake.await_count == 2
+    assert stats.skipped == 1
+    assert stats.failed == 1
+    assert stats.llm_calls_saved == 1
+
+    # Lần chạy lại: mọi file đã có trong checkpoint → không xử lý lại
+    fake2 = AsyncMock(return_value={"source": "llm"})
+    with patch("app.bulk_ingest.process_new_file", fake2):
+        stats = await bulk_ingest(tree, CONFIG, None, store, None, None, checkpoint=checkpoint)
+    assert fake2.await_count == 0
+
+    # --retry-failed: chỉ xử lý lại file lỗi
+    with patch("app.bulk_ingest.process_new_file", fake2):
+        await bulk_ingest(
+            tree, CONFIG, None, store, None, None, checkpoint=checkpoint, retry_failed=True
+        )
+    checkpoint.close()
+    assert fake2.await_count == 1
+
+
+@pytest.mark.asyncio
+async def test_already_indexed_file_counted_as_skipped_not_failed(tree, store, tmp_path):
+    checkpoint = Checkpoint(tmp_path / "ckpt.jsonl")
+    # File được watcher index trong lúc bulk ingest đang chạy
+    fake = AsyncMock(return_value=SKIPPED)
+    with patch("app.bulk_ingest.process_new_file", fake):
+        stats = await bulk_ingest(tree, CONFIG, None, store, None, None, checkpoint=checkpoint)
+    checkpoint.close()
+    assert (stats.failed, stats.skipped) == (0, 3)
+
+    # --retry-failed không xử lý lại file đã bỏ qua
+    with patch("app.bulk_ingest.process_new_file", fake):
+        await bulk_ingest(
+            tree, CONFIG, None, store, None, None, checkpoint=checkpoint, retry_failed=True
+        )
+    checkpoint.close()
+    assert fake.await_count == 3
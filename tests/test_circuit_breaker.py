@@ -0,0 +1,37 @@
+import time
+
+from app.circuit_breaker import CircuitBreaker
+
+
+def test_opens_after_failure_rate_and_recovers_via_half_open_probe(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(time, "monotonic", lambda: now[0])
+    breaker = CircuitBreaker("primary", failure_threshold=0.5, window=10, min_requests=4, open_seconds=30)
+
+    for ok in (True, False, True, False):
+        breaker.record_success(100) if ok else breaker.record_failure()
+    assert breaker.state == "open" and not breaker.allow()
+
+    # Request gửi trước khi mở mạch thành công muộn: không đóng mạch
+    breaker.record_success(100)
+    assert breaker.state == "open"
+
+    now[0] += 31
+    assert breaker.state == "half_open"
+    assert breaker.allow()
+    assert not breaker.allow()  # chỉ một request thử
+    breaker.record_failure()
+    assert breaker.state == "open" and breaker.opened == 2
+
+    now[0] += 31
+    assert breaker.allow()
+    breaker.record_success(80)
+    assert breaker.state == "closed" and breaker.allow()
+
+
+def test_latency_percentile_needs_min_samples():
+    breaker = CircuitBreaker("primary")
+    for ms in range(1, 11):
+        breaker.record_success(ms * 10)
+    assert breaker.latency_percentile(95, min_samples=20) is None
+    assert 90 <= breaker.latency_percentile(95, min_samples=5) <= 100
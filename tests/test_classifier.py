@@ -1,4 +1,5 @@
-from unittest.mock import patch, MagicMock
+import json
+from unittest.mock import AsyncMock, patch, MagicMock
 from pathlib import Path
 
 import pytest
@@ -11,7 +12,8 @@ async def test_classify_file_success():
     
     # Mock httpx AsyncClient
     with patch("app.classifier.httpx.AsyncClient") as mock_client_class:
-        mock_client = mock_client_class.return_value.__aenter__.return_value
+        mock_client = mock_client_class.return_value
+        mock_client.is_closed = False
         
         # Setup mock response
         mock_response = MagicMock()
@@ -23,7 +25,8 @@ async def test_classify_file_success():
             }]
         }
         mock_response.raise_for_status = MagicMock()
-        mock_client.post.return_value = mock_response
+        mock_response.headers = {}
+        mock_client.post = AsyncMock(return_value=mock_response)
         
         # Test classification
         with patch("app.classifier.extract_file") as mock_extract:
@@ -36,3 +39,98 @@ async def test_classify_file_success():
             assert result["doc_type"] == "ky_thuat"
             assert result["vendor"] == "GE"
             assert result["confidence"] == 0.95
+
+
+@pytest.mark.asyncio
+async def test_classifier_reuses_one_client_and_closes_it():
+    """Một AsyncClient dùng chung cho mọi lần gọi, đóng qua close()/async with."""
+    async with MedicalClassifier() as classifier:
+        client = classifier._get_client()
+        assert classifier._get_client() is client
+    assert client.is_closed
+    assert classifier._client is None
+
+
+@pytest.mark.asyncio
+async def test_classify_batch_falls_back_for_invalid_items():
+    """Batch trả về thiếu/sai phần tử → phân loại lại riêng lẻ phần tử đó."""
+    classifier = MedicalClassifier()
+    classifier.batch_size = 3
+    batch_reply = (
+        '{"results": ['
+        '{"id": "1", "doc_type": "bao_gia", "vendor": "GE", "model": "A", "category_slug": "x/y"},'
+        '{"id": "2", "doc_type": "khong_co", "vendor": "GE", "model": "B", "category_slug": "x/y"}'
+        "]}"
+    )
+    single_reply = '{"doc_type": "hop_dong", "vendor": "Philips", "model": "C", "category_slug": "x/y"}'
+    complete = AsyncMock(side_effect=[batch_reply, single_reply, single_reply])
+
+    with patch.object(classifier, "_complete", complete), patch(
+        "app.classifier.extract_file", AsyncMock(side_effect=Exception("no file"))
+    ):
+        results = await classifier.classify_batch(
+            [("a.pdf", None), ("b.pdf", None), ("c.pdf", None)], use_rules=False
+        )
+
+    assert complete.await_count == 3  # 1 batch + 2 lần gọi lại (id 2 sai doc_type, id 3 thiếu)
+    assert results[0]["doc_type"] == "bao_gia" and results[0]["source"] == "llm"
+    assert [r["doc_type"] for r in results[1:]] == ["hop_dong", "hop_dong"]
+
+
+@pytest.mark.asyncio
+async def test_batching_classifier_coalesces_concurrent_calls():
+    import asyncio
+
+    from app.classifier import BatchingClassifier
+
+    classifier = MedicalClassifier()
+    classify_batch = AsyncMock(side_effect=lambda items, **kw: [{"doc_type": p} for p, _ in items])
+    with patch.object(classifier, "classify_batch", classify_batch):
+        batching = BatchingClassifier(classifier, batch_size=3, max_wait_seconds=0.01)
+        results = await asyncio.gather(
+            *(batching.classify_file(f"{i}.pdf", use_rules=False) for i in range(4))
+        )
+        await batching.close()
+
+    assert [r["doc_type"] for r in results] == ["0.pdf", "1.pdf", "2.pdf", "3.pdf"]
+    assert [len(c.args[0]) for c in classify_batch.await_args_list] == [3, 1]
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    "content, doc_type",
+    [
+        # Object bọc trong mảng một phần tử → mở ra
+        ('[{"doc_type": "bao_gia", "vendor": "GE", "model": "A", "category_slug": "x/y"}]',
+         "bao_gia"),
+        # Mảng đứng trước object hợp lệ: validate chọn object (như chế độ stream)
+        ('Các id: [1, 2]\n{"doc_type": "hop_dong", "vendor": "GE", "model": "A", '
+         '"category_slug": "x/y"}', "hop_dong"),
+        # Mảng không phải kết quả → coi như lỗi định dạng, không trả list cho caller
+        ('[["bao_gia"], ["GE"]]', "khac"),
+    ],
+)
+async def test_single_file_reply_is_always_a_dict(content, doc_type):
+    classifier = MedicalClassifier()
+    with patch("app.classifier.httpx.AsyncClient") as mock_client_class:
+        mock_client = mock_client_class.return_value
+        mock_client.is_closed = False
+        mock_response = MagicMock()
+        mock_response.json.return_value = {"choices": [{"message": {"content": content}}]}
+        mock_response.headers = {}
+        mock_client.post = AsyncMock(return_value=mock_response)
+        with patch("app.classifier.extract_file", AsyncMock(side_effect=Exception("no file"))):
+            result = await classifier.classify_file("test.pdf", max_retries=1, use_rules=False)
+
+    assert isinstance(result, dict)
+    assert result["doc_type"] == doc_type
+
+
+@pytest.mark.asyncio
+async def test_gateway_body_not_json_is_an_error_not_unbound_content():
+    classifier = MedicalClassifier()
+    body_error = json.JSONDecodeError("Expecting value", "<html>502</html>", 0)
+    with patch.object(classifier, "_complete", AsyncMock(side_effect=body_error)):
+        with patch("app.classifier.extract_file", AsyncMock(side_effect=Exception("no file"))):
+            with pytest.raises(json.JSONDecodeError):
+                await classifier.classify_file("test.pdf", max_retries=1, use_rules=False)
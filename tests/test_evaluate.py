@@ -0,0 +1,98 @@
+import pytest
+
+from app.evaluate import (
+    _common,
+    _parse_overrides,
+    apply_overrides,
+    evaluate,
+    format_comparison,
+    format_confusion,
+    load_samples,
+    summarize_report,
+)
+from app.extract_cache import ExtractionCache
+from app.fake_gateway import FakeGateway, GatewayProfile
+from app.index_store import IndexStore
+from app.native_extract import NativeResult
+from app.preview import PREVIEW_VARIANT
+
+_CONFIRMED = [
+    # (tên file, doc_type, category, group, vendor, có trong cache)
+    ("bao_gia_philips_01.pdf", "bao_gia", "chan_doan_hinh_anh", "x_quang", "Philips", True),
+    ("bao_gia_philips_02.pdf", "bao_gia", "chan_doan_hinh_anh", "x_quang", "PHILIPS", True),
+    ("contract_siemens.pdf", "hop_dong", "noi_soi", "ong_soi_mem", "Siemens Healthineers", True),
+    ("manual_olympus.pdf", "ky_thuat", "noi_soi", "ong_soi_mem", "Olympus", False),
+]
+
+
+@pytest.mark.asyncio
+async def test_replays_confirmed_rows_from_cache(tmp_path, make_classifier):
+    store = IndexStore(tmp_path / "index.db")
+    await store.init()
+    cache = ExtractionCache(tmp_path / "cache")
+    for i, (name, doc_type, category, group, vendor, cached) in enumerate(_CONFIRMED):
+        await store.upsert_file(
+            f"/kho/{category}/{group}/{name}", f"h{i}", doc_type, category_slug=category,
+            group_slug=group, vendor=vendor, size_bytes=1, confirmed=True,
+        )
+        if cached:
+            result = NativeResult(f"Báo giá thiết bị {vendor}", "text/plain", {}, True)
+            await cache.put(f"h{i}", result, variant=PREVIEW_VARIANT)
+    await store.upsert_file("/kho/inbox/chua_xac_nhan.pdf", "x", size_bytes=1)
+
+    samples, missing = await load_samples(store, cache)
+    await store.close()
+    assert missing == 1
+    assert [row["id"] for row, _ in samples] == [1, 2, 3]
+    assert samples[0][1] == "Báo giá thiết bị Philips"
+
+    async with FakeGateway(GatewayProfile(latency_ms=1)) as gateway:
+        # File không còn trên đĩa: chỉ dùng text trong cache
+        async with make_classifier(gateway.base_url) as classifier:
+            report = await evaluate(classifier, samples, concurrency=2)
+    assert gateway.stats["requests"] == 3
+
+    summary = summarize_report(report)
+    assert summary["accuracy"]["doc_type"] == 1.0
+    assert summary["accuracy"]["vendor"] == 1.0
+    # Gateway giả luôn trả x_quang: file nội soi bị sai category
+    assert summary["accuracy"]["category"] == pytest.approx(2 / 3)
+    assert summary["confusion"]["category"][
+        ("noi_soi/ong_soi_mem", "chan_doan_hinh_anh/x_quang")
+    ] == 1
+    assert summary["tokens"] > 0 and summary["latency_ms"][50] > 0
+    assert "noi_soi/ong_soi_mem" in format_confusion(summary["confusion"]["category"])
+
+
+def _report(model, predictions, latency_ms=100.0):
+    rows = []
+    for i, predicted in enumerate(predictions, start=1):
+        row = {"id": i, "truth": {"doc_type": "bao_gia", "category": "a/b", "vendor": "ge"},
+               "latency_ms": latency_ms, "tokens": 500}
+        if predicted is None:
+            row["error"] = "timeout"
+        else:
+            row["predicted"] = {"doc_type": predicted, "category": "a/b", "vendor": "ge"}
+        rows.append(row)
+    return {"model": model, "rows": rows}
+
+
+def test_comparison_counts_fixed_and_broken_files():
+    baseline = _report("glm-4.7", ["bao_gia", "hop_dong", "bao_gia", None, "bao_gia"])
+    candidate = _report("glm-5", ["bao_gia", "bao_gia", "khac", "bao_gia"], latency_ms=80.0)
+
+    # Baseline có thêm file 5: chỉ so trên các file chung
+    pair = _common(baseline, candidate)
+    summaries = (summarize_report(pair[0]), summarize_report(pair[1]))
+    assert summaries[0]["accuracy"]["doc_type"] == 0.5
+    assert summaries[1]["errors"] == 0 and summaries[1]["accuracy"]["doc_type"] == 0.75
+
+    text = format_comparison(pair, summaries, ("glm-4.7", "glm-5"))
+    assert "doc_type: 2 file sai → đúng, 1 file đúng → sai" in text
+    assert "latency p50 ms" in text and "-20" in text
+
+    overrides = _parse_overrides(["services.9router.model=if/glm-5", "classifier.batch_size=3"])
+    config = apply_overrides({"services": {"9router": {"model": "if/glm-4.7"}}}, overrides)
+    assert config == {
+        "services": {"9router": {"model": "if/glm-5"}}, "classifier": {"batch_size": 3},
+    }
@@ -0,0 +1,62 @@
+import gzip
+import json
+import os
+
+import pytest
+
+from app.extract_cache import ExtractionCache
+from app.ingest import extract_content, ingest_file
+
+
+@pytest.mark.asyncio
+async def test_extract_content_reads_through_cache(tmp_path, monkeypatch):
+    src = tmp_path / "note.txt"
+    src.write_text("Máy siêu âm GE Logiq", encoding="utf-8")
+    cache = ExtractionCache(tmp_path / "cache")
+    ingested = await ingest_file(src)
+
+    first = await extract_content(ingested, cache=cache)
+    assert "Logiq" in first.content
+    assert cache.misses == 1
+
+    # Lần sau không gọi kreuzberg nữa
+    async def boom(*args, **kwargs):
+        raise AssertionError("không được trích xuất lại")
+
+    monkeypatch.setattr("app.ingest.extract_bytes", boom)
+    second = await extract_content(ingested, cache=cache)
+    assert second.content == first.content
+    assert cache.hits == 1
+
+
+def test_stale_extractor_version_is_a_miss(tmp_path):
+    cache = ExtractionCache(tmp_path)
+    sha = "ab" * 32
+    path = tmp_path / sha[:2] / f"{sha}.json.gz"
+    path.parent.mkdir(parents=True)
+    with gzip.open(path, "wt", encoding="utf-8") as f:
+        json.dump({"extractor_version": "old", "content": "x"}, f)
+    assert cache.get_sync(sha) is None
+
+
+def test_lru_eviction_keeps_recently_used(tmp_path):
+    class Result:
+        mime_type = "text/plain"
+        metadata = {}
+
+        def __init__(self, content):
+            self.content = content
+
+    cache = ExtractionCache(tmp_path)
+    for i, sha in enumerate(["aa" * 32, "bb" * 32, "cc" * 32]):
+        cache.put_sync(sha, Result(os.urandom(2000).hex()))
+        os.utime(cache._path(sha), (1000 + i, 1000 + i))
+
+    cache.get_sync("aa" * 32)  # "aa" vừa dùng → mới nhất
+    one_entry = cache._path("aa" * 32).stat().st_size
+    cache.max_bytes = int(one_entry * 2.5)
+    cache.put_sync("dd" * 32, Result("small"))
+
+    assert cache._path("aa" * 32).exists()
+    assert cache._path("dd" * 32).exists()
+    assert not cache._path("bb" * 32).exists()
@@ -0,0 +1,87 @@
+import os
+import time
+
+import pytest
+
+from app.extract_pool import ExtractionError, ExtractionPool
+from app.ingest import extract_content, ingest_file
+
+
+# Extractor giả chạy trong worker (phải là hàm top-level để pickle được)
+def _slow_extract(path, data, mime_type):
+    if path.endswith("hang.pdf"):
+        time.sleep(30)
+    if path.endswith("bloat.pdf"):
+        blob = bytearray(400 * 1024 * 1024)  # noqa: F841
+        time.sleep(30)
+    if path.endswith("crash.pdf"):
+        os._exit(3)
+    if path.endswith("broken.pdf"):
+        raise ValueError("PDF hỏng")
+    return {"content": f"pid={os.getpid()}", "mime_type": mime_type, "metadata": {}}
+
+
+@pytest.mark.asyncio
+async def test_extract_content_runs_in_worker(tmp_path):
+    src = tmp_path / "note.txt"
+    src.write_text("Máy X-quang Siemens Luminos", encoding="utf-8")
+    pool = ExtractionPool(workers=1)
+    try:
+        result = await extract_content(await ingest_file(src), pool=pool)
+        assert "Luminos" in result.content
+    finally:
+        await pool.close()
+
+
+def _report_input(path, data, mime_type):
+    return {"content": f"data={data is not None} mime={mime_type}", "metadata": {}}
+
+
+@pytest.mark.asyncio
+async def test_worker_reuses_buffer_and_reads_only_unbuffered_files(tmp_path):
+    src = tmp_path / "manual.pdf"
+    src.write_bytes(b"%PDF-1.4" + b"0" * 4096)
+    pool = ExtractionPool(workers=1, extractor=_report_input)
+    try:
+        # Đã buffer: worker dùng đúng bytes đã hash, không đọc lại qua NAS
+        result = await extract_content(await ingest_file(src), pool=pool)
+        assert result.content == "data=True mime=application/pdf"
+        # Vượt ngưỡng buffer: worker tự đọc từ đường dẫn
+        large = await ingest_file(src, max_buffer_bytes=1024)
+        result = await extract_content(large, pool=pool)
+        assert result.content == "data=False mime=application/pdf"
+    finally:
+        await pool.close()
+
+
+@pytest.mark.asyncio
+async def test_worker_recycled_after_max_jobs():
+    pool = ExtractionPool(workers=1, max_jobs_per_worker=2, extractor=_slow_extract)
+    try:
+        pids = [(await pool.extract("/tmp/ok.txt")).content for _ in range(3)]
+        assert pids[0] == pids[1] != pids[2]
+        assert pids[0] != f"pid={os.getpid()}"
+    finally:
+        await pool.close()
+
+
+@pytest.mark.asyncio
+async def test_poisoned_documents_fail_structured_and_pool_recovers():
+    pool = ExtractionPool(workers=1, timeout_seconds=1.5, max_rss_mb=200, extractor=_slow_extract)
+    try:
+        for name, kind in [
+            ("hang.pdf", "timeout"),
+            ("bloat.pdf", "memory"),
+            ("crash.pdf", "crash"),
+            ("broken.pdf", "error"),
+        ]:
+            with pytest.raises(ExtractionError) as exc_info:
+                await pool.extract(f"/tmp/{name}")
+            assert exc_info.value.kind == kind
+            assert exc_info.value.to_dict()["path"].endswith(name)
+
+        result = await pool.extract("/tmp/ok.pdf", b"%PDF", "application/pdf")
+        assert result.content.startswith("pid=")
+        assert pool.failures == {"timeout": 1, "memory": 1, "crash": 1, "error": 1}
+    finally:
+        await pool.close()
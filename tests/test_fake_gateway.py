@@ -0,0 +1,150 @@
+import json
+import time
+
+import pytest
+
+from app.classifier import _JsonObjectScanner
+from app.fake_gateway import FakeGateway, GatewayProfile
+
+
+@pytest.mark.asyncio
+async def test_trailing_processing_text_is_tolerated(tmp_path, make_classifier):
+    profile = GatewayProfile(latency_ms=1, malformed_rate=1.0)
+    async with FakeGateway(profile) as gateway:
+        async with make_classifier(gateway.base_url) as classifier:
+            result = await classifier.classify_file(
+                str(tmp_path / "bao_gia_philips.pdf"), use_rules=False
+            )
+    assert result["doc_type"] == "bao_gia"
+    assert result["vendor"] == "Philips"
+    assert gateway.stats["malformed"] == 1
+
+
+@pytest.mark.asyncio
+async def test_429_burst_honours_retry_after_then_succeeds(tmp_path, make_classifier):
+    profile = GatewayProfile(latency_ms=1, burst_429_length=2, retry_after_seconds=0.05)
+    async with FakeGateway(profile) as gateway:
+        gateway._burst_remaining = profile.burst_429_length  # bắt đầu bằng một burst
+        async with make_classifier(gateway.base_url) as classifier:
+            result = await classifier.classify_file(
+                str(tmp_path / "manual_ge.pdf"), use_rules=False
+            )
+            throttled = classifier.rate_limiter.throttled
+    assert result["doc_type"] == "ky_thuat"
+    assert gateway.stats["rate_limited"] == 2 and gateway.stats["ok"] == 1
+    assert throttled == 2
+
+
+@pytest.mark.asyncio
+async def test_single_object_wrapped_in_list_is_unwrapped(tmp_path, make_classifier):
+    async with FakeGateway(GatewayProfile(latency_ms=1, list_reply_rate=1.0)) as gateway:
+        async with make_classifier(gateway.base_url) as classifier:
+            result = await classifier.classify_file(
+                str(tmp_path / "contract_siemens.pdf"), use_rules=False
+            )
+    assert gateway.stats["list_replies"] == 1
+    assert isinstance(result, dict) and result["doc_type"] == "hop_dong"
+
+
+@pytest.mark.asyncio
+async def test_epoch_ms_reset_header_blocks_only_until_reset(tmp_path, make_classifier):
+    # OpenRouter: X-RateLimit-Reset là epoch ms, hết quota trong 200ms tới
+    profile = GatewayProfile(latency_ms=1, ratelimit_reset_ms=200)
+    async with FakeGateway(profile) as gateway:
+        async with make_classifier(gateway.base_url) as classifier:
+            started = time.monotonic()
+            for name in ("manual_ge.pdf", "quotation_ge.pdf"):
+                await classifier.classify_file(str(tmp_path / name), use_rules=False)
+            elapsed = time.monotonic() - started
+    assert gateway.stats["ok"] == 2
+    # Lần 2 chờ tới reset (~0.2s), không bị chặn tới max_block_seconds
+    assert 0.1 <= elapsed < 2.0
+
+
+@pytest.mark.asyncio
+async def test_stream_returns_as_soon_as_json_object_is_complete(tmp_path, make_classifier):
+    # ~5000 ký tự văn xuôi sau JSON: đọc hết mất ~1.5s, dừng sớm chỉ vài chục ms
+    profile = GatewayProfile(
+        latency_ms=1, verbose_suffix_chars=5000, stream_chunk_delay_ms=5, malformed_rate=1.0
+    )
+    async with FakeGateway(profile) as gateway:
+        classifier = make_classifier(gateway.base_url)
+        classifier.stream = True
+        async with classifier:
+            started = time.monotonic()
+            result = await classifier.classify_file(
+                str(tmp_path / "quotation_olympus.pdf"), use_rules=False
+            )
+            elapsed = time.monotonic() - started
+    assert result["doc_type"] == "bao_gia" and result["vendor"] == "Olympus"
+    assert elapsed < 1.0
+
+
+def test_json_scanner_handles_fences_and_braces_in_strings():
+    scanner = _JsonObjectScanner()
+    assert scanner.feed('```json\n{"summary": "ngoặc } trong chuỗi \\"{\\"",') == []
+    done = scanner.feed(' "doc_type": "khac"}\n```\nGiải thích {thêm}')
+    assert json.loads(done[0])["doc_type"] == "khac"
+    assert done[1] == "{thêm}"
+
+
+
+@pytest.mark.asyncio
+async def test_failing_primary_routes_to_fallback_until_breaker_opens(tmp_path, make_classifier):
+    async with FakeGateway(GatewayProfile(latency_ms=1, error_rate=1.0)) as primary, FakeGateway(
+        GatewayProfile(latency_ms=1)
+    ) as fallback:
+        classifier = make_classifier(
+            primary.base_url, fallback_base_url=fallback.base_url, circuit_min_requests=3
+        )
+        async with classifier:
+            for i in range(6):
+                result = await classifier.classify_file(
+                    str(tmp_path / f"bao_gia_ge_{i}.pdf"), use_rules=False
+                )
+                assert result["doc_type"] == "bao_gia" and not result.get("degraded")
+            primary_breaker = classifier.routes[0].breaker
+    # Sau 3 lỗi liên tiếp route chính bị bỏ qua, mọi file đi thẳng tới dự phòng
+    assert primary.stats["errors"] == 3
+    assert fallback.stats["ok"] == 6
+    assert primary_breaker.state == "open" and primary_breaker.opened == 1
+
+
+@pytest.mark.asyncio
+async def test_all_routes_open_returns_degraded_result_without_backoff(tmp_path, make_classifier):
+    async with FakeGateway(GatewayProfile(latency_ms=1, error_rate=1.0)) as gateway:
+        async with make_classifier(gateway.base_url, circuit_min_requests=2) as classifier:
+            for i in range(2):
+                with pytest.raises(Exception):
+                    await classifier.classify_file(str(tmp_path / f"x_{i}.pdf"), use_rules=False)
+            started = time.monotonic()
+            result = await classifier.classify_file(
+                str(tmp_path / "quotation_philips.pdf"), use_rules=True
+            )
+            elapsed = time.monotonic() - started
+    assert result["degraded"] and result["doc_type"] == "bao_gia"
+    assert result["confidence"] <= 0.5
+    assert gateway.stats["requests"] == 2
+    assert elapsed < 1.0
+
+
+@pytest.mark.asyncio
+async def test_slow_request_is_hedged_to_fallback(tmp_path, make_classifier):
+    async with FakeGateway(GatewayProfile(latency_ms=800)) as primary, FakeGateway(
+        GatewayProfile(latency_ms=1)
+    ) as fallback:
+        classifier = make_classifier(
+            primary.base_url, fallback_base_url=fallback.base_url,
+            hedge_enabled=True, hedge_min_samples=5,
+        )
+        async with classifier:
+            for _ in range(5):
+                classifier.routes[0].breaker.record_success(50)  # p95 lịch sử ~50ms
+            started = time.monotonic()
+            result = await classifier.classify_file(
+                str(tmp_path / "manual_siemens.pdf"), use_rules=False
+            )
+            elapsed = time.monotonic() - started
+    assert result["doc_type"] == "ky_thuat"
+    assert fallback.stats["ok"] == 1
+    assert elapsed < 0.6
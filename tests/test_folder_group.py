@@ -0,0 +1,112 @@
+import asyncio
+from unittest.mock import AsyncMock, patch
+
+import pytest
+
+from app.fake_gateway import FakeGateway, GatewayProfile
+from app.folder_group import FolderGroupClassifier
+from app.ingest import ingest_file
+
+_NAMES = ["brochure.pdf", "quotation_2025.pdf", "contract.pdf", "config_sheet.pdf", "manual.pdf"]
+
+
+def _folder(tmp_path, name="philips_digitaldiagnost", names=_NAMES):
+    folder = tmp_path / name
+    folder.mkdir()
+    return [str(folder / n) for n in names]
+
+
+@pytest.mark.asyncio
+async def test_folder_classified_with_one_request(tmp_path, make_classifier):
+    paths = _folder(tmp_path)
+    async with FakeGateway(GatewayProfile(latency_ms=1)) as gateway:
+        async with make_classifier(gateway.base_url) as classifier:
+            grouping = FolderGroupClassifier(classifier)
+            assert grouping.expect(paths) == 1
+            results = await asyncio.gather(
+                *(grouping.classify_file(p, use_rules=False) for p in paths)
+            )
+            assert grouping.groups_classified == 1 and not grouping._groups
+    assert gateway.stats["requests"] == 1
+
+    assert {(r["vendor"], r["model"], r["category_slug"]) for r in results} == {
+        (results[0]["vendor"], results[0]["model"], "chan_doan_hinh_anh/x_quang")
+    }
+    assert results[0]["vendor"] == "Philips"
+    assert [r["doc_type"] for r in results] == [
+        "thong_tin", "bao_gia", "hop_dong", "cau_hinh", "ky_thuat",
+    ]
+    assert all(r["source"] == "folder_group" for r in results)
+
+
+@pytest.mark.asyncio
+async def test_small_or_unexpected_folders_classified_per_file(tmp_path, make_classifier):
+    pair = _folder(tmp_path, "le", _NAMES[:2])
+    async with FakeGateway(GatewayProfile(latency_ms=1)) as gateway:
+        async with make_classifier(gateway.base_url) as classifier:
+            grouping = FolderGroupClassifier(classifier, min_files=3)
+            # Dưới min_files: không lập nhóm
+            assert grouping.expect(pair) == 0
+            # Thư mục quá lớn (kho nhiều thiết bị) cũng không lập nhóm
+            classifier.folder_group_max_files = 2
+            assert grouping.expect(_folder(tmp_path, "kho")[:3]) == 0
+            result = await grouping.classify_file(pair[0], use_rules=False)
+    assert gateway.stats["requests"] == 1
+    assert result.get("source") != "folder_group"
+
+
+@pytest.mark.asyncio
+async def test_failed_group_call_falls_back_to_single_files(tmp_path, make_classifier):
+    paths = _folder(tmp_path)[:3]
+    profile = GatewayProfile(latency_ms=1, invalid_content_rate=1.0)
+    async with FakeGateway(profile) as gateway:
+        async with make_classifier(gateway.base_url, max_retries=1) as classifier:
+            grouping = FolderGroupClassifier(classifier)
+            grouping.expect(paths)
+            results = await asyncio.gather(
+                *(grouping.classify_file(p, use_rules=False) for p in paths),
+                return_exceptions=True,
+            )
+            assert grouping.groups_classified == 0 and not grouping._groups
+    # 1 lần gọi nhóm lỗi + mỗi file một lần gọi riêng
+    assert gateway.stats["requests"] == 1 + len(paths)
+    assert all(not isinstance(r, dict) or r.get("source") != "folder_group" for r in results)
+
+
+@pytest.mark.asyncio
+async def test_group_waits_for_sibling_buffers_and_skips_rule_hits(tmp_path, make_classifier):
+    paths = _folder(tmp_path)[:4]
+    for p in paths:
+        with open(p, "wb") as f:
+            f.write(b"%PDF-1.4 " + p.encode())
+    ingested = {p: await ingest_file(p) for p in paths}
+    rule_hit = {"doc_type": "hop_dong", "source": "rules"}
+    folder_reply = ({"vendor": "Philips"}, {p: {"doc_type": "ky_thuat"} for p in paths})
+    classify_folder = AsyncMock(return_value=folder_reply)
+
+    async with make_classifier("http://127.0.0.1:9/v1") as classifier:
+        grouping = FolderGroupClassifier(classifier, gather_seconds=1.0)
+        grouping.expect(paths)
+
+        async def member(path, delay):
+            await asyncio.sleep(delay)
+            return await grouping.classify_file(path, ingested=ingested[path])
+
+        def rules(file_path_obj):
+            return rule_hit if file_path_obj.name == "contract.pdf" else None
+
+        with patch.object(classifier, "classify_folder", classify_folder), patch.object(
+            classifier, "_confident_rule_result", side_effect=rules
+        ):
+            # File đầu tới trước, các file khác tới sau một chút
+            results = await asyncio.gather(
+                *(member(p, 0 if i == 0 else 0.05) for i, p in enumerate(paths))
+            )
+
+    classify_folder.assert_awaited_once()
+    items = classify_folder.await_args.args[0]
+    # File giải quyết bằng luật không nằm trong prompt nhóm
+    assert [p for p, _ in items] == [p for p in paths if not p.endswith("contract.pdf")]
+    # Preview dùng buffer đã đọc của các file cùng nhóm, không đọc lại từ đĩa
+    assert all(ing is ingested[p] for p, ing in items)
+    assert results[2] is rule_hit
@@ -0,0 +1,40 @@
+import hashlib
+
+import pytest
+
+from app.ingest import ingest_file
+from app.utils import compute_sha256
+
+
+@pytest.mark.asyncio
+async def test_ingest_file_hash_and_size(tmp_path):
+    f = tmp_path / "bao_gia.txt"
+    payload = b"Bao gia may tho Drager Savina 300\n" * 5000
+    f.write_bytes(payload)
+
+    ingested = await ingest_file(f)
+
+    assert ingested.size_bytes == len(payload)
+    assert ingested.sha256 == hashlib.sha256(payload).hexdigest()
+    assert ingested.sha256 == compute_sha256(f)
+    assert ingested.mime_type == "text/plain"
+    assert ingested.data == payload
+
+
+@pytest.mark.asyncio
+async def test_ingest_file_over_buffer_limit(tmp_path):
+    f = tmp_path / "manual.pdf"
+    payload = b"%PDF-1.4" + b"0" * 4096
+    f.write_bytes(payload)
+
+    ingested = await ingest_file(f, max_buffer_bytes=1024)
+
+    assert ingested.buffered is False
+    assert ingested.data is None
+    assert ingested.sha256 == hashlib.sha256(payload).hexdigest()
+
+
+@pytest.mark.asyncio
+async def test_ingest_file_missing(tmp_path):
+    with pytest.raises(OSError):
+        await ingest_file(tmp_path / "khong_ton_tai.pdf")
@@ -0,0 +1,176 @@
+import asyncio
+import math
+import random
+from unittest.mock import AsyncMock, patch
+
+import pytest
+import yaml
+
+from app.classifier import BatchingClassifier, MedicalClassifier
+from app.index_store import IndexStore
+from app.local_model import LocalModel, featurize, row_labels
+
+_DOCS = [
+    # (mẫu tên file, doc_type, category, vendor)
+    ("bao_gia_{v}_{n}", "bao_gia", "chan_doan_hinh_anh/x_quang", "GE Healthcare"),
+    ("service_manual_{v}_{n}", "ky_thuat", "hoi_suc/may_tho", "Dräger"),
+    ("hop_dong_mua_ban_{v}_{n}", "hop_dong", "noi_soi/ong_soi_mem", "Olympus"),
+]
+_VENDOR_WORDS = {"GE Healthcare": "ge", "Dräger": "drager", "Olympus": "olympus"}
+
+
+def _rows(count: int) -> list[dict]:
+    rng = random.Random(1)
+    rows = []
+    for i in range(count):
+        pattern, doc_type, category, vendor = _DOCS[i % len(_DOCS)]
+        name = pattern.format(v=_VENDOR_WORDS[vendor], n=rng.randint(1000, 9999)) + ".pdf"
+        cat, group = category.split("/")
+        rows.append({
+            "id": i + 1, "path": f"/kho/{cat}/{name}", "sha256": f"h{i}",
+            "doc_type": doc_type, "category_slug": cat, "group_slug": group, "vendor": vendor,
+        })
+    return rows
+
+
+def _examples(rows):
+    return [
+        (f"{r['id']}", featurize(r["path"].rsplit("/", 1)[1]), row_labels(r)) for r in rows
+    ]
+
+
+def test_featurize_is_stable_and_normalized():
+    x = featurize("Bao_Gia_GE_Optima 220.pdf", "Báo giá máy X-quang GE Optima")
+    assert x == featurize("Bao_Gia_GE_Optima 220.pdf", "Báo giá máy X-quang GE Optima")
+    assert math.isclose(sum(v * v for v in x.values()), 1.0)
+    assert featurize("a.pdf") != featurize("a.docx")
+
+
+def test_fit_predicts_familiar_documents_and_round_trips(tmp_path):
+    model = LocalModel(tmp_path / "model.json.gz", min_rows=30)
+    model.fit(_examples(_rows(20)))
+    assert not model.ready and model.predict(featurize("bao_gia_ge_1.pdf")) is None
+
+    model.fit(_examples(_rows(60)))
+    prediction = model.predict(featurize("bao_gia_ge_4321.pdf"))
+    assert prediction["doc_type"] == "bao_gia"
+    assert prediction["category"] == "chan_doan_hinh_anh/x_quang"
+    assert prediction["vendor"] == "GE Healthcare"
+    assert prediction["confidence"] > 0.7
+
+    model.save()
+    loaded = LocalModel(tmp_path / "model.json.gz", min_rows=30)
+    assert loaded.load()
+    reloaded = loaded.predict(featurize("bao_gia_ge_4321.pdf"))
+    assert reloaded["doc_type"] == "bao_gia"
+    assert math.isclose(reloaded["confidence"], prediction["confidence"], abs_tol=1e-3)
+
+
+def _config_path(tmp_path):
+    with open("config.yaml", encoding="utf-8") as f:
+        config = yaml.safe_load(f)
+    config["classifier"].update(
+        local_model_file=str(tmp_path / "local_model.json.gz"),
+        local_model_min_rows=30,
+        local_model_threshold=0.6,
+        # Tầng luật không tự quyết: kiểm tra riêng tầng mô hình cục bộ
+        rules_confidence_threshold=0.95,
+    )
+    config["paths"]["medical_devices_root"] = str(tmp_path / "kho")
+    config["paths"]["extracted_cache_dir"] = str(tmp_path / "extracted")
+    config["extraction"]["pool_workers"] = 0
+    config_path = tmp_path / "config.yaml"
+    config_path.write_text(yaml.safe_dump(config, allow_unicode=True), encoding="utf-8")
+    return str(config_path)
+
+
+async def _confirmed_store(tmp_path, rows):
+    store = IndexStore(tmp_path / "index.db")
+    await store.init()
+    for row in rows:
+        await store.upsert_file(
+            row["path"], row["sha256"], row["doc_type"], category_slug=row["category_slug"],
+            group_slug=row["group_slug"], vendor=row["vendor"], size_bytes=1, confirmed=True,
+        )
+    return store
+
+
+# Thư mục thiết bị có sẵn: model/device_slug lấy từ đây, không phải "Unknown"
+_DEVICE_DIR = "gay_me_may_tho/may_tho_hoi_suc/drager_savina_300"
+
+
+@pytest.mark.asyncio
+async def test_classifier_learns_confirmed_rows_and_skips_gateway(tmp_path):
+    rows = _rows(60)
+    store = await _confirmed_store(tmp_path, rows)
+    await store.upsert_file("/kho/inbox/chua_xac_nhan.pdf", "x", size_bytes=1)
+
+    async with MedicalClassifier(_config_path(tmp_path)) as classifier:
+        assert await classifier.refresh_local_model(store) == 60
+        assert await classifier.refresh_local_model(store) == 0  # không có dòng mới
+        # Sửa nhãn một file đã học: học lại từ đầu, mẫu cũ không còn được tính
+        row = rows[0]
+        await store.upsert_file(
+            row["path"], row["sha256"], "hop_dong", category_slug=row["category_slug"],
+            group_slug=row["group_slug"], vendor=row["vendor"], size_bytes=1, confirmed=True,
+        )
+        assert await classifier.refresh_local_model(store) == 1
+        assert len(classifier.local_model.trained) == 60
+        assert classifier.local_model.heads["doc_type"].docs["hop_dong"] == 21
+
+        classifier._complete = AsyncMock(side_effect=AssertionError("không được gọi AI"))
+        result = await classifier.classify_file(
+            str(tmp_path / "kho" / _DEVICE_DIR / "service_manual_drager_77.pdf")
+        )
+        # Ngoài thư mục thiết bị: không suy ra được model → vẫn hỏi gateway
+        with pytest.raises(AssertionError):
+            await classifier.classify_file(str(tmp_path / "service_manual_drager_78.pdf"))
+    await store.close()
+
+    assert result["source"] == "local_model"
+    assert result["doc_type"] == "ky_thuat"
+    assert result["category_slug"] == "gay_me_may_tho/may_tho_hoi_suc"
+    assert result["vendor"] == "Dräger"
+    assert result["device_slug"] == "drager_savina_300"
+    assert (tmp_path / "local_model.json.gz").exists()
+
+
+@pytest.mark.asyncio
+async def test_batching_path_uses_local_model_before_gateway(tmp_path):
+    store = await _confirmed_store(tmp_path, _rows(60))
+    async with MedicalClassifier(_config_path(tmp_path)) as classifier:
+        await classifier.refresh_local_model(store)
+        classifier._complete = AsyncMock(side_effect=AssertionError("không được gọi AI"))
+        # Đường bulk ingest mặc định (batch_size > 1)
+        batching = BatchingClassifier(classifier, batch_size=4)
+        results = await asyncio.gather(*(
+            batching.classify_file(str(tmp_path / "kho" / _DEVICE_DIR / name))
+            for name in ("service_manual_drager_11.pdf", "bao_gia_ge_12.pdf")
+        ))
+    await store.close()
+
+    assert [r["source"] for r in results] == ["local_model", "local_model"]
+    assert [r["doc_type"] for r in results] == ["ky_thuat", "bao_gia"]
+    classifier._complete.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_incremental_learning_swaps_in_a_copy_off_the_event_loop(tmp_path):
+    rows = _rows(40)
+    store = await _confirmed_store(tmp_path, rows[:30])
+    async with MedicalClassifier(_config_path(tmp_path)) as classifier:
+        assert await classifier.refresh_local_model(store) == 30
+        before = classifier.local_model
+        for row in rows[30:]:
+            await store.upsert_file(
+                row["path"], row["sha256"], row["doc_type"], category_slug=row["category_slug"],
+                group_slug=row["group_slug"], vendor=row["vendor"], size_bytes=1, confirmed=True,
+            )
+        with patch("app.classifier.asyncio.to_thread", wraps=asyncio.to_thread) as to_thread:
+            assert await classifier.refresh_local_model(store) == 10
+    await store.close()
+
+    to_thread.assert_called()
+    # Mô hình đang phục vụ predict không bị sửa tại chỗ trong lúc học
+    assert len(before.trained) == 30
+    assert classifier.local_model is not before and len(classifier.local_model.trained) == 40
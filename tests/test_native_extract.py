@@ -0,0 +1,107 @@
+import zipfile
+
+import pytest
+from kreuzberg.exceptions import KreuzbergError
+
+from app.extract_cache import ExtractionCache
+from app.ingest import extract_content, ingest_file
+from app.native_extract import NativeResult, detect_encoding, extract_native
+from app.preview import extract_preview
+
+_NS_MAIN = "http://schemas.openxmlformats.org/spreadsheetml/2006/main"
+_NS_R = "http://schemas.openxmlformats.org/officeDocument/2006/relationships"
+_NS_REL = "http://schemas.openxmlformats.org/package/2006/relationships"
+
+
+def _make_xlsx(path, sheets: dict[str, list[list[str]]]) -> None:
+    """XLSX tối giản: mọi ô là shared string."""
+    shared: list[str] = []
+    with zipfile.ZipFile(path, "w") as zf:
+        decl = "".join(
+            f'<sheet name="{name}" sheetId="{i}" r:id="rId{i}"/>'
+            for i, name in enumerate(sheets, start=1)
+        )
+        zf.writestr(
+            "xl/workbook.xml",
+            f'<workbook xmlns="{_NS_MAIN}" xmlns:r="{_NS_R}"><sheets>{decl}</sheets></workbook>',
+        )
+        rels = "".join(
+            f'<Relationship Id="rId{i}" Target="worksheets/sheet{i}.xml"/>'
+            for i in range(1, len(sheets) + 1)
+        )
+        zf.writestr(
+            "xl/_rels/workbook.xml.rels", f'<Relationships xmlns="{_NS_REL}">{rels}</Relationships>'
+        )
+        for i, rows in enumerate(sheets.values(), start=1):
+            xml_rows = []
+            for row in rows:
+                cells = []
+                for value in row:
+                    shared.append(value)
+                    cells.append(f'<c t="s"><v>{len(shared) - 1}</v></c>')
+                xml_rows.append(f"<row>{''.join(cells)}</row>")
+            zf.writestr(
+                f"xl/worksheets/sheet{i}.xml",
+                f'<worksheet xmlns="{_NS_MAIN}"><sheetData>{"".join(xml_rows)}</sheetData></worksheet>',
+            )
+        items = "".join(f"<si><t>{s}</t></si>" for s in shared)
+        zf.writestr("xl/sharedStrings.xml", f'<sst xmlns="{_NS_MAIN}">{items}</sst>')
+
+
+@pytest.mark.asyncio
+async def test_text_and_csv_detect_encoding(tmp_path):
+    legacy = tmp_path / "cau_hinh.txt"
+    # Windows tiếng Việt: dấu thanh lưu dạng tổ hợp (ơ + dấu hỏi)
+    legacy.write_bytes("Máy thơ\u0309 Evita - Đư\u0301c".encode("cp1258"))
+    assert detect_encoding(legacy.read_bytes()) == "cp1258"
+    result = extract_native(await ingest_file(legacy))
+    assert result.content == "Máy thở Evita - Đức"
+
+    quote = tmp_path / "bao_gia.csv"
+    rows = ["Hạng mục;Hãng;Đơn giá"] + [f"Đầu dò {i};GE Healthcare;{i}000000" for i in range(500)]
+    quote.write_text("\n".join(rows), encoding="utf-16")
+    ingested = await ingest_file(quote)
+
+    full = extract_native(ingested)
+    assert full.content.splitlines()[1] == "Đầu dò 0\tGE Healthcare\t0000000"
+    assert full.metadata == {"encoding": "utf-16", "row_count": 501}
+
+    preview = await extract_preview(ingested, max_chars=200)
+    assert preview.partial and "Đầu dò 499" not in preview.content
+
+
+@pytest.mark.asyncio
+async def test_xlsx_rows_stream_until_budget(tmp_path):
+    src = tmp_path / "bao_gia.xlsx"
+    _make_xlsx(src, {
+        "Báo giá": [["Model", "Giá"]] + [[f"Optima {i}", f"{i}00"] for i in range(300)],
+        "Ghi chú": [["Bảo hành 24 tháng"]],
+    })
+    ingested = await ingest_file(src)
+
+    preview = extract_native(ingested, max_pages=3, max_chars=100)
+    assert not preview.complete
+    assert preview.content.startswith("--- Sheet Báo giá ---\nModel\tGiá\nOptima 0\t000")
+    assert "Optima 299" not in preview.content
+
+    full = extract_native(ingested)
+    assert full.complete and full.metadata == {"sheet_count": 2}
+    assert "Optima 299\t29900" in full.content and "Bảo hành 24 tháng" in full.content
+
+
+@pytest.mark.asyncio
+async def test_extract_content_prefers_native_and_falls_back_to_kreuzberg(tmp_path):
+    cache = ExtractionCache(tmp_path / "cache")
+    note = tmp_path / "note.md"
+    note.write_text("# Hướng dẫn vệ sinh đầu dò", encoding="utf-8")
+    ingested = await ingest_file(note)
+
+    result = await extract_content(ingested, cache=cache)
+    assert isinstance(result, NativeResult)
+    assert cache.get_sync(ingested.sha256).content == "# Hướng dẫn vệ sinh đầu dò"
+
+    broken = tmp_path / "hop_dong.docx"
+    broken.write_bytes(b"not a zip")
+    # Reader native lỗi → chuyển sang kreuzberg (ở đây kreuzberg cũng báo lỗi định dạng)
+    with pytest.raises(KreuzbergError):
+        await extract_content(await ingest_file(broken))
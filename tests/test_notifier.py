@@ -0,0 +1,130 @@
+from unittest.mock import AsyncMock, Mock
+
+import asyncio
+
+import pytest
+
+from app.index_store import IndexStore
+from app.notifier import TelegramNotifier
+from app.scheduler import BULK, classification_priority
+
+
+def _make_notifier(**tg_overrides):
+    tg_config = {
+        "min_send_interval_seconds": 0,
+        "digest_window_seconds": 0.05,
+        "digest_min_items": 3,
+        "digest_page_size": 2,
+    }
+    tg_config.update(tg_overrides)
+    config = {"services": {"telegram": tg_config}}
+    bot = Mock()
+    bot.send_message = AsyncMock()
+    bot.shutdown = AsyncMock()
+    return TelegramNotifier(None, "123", config, bot=bot), bot
+
+
+def _file_info(i):
+    return {
+        "id": i,
+        "path": f"/root/file_{i}.pdf",
+        "vendor": "GE",
+        "model": "Optima",
+        "doc_type": "bao_gia",
+        "summary": "",
+        "category_slug": "chan_doan_hinh_anh",
+        "group_slug": "x_quang",
+        "device_slug": "ge_optima",
+    }
+
+
+@pytest.mark.asyncio
+async def test_digest_batches_burst_into_pages():
+    notifier, bot = _make_notifier()
+    await notifier.start()
+    with classification_priority(BULK):
+        for i in range(5):
+            await notifier.notify_draft(_file_info(i), 0.9, True)
+    await notifier.close()
+
+    # 5 drafts, page size 2 → 3 trang digest thay vì 5 tin nhắn
+    assert bot.send_message.await_count == 3
+    first_text = bot.send_message.await_args_list[0].kwargs["text"]
+    assert "5 tài liệu mới" in first_text
+    assert "Trang 1/3" in first_text
+
+
+@pytest.mark.asyncio
+async def test_small_burst_sends_individual_drafts():
+    notifier, bot = _make_notifier()
+    await notifier.start()
+    await notifier.notify_draft(_file_info(1), 0.9, True)
+    await notifier.close()
+
+    bot.send_message.assert_awaited_once()
+    assert "Phát hiện tài liệu mới" in bot.send_message.await_args.kwargs["text"]
+
+
+@pytest.mark.asyncio
+async def test_interactive_draft_is_not_held_for_the_window():
+    notifier, bot = _make_notifier(digest_window_seconds=30)
+    await notifier.start()
+    await notifier.notify_draft(_file_info(1), 0.4, False)
+    # Không chờ hết cửa sổ digest: tin đã nằm trong hàng đợi gửi
+    await asyncio.sleep(0.05)
+    bot.send_message.assert_awaited_once()
+    # Độ tin cậy thấp vẫn được hiển thị
+    assert "AI không chắc chắn" in bot.send_message.await_args.kwargs["text"]
+    await notifier.close()
+
+
+@pytest.mark.asyncio
+async def test_interactive_burst_above_threshold_is_digested():
+    notifier, bot = _make_notifier(digest_min_items=2, digest_page_size=10)
+    await notifier.start()
+    for i in range(4):
+        await notifier.notify_draft(_file_info(i), 0.9, True)
+    await notifier.close()
+
+    # Draft đầu gửi ngay, 3 draft sau gom thành 1 trang digest
+    texts = [c.kwargs["text"] for c in bot.send_message.await_args_list]
+    assert len(texts) == 2
+    assert "3 tài liệu mới" in texts[1]
+
+
+@pytest.mark.asyncio
+async def test_long_bulk_run_flushes_by_size_and_age():
+    notifier, bot = _make_notifier(
+        digest_window_seconds=30, digest_max_items=3, digest_max_wait_seconds=0.1
+    )
+    await notifier.start()
+    with classification_priority(BULK):
+        for i in range(4):
+            await notifier.notify_draft(_file_info(i), 0.9, True)
+        # Đủ max_items → flush ngay dù các draft vẫn liên tục đến
+        await asyncio.sleep(0.05)
+        assert bot.send_message.await_count == 2
+        # Draft còn lại được flush theo max_wait, không chờ 30s yên lặng
+        await asyncio.sleep(0.15)
+        assert bot.send_message.await_count == 3
+    await notifier.close()
+
+
+@pytest.mark.asyncio
+async def test_stored_confidence_survives_for_rerender(tmp_path):
+    store = IndexStore(tmp_path / "index.db")
+    await store.init()
+    file_id = await store.upsert_file(
+        path=tmp_path / "a.pdf", sha256="x", size_bytes=1, confidence=0.42
+    )
+    row = await store.get_file_by_id(file_id)
+    await store.close()
+    assert row["confidence"] == pytest.approx(0.42)
+
+
+@pytest.mark.asyncio
+async def test_disabled_without_chat_id():
+    notifier = TelegramNotifier(None, None, {"services": {"telegram": {}}})
+    assert notifier.enabled is False
+    await notifier.notify_error("/x.pdf", "boom")
+    await notifier.close()
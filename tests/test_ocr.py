@@ -0,0 +1,89 @@
+import asyncio
+
+import pytest
+
+from app.extract_cache import ExtractionCache
+from app.ingest import ingest_file
+from app.ocr import PageOcr
+from app.preview import FullExtractionQueue, extract_preview
+
+pytest.importorskip("pypdf")
+
+
+class _FakeOcr(PageOcr):
+    """Engine OCR giả: mỗi trang trả về 500 ký tự, ghi lại trang đã OCR và độ song song."""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.pages: list[int] = []
+        self.active = 0
+        self.max_active = 0
+
+    async def _ocr_page(self, ingested, index, data):
+        self.pages.append(index)
+        self.active += 1
+        self.max_active = max(self.max_active, self.active)
+        await asyncio.sleep(0.02)
+        self.active -= 1
+        return f"Bao gia trang {index + 1} " + "x" * 480
+
+
+@pytest.fixture
+def scanned(tmp_path, make_pdf):
+    """PDF scan (các trang không có text) đã ingest, N trang."""
+
+    async def _scan(pages: int):
+        src = tmp_path / "quyet_dinh_trung_thau.pdf"
+        src.write_bytes(make_pdf([""] * pages))
+        return await ingest_file(src)
+
+    return _scan
+
+
+@pytest.mark.asyncio
+async def test_pages_ocr_in_parallel_and_stop_early(scanned):
+    ingested = await scanned(12)
+    ocr = _FakeOcr(workers=3)
+
+    result = await ocr.run(ingested, target_chars=1200)
+
+    assert 1 < ocr.max_active <= 3
+    # Đủ 1200 ký tự sau 3 trang: ngừng giao trang mới, chỉ chờ các trang đang chạy
+    assert len(ocr.pages) <= 5
+    assert not result.complete and result.page_count == 12
+    assert result.content.startswith("Bao gia trang 1 ")
+
+
+@pytest.mark.asyncio
+async def test_preview_ocrs_scanned_pdf_but_not_text_pdf(tmp_path, scanned, make_pdf):
+    cache = ExtractionCache(tmp_path / "cache")
+    ocr = _FakeOcr(workers=2, target_chars=1000, min_chars_per_page=10)
+    ingested = await scanned(8)
+
+    preview = await extract_preview(ingested, cache=cache, max_pages=2, ocr=ocr)
+
+    assert "Bao gia trang 2" in preview.content
+    assert preview.partial and preview.metadata["ocr_pages"] < 8
+
+    text_pdf = tmp_path / "manual.pdf"
+    text_pdf.write_bytes(make_pdf([f"Service manual page {i}" for i in range(4)]))
+    ocr.pages.clear()
+    preview = await extract_preview(await ingest_file(text_pdf), cache=cache, ocr=ocr)
+    assert "Service manual page 0" in preview.content
+    assert ocr.pages == []
+
+
+@pytest.mark.asyncio
+async def test_background_extraction_ocrs_every_page(tmp_path, scanned):
+    cache = ExtractionCache(tmp_path / "cache")
+    ocr = _FakeOcr(workers=4)
+    ingested = await scanned(6)
+    queue = FullExtractionQueue(cache, ocr=ocr)
+
+    queue.submit(ingested.path, ingested.sha256)
+    await queue._worker
+
+    full = cache.get_sync(ingested.sha256)
+    assert sorted(ocr.pages) == list(range(6))
+    assert "Bao gia trang 6" in full.content
+    assert full.metadata["ocr_pages"] == 6
@@ -0,0 +1,108 @@
+import zipfile
+from unittest.mock import AsyncMock, patch
+
+import pytest
+
+from app.extract_cache import ExtractionCache
+from app.ingest import ingest_file
+from app.preview import PREVIEW_VARIANT, FullExtractionQueue, extract_preview
+
+
+@pytest.mark.asyncio
+async def test_pdf_preview_reads_only_first_pages(tmp_path, make_pdf):
+    pytest.importorskip("pypdf")
+    src = tmp_path / "manual.pdf"
+    src.write_bytes(make_pdf([f"Page number {i}" for i in range(1, 7)]))
+    cache = ExtractionCache(tmp_path / "cache")
+    ingested = await ingest_file(src)
+
+    result = await extract_preview(ingested, cache=cache, max_pages=2)
+
+    assert "Page number 2" in result.content
+    assert "Page number 3" not in result.content
+    assert result.partial and result.metadata["page_count"] == 6
+    # Preview được cache riêng, không chiếm chỗ bản đầy đủ
+    assert cache.get_sync(ingested.sha256) is None
+    assert cache.get_sync(ingested.sha256, variant=PREVIEW_VARIANT) is not None
+
+
+@pytest.mark.asyncio
+async def test_pptx_preview_reads_first_slides_in_order(tmp_path):
+    src = tmp_path / "slides.pptx"
+    ns_p = "http://schemas.openxmlformats.org/presentationml/2006/main"
+    ns_r = "http://schemas.openxmlformats.org/officeDocument/2006/relationships"
+    ns_a = "http://schemas.openxmlformats.org/drawingml/2006/main"
+    # Thứ tự trong presentation.xml khác thứ tự tên file slide
+    order = [3, 1, 2]
+    with zipfile.ZipFile(src, "w") as zf:
+        ids = "".join(f'<p:sldId id="{255 + n}" r:id="rId{n}"/>' for n in order)
+        zf.writestr(
+            "ppt/presentation.xml",
+            f'<p:presentation xmlns:p="{ns_p}" xmlns:r="{ns_r}"><p:sldIdLst>{ids}</p:sldIdLst></p:presentation>',
+        )
+        rels = "".join(
+            f'<Relationship Id="rId{n}" Target="slides/slide{n}.xml"/>' for n in order
+        )
+        zf.writestr(
+            "ppt/_rels/presentation.xml.rels",
+            f'<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">{rels}</Relationships>',
+        )
+        for n in order:
+            zf.writestr(
+                f"ppt/slides/slide{n}.xml",
+                f'<p:sld xmlns:p="{ns_p}" xmlns:a="{ns_a}"><a:p><a:r><a:t>Nội dung slide {n}</a:t></a:r></a:p></p:sld>',
+            )
+    ingested = await ingest_file(src)
+
+    result = await extract_preview(ingested, max_pages=2)
+
+    assert result.content.index("slide 3") < result.content.index("slide 1")
+    assert "slide 2" not in result.content
+    assert result.metadata["slide_count"] == 3
+
+
+@pytest.mark.asyncio
+async def test_background_queue_fills_full_cache(tmp_path):
+    src = tmp_path / "note.txt"
+    src.write_text("Máy thở Dräger Evita V800\n" * 2000, encoding="utf-8")
+    cache = ExtractionCache(tmp_path / "cache")
+    ingested = await ingest_file(src)
+
+    preview = await extract_preview(ingested, cache=cache, max_chars=100)
+    assert preview.partial and len(preview.content) == 100
+
+    queue = FullExtractionQueue(cache)
+    queue.submit(src, ingested.sha256)
+    queue.submit(src, ingested.sha256)  # trùng → bỏ qua
+    assert queue.pending == 1
+    await queue._worker
+    await queue.close()
+
+    full = cache.get_sync(ingested.sha256)
+    assert full is not None and full.content.count("Evita") == 2000
+    # Lần preview sau dùng luôn bản đầy đủ
+    again = await extract_preview(ingested, cache=cache, max_chars=100)
+    assert not again.partial
+
+
+@pytest.mark.asyncio
+async def test_background_queue_reuses_first_read_within_held_limit(tmp_path):
+    cache = ExtractionCache(tmp_path / "cache")
+    files = []
+    for name in ("a.txt", "b.txt"):
+        src = tmp_path / name
+        src.write_text(f"Catalogue {name} Mindray BeneHeart\n" * 500, encoding="utf-8")
+        files.append(await ingest_file(src))
+
+    # Chỉ đủ chỗ giữ buffer của một file: file thứ hai được đọc lại khi tới lượt
+    queue = FullExtractionQueue(cache, max_held_bytes=files[0].size_bytes)
+    reread = AsyncMock(side_effect=ingest_file)
+    with patch("app.preview.ingest_file", reread):
+        for ingested in files:
+            queue.submit(ingested.path, ingested.sha256, ingested)
+        await queue._worker
+    await queue.close()
+
+    assert [c.args[0] for c in reread.await_args_list] == [files[1].path]
+    assert queue._held_bytes == 0
+    assert all(cache.get_sync(f.sha256).content.count("BeneHeart") == 500 for f in files)
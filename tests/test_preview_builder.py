@@ -0,0 +1,39 @@
+from app.preview_builder import PreviewBuilder, estimate_tokens
+
+VENDORS = {"ge": "GE Healthcare", "philips": "Philips"}
+
+
+def _manual_text() -> str:
+    toc = "\n".join(f"{i}. Chương {i} ........................ {i * 4}" for i in range(1, 40))
+    legal = "Copyright © 2021 Philips. All rights reserved. Không được sao chép tài liệu. " * 8
+    filler = "\n".join(["Nội dung mô tả chung về quy trình vận hành thiết bị trong bệnh viện."] * 60)
+    specs = "Model: EPIQ Elite\nTần số đầu dò: 1-22 MHz\nKhối lượng: 104 kg"
+    footer = "\n".join(["Philips Ultrasound | EPIQ Elite User Manual"] * 4)
+    return "\n".join(["HƯỚNG DẪN SỬ DỤNG", "Mục lục", toc, legal, filler, specs, footer])
+
+
+def test_estimate_tokens_scales_with_text():
+    assert estimate_tokens("") == 0
+    assert estimate_tokens("Philips EPIQ") == 3
+    # Tiếng Việt có dấu tốn nhiều token hơn ASCII cùng độ dài
+    assert estimate_tokens("thiết bị y tế") > estimate_tokens("thiet bi y te")
+
+
+def test_short_text_is_returned_unchanged():
+    text = "Báo giá máy siêu âm GE Logiq E10"
+    assert PreviewBuilder(VENDORS).build(text, token_budget=200) == text
+
+
+def test_build_prefers_specs_and_headers_over_toc_and_legal():
+    text = _manual_text()
+    preview = PreviewBuilder(VENDORS).build(text, token_budget=150)
+
+    assert estimate_tokens(preview) <= 150
+    assert preview.startswith("HƯỚNG DẪN SỬ DỤNG")
+    assert "Model: EPIQ Elite" in preview and "1-22 MHz" in preview
+    assert preview.count("EPIQ Elite User Manual") == 1
+    assert "Chương 3" not in preview
+    assert "All rights reserved" not in preview
+    # Thứ tự gốc được giữ, đoạn bị bỏ đánh dấu bằng [...]
+    assert preview.index("Model:") < preview.index("User Manual")
+    assert "[...]" in preview
@@ -0,0 +1,76 @@
+import asyncio
+import time
+
+import pytest
+
+from app.rate_limiter import (
+    AdaptiveRateLimiter,
+    get_shared_limiter,
+    parse_rate_limit_reset,
+    parse_retry_after,
+)
+
+
+def test_parse_retry_after():
+    assert parse_retry_after("3") == 3.0
+    assert parse_retry_after(None) is None
+    assert parse_retry_after("garbage") is None
+    assert parse_retry_after("Wed, 21 Oct 2015 07:28:00 GMT") == 0.0  # Đã qua
+
+
+@pytest.mark.asyncio
+async def test_burst_and_concurrency():
+    limiter = AdaptiveRateLimiter(rate=1000, burst=3, max_concurrency=2)
+    in_flight = peak = 0
+
+    async def call():
+        nonlocal in_flight, peak
+        async with limiter.acquire():
+            in_flight += 1
+            peak = max(peak, in_flight)
+            await asyncio.sleep(0.01)
+            in_flight -= 1
+
+    await asyncio.gather(*(call() for _ in range(6)))
+    assert peak == 2
+
+
+@pytest.mark.asyncio
+async def test_throttle_halves_rate_and_blocks_until_retry_after():
+    limiter = AdaptiveRateLimiter(rate=100, burst=5, max_rate=200)
+    limiter.on_success()
+    assert limiter.rate == pytest.approx(110)
+
+    limiter.on_throttle(retry_after=0.05)
+    assert limiter.rate == pytest.approx(55)
+    started = time.monotonic()
+    async with limiter.acquire() as waited:
+        pass
+    assert time.monotonic() - started >= 0.045
+    assert waited >= 0.045
+
+
+def test_epoch_reset_header_blocks_until_reset_not_for_decades():
+    now = time.time()
+    assert parse_rate_limit_reset("2", now=now) == 2.0
+    # Epoch giây và epoch ms (OpenRouter) → số giây còn lại
+    assert parse_rate_limit_reset(str(int(now) + 30), now=int(now)) == pytest.approx(30)
+    assert parse_rate_limit_reset(str(int(now * 1000) + 1500), now=now) == pytest.approx(
+        1.5, abs=0.01
+    )
+    assert parse_rate_limit_reset(str(int(now) - 5), now=now) == 0.0
+
+    limiter = AdaptiveRateLimiter(rate=100, max_block_seconds=60)
+    limiter.on_success({"x-ratelimit-remaining": "0", "x-ratelimit-reset": str(int(now * 1000))})
+    assert limiter._blocked_until - time.monotonic() < 1
+    # Reset quá xa vẫn chỉ chặn tối đa max_block_seconds
+    limiter.on_success({"x-ratelimit-remaining": "0", "x-ratelimit-reset": str(int(now) + 86400)})
+    assert 59 < limiter._blocked_until - time.monotonic() <= 60
+
+
+def test_shared_limiter_keyed_by_rate_settings():
+    base = {"base_url": "http://gw.test/v1", "rate_limit_seconds": 6.0}
+    assert get_shared_limiter(base) is get_shared_limiter(dict(base))
+    faster = get_shared_limiter({**base, "rate_limit_seconds": 0.5})
+    assert faster is not get_shared_limiter(base)
+    assert faster.rate == pytest.approx(2.0)
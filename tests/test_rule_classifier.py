@@ -0,0 +1,63 @@
+import pytest
+import yaml
+
+from app.rule_classifier import RuleClassifier
+from app.taxonomy import Taxonomy
+
+
+@pytest.fixture
+def taxonomy(tmp_path):
+    data = {
+        "version": 2,
+        "categories": {
+            "gay_me_may_tho": {
+                "label_vi": "Gây mê, máy thở",
+                "label_en": "Anesthesia & ventilators",
+                "sub": {"may_tho_hoi_suc": "Máy thở hồi sức"},
+            }
+        },
+    }
+    f = tmp_path / "taxonomy.yaml"
+    f.write_text(yaml.dump(data, allow_unicode=True), encoding="utf-8")
+    return Taxonomy(f)
+
+
+@pytest.fixture
+def rules(tmp_path, taxonomy):
+    config = {
+        "paths": {"medical_devices_root": str(tmp_path / "root")},
+        "classifier": {
+            "subfolder_rules": {"tech": "ky_thuat", "price": "bao_gia"},
+            "filename_rules": {"quotation": "bao_gia", "hop_dong": "hop_dong", "manual": "ky_thuat"},
+            "vendor_aliases": {"drager": "Dräger", "ge": "GE Healthcare"},
+        },
+    }
+    return RuleClassifier(config, taxonomy)
+
+
+def test_filename_rule_and_vendor(rules, tmp_path):
+    result = rules.classify(tmp_path / "inbox" / "Quotation_Drager_Savina.pdf")
+    assert result["doc_type"] == "bao_gia"
+    assert result["vendor"] == "Dräger"
+    assert not rules.is_confident(result)
+
+
+def test_keyword_does_not_match_inside_word(rules):
+    assert rules.match_doc_type("manuals_list.pdf") is None
+    assert rules.match_vendor("general_report.pdf") is None
+    assert rules.match_doc_type("Hợp đồng 2024.pdf") == "hop_dong"
+
+
+def test_partial_placement_with_device_folder(rules, tmp_path):
+    path = tmp_path / "root" / "gay_me_may_tho" / "may_tho_hoi_suc" / "drager_savina_300" / "quotation.pdf"
+    result = rules.classify(path)
+    assert result["doc_type"] == "bao_gia"
+    assert result["category_slug"] == "gay_me_may_tho/may_tho_hoi_suc"
+    assert result["device_slug"] == "drager_savina_300"
+    assert result["model"] == "savina_300"
+    assert rules.is_confident(result)
+
+
+def test_unknown_category_is_ignored(rules, tmp_path):
+    path = tmp_path / "root" / "khong_co" / "nhom" / "file.pdf"
+    assert rules.classify(path) is None
@@ -0,0 +1,81 @@
+import asyncio
+import time
+
+import pytest
+
+from app.rate_limiter import AdaptiveRateLimiter, request_deadline
+from app.scheduler import BULK, INTERACTIVE, ClassificationScheduler, classification_priority
+
+
+class _SlowClassifier:
+    """Classifier giả: mỗi file mất 10ms, ghi lại thứ tự được phục vụ."""
+
+    def __init__(self):
+        self.order: list[str] = []
+
+    async def classify_file(self, file_path, max_retries=None, ingested=None, use_rules=True):
+        self.order.append(file_path)
+        await asyncio.sleep(0.01)
+        return {"doc_type": "khac", "path": file_path}
+
+    async def close(self):
+        pass
+
+
+async def _submit(scheduler, names, priority, **kwargs):
+    with classification_priority(priority):
+        tasks = [asyncio.create_task(scheduler.classify_file(n, **kwargs)) for n in names]
+    await asyncio.sleep(0)  # vào hàng đợi theo đúng thứ tự
+    return tasks
+
+
+@pytest.mark.asyncio
+async def test_limiter_serves_earliest_deadline_first():
+    limiter = AdaptiveRateLimiter(rate=50, burst=1, max_concurrency=1)
+    order = []
+
+    async def call(name, deadline=None):
+        with request_deadline(deadline):
+            async with limiter.acquire():
+                order.append(name)
+                await asyncio.sleep(0.01)
+
+    bulk = [asyncio.create_task(call(f"bulk{i}")) for i in range(4)]
+    await asyncio.sleep(0)
+    urgent = asyncio.create_task(call("urgent", deadline=time.monotonic()))
+    await asyncio.gather(*bulk, urgent)
+
+    # bulk0 đã giữ slot; request có hạn chót sớm vượt lên trước các bulk còn lại
+    assert order[:2] == ["bulk0", "urgent"]
+
+
+@pytest.mark.asyncio
+async def test_interactive_jumps_queue_but_bulk_is_not_starved():
+    inner = _SlowClassifier()
+    scheduler = ClassificationScheduler(
+        inner, concurrency=1, weights={INTERACTIVE: 3, BULK: 1}
+    )
+    bulk = await _submit(scheduler, [f"b{i}" for i in range(6)], BULK)
+    interactive = await _submit(scheduler, [f"i{i}" for i in range(6)], INTERACTIVE)
+    await asyncio.gather(*bulk, *interactive)
+
+    order = inner.order
+    # File interactive đầu tiên chỉ chờ file bulk đang chạy
+    assert order.index("i0") == 1
+    # Trọng số 3:1 → bulk vẫn được chen vào giữa các file interactive
+    last_interactive = max(order.index(f"i{i}") for i in range(6))
+    between = [name for name in order[1:last_interactive] if name.startswith("b")]
+    assert len(between) >= 1
+    assert scheduler.stats()[BULK] == {"queued": 0, "active": 0, "served": 6}
+
+
+@pytest.mark.asyncio
+async def test_overdue_request_is_served_before_other_classes():
+    inner = _SlowClassifier()
+    scheduler = ClassificationScheduler(inner, concurrency=1)
+    first = await _submit(scheduler, ["i0"], INTERACTIVE)
+    waiting = await _submit(scheduler, ["i1", "i2"], INTERACTIVE)
+    overdue = await _submit(scheduler, ["b_overdue"], BULK, deadline_seconds=0)
+    await asyncio.gather(*first, *waiting, *overdue)
+
+    assert inner.order[:2] == ["i0", "b_overdue"]
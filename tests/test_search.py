@@ -21,3 +21,14 @@ def test_parse_search_query_only_doc_type():
     doc_types, keyword = parse_search_query("hướng dẫn sử dụng")
     assert doc_types == ["huong_dan_su_dung"]
     assert keyword == "sử dụng"
+
+def test_parse_search_query_unaccented_keywords():
+    doc_types, keyword = parse_search_query("Hop Dong  bao gia Philips")
+    assert doc_types == ["hop_dong", "bao_gia"]
+    assert keyword == "philips"
+
+def test_parse_search_query_short_alias_needs_word_boundary():
+    # "ch" trong "chụp", "tt" trong "ttxvn", "hd" trong "hdsd" không phải alias
+    doc_types, keyword = parse_search_query("chụp ct ttxvn hdsd")
+    assert doc_types == ["huong_dan_su_dung"]
+    assert keyword == "chụp ct ttxvn"
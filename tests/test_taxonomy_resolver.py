@@ -0,0 +1,90 @@
+import json
+
+import pytest
+
+from app.taxonomy import Taxonomy
+from app.taxonomy_resolver import TaxonomyResolver
+
+TAXONOMY = """
+categories:
+  chan_doan_hinh_anh:
+    label_vi: "Chẩn đoán hình ảnh"
+    label_en: "Diagnostic imaging equipment"
+    sub:
+      x_quang: "Hệ thống X-quang thông thường"
+      sieu_am: "Máy siêu âm chẩn đoán"
+  noi_soi:
+    label_vi: "Thiết bị nội soi"
+    label_en: "Endoscopy systems"
+    sub:
+      noi_soi_tieu_hoa: "Nội soi tiêu hóa (dạ dày, đại tràng, ERCP)"
+  thiet_bi_phong_mo:
+    label_vi: "Thiết bị phòng mổ"
+    label_en: "Operating room equipment"
+    sub:
+      ban_mo: "Bàn mổ"
+"""
+
+
+@pytest.fixture
+def taxonomy(tmp_path):
+    f = tmp_path / "taxonomy.yaml"
+    f.write_text(TAXONOMY, encoding="utf-8")
+    return Taxonomy(f)
+
+
+def test_exact_and_static_aliases(taxonomy):
+    resolver = TaxonomyResolver(taxonomy)
+    res = resolver.resolve("chan_doan_hinh_anh", "x_quang")
+    assert (res.category_slug, res.group_slug, res.method) == ("chan_doan_hinh_anh", "x_quang", "exact")
+
+    res = resolver.resolve("ngoai_khoa", "ban-mo")
+    assert (res.category_slug, res.group_slug) == ("thiet_bi_phong_mo", "ban_mo")
+
+    # Alias trỏ về slug ngoài taxonomy → cố ý không phân loại
+    assert resolver.resolve("Unknown", "Unknown").category_slug is None
+
+
+def test_fuzzy_snaps_near_misses(taxonomy):
+    resolver = TaxonomyResolver(taxonomy)
+    res = resolver.resolve("chuan_doan_hinh_anh", "sieu_am_chan_doan")
+    assert (res.category_slug, res.group_slug, res.method) == ("chan_doan_hinh_anh", "sieu_am", "fuzzy")
+
+    # Label tiếng Việt có dấu khớp theo token đã bỏ dấu
+    res = resolver.resolve("noi_soi", "Nội soi dạ dày")
+    assert res.group_slug == "noi_soi_tieu_hoa"
+
+    # Group hợp lệ suy ra category
+    res = resolver.resolve("imaging", "x_quang")
+    assert (res.category_slug, res.method) == ("chan_doan_hinh_anh", "group")
+
+    assert resolver.resolve("hoan_toan_khong_lien_quan", "zzz").category_slug is None
+
+
+def test_learned_aliases_are_persisted(taxonomy, tmp_path):
+    aliases_file = tmp_path / "aliases.json"
+    resolver = TaxonomyResolver(taxonomy, learned_aliases_file=aliases_file)
+    res = resolver.resolve("chuan_doan_hinh_anh", "sieu_am_chan_doan")
+    resolver.learn("chuan_doan_hinh_anh", "sieu_am_chan_doan", res)
+
+    data = json.loads(aliases_file.read_text(encoding="utf-8"))
+    assert data["category"]["chuan_doan_hinh_anh"] == "chan_doan_hinh_anh"
+
+    reloaded = TaxonomyResolver(taxonomy, learned_aliases_file=aliases_file)
+    res = reloaded.resolve("chuan_doan_hinh_anh", "sieu_am_chan_doan")
+    assert (res.category_slug, res.group_slug, res.method) == ("chan_doan_hinh_anh", "sieu_am", "alias")
+
+
+def test_ambiguous_or_group_only_matches_are_not_snapped_or_learned(tmp_path):
+    taxonomy = Taxonomy("data/taxonomy.yaml")
+    aliases_file = tmp_path / "aliases.json"
+    resolver = TaxonomyResolver(taxonomy, learned_aliases_file=aliases_file)
+    # Bốn category xet_nghiem_* gần như bằng điểm → để người dùng phân loại
+    assert resolver.resolve("xet_nghiem", "may_xet_nghiem").category_slug is None
+    assert resolver.resolve("thiet_bi_y_te", "khac").category_slug is None
+
+    # Category chỉ suy ra từ group hợp lệ: dùng được nhưng không ghi nhớ alias
+    res = resolver.resolve("imaging", "x_quang")
+    assert res.category_slug == "chan_doan_hinh_anh" and not res.learnable
+    resolver.learn("imaging", "x_quang", res)
+    assert not aliases_file.exists()
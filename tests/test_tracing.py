@@ -0,0 +1,51 @@
+from datetime import UTC, datetime, timedelta
+
+import pytest
+
+from app.tracing import add_sink, annotate, current_trace_id, remove_sink, span, summarize, trace_file
+
+
+@pytest.fixture
+def records():
+    collected: list[dict] = []
+    add_sink(collected.append)
+    yield collected
+    remove_sink(collected.append)
+
+
+def test_spans_share_trace_id_and_total_carries_annotations(records):
+    with trace_file("/tmp/a/quotation.pdf") as trace_id:
+        assert current_trace_id() == trace_id
+        with span("ingest") as sp:
+            sp["bytes"] = 10
+        annotate(retries=2)
+
+    assert current_trace_id() is None
+    assert [r["stage"] for r in records] == ["ingest", "total"]
+    assert {r["trace_id"] for r in records} == {trace_id}
+    assert records[0]["bytes"] == 10
+    assert records[1]["retries"] == 2
+    assert records[1]["file"] == "quotation.pdf"
+
+
+def test_span_records_error_and_reraises(records):
+    with pytest.raises(ValueError):
+        with trace_file("x.pdf"):
+            with span("extract"):
+                raise ValueError("boom")
+    assert records[0]["error"] == "ValueError"
+    assert records[1]["stage"] == "total" and records[1]["error"] == "ValueError"
+
+
+def test_summarize_percentiles_and_window():
+    now = datetime.now(UTC)
+    old = (now - timedelta(hours=2)).isoformat()
+    recent = now.isoformat()
+    recs = [{"ts": recent, "stage": "gateway", "duration_ms": float(ms)} for ms in range(1, 101)]
+    recs.append({"ts": old, "stage": "gateway", "duration_ms": 10_000.0})
+
+    summary = summarize(recs, window_seconds=3600)["gateway"]
+    assert summary["count"] == 100
+    assert summary["p50"] == pytest.approx(50.5)
+    assert summary["max"] == 100.0
+    assert summarize(recs)["gateway"]["max"] == 10_000.0
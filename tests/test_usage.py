@@ -0,0 +1,82 @@
+import pytest
+
+from app.fake_gateway import FakeGateway, GatewayProfile
+from app.index_store import IndexStore
+from app.scheduler import BULK, INTERACTIVE, classification_priority
+from app.usage import BudgetExceededError, UsageBudget, UsageTracker, format_usage, today
+
+
+@pytest.fixture
+async def store(tmp_path):
+    index_store = IndexStore(str(tmp_path / "test.db"))
+    await index_store.init()
+    yield index_store
+    await index_store.close()
+
+
+def _row(day, path, prompt_tokens, **kwargs):
+    row = {
+        "ts": f"{day}T09:00:00", "day": day, "path": path, "model": "glm", "files": 1,
+        "requests": 1, "retries": 0, "prompt_tokens": prompt_tokens, "completion_tokens": 0,
+        "latency_ms": 100, "estimated": 0,
+    }
+    return {**row, **kwargs}
+
+
+@pytest.mark.asyncio
+async def test_usage_rows_roll_up_by_day_and_month(store):
+    await store.record_usage([
+        _row("2026-03-15", "/a.pdf", 300, completion_tokens=50, requests=2, retries=1,
+             doc_type="bao_gia"),
+        _row("2026-03-15", "/b.pdf", 240, doc_type="ky_thuat"),
+        # Ngày trước trong cùng tháng chỉ tính vào tổng tháng; tháng trước không tính
+        _row("2026-03-02", "/c.pdf", 1000, doc_type="bao_gia"),
+        _row("2026-02-28", "/d.pdf", 5000),
+    ])
+
+    summary = await store.usage_summary("2026-03-15")
+    assert summary["day"] == {
+        "files": 2, "requests": 3, "retries": 1, "tokens": 590, "latency_ms": 200,
+    }
+    assert summary["month"]["tokens"] == 1590
+    assert summary["by_doc_type"]["bao_gia"] == {"files": 2, "tokens": 1350}
+
+    lines = format_usage(summary, UsageBudget(daily_tokens=1000))
+    assert "<code>590/1,000</code> (59%)" in lines[2]
+
+    # Tracker nạp lại tổng của hôm nay từ DB (dùng chung giữa watcher và bulk ingest)
+    await store.record_usage([_row(today(), "/e.pdf", 700)])
+    tracker = UsageTracker()
+    await tracker.attach(store)
+    assert tracker.totals()["day"]["tokens"] == 700
+
+
+@pytest.mark.asyncio
+async def test_budget_blocks_bulk_but_not_interactive():
+    tracker = UsageTracker(UsageBudget(daily_tokens=1000, soft_ratio=0.5, throttle_seconds=0.01))
+    tracker.record("/a.pdf", "glm", 600, 0, 100)
+    # Trên ngưỡng mềm: bulk chỉ bị giảm tốc
+    await tracker.admit(BULK)
+
+    tracker.record("/b.pdf", "glm", 400, 0, 100)
+    assert tracker.exceeded() == "đã dùng 1000/1000 token/ngày"
+    await tracker.admit(INTERACTIVE)
+    with pytest.raises(BudgetExceededError):
+        await tracker.admit(BULK)
+
+
+@pytest.mark.asyncio
+async def test_classifier_records_gateway_usage(tmp_path, store, make_classifier):
+    async with FakeGateway(GatewayProfile(latency_ms=1)) as gateway:
+        async with make_classifier(gateway.base_url, budget_daily_requests=1) as classifier:
+            await classifier.usage.attach(store)
+            await classifier.classify_file(str(tmp_path / "bao_gia_philips.pdf"), use_rules=False)
+            items = [(str(tmp_path / f"contract_siemens_{i}.pdf"), None) for i in range(3)]
+            with classification_priority(BULK), pytest.raises(BudgetExceededError):
+                await classifier.classify_batch(items, use_rules=False)
+    assert gateway.stats["requests"] == 1
+
+    summary = await store.usage_summary(today())
+    assert summary["day"]["files"] == 1 and summary["day"]["requests"] == 1
+    assert summary["day"]["tokens"] > 0
+    assert summary["by_doc_type"]["bao_gia"]["files"] == 1
@@ -0,0 +1,58 @@
+import asyncio
+
+import pytest
+
+from app.scheduler import INTERACTIVE
+from app.watcher import MedicalWatcher
+
+
+def _watcher(monkeypatch, interactive_workers=8):
+    watcher = MedicalWatcher("config.yaml")
+    watcher._interactive_slots = asyncio.Semaphore(interactive_workers)
+    running: dict[str, int] = {}
+    calls: list[str] = []
+    peak = {"path": 0, "total": 0}
+
+    async def fake_process(event):
+        path = event["path"]
+        running[path] = running.get(path, 0) + 1
+        peak["path"] = max(peak["path"], running[path])
+        peak["total"] = max(peak["total"], sum(running.values()))
+        calls.append(event["event"])
+        await asyncio.sleep(0.02)
+        running[path] -= 1
+
+    monkeypatch.setattr(watcher, "_process_event", fake_process)
+    return watcher, calls, peak
+
+
+async def _drain(watcher):
+    while watcher._tasks:
+        await asyncio.gather(*list(watcher._tasks))
+
+
+@pytest.mark.asyncio
+async def test_same_path_events_are_coalesced_not_run_concurrently(monkeypatch):
+    watcher, calls, peak = _watcher(monkeypatch)
+    watcher._spawn_events([{"event": "created", "path": "/kho/a.pdf"}], INTERACTIVE)
+    await asyncio.sleep(0)
+    # Hai lần flush sau trong lúc a.pdf còn đang xử lý: gộp thành một lần chạy lại
+    for event_type in ("modified", "modified"):
+        watcher._spawn_events([{"event": event_type, "path": "/kho/a.pdf"}], INTERACTIVE)
+    await _drain(watcher)
+
+    assert calls == ["created", "modified"]
+    assert peak["path"] == 1
+    assert not watcher._in_flight
+
+
+@pytest.mark.asyncio
+async def test_interactive_events_are_bounded(monkeypatch):
+    watcher, calls, peak = _watcher(monkeypatch, interactive_workers=2)
+    for i in range(4):
+        # Mỗi đợt một file (dưới ngưỡng bulk) → lớp interactive
+        watcher._spawn_events([{"event": "created", "path": f"/kho/{i}.pdf"}])
+    await _drain(watcher)
+
+    assert len(calls) == 4
+    assert peak["total"] == 2